@@ -5,4 +5,5 @@ from .asvdb import (
     BenchmarkInfoKeys,
     BenchmarkResultKeys,
 )
+from .multiasvdb import MultiASVDb
 from . import utils
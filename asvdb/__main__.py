@@ -1,7 +1,12 @@
 import argparse
-from os import path
+import ast
+import itertools
+import operator
+import sys
+import time
 
 import asvdb
+from asvdb import aggregate, export, importers, retention
 
 DESCRIPTION = "Examine or update an ASV 'database' row-by-row."
 
@@ -24,16 +29,76 @@ The final list of rows will be written to the destination database specified by
 it will be created. If the destination database does exist, it will be updated
 with the results in the final list of rows.
 
+The --export action writes the current rows to the file specified by --output
+(or STDOUT) as a table with a column for each key and a "param_<name>" column
+for each param in the --read-from database. This is much faster than using
+--print to output the same data.
+
+The --group-by action groups the current rows by the values of one or more
+keys, and outputs a table (to --agg-output) with a row for each group containing
+the aggregations specified by --agg. For example, the median result per
+funcName per machine, and the minimum across CUDA versions:
+    --group-by machineName,funcName --agg "median(result)"
+    --group-by funcName,param_dataset --agg "min(result)" --agg "count()"
+
+Rows are read, passed through the actions, and written in batches (see
+--batch-size), so the entire database does not need to fit in memory. The
+output is the same as if each action was applied to all rows before the next:
+actions that depend on variables set by previous actions (eg. an --exec that
+computes a value used in a later --filter), or that print after a previous
+action that printed, wait for all rows to pass through the previous actions
+first, which requires holding all of them in memory.
+
 Remember, an ASV database stores results based on the commitHash, so modifying
 the commitHash for a result and writing it back to the same databse results in a
 new, *additional* result as opposed to a modified one. All updates to the
 database specified by --write-to either modify an existing result or add new
-results, and results cannot be removed from a database. In order to effectively
-remove results, a user can --write-to a new database with only the results they
-want, then replace the original with the new using file system commands (rm the
-old one, mv the new one to the old one's name, etc.)
+results, and results are never removed from it.
+
+Results can only be removed from the --read-from database, in place, using
+--prune and --retain. These are applied before any actions, and remove the
+results for which any --prune expression evaluates to True or that are not kept
+by all --retain policies. Results files left empty are deleted, and unused param
+values and benchmarks are removed from the remaining files. Retention policies
+are:
+    last:N          keep the last N commits (by commitTime) for each branch
+    weekly-after:D  keep only the latest commit per week for each branch for
+                    commits older than D days
+
+Instead of reading a database with --read-from, rows can be imported from the
+JSON reports written by other benchmarking tools using --import-from
+FORMAT:GLOB, where FORMAT is pytest-benchmark or google-benchmark. All files
+matching GLOB are parsed in parallel, and all rows are passed through the actions
+and written to --write-to as a single batch, so each results file is written
+once. Info not in the reports (eg. the commitHash for google-benchmark) can be
+set with --exec:
+    --import-from "google-benchmark:reports/*.json" --exec "commitHash='...'"
+
+Each result added to or changed in a database is also recorded in its change
+feed, so only the rows added or changed since a previous read can be read
+using --since TOKEN. The TOKEN to use next time is written to STDERR
+("asvdb: --since TOKEN") each time rows are read this way. --follow keeps
+reading the rows added or changed every --follow-interval seconds and passes
+them through the actions as they land, until interrupted:
+    --read-from PATH --follow --print "funcName, result"
+Since the rows never end, --exec-once can only be used before the first row
+action with --follow, and --group-by cannot be used. The change feed only keeps the last 10,000 writes from the last 7 days, so an
+older TOKEN has expired and is an error.
+
+To run many queries on the same database, "python -m asvdb serve --read-from
+PATH" starts a server which keeps the results in memory and answers queries
+over HTTP (see "python -m asvdb serve --help"). "python -m asvdb ingest
+--socket PATH --db DB" starts a daemon which coalesces results added to DB by
+many processes (see "python -m asvdb ingest --help").
 """
 
+# Keys whose values are scalars (as opposed to lists or dicts), which are the only
+# keys that can be used in vectorized expressions.
+VECTORIZABLE_KEYS = set.union(asvdb.BenchmarkInfoKeys,
+                              asvdb.BenchmarkResultKeys) \
+                    - set(["argNameValuePairs", "requirements"])
+
+
 def parseArgs(argv=None):
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -45,6 +110,30 @@ def parseArgs(argv=None):
                         help="Print the current verison of asvdb and exit.")
     parser.add_argument("--read-from", type=str, metavar="PATH",
                         help="Path to ASV db dir to read data from.")
+    parser.add_argument("--since", type=int, metavar="TOKEN",
+                        help="Only read the results added or changed in "
+                        "--read-from since the change feed %(metavar)s (see "
+                        "--follow).")
+    parser.add_argument("--follow", action="store_true",
+                        help="After reading --read-from, keep reading the "
+                        "results added or changed in it, every "
+                        "--follow-interval seconds, until interrupted.")
+    parser.add_argument("--follow-interval", type=float, metavar="SECONDS",
+                        default=1.0,
+                        help="Seconds between reads of new results for "
+                        "--follow (default: %(default)s).")
+    parser.add_argument("--import-from", metavar="FORMAT:GLOB",
+                        action="append",
+                        help="Import rows from the report files matching GLOB "
+                        "instead of reading them from --read-from. FORMAT is "
+                        f"one of: {', '.join(importers.importerClasses)}. Can "
+                        "be specified multiple times.")
+    parser.add_argument("--import-stat", metavar="STAT",
+                        help="Statistic in the imported reports used as the "
+                        "result (default: median).")
+    parser.add_argument("--repo", type=str, metavar="URL",
+                        help="Repo URL used when --write-to is created for "
+                        "rows from --import-from.")
     parser.add_argument("--list-keys", action="store_true",
                         help="List all keys found in the database to STDOUT.")
     parser.add_argument("--filter", metavar="EXPR", dest="cmds",
@@ -63,9 +152,64 @@ def parseArgs(argv=None):
                         type=_storeActionArg("print"), action="append",
                         help="Action which evaluates %(metavar)s in a print() "
                         "statement for each of the current results.")
+    parser.add_argument("--export", metavar="FORMAT", dest="cmds",
+                        type=_storeActionArg("export"), action="append",
+                        help="Action which writes each of the current results "
+                        "as a row to --output in %(metavar)s (one of: "
+                        f"{', '.join(export.exporterClasses)}). parquet "
+                        "requires pyarrow.")
+    parser.add_argument("--output", type=str, metavar="PATH", default="-",
+                        help="Path to the file --export writes to, or - for "
+                        "STDOUT (default).")
+    parser.add_argument("--group-by", metavar="KEYS", dest="cmds",
+                        type=_storeActionArg("group_by"), action="append",
+                        help="Action which groups each of the current results "
+                        "by the values of the comma-separated %(metavar)s "
+                        "(keys or param_<name>) and computes the --agg "
+                        "aggregations for each group.")
+    parser.add_argument("--agg", metavar="SPEC", dest="aggs", action="append",
+                        help="Aggregation computed by --group-by, in the form "
+                        "FUNC(FIELD) where FUNC is one of: "
+                        f"{', '.join(aggregate.aggFuncNames[:-1])}, or "
+                        "percentile(FIELD, Q). Can be specified multiple "
+                        "times (default: count()).")
+    parser.add_argument("--agg-output", type=str, metavar="PATH", default="-",
+                        help="Path to the file the --group-by table is written "
+                        "to, or - for STDOUT as CSV (default). The format is "
+                        "determined by the extension (.csv, .jsonl, "
+                        ".parquet).")
+    parser.add_argument("--prune", metavar="EXPR", dest="prunes",
+                        action="append",
+                        help="Remove all results for which %(metavar)s "
+                        "evaluates to True from the --read-from db, in place. "
+                        "Can be specified multiple times.")
+    parser.add_argument("--retain", metavar="POLICY", action="append",
+                        help="Remove all results not kept by the retention "
+                        "%(metavar)s (last:N or weekly-after:DAYS) from the "
+                        "--read-from db, in place. Can be specified multiple "
+                        "times.")
+    parser.add_argument("--merge-from", metavar="PATH", action="append",
+                        help="Path to an ASV db dir to merge into --write-to "
+                        "before any other actions. Can be specified multiple "
+                        "times, all dbs are read concurrently.")
+    parser.add_argument("--merge-conflict", default="newest", metavar="MODE",
+                        choices=asvdb.ASVDb.mergeConflictModes,
+                        help="How --merge-from handles the same result having "
+                        "different values in multiple dbs: use the newest "
+                        "(last specified) value, keep the existing (first) "
+                        "value, or error (default: %(default)s).")
     parser.add_argument("--write-to", type=str, metavar="PATH",
                         help="Path to ASV db dir to write data to. %(metavar)s "
                         "is created if it does not exist.")
+    parser.add_argument("--batch-size", type=int, metavar="N", default=10000,
+                        help="Number of rows read, passed through the "
+                        "actions, and written to --write-to at a time "
+                        "(default: %(default)s).")
+    parser.add_argument("--vectorize", action="store_true",
+                        help="Evaluate --filter expressions against entire "
+                        "columns of values at once (requires numpy). Only "
+                        "simple comparisons/arithmetic of keys and constants "
+                        "are vectorized, others are evaluated row-by-row.")
 
     return parser.parse_args(argv)
 
@@ -91,13 +235,66 @@ def openAsvdbAtPath(dbDir, repo=None, branches=None,
     """
     db = asvdb.ASVDb(dbDir, repo=repo, branches=branches,
                      projectName=projectName, commitUrl=commitUrl)
-    if path.isdir(dbDir):
+    if db.storage.exists() and \
+       (db.storage.read(db.confFileName) is not None):
         db.loadConfFile()
     else:
         db.updateConfFile()
     return db
 
 
+def mergeDbs(sourceDirs, dbDir, conflict):
+    """
+    Merge the dbs at sourceDirs into the db at dbDir, which is created if it
+    does not exist. Return the number of results files added or updated.
+    """
+    db = asvdb.ASVDb(dbDir)
+    return db.merge(sourceDirs, conflict=conflict)
+
+
+def importResults(importSpecs, stat=None):
+    """
+    Return a list of (BenchmarkInfo, [BenchmarkResult, ...]) tuples imported
+    from the report files matching each FORMAT:GLOB spec in importSpecs.
+    """
+    resultTupleList = []
+    for spec in importSpecs:
+        (formatName, paths) = importers.parseImportSpec(spec)
+        if not(paths):
+            raise RuntimeError(f"No files match --import-from {spec}")
+        resultTupleList += importers.importFiles(formatName, paths, stat=stat)
+    return resultTupleList
+
+
+def pruneDb(dbObj, pruneExprs, retentionSpecs):
+    """
+    Remove the results for which any of the pruneExprs evaluate to True, or
+    which are removed by any of the retention policies in retentionSpecs, from
+    dbObj in place. Return the number of results removed.
+    """
+    policies = [retention.parseRetentionPolicy(spec)
+                for spec in retentionSpecs]
+    codes = [compile(expr, "<prune>", "eval") for expr in pruneExprs]
+
+    retentionPredicate = None
+    if policies:
+        retentionPredicate = retention.getPrunePredicate(policies,
+                                                         dbObj.getInfo())
+
+    def predicate(benchmarkInfo, benchmarkResult):
+        if (retentionPredicate is not None) and \
+           retentionPredicate(benchmarkInfo, benchmarkResult):
+            return True
+        if codes:
+            namespace = createNamespace(benchmarkInfo, benchmarkResult)
+            for code in codes:
+                if eval(code, globals(), namespace):
+                    return True
+        return False
+
+    return dbObj.prune(predicate)
+
+
 def createNamespace(benchmarkInfo, benchmarkResult):
     """
     Creates a dictionary representing a namespace containing the member
@@ -132,34 +329,237 @@ def filterResults(resultTupleList, expr):
     Return a new list of results contining objects that evaluate as True when
     the expression is applied to them.
     """
+    code = compile(expr, "<filter>", "eval")
+    assignsNames = _assignsNames(expr)
     newResultTupleList = []
     for (benchmarkInfo, benchmarkResults) in resultTupleList:
         resultsForInfo = []
-        for resultObj in benchmarkResults:
-            namespace = createNamespace(benchmarkInfo, resultObj)
-            if eval(expr, globals(), namespace):
+        for (resultObj, namespace) in \
+            _iterNamespaces(benchmarkInfo, benchmarkResults, assignsNames):
+            if eval(code, globals(), namespace):
                 resultsForInfo.append(resultObj)
         if resultsForInfo:
             newResultTupleList.append((benchmarkInfo, resultsForInfo))
     return newResultTupleList
 
 
+def filterResultsVectorized(resultTupleList, expr):
+    """
+    Same as filterResults(), but the expression is evaluated once using numpy
+    arrays containing the values of each key for all results (columns) instead
+    of once per result. Expressions that cannot be vectorized fall back to
+    filterResults().
+    """
+    vectorized = compileVectorizedExpr(expr)
+    if vectorized is None:
+        return filterResults(resultTupleList, expr)
+    (code, names, hasArithmetic) = vectorized
+
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("--vectorize requires numpy") from e
+
+    groupSizes = [len(benchmarkResults)
+                  for (_, benchmarkResults) in resultTupleList]
+    numRows = sum(groupSizes)
+
+    namespace = {}
+    for name in names:
+        if name in VECTORIZABLE_KEYS:
+            namespace[name] = _getColumn(numpy, resultTupleList, groupSizes,
+                                         name)
+        elif type(globals().get(name)) not in (int, float, str, bool):
+            # Only scalar globals (eg. set with --exec-once) can be used.
+            return filterResults(resultTupleList, expr)
+    # numpy integer arithmetic silently wraps around on overflow, unlike
+    # Python ints.
+    if hasArithmetic and any(column.dtype.kind in "iu"
+                             for column in namespace.values()):
+        return filterResults(resultTupleList, expr)
+
+    try:
+        # Raise on float errors (eg. divide by zero) so the row-by-row
+        # evaluation can raise the same error Python would.
+        with numpy.errstate(all="raise"):
+            mask = numpy.asarray(eval(code, globals(), namespace))
+    except Exception:
+        return filterResults(resultTupleList, expr)
+    if (mask.dtype != bool) or (mask.shape not in [(), (numRows,)]):
+        return filterResults(resultTupleList, expr)
+    mask = numpy.broadcast_to(mask, (numRows,))
+
+    newResultTupleList = []
+    i = 0
+    for ((benchmarkInfo, benchmarkResults), size) in \
+        zip(resultTupleList, groupSizes):
+        resultsForInfo = [benchmarkResults[j] for j in
+                          numpy.flatnonzero(mask[i:i+size]).tolist()]
+        i += size
+        if resultsForInfo:
+            newResultTupleList.append((benchmarkInfo, resultsForInfo))
+    return newResultTupleList
+
+
+def compileVectorizedExpr(expr):
+    """
+    Return a tuple of (code obj, set of names used, True if expr does
+    arithmetic) for expr rewritten to be evaluated on numpy arrays, or None if
+    expr cannot be vectorized. Only expressions made of names, scalar
+    constants, arithmetic and single comparisons combined with and/or/not are
+    supported. and/or/not are rewritten to &/|/~, which is why their operands
+    must be comparisons.
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError:
+        return None
+
+    names = set()
+    hasArithmetic = False
+    booleanNodes = (ast.Compare, ast.BoolOp)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.BinOp, ast.USub)):
+            hasArithmetic = True
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Constant):
+            if type(node.value) not in (int, float, str, bool):
+                return None
+        elif isinstance(node, ast.Compare):
+            if len(node.ops) != 1 or \
+               not(isinstance(node.ops[0], (ast.Eq, ast.NotEq, ast.Lt,
+                                             ast.LtE, ast.Gt, ast.GtE))):
+                return None
+        elif isinstance(node, ast.BoolOp):
+            if not all(isinstance(v, booleanNodes) or _isNot(v)
+                       for v in node.values):
+                return None
+        elif isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not) and \
+               not(isinstance(node.operand, booleanNodes) or _isNot(node.operand)):
+                return None
+        elif not isinstance(node, (ast.Expression, ast.BinOp, ast.operator,
+                                   ast.unaryop, ast.cmpop, ast.boolop,
+                                   ast.Load)):
+            return None
+
+    tree = ast.fix_missing_locations(_BoolOpTransformer().visit(tree))
+    return (compile(tree, "<filter>", "eval"), names, hasArithmetic)
+
+
+def _isNot(node):
+    return isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not)
+
+
+class _BoolOpTransformer(ast.NodeTransformer):
+    """
+    Rewrites "and", "or", and "not" to their elementwise equivalents.
+    """
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        newNode = node.values[0]
+        for value in node.values[1:]:
+            newNode = ast.BinOp(left=newNode, op=op, right=value)
+        return newNode
+
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+
+_int64Min = -2**63
+_int64Max = 2**63 - 1
+
+
+def _getColumn(numpy, resultTupleList, groupSizes, name):
+    """
+    Return a numpy array of the values of name for each result in
+    resultTupleList. BenchmarkInfo values are the same for all results in a
+    group, so they are only read once per group.
+    """
+    if name in asvdb.BenchmarkInfoKeys:
+        values = [getattr(benchmarkInfo, name)
+                  for (benchmarkInfo, _) in resultTupleList]
+        return numpy.repeat(_toArray(numpy, values), groupSizes)
+
+    getter = operator.attrgetter(name)
+    values = [getter(resultObj)
+              for (_, benchmarkResults) in resultTupleList
+              for resultObj in benchmarkResults]
+    return _toArray(numpy, values)
+
+
+def _toArray(numpy, values):
+    """
+    Values that numpy cannot store natively (eg. mixed types or None), or not
+    exactly (ints outside the int64 range, which numpy stores as uint64 or
+    float64), are stored as Python objects so comparisons behave the same as
+    in Python.
+    """
+    array = numpy.array(values)
+    if (array.dtype.kind not in "bifU") or \
+       ((array.dtype.kind == "f") and
+        any((type(v) is int) and not(_int64Min <= v <= _int64Max)
+            for v in values)):
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+    return array
+
+
 def printResults(resultTupleList, expr):
     """
     Print the print expression for each result in the resultTupleList list.
     """
+    code = compile(f"print({expr})", "<print>", "eval")
+    assignsNames = _assignsNames(expr)
     for (benchmarkInfo, benchmarkResults) in resultTupleList:
-        for resultObj in benchmarkResults:
-            namespace = createNamespace(benchmarkInfo, resultObj)
-            eval(f"print({expr})", globals(), namespace)
+        for (_, namespace) in \
+            _iterNamespaces(benchmarkInfo, benchmarkResults, assignsNames):
+            eval(code, globals(), namespace)
     return resultTupleList
 
 
+def _iterNamespaces(benchmarkInfo, benchmarkResults, assignsNames):
+    """
+    Generate a (BenchmarkResult obj, namespace) tuple for each result in
+    benchmarkResults, where namespace contains the members of benchmarkInfo
+    and the result. The namespace is created once and only the
+    BenchmarkResult members are updated for each result, unless assignsNames
+    is True (the expression evaluated assigns names, eg. with :=), in which
+    case each result gets its own namespace so the names assigned are not
+    seen by the next result.
+    """
+    infoDict = benchmarkInfo.__dict__
+    namespace = dict(infoDict)
+    for resultObj in benchmarkResults:
+        if assignsNames:
+            namespace = dict(infoDict)
+        namespace.update(resultObj.__dict__)
+        yield (resultObj, namespace)
+
+
+def _assignsNames(expr):
+    """
+    Return True if evaluating the expression expr can assign names.
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError:
+        return True
+    return any(isinstance(node, ast.NamedExpr) for node in ast.walk(tree))
+
+
 def execResults(resultTupleList, code):
     """
     Run the code on each result in the list. This likely results in modified
     objects and possibly new variables in the global namespace.
     """
+    code = compile(code, "<exec>", "exec")
     for (benchmarkInfo, benchmarkResults) in resultTupleList:
         for resultObj in benchmarkResults:
             namespace = createNamespace(benchmarkInfo, resultObj)
@@ -181,17 +581,211 @@ def updateDb(dbObj, resultTupleList):
     """
     Write the results to the dbOj.
     """
-    for (benchmarkInfo, benchmarkResults) in resultTupleList:
-        dbObj.addResults(benchmarkInfo, benchmarkResults)
+    dbObj.addResultTuples(resultTupleList)
+
+
+def followResults(dbObj, token, interval, maxPolls=None):
+    """
+    Generate a list of the results added or changed in dbObj since token (see
+    ASVDb.getResultsSince()) every interval seconds, for each poll that found
+    any, until maxPolls polls (forever if None). The token of each poll that
+    found results is written to STDERR, so a later run can continue from it
+    with --since.
+    """
+    numPolls = 0
+    while (maxPolls is None) or (numPolls < maxPolls):
+        time.sleep(interval)
+        (token, resultTupleList) = dbObj.getResultsSince(token)
+        numPolls += 1
+        if resultTupleList:
+            sys.stderr.write(f"asvdb: --since {token}\n")
+            yield resultTupleList
 
 
-def main():
+def _exportAction(exporter):
+    """
+    Return a callable used as the --export action, which writes the results
+    passed to it using exporter and returns them unmodified.
+    """
+    def exportResults(resultTupleList, formatName):
+        exporter.writeResults(resultTupleList)
+        return resultTupleList
+    return exportResults
+
+
+def _groupByAction(aggregator):
+    """
+    Return a callable used as the --group-by action, which adds the results
+    passed to it to aggregator and returns them unmodified.
+    """
+    def groupResults(resultTupleList, keys):
+        aggregator.addResults(resultTupleList)
+        return resultTupleList
+    return groupResults
+
+
+def iterBatches(resultTuples, batchSize):
+    """
+    Group the (BenchmarkInfo, [BenchmarkResult, ...]) tuples produced by the
+    resultTuples iterable into lists containing at least batchSize results
+    (except for the last list).
+    """
+    batch = []
+    numResults = 0
+    for resultTuple in resultTuples:
+        batch.append(resultTuple)
+        numResults += len(resultTuple[1])
+        if numResults >= batchSize:
+            yield batch
+            batch = []
+            numResults = 0
+    if batch:
+        yield batch
+
+
+def createPipeline(batches, cmds, cmdMap, collectAll=True):
+    """
+    Return a generator of lists of results (batches) produced by lazily
+    applying each action in cmds, in order, to the batches generator.
+
+    Since each batch passes through all actions before the next batch is read,
+    the order in which actions are applied to rows is different than applying
+    each action to all rows before the next. This is only noticeable if an
+    action uses the global namespace modified by another action, or if both
+    actions print, so in those cases all rows are collected before the
+    dependent action is applied. --exec-once actions are run before any rows
+    are read if no row actions precede them, or after all rows have passed
+    through if no row actions follow them.
+
+    If collectAll is False (for batches that never end, eg. with --follow),
+    rows are never collected, and each batch passes through all actions
+    before the next. --exec-once actions must then precede all row actions.
+    """
+    rowCmdIndices = [i for (i, (cmd, _)) in enumerate(cmds)
+                     if cmd != "exec_once"]
+    # (mutatesGlobals, printsOutput) for each row action since the last time
+    # all rows were collected.
+    pendingEffects = []
+
+    for (i, (cmd, expr)) in enumerate(cmds):
+        if cmd == "exec_once":
+            if not(rowCmdIndices) or (i < rowCmdIndices[0]):
+                cmdMap[cmd]([], expr)
+            elif i > rowCmdIndices[-1]:
+                batches = _execOnceAfter(batches, cmdMap[cmd], expr)
+            else:
+                batches = _execOnceAfterAll(batches, cmdMap[cmd], expr)
+                pendingEffects = []
+            continue
+
+        effects = getActionEffects(cmd, expr)
+        if collectAll and any(_dependsOn(effects, e) for e in pendingEffects):
+            batches = _collectAll(batches)
+            pendingEffects = []
+        batches = _applyAction(batches, cmdMap[cmd], expr)
+        pendingEffects.append(effects)
+
+    return batches
+
+
+def getActionEffects(cmd, expr):
+    """
+    Return a tuple of (mutatesGlobals, printsOutput) describing the possible
+    side effects of the row action cmd with the expression/code expr.
+    """
+    if cmd == "export":
+        # Exports may be written to STDOUT.
+        return (False, True)
+    elif cmd == "group_by":
+        # The aggregated table is only output after all rows are processed.
+        return (False, False)
+
+    mode = "exec" if cmd == "exec" else "eval"
+    try:
+        tree = ast.parse(expr, mode=mode)
+    except SyntaxError:
+        # Assume the worst, the error will be raised when compiled.
+        return (True, True)
+
+    hasCalls = False
+    mutatesGlobals = False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            hasCalls = True
+        elif isinstance(node, (ast.Global, ast.Nonlocal, ast.Import,
+                               ast.ImportFrom, ast.NamedExpr)):
+            mutatesGlobals = True
+        elif isinstance(node, ast.Name) and \
+             isinstance(node.ctx, (ast.Store, ast.Del)):
+            # Assigning to a key only modifies the row, anything else is a
+            # global.
+            if node.id not in VECTORIZABLE_KEYS and \
+               node.id not in ("argNameValuePairs", "requirements"):
+                mutatesGlobals = True
+        elif isinstance(node, (ast.Attribute, ast.Subscript)) and \
+             isinstance(node.ctx, (ast.Store, ast.Del)):
+            # Modifying an object, which could be a global.
+            mutatesGlobals = True
+
+    if cmd == "exec":
+        # Any call could modify a global object or print.
+        return (mutatesGlobals or hasCalls, hasCalls)
+    return (mutatesGlobals, cmd == "print")
+
+
+def _dependsOn(effects, otherEffects):
+    (mutatesGlobals, printsOutput) = effects
+    (otherMutatesGlobals, otherPrintsOutput) = otherEffects
+    return mutatesGlobals or otherMutatesGlobals \
+        or (printsOutput and otherPrintsOutput)
+
+
+def _applyAction(batches, actionFunc, expr):
+    for batch in batches:
+        batch = actionFunc(batch, expr)
+        if batch:
+            yield batch
+
+
+def _collectAll(batches):
+    allBatches = list(batches)
+    yield from allBatches
+
+
+def _execOnceAfter(batches, execOnceFunc, code):
+    yield from batches
+    execOnceFunc([], code)
+
+
+def _execOnceAfterAll(batches, execOnceFunc, code):
+    allBatches = list(batches)
+    execOnceFunc([], code)
+    yield from allBatches
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    # "serve" runs the query server and "ingest" runs the ingestion daemon,
+    # which have their own args.
+    if argv and (argv[0] == "serve"):
+        from asvdb import server
+        server.main(argv[1:])
+        return
+    if argv and (argv[0] == "ingest"):
+        from asvdb import ingest
+        ingest.main(argv[1:])
+        return
+
     cmdMap = {"filter": filterResults,
               "print": printResults,
               "exec": execResults,
               "exec_once": execOnce,
               }
-    args = parseArgs()
+    args = parseArgs(argv)
+
+    if args.vectorize:
+        cmdMap["filter"] = filterResultsVectorized
 
     if args.version:
         print(asvdb.__version__)
@@ -202,22 +796,117 @@ def main():
             print(k)
 
     else:
-        if args.read_from is None:
+        if args.merge_from:
+            if args.write_to is None:
+                raise RuntimeError("--merge-from requires --write-to")
+            mergeDbs(args.merge_from, args.write_to, args.merge_conflict)
+            if args.read_from is None:
+                return
+
+        if args.import_from:
+            if args.read_from is not None:
+                raise RuntimeError("--import-from cannot be used with "
+                                   "--read-from")
+            if args.prunes or args.retain:
+                raise RuntimeError("--prune and --retain require --read-from")
+        elif args.read_from is None:
             raise RuntimeError("--read-from must be specified")
-
-        fromDb = openAsvdbAtPath(args.read_from)
-
-        results = fromDb.getResults()
-        for (cmd, expr) in args.cmds or []:
-            results = cmdMap[cmd](results, expr)
-
-        if args.write_to:
-            toDb = openAsvdbAtPath(args.write_to,
-                                   repo=fromDb.repo,
-                                   branches=fromDb.branches,
-                                   projectName=fromDb.projectName,
-                                   commitUrl=fromDb.commitUrl)
-            updateDb(toDb, results)
+        if args.import_from and ((args.since is not None) or args.follow):
+            raise RuntimeError("--since and --follow require --read-from")
+
+        exportFormats = [expr for (cmd, expr) in args.cmds or []
+                         if cmd == "export"]
+        if len(exportFormats) > 1:
+            raise RuntimeError("--export can only be specified once")
+        groupByKeys = [expr for (cmd, expr) in args.cmds or []
+                       if cmd == "group_by"]
+        if len(groupByKeys) > 1:
+            raise RuntimeError("--group-by can only be specified once")
+        if args.aggs and not(groupByKeys):
+            raise RuntimeError("--agg requires --group-by")
+        if args.follow and groupByKeys:
+            raise RuntimeError("--group-by cannot be used with --follow")
+        if args.follow:
+            # An --exec-once after a row action runs after all rows have been
+            # read, which never happens with --follow.
+            cmdNames = [cmd for (cmd, _) in args.cmds or []]
+            rowCmdNames = [cmd for cmd in cmdNames if cmd != "exec_once"]
+            if rowCmdNames and ("exec_once" in
+                                cmdNames[cmdNames.index(rowCmdNames[0]):]):
+                raise RuntimeError("--exec-once can only be used before the "
+                                   "first row action with --follow")
+
+        aggregator = None
+        if groupByKeys:
+            aggregator = aggregate.Aggregator(
+                [k.strip() for k in groupByKeys[0].split(",")],
+                args.aggs or ["count()"])
+            cmdMap["group_by"] = _groupByAction(aggregator)
+            aggFormat = export.getFormatForPath(args.agg_output)
+
+        if args.import_from:
+            imported = importResults(args.import_from, args.import_stat)
+            paramNames = export.getParamNames(imported)
+            # All imported rows are a single batch, so each results file is
+            # only written once.
+            batches = [imported]
+            toDbArgs = dict(repo=args.repo,
+                            branches=sorted(set(bInfo.branch for (bInfo, _)
+                                                in imported if bInfo.branch)))
+        else:
+            fromDb = openAsvdbAtPath(args.read_from)
+
+            if args.prunes or args.retain:
+                pruneDb(fromDb, args.prunes or [], args.retain or [])
+
+            paramNames = fromDb.getParamNames()
+            if (args.since is not None) or args.follow:
+                (token, resultTupleList) = \
+                    fromDb.getResultsSince(args.since)
+                sys.stderr.write(f"asvdb: --since {token}\n")
+                batches = iterBatches(resultTupleList, args.batch_size)
+                if args.follow:
+                    # Each poll is a single batch, passed through all actions
+                    # before the next poll.
+                    batches = itertools.chain(
+                        batches, followResults(fromDb, token,
+                                               args.follow_interval))
+            else:
+                batches = iterBatches(fromDb.iterResults(), args.batch_size)
+            toDbArgs = dict(repo=fromDb.repo,
+                            branches=fromDb.branches,
+                            projectName=fromDb.projectName,
+                            commitUrl=fromDb.commitUrl)
+
+        exporter = None
+        if exportFormats:
+            exporter = export.getExporter(exportFormats[0], args.output,
+                                          paramNames)
+            cmdMap["export"] = _exportAction(exporter)
+
+        try:
+            batches = createPipeline(batches, args.cmds or [], cmdMap,
+                                     collectAll=not(args.follow))
+
+            if args.write_to:
+                toDb = openAsvdbAtPath(args.write_to, **toDbArgs)
+                for batch in batches:
+                    updateDb(toDb, batch)
+            else:
+                for batch in batches:
+                    pass
+
+        except KeyboardInterrupt:
+            # --follow runs until interrupted
+            if not(args.follow):
+                raise
+        finally:
+            if exporter is not None:
+                exporter.close()
+
+        if aggregator is not None:
+            export.writeTable(aggregator.columns, aggregator.getRows(),
+                              aggFormat, args.agg_output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+"""
+Hash-based group-by aggregation of (BenchmarkInfo, [BenchmarkResult, ...])
+tuples.
+
+Rows are assigned to groups by the values of the group-by keys in a single pass,
+and the values of the aggregated fields are collected per group in compact
+arrays. The aggregations are computed once all rows have been added, using
+numpy if it is installed.
+"""
+import array
+import math
+import re
+
+from .asvdb import BenchmarkInfoKeys, BenchmarkResultKeys
+
+aggFuncNames = ["count", "min", "max", "mean", "median", "percentile"]
+paramKeyPrefix = "param_"
+# Keys with values (dicts and lists) that cannot be used to group results.
+ungroupableKeys = set(["requirements", "argNameValuePairs"])
+
+_aggSpecRegex = re.compile(r"^\s*(\w+)\s*\(\s*(\w*)\s*(?:,\s*([0-9.]+)\s*)?\)\s*$")
+
+
+def parseAggSpec(spec):
+    """
+    Return a (funcName, fieldName, q) tuple for the aggregation spec string,
+    which is of the form "FUNC(FIELD)", or "percentile(FIELD, Q)" where Q is
+    between 0 and 100. fieldName is None for "count()", and q is None for all
+    but percentile.
+    """
+    match = _aggSpecRegex.match(spec)
+    if match is None:
+        raise ValueError(f"Invalid aggregation '{spec}', must be of the form "
+                         "FUNC(FIELD) or percentile(FIELD, Q)")
+    (funcName, fieldName, q) = match.groups()
+    if funcName not in aggFuncNames:
+        raise ValueError(f"Invalid aggregation function '{funcName}', must be "
+                         f"one of: {', '.join(aggFuncNames)}")
+    if not(fieldName) and (funcName != "count"):
+        raise ValueError(f"{funcName}() requires a field name")
+    if (funcName == "percentile") != (q is not None):
+        raise ValueError("Q must be specified for, and only for, percentile()")
+    if q is not None:
+        q = float(q)
+        if not(0 <= q <= 100):
+            raise ValueError(f"Q must be between 0 and 100, got {q}")
+    return (funcName, fieldName or None, q)
+
+
+def getAggColumnName(funcName, fieldName, q):
+    """
+    Return the name of the column for the aggregation described by the args
+    (in the form returned by parseAggSpec()).
+    """
+    if q is not None:
+        return f"{funcName}({fieldName},{q:g})"
+    return f"{funcName}({fieldName or ''})"
+
+
+def _getKeyFunc(key):
+    """
+    Return a tuple of (isInfoKey, func), where func returns the value of key
+    from a BenchmarkInfo obj if isInfoKey is True, else a BenchmarkResult obj.
+    """
+    if key in BenchmarkInfoKeys:
+        return (True, lambda obj: getattr(obj, key))
+    if key in BenchmarkResultKeys:
+        return (False, lambda obj: getattr(obj, key))
+    if key.startswith(paramKeyPrefix) and (len(key) > len(paramKeyPrefix)):
+        paramName = key[len(paramKeyPrefix):]
+        def getParam(obj):
+            for (name, value) in obj.argNameValuePairs:
+                if name == paramName:
+                    return value
+            return None
+        return (False, getParam)
+    raise ValueError(f"Unknown key '{key}', must be a BenchmarkInfo or "
+                     f"BenchmarkResult key, or {paramKeyPrefix}<param name>")
+
+
+class Aggregator:
+    """
+    Computes aggregations of fields over groups of results. groupKeys is a list
+    of keys used to group results (any BenchmarkInfo or BenchmarkResult key,
+    or "param_<name>" for the value of a param), and aggSpecs is a list of
+    aggregation spec strings (see parseAggSpec()).
+    """
+    def __init__(self, groupKeys, aggSpecs):
+        self.groupKeys = list(groupKeys)
+        for key in self.groupKeys:
+            if key in ungroupableKeys:
+                raise ValueError(f"Cannot group by '{key}', group by "
+                                 f"{paramKeyPrefix}<name> for the value of a "
+                                 "param instead")
+        self.aggs = [parseAggSpec(spec) for spec in aggSpecs]
+        self.columns = self.groupKeys \
+            + [getAggColumnName(*agg) for agg in self.aggs]
+
+        self.__groupKeyFuncs = [_getKeyFunc(k) for k in self.groupKeys]
+        # Only fields that are aggregated have their values stored.
+        self.__fields = sorted(set(fieldName for (_, fieldName, _) in self.aggs
+                                   if fieldName is not None))
+        self.__fieldFuncs = [_getKeyFunc(f) for f in self.__fields]
+        # group key tuple: [row count, array of values for each field]
+        self.__groups = {}
+
+
+    def addResults(self, resultTupleList):
+        """
+        Add each result in resultTupleList, a list of (BenchmarkInfo obj,
+        [BenchmarkResult obj, ...]) tuples, to its group.
+        """
+        groups = self.__groups
+        for (benchmarkInfo, benchmarkResults) in resultTupleList:
+            # Values from the BenchmarkInfo obj are the same for all its
+            # results, so only look them up once.
+            infoKey = [func(benchmarkInfo) if isInfoKey else None
+                       for (isInfoKey, func) in self.__groupKeyFuncs]
+            infoFields = [func(benchmarkInfo) if isInfoKey else None
+                          for (isInfoKey, func) in self.__fieldFuncs]
+
+            for benchmarkResult in benchmarkResults:
+                groupKey = tuple(
+                    value if isInfoKey else func(benchmarkResult)
+                    for (value, (isInfoKey, func)) in
+                    zip(infoKey, self.__groupKeyFuncs))
+                group = groups.get(groupKey)
+                if group is None:
+                    group = [0] + [array.array("d") for _ in self.__fields]
+                    groups[groupKey] = group
+                group[0] += 1
+
+                for (i, (value, (isInfoKey, func))) in \
+                    enumerate(zip(infoFields, self.__fieldFuncs), start=1):
+                    if not(isInfoKey):
+                        value = func(benchmarkResult)
+                    # Missing results (eg. failed benchmarks) are skipped.
+                    if value is not None:
+                        group[i].append(self.__toFloat(value,
+                                                       self.__fields[i-1]))
+
+
+    def getRows(self):
+        """
+        Return a list of rows, one per group sorted by the group key values,
+        each containing the group key values followed by the aggregated values
+        (None if a group has no values for a field).
+        """
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        fieldIndices = dict((f, i) for (i, f) in enumerate(self.__fields,
+                                                             start=1))
+        rows = []
+        for (groupKey, group) in sorted(self.__groups.items(),
+                                        key=lambda item: _sortKey(item[0])):
+            row = list(groupKey)
+            for (funcName, fieldName, q) in self.aggs:
+                if fieldName is None:
+                    row.append(group[0])
+                else:
+                    values = group[fieldIndices[fieldName]]
+                    row.append(_aggregate(numpy, funcName, values, q))
+            rows.append(row)
+        return rows
+
+
+    def __toFloat(self, value, fieldName):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Cannot aggregate non-numeric value {value!r} "
+                             f"of '{fieldName}'") from None
+
+
+def _sortKey(groupKey):
+    # Values of different types (eg. None and str) cannot be compared, so also
+    # sort by type name.
+    return tuple((type(v).__name__, v) for v in groupKey)
+
+
+def _aggregate(numpy, funcName, values, q):
+    """
+    Return the result of the aggregation funcName applied to values, an array
+    of floats, using numpy if it is not None.
+    """
+    if funcName == "count":
+        return len(values)
+    if len(values) == 0:
+        return None
+
+    if numpy is not None:
+        values = numpy.frombuffer(values, dtype=numpy.float64)
+        if funcName == "min":
+            return float(values.min())
+        elif funcName == "max":
+            return float(values.max())
+        elif funcName == "mean":
+            return float(values.mean())
+        elif funcName == "median":
+            return float(numpy.median(values))
+        return float(numpy.percentile(values, q))
+
+    if funcName == "min":
+        return min(values)
+    elif funcName == "max":
+        return max(values)
+    elif funcName == "mean":
+        return math.fsum(values) / len(values)
+    elif funcName == "median":
+        q = 50
+    return _percentile(sorted(values), q)
+
+
+def _percentile(sortedValues, q):
+    """
+    Return the q-th percentile of sortedValues, linearly interpolated between
+    the closest values (the same as numpy.percentile()).
+    """
+    pos = (len(sortedValues) - 1) * q / 100
+    lower = math.floor(pos)
+    upper = min(lower + 1, len(sortedValues) - 1)
+    return sortedValues[lower] \
+        + (sortedValues[upper] - sortedValues[lower]) * (pos - lower)
@@ -1,17 +1,20 @@
-import json
 import os
 from os import path
-from pathlib import Path
-import tempfile
+import posixpath
 import itertools
-import glob
+import sys
+import threading
 import time
-import random
-import stat
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 
-from botocore import exceptions
-import boto3
+from . import publish
+from .batchwriter import BatchWriter
+from .catalog import Catalog, getMachineFileKeys
+from .changefeed import ChangeFeed
+from .codec import getCodec
+from .filecache import FileCache
+from .journal import Journal, JournalWriter, mergeJournalResult
+from .storage import getStorageForURL, lockfilePrefix
 
 BenchmarkInfoKeys = set([
     "machineName",
@@ -126,6 +129,30 @@ class BenchmarkResult:
             and (self.unit == other.unit)
 
 
+def encodeResultTuples(resultTupleList):
+    """
+    Return a JSON-serializable list for resultTupleList, a list of
+    (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples.
+    """
+    return [[benchmarkInfo.__dict__,
+             [[r.funcName, r.result, r.argNameValuePairs, r.unit]
+              for r in benchmarkResults]]
+            for (benchmarkInfo, benchmarkResults) in resultTupleList]
+
+
+def decodeResultTuples(encodedList):
+    """
+    Return the list of (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples
+    encoded in encodedList by encodeResultTuples().
+    """
+    return [(BenchmarkInfo(**infoDict),
+             [BenchmarkResult(funcName=funcName, result=result,
+                              argNameValuePairs=[tuple(p) for p in pairs],
+                              unit=unit)
+              for (funcName, result, pairs, unit) in encodedResults])
+            for (infoDict, encodedResults) in encodedList]
+
+
 class ASVDb:
     """
     A "database" of benchmark results consumable by ASV.
@@ -137,33 +164,100 @@ class ASVDb:
     defaultConfVersion = 1
     benchmarksFileName = "benchmarks.json"
     machineFileName = "machine.json"
-    lockfilePrefix = ".asvdbLOCK"
+    lockfilePrefix = lockfilePrefix
+    mergeConflictModes = ["newest", "keep", "error"]
+    # Max number of threads used to read and write files in merge()
+    maxMergeThreads = 16
+    # Max seconds results queued by addResultAsync() wait before being
+    # written, and max number of queued results written at once.
+    asyncMaxDelay = 1.0
+    asyncMaxBatchSize = 1000
+    # Dir (relative to dbDir) containing the journal files written in journaled
+    # mode, and the file recording how much of each has been compacted.
+    journalDirName = ".asvdb-journal"
+    journalOffsetsFileName = "compacted.json"
+    # Journaled writers start a new journal file at least every
+    # journalSegmentMaxAge seconds, so journal files of any writer that are
+    # older than twice that are no longer appended to, and are removed by
+    # compactJournal() once compacted. Must be the same for all writers.
+    journalSegmentMaxAge = 300
+    # Dir (relative to dbDir) containing the change feed: a record of the
+    # results written by each write, in files of changeFeedSegmentSize records,
+    # and the file with the sequence number of the last record (see
+    # getResultsSince()). The segment size must be the same for all writers.
+    # Only the last changeFeedMaxSegments files, and those with records newer
+    # than changeFeedMaxAge seconds (None for no limit), are kept, so tokens
+    # older than that expire.
+    changeFeedDirName = ".asvdb-changes"
+    changeFeedHeadFileName = "head.json"
+    changeFeedSegmentSize = 100
+    changeFeedMaxSegments = 100
+    changeFeedMaxAge = 7 * 24 * 60 * 60
+    # Name of the JSON codec (see asvdb.codec) used to read and write all
+    # files, None to use the fastest installed. If compactJson is True, files
+    # are written without indentation, which ASV reads the same.
+    jsonCodecName = None
+    compactJson = False
+    # The catalog (in the results dir) lists the info of every results file,
+    # so reads do not need to parse machine.json and results files not being
+    # returned. It is checked against a listing of the results dir on every
+    # read, unless trustCatalog is True, in which case changes not made by
+    # asvdb (eg. by ASV itself) are not seen until rebuildCatalog() is called.
+    catalogFileName = ".asvdb-index.json"
+    catalogVersion = 1
+    trustCatalog = False
+    # The state of the last publishIncremental() (in the html dir) records the
+    # version of each results file published, and the graphs it is in.
+    publishStateFileName = ".asvdb-publish.json"
+    publishStateVersion = 1
+    # Results files parsed by reads, shared by all instances (and threads) in
+    # this process and reused until the file changes.
+    parsedFileCache = FileCache(maxSize=1000)
 
     def __init__(self, dbDir,
-                 repo=None, branches=None, projectName=None, commitUrl=None):
+                 repo=None, branches=None, projectName=None, commitUrl=None,
+                 ingestSocket=None, journaled=False):
         """
-        dbDir - directory containing the ASV results, config file, etc.
+        dbDir - directory containing the ASV results, config file, etc. This
+                can also be a "s3://<bucket>/<prefix>" URL, or a
+                "memory://<name>" URL for a DB held only in memory.
         repo - the repo associated with all reasults in the DB.
         branches - https://asv.readthedocs.io/en/stable/asv.conf.json.html#branches
         projectName - the name of the project to display in ASV reports
         commitUrl - the URL ASV will use in reports to redirect users to when
                     they click on a data point. This is typically a Github
                     project URL that shows the contents of a commit.
+        ingestSocket - path to the Unix socket of an ingestion daemon (see
+                       asvdb.ingest). If set, results added are sent to the
+                       daemon, which coalesces them with results from other
+                       processes, instead of being written by this instance.
+        journaled - if True, results added are appended to a journal file for
+                    this instance instead of being written to the ASV files,
+                    which takes the same time regardless of the size of the
+                    DB. See compactJournal().
         """
         self.dbDir = dbDir
         self.repo = repo
         self.branches = branches
         self.projectName = projectName
         self.commitUrl = commitUrl
+        self.ingestSocket = ingestSocket
+        self.__ingestClient = None
+        self.__ingestClientLock = threading.Lock()
+        # The BatchWriter used by addResultAsync(), created when first used.
+        self.__asyncWriter = None
+        self.__asyncWriterLock = threading.Lock()
+        self.journaled = journaled
+        # The journal files appended to by this instance, see asvdb.journal.
+        self.__journalWriter = JournalWriter()
+        self.__journalCompactionThread = None
+        self.__stopJournalCompaction = threading.Event()
 
-        self.machineFileExt = path.join(self.defaultResultsDirName, "*", self.machineFileName)
-        self.confFileExt = self.confFileName
         self.confFilePath = path.join(self.dbDir, self.confFileName)
         self.confVersion = self.defaultConfVersion
         self.resultsDirName = self.defaultResultsDirName
         self.resultsDirPath = path.join(self.dbDir, self.resultsDirName)
         self.htmlDirName = self.defaultHtmlDirName
-        self.benchmarksFileExt = path.join(self.defaultResultsDirName, self.benchmarksFileName)
         self.benchmarksFilePath = path.join(self.resultsDirPath, self.benchmarksFileName)
 
         # Each ASVDb instance must have a unique lockfile name to identify other
@@ -171,11 +265,10 @@ class ASVDb:
         self.lockfileName = "%s-%s-%s" % (self.lockfilePrefix, os.getpid(), time.time())
         self.lockfileTimeout = 5  # seconds
 
-        # S3-related attributes
-        if self.__isS3URL(dbDir):
-            self.s3Resource = boto3.resource("s3")
-            self.bucketName = urlparse(self.dbDir, allow_fragments=False).netloc
-            self.bucketKey = urlparse(self.dbDir, allow_fragments=False).path.lstrip('/')
+        # The StorageBackend (local dir, S3, in-memory) used for all file
+        # access, based on the dbDir URL.
+        self.storage = getStorageForURL(dbDir)
+        self.jsonCodec = getCodec(self.jsonCodecName)
 
         ########################################
         # Testing and debug members
@@ -183,8 +276,31 @@ class ASVDb:
         # adds a delay during write operations to easily test write collision
         # handling.
         self.writeDelay = 0
-        # To "cancel" write operations that are being delayed.
-        self.cancelWrite = False
+        # Events set to "cancel" the write operations being delayed, one for
+        # each thread waiting, see cancelWrite.
+        self.__delayedWrites = set()
+        self.__pendingCancelWrite = False
+        self.__delayedWritesLock = threading.Lock()
+
+
+    @property
+    def cancelWrite(self):
+        """
+        Testing helper: setting to True "cancels" the write operations being
+        delayed by writeDelay in all threads, or the next one if there are
+        none.
+        """
+        return self.__pendingCancelWrite
+
+
+    @cancelWrite.setter
+    def cancelWrite(self, cancel):
+        with self.__delayedWritesLock:
+            if cancel and self.__delayedWrites:
+                for event in self.__delayedWrites:
+                    event.set()
+            else:
+                self.__pendingCancelWrite = bool(cancel)
 
 
     ###########################################################################
@@ -197,11 +313,9 @@ class ASVDb:
         """
         self.__assertDbDirExists()
         try:
-            self.__getLock(self.dbDir)
+            self.__getLock()
             # FIXME: check if confFile exists
-            self.__downloadIfS3()
-
-            d = self.__loadJsonDictFromFile(self.confFilePath)
+            d = self.__loadJsonDictFromFile(self.confFileName)
             self.resultsDirName = d.get("results_dir", self.resultsDirName)
             self.resultsDirPath = path.join(self.dbDir, self.resultsDirName)
             self.benchmarksFilePath = path.join(self.resultsDirPath, self.benchmarksFileName)
@@ -211,11 +325,8 @@ class ASVDb:
             self.projectName = d.get("project")
             self.commitUrl = d.get("show_commit_url")
 
-            self.__uploadIfS3()
-
         finally:
-            self.__releaseLock(self.dbDir)
-            self.__removeLocalS3Copy()
+            self.__releaseLock()
 
 
     def updateConfFile(self):
@@ -226,17 +337,12 @@ class ASVDb:
         """
         self.__ensureDbDirExists()
         try:
-            self.__getLock(self.dbDir)
-            self.__downloadIfS3()
-
+            self.__getLock()
             if self.__waitForWrite():
                 self.__updateConfFile()
 
-            self.__uploadIfS3()
-
         finally:
-            self.__releaseLock(self.dbDir)
-            self.__removeLocalS3Copy()
+            self.__releaseLock()
 
 
     def addResult(self, benchmarkInfo, benchmarkResult):
@@ -245,19 +351,7 @@ class ASVDb:
         This will also update the conf file with the CTOR args if not done
         already.
         """
-        self.__ensureDbDirExists()
-        try:
-            self.__getLock(self.dbDir)
-            self.__downloadIfS3(bInfo=benchmarkInfo)
-            if self.__waitForWrite():
-                self.__updateFilesForInfo(benchmarkInfo)
-                self.__updateFilesForResult(benchmarkInfo, benchmarkResult)
-
-            self.__uploadIfS3()
-
-        finally:
-            self.__releaseLock(self.dbDir)
-            self.__removeLocalS3Copy()
+        self.addResultTuples([(benchmarkInfo, [benchmarkResult])])
 
 
     def addResults(self, benchmarkInfo, benchmarkResultList):
@@ -266,21 +360,222 @@ class ASVDb:
         benchmarkInfo to the DB.  This will also update the conf file with the
         CTOR args if not done already.
         """
+        self.addResultTuples([(benchmarkInfo, benchmarkResultList)])
+
+
+    def addResultTuples(self, resultTupleList):
+        """
+        Add the results in resultTupleList, a list of (BenchmarkInfo obj,
+        [BenchmarkResult obj, ...]) tuples (the same form returned by
+        getResults()), to the DB. All results are added while holding the lock
+        once, and each file in the DB is read and written only once regardless
+        of how many results are added to it.  This will also update the conf
+        file with the CTOR args if not done already.
+        """
+        self.__addResultTuples(list(resultTupleList), self.lockfileName)
+
+
+    def addResultAsync(self, benchmarkInfo, benchmarkResult):
+        """
+        Queue the benchmarkResult associated with the benchmarkInfo to be added
+        to the DB by a background writer thread, and return immediately. Queued
+        results are coalesced and written (see addResultTuples()) once
+        asyncMaxDelay seconds have passed or asyncMaxBatchSize results are
+        queued, or when flush() or close() is called. Return a
+        concurrent.futures.Future whose result is set once the result has been
+        written, or to the exception raised if writing it failed.
+        """
+        return self.addResultsAsync(benchmarkInfo, [benchmarkResult])
+
+
+    def addResultsAsync(self, benchmarkInfo, benchmarkResultList):
+        """
+        Queue each benchmarkResult obj in benchmarkResultList associated with
+        benchmarkInfo to be added to the DB. See addResultAsync().
+        """
+        return self.__getAsyncWriter().submit(
+            [(benchmarkInfo, list(benchmarkResultList))])
+
+
+    async def aaddResult(self, benchmarkInfo, benchmarkResult):
+        """
+        asyncio version of addResultAsync(), which returns once the result has
+        been written.
+        """
+        # asyncio is only imported when used, since it is slow to import.
+        import asyncio
+        await asyncio.wrap_future(
+            self.addResultAsync(benchmarkInfo, benchmarkResult))
+
+
+    async def aaddResults(self, benchmarkInfo, benchmarkResultList):
+        """
+        asyncio version of addResultsAsync(), which returns once the results
+        have been written.
+        """
+        # asyncio is only imported when used, since it is slow to import.
+        import asyncio
+        await asyncio.wrap_future(
+            self.addResultsAsync(benchmarkInfo, benchmarkResultList))
+
+
+    def flush(self):
+        """
+        Write all results queued by addResultAsync() and wait for them to be
+        written. Errors are reported through the futures returned by
+        addResultAsync().
+        """
+        with self.__asyncWriterLock:
+            asyncWriter = self.__asyncWriter
+        if asyncWriter is not None:
+            asyncWriter.flush()
+
+
+    def close(self):
+        """
+        Write all results queued by addResultAsync() and stop the background
+        writer thread. addResultAsync() can be called again after this, which
+        starts a new writer thread.
+        """
+        with self.__asyncWriterLock:
+            asyncWriter = self.__asyncWriter
+            self.__asyncWriter = None
+        if asyncWriter is not None:
+            asyncWriter.close()
+        if self.__ingestClient is not None:
+            self.__ingestClient.close()
+        if self.__journalCompactionThread is not None:
+            self.__stopJournalCompaction.set()
+            self.__journalCompactionThread.join()
+            self.__journalCompactionThread = None
+
+
+    def compactJournal(self):
+        """
+        Fold the results in the journal files of all journaled writers (see
+        the journaled CTOR arg) that have not been compacted yet into the ASV
+        files, and remove the journal files that have been compacted and are
+        no longer appended to (the previous journal files of this instance,
+        and those of any writer older than twice journalSegmentMaxAge). Return
+        the number of results compacted.
+
+        Results in journal files are returned by getResults(), getInfo() and
+        iterResults() before they are compacted.
+        """
+        # Start a new journal segment for this instance, so the current one is
+        # no longer appended to and can be removed once compacted.
+        self.__getJournal().startSegment()
+
         self.__ensureDbDirExists()
+        numResults = 0
         try:
-            self.__getLock(self.dbDir)
-            self.__downloadIfS3(bInfo=benchmarkInfo)
+            self.__getLock()
+            if self.__waitForWrite():
+                numResults = self.__compactJournal()
 
+        finally:
+            self.__releaseLock()
+
+        return numResults
+
+
+    def startJournalCompaction(self, interval):
+        """
+        Start a background thread that calls compactJournal() every interval
+        seconds, until close() is called.
+        """
+        if self.__journalCompactionThread is not None:
+            return
+
+        def compactLoop():
+            while not(self.__stopJournalCompaction.wait(interval)):
+                try:
+                    self.compactJournal()
+                except Exception as e:
+                    sys.stderr.write(f"Error compacting journal: {e}\n")
+
+        self.__stopJournalCompaction.clear()
+        self.__journalCompactionThread = threading.Thread(target=compactLoop,
+                                                          daemon=True)
+        self.__journalCompactionThread.start()
+
+
+    def merge(self, sources, conflict="newest"):
+        """
+        Merge the results in sources, a list of ASVDb objs or db dirs/URLs,
+        into this db. All sources are read concurrently, then this db is
+        updated while holding the lock once.
+
+        Results files only present in one source (and not in this db) are
+        copied verbatim. Results files present in more than one db are merged
+        by taking the union of their params lists. benchmarks.json files are
+        merged the same way. conflict determines the value used when the same
+        result (benchmark and param values) in the same results file has
+        different values in more than one db:
+          "newest" - use the value from the last source with the result
+                     (sources are considered newer than this db, and later
+                     sources newer than earlier ones)
+          "keep"   - use the value in this db, or the first source with the
+                     result
+          "error"  - raise a ValueError before anything is written
+        The other contents of the files (eg. the unit in benchmarks.json, and
+        machine.json files) are chosen the same way, but never raise.
+
+        Return the number of results files added or updated.
+        """
+        if conflict not in self.mergeConflictModes:
+            raise ValueError(f"Invalid conflict mode '{conflict}', must be one "
+                             f"of: {', '.join(self.mergeConflictModes)}")
+        sources = [s if isinstance(s, ASVDb) else ASVDb(s) for s in sources]
+        for source in sources:
+            source.__assertDbDirExists()
+
+        # Each source is read while holding its own lock.
+        with ThreadPoolExecutor(max_workers=self.maxMergeThreads) as executor:
+            sourceContents = list(executor.map(lambda s: s.__readAllFiles(),
+                                               sources))
+
+        numWritten = 0
+        self.__ensureDbDirExists()
+        try:
+            self.__getLock()
             if self.__waitForWrite():
-                self.__updateFilesForInfo(benchmarkInfo)
-                for resultObj in benchmarkResultList:
-                    self.__updateFilesForResult(benchmarkInfo, resultObj)
+                numWritten = self.__mergeFiles(sources, sourceContents,
+                                               conflict)
+                self.__loadCatalog(verify=True)
+
+        finally:
+            self.__releaseLock()
 
-            self.__uploadIfS3()
+        return numWritten
+
+
+    def prune(self, predicate):
+        """
+        Remove all results for which predicate(benchmarkInfo, benchmarkResult)
+        returns True from the db, in place and while holding the lock once.
+        Results files left with no results are deleted, and the "params" lists
+        in the results files that changed and in benchmarks.json are compacted
+        to only contain values used by the remaining results. Benchmarks with
+        no remaining results are removed from benchmarks.json. Return the
+        number of results removed.
+
+        The change feed (see getResultsSince()) is also trimmed to
+        changeFeedMaxSegments and changeFeedMaxAge.
+        """
+        self.__assertDbDirExists()
+        numRemoved = 0
+        try:
+            self.__getLock()
+            if self.__waitForWrite():
+                numRemoved = self.__pruneFiles(predicate)
+                self.__loadCatalog(verify=True)
+                self.__getChangeFeed().trim()
 
         finally:
-            self.__releaseLock(self.dbDir)
-            self.__removeLocalS3Copy()
+            self.__releaseLock()
+
+        return numRemoved
 
 
     def getInfo(self):
@@ -289,17 +584,35 @@ class ASVDb:
         """
         self.__assertDbDirExists()
         try:
-            self.__getLock(self.dbDir)
-            self.__downloadIfS3()
-            retList = self.__readResults(infoOnly=True)
+            self.__getLock()
+            (_, retList) = self.__snapshotResults(infoOnly=True)
 
         finally:
-            self.__releaseLock(self.dbDir)
-            self.__removeLocalS3Copy()
+            self.__releaseLock()
 
         return retList
 
 
+    def getParamNames(self):
+        """
+        Return a sorted list of the names of all params used by any benchmark
+        in the db.
+        """
+        self.__assertDbDirExists()
+        try:
+            self.__getLock()
+            bDict = self.__loadJsonDictFromFile(self.__getBenchmarksFileKey())
+
+        finally:
+            self.__releaseLock()
+
+        paramNames = set()
+        for benchDescr in bDict.values():
+            if isinstance(benchDescr, dict):
+                paramNames.update(benchDescr.get("param_names", []))
+        return sorted(paramNames)
+
+
     def getResults(self, filterInfoObjList=None):
         """
         Return a list of (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples
@@ -309,155 +622,495 @@ class ASVDb:
         """
         self.__assertDbDirExists()
         try:
-            self.__getLock(self.dbDir)
-            self.__downloadIfS3(results=True)
-            retList = self.__readResults(filterByInfoObjs=filterInfoObjList)
+            self.__getLock()
+            snapshot = self.__snapshotResults(
+                filterByInfoObjs=filterInfoObjList)
 
         finally:
-            self.__releaseLock(self.dbDir)
-            self.__removeLocalS3Copy()
+            self.__releaseLock()
+
+        # Results files are parsed, and objs created, without the lock, so
+        # other threads can read (and write) the db at the same time.
+        return self.__createResultTuples(*snapshot)
 
+
+    def iterResults(self, filterInfoObjList=None):
+        """
+        Return a generator of (BenchmarkInfo obj, [BenchmarkResult obj, ...])
+        tuples, the same tuples in the list returned by getResults(). Each
+        results file is only read when the next tuple is needed, so the entire
+        DB is never in memory at once.
+
+        The list of results files is determined when the first tuple is
+        requested, and the lock is only held while reading each individual
+        file. This allows other ASVDb instances to write to the DB while the
+        results are being processed.
+        """
+        self.__assertDbDirExists()
+        try:
+            self.__getLock()
+            journalResults = self.__getJournalResults()
+            bDict = self.__loadBenchmarksDictForJournal(journalResults)
+            # Only the results files whose info matches the filter are read.
+            resultsFiles = []
+            for (resultsFile, mDict, entry) in \
+                self.__getCatalog().getResultsFiles(self.__loadCatalog()):
+                bi = self.__createBenchmarkInfo(mDict, entry)
+                journalResult = journalResults.pop(resultsFile, None)
+                if journalResult is not None:
+                    bi = journalResult[0]
+                if filterInfoObjList and not(bi in filterInfoObjList):
+                    continue
+                resultsFiles.append((resultsFile, entry["version"], bi,
+                                     journalResult))
+
+        finally:
+            self.__releaseLock()
+
+        for (resultsFile, version, bi, journalResult) in resultsFiles:
+            try:
+                self.__getLock()
+                fileContents = self.__readResultsFile(resultsFile, version)
+
+            finally:
+                self.__releaseLock()
+
+            rDict = self.__parseResultsFile(resultsFile, fileContents)
+            # Benchmarks could have been added after benchmarks.json was read
+            # above.
+            if any((benchmarkName not in bDict)
+                   for benchmarkName in rDict.get("results", {})):
+                try:
+                    self.__getLock()
+                    bDict = self.__loadBenchmarksDict()
+
+                finally:
+                    self.__releaseLock()
+
+            # The file could have been removed after being listed.
+            if not(rDict):
+                continue
+
+            resultTuple = (bi, self.__createBenchmarkResults(bDict, rDict,
+                                                             resultsFile))
+            if journalResult is not None:
+                resultTuple = mergeJournalResult(resultTuple, journalResult)
+            yield resultTuple
+
+        # Results files that only exist in journal files
+        for (bi, results) in journalResults.values():
+            if filterInfoObjList and not(bi in filterInfoObjList):
+                continue
+            yield (bi, list(results.values()))
+
+
+    def getResult(self, benchmarkInfo, funcName, params=None):
+        """
+        Return the result of the benchmark funcName with params for
+        benchmarkInfo, or None if there is no such result. params is a
+        dictionary of {param name: value} or a list of (param name, value)
+        pairs, in the same order as the argNameValuePairs of the result when it
+        was added (see getResultsForParams()).
+        """
+        return self.getResultsForParams(benchmarkInfo, funcName,
+                                        [params or []])[0]
+
+
+    def getResultsForParams(self, benchmarkInfo, funcName, paramsList):
+        """
+        Return a list of the results of the benchmark funcName for
+        benchmarkInfo, one for each params in paramsList (see getResult()), with
+        None for each params that has no result.
+
+        Only the results file for benchmarkInfo is read, and the position of
+        each result in the file is computed from the index of each param value
+        in the lists of values for the benchmark, so the other results in the
+        file are never expanded into BenchmarkResult objs. Params are matched by
+        position, since the param names are only in benchmarks.json, and a
+        ValueError is raised if the benchmark has a different number of params.
+        """
+        paramValuesList = [
+            tuple(str(v if v is not None else "NaN")
+                  for (_, v) in (params.items() if isinstance(params, dict)
+                                 else params))
+            for params in paramsList]
+
+        self.__assertDbDirExists()
+        try:
+            self.__getLock()
+            resultsFileKey = self.__getResultsFileKey(benchmarkInfo)
+            fileContents = self.__readResultsFile(resultsFileKey, None)
+            journalResult = self.__getJournalResults().get(resultsFileKey)
+
+        finally:
+            self.__releaseLock()
+
+        rDict = self.__parseResultsFile(resultsFileKey, fileContents)
+        benchmarkResults = rDict.get("results", {}).get(funcName, {})
+        existingParamValuesList = benchmarkResults.get("params", [])
+        results = benchmarkResults.get("result") or []
+        # {param value: index in the param's values} for each param
+        valueIndexesList = [dict((v, i) for (i, v) in enumerate(values))
+                            for values in existingParamValuesList]
+        # Results not yet compacted from journal files replace the results in
+        # the results file.
+        journalValues = {}
+        if journalResult is not None:
+            journalValues = dict(
+                (tuple(v for (_, v) in argNameValuePairs), r.result)
+                for ((name, argNameValuePairs), r) in journalResult[1].items()
+                if name == funcName)
+
+        retList = []
+        for paramValues in paramValuesList:
+            if paramValues in journalValues:
+                retList.append(journalValues[paramValues])
+                continue
+            if not(benchmarkResults):
+                retList.append(None)
+                continue
+            if len(paramValues) != len(existingParamValuesList):
+                raise ValueError("result for %s has %d params in %s, but %d "
+                                 "params were given"
+                                 % (funcName, len(existingParamValuesList),
+                                    resultsFileKey, len(paramValues)))
+            # The results are in the order of the cartesian product of the
+            # param values (see __updateResultDict()), so the index of a result
+            # is the mixed-radix number whose digits are the indices of its
+            # param values.
+            index = 0
+            for (value, values, valueIndexes) in \
+                zip(paramValues, existingParamValuesList, valueIndexesList):
+                valueIndex = valueIndexes.get(value)
+                if valueIndex is None:
+                    index = None
+                    break
+                index = (index * len(values)) + valueIndex
+            if (index is None) or (index >= len(results)):
+                retList.append(None)
+            else:
+                retList.append(results[index])
         return retList
 
 
+    def getResultsSince(self, token=None):
+        """
+        Return a tuple of (new token, list of (BenchmarkInfo obj,
+        [BenchmarkResult obj, ...]) tuples) for the results added or changed
+        since token was returned by a previous call, in the order they were
+        written. The new token is passed to the next call to get the results
+        written after this one. If token is None, all results in the db are
+        returned, as getResults() does.
+
+        Each write records the results it wrote in the change feed (in the
+        changeFeedDirName dir), and only the records after token are read, so
+        the time taken depends on the number of changes rather than the size
+        of the db. Results written more than once since token are returned
+        once per write. Results removed by prune() are not returned, and
+        results in journal files are returned once compacted.
+
+        Only the last changeFeedMaxSegments * changeFeedSegmentSize writes,
+        and the writes in the last changeFeedMaxAge seconds, are kept in the
+        change feed. A token for a write older than that has expired, and a
+        ValueError is raised, after which all results should be read again
+        by passing None.
+        """
+        self.__assertDbDirExists()
+        try:
+            self.__getLock()
+            changeFeed = self.__getChangeFeed()
+            head = changeFeed.loadHead()
+            headSeq = head.get("seq", 0)
+            if token is None:
+                # Results in journal files are returned by a later call, once
+                # compacted (and recorded in the change feed).
+                snapshot = self.__snapshotResults(includeJournal=False)
+            else:
+                retList = changeFeed.read(int(token), head)
+
+        finally:
+            self.__releaseLock()
+
+        if token is None:
+            retList = self.__createResultTuples(*snapshot)
+        return (headSeq, retList)
+
+
+    def updateResultsCache(self, resultsCache):
+        """
+        Update resultsCache, a dictionary that is either empty or was
+        previously passed to this method, so resultsCache["results"] is a
+        dictionary of {results file key: (BenchmarkInfo obj, [BenchmarkResult
+        obj, ...])} for all results in the db. Only results files that changed
+        since the last update are read, based on the version of each file
+        reported by the storage backend (inode, mtime and size for local dirs,
+        ETag for S3). Return a tuple of (set of keys added or changed, set of
+        keys removed).
+        """
+        self.__assertDbDirExists()
+        try:
+            self.__getLock()
+            (changedKeys, removedKeys) = self.__updateResultsCache(resultsCache)
+
+        finally:
+            self.__releaseLock()
+
+        return (changedKeys, removedKeys)
+
+
+    def rebuildCatalog(self):
+        """
+        Rebuild the catalog from the contents of all results files. This is
+        only needed if trustCatalog is True and the db was changed by something
+        other than asvdb, since the catalog is otherwise updated on each read
+        and write.
+        """
+        self.__assertDbDirExists()
+        try:
+            self.__getLock()
+            self.__getCatalog().rebuild()
+
+        finally:
+            self.__releaseLock()
+
+
+    def publishIncremental(self, htmlDir=None):
+        """
+        Update the files read by the ASV web frontend (the output of "asv
+        publish", see asvdb.publish) in htmlDir, a dir or URL (default: the
+        html dir of this db), for the results files added, changed or removed
+        since the last call. Only the graph files of the benchmarks and results
+        params (machine, python, branch, etc.) in those results files, the
+        summary graphs of those benchmarks, index.json and info.json are
+        written, so the time taken depends on the size of the change rather
+        than the size of the db. The first call (or the first after the html
+        dir is removed, eg. by "asv publish") writes all graphs.
+
+        Results in journal files are not published until compacted. Return the
+        number of graph files written or removed.
+        """
+        self.__assertDbDirExists()
+        if htmlDir is None:
+            (htmlStorage, htmlDirKey) = (self.storage, self.htmlDirName)
+        else:
+            (htmlStorage, htmlDirKey) = (getStorageForURL(htmlDir), "")
+
+        numWritten = 0
+        try:
+            self.__getLock()
+            numWritten = self.__publishIncremental(htmlStorage, htmlDirKey)
+
+        finally:
+            self.__releaseLock()
+
+        return numWritten
+
+
     ###########################################################################
     # Private methods. These should not be called by clients. Among other
     # things, public methods use proper locking to ensure atomic operations
     # and these do not.
     ###########################################################################
-    def __readResults(self, infoOnly=False, filterByInfoObjs=None):
+    def __snapshotResults(self, infoOnly=False, filterByInfoObjs=None,
+                          includeJournal=True):
         """
-        Main "read" method responsible for reading ASV JSON files and creating
-        BenchmarkInfo and BenchmarkResult objs.
+        Main "read" method responsible for reading ASV JSON files, which must
+        be called while holding the lock. Return a tuple of (benchmarks.json
+        contents, list), which is passed to __createResultTuples() (without
+        the lock) to create the BenchmarkInfo and BenchmarkResult objs.
 
-        If infoOnly==True, returns a list of only BenchmarkInfo objs, otherwise
-        returns a list of tuples containing (BenchmarkInfo obj, [BenchmarkResult
-        obj, ...]) to represent each BenchmarkInfo object and all the
-        BenchmarkResult objs associated with it.
+        If infoOnly==True, the list is of only BenchmarkInfo objs (and
+        benchmarks.json is not read), otherwise it has a (BenchmarkInfo obj,
+        results file key, contents returned by __readResultsFile(), journal
+        result) tuple for each BenchmarkInfo obj.
 
         filterByInfoObjs can be set to only return BenchmarkInfo objs and their
         results that match at least one of the BenchmarkInfo objs in the
         filterByInfoObjs list (the list is treated as ORd).
+
+        If includeJournal is False, results in journal files that have not been
+        compacted are not included.
         """
         retList = []
-
-        resultsPath = Path(self.resultsDirPath)
+        bDict = None
 
         # benchmarks.json containes meta-data about the individual benchmarks,
         # which is only needed for returning results.
+        # Results not yet compacted from journal files, which replace results
+        # in the ASV files.
+        journalResults = {}
+        if includeJournal:
+            journalResults = self.__getJournalResults()
         if not(infoOnly):
-            benchmarksJsonFile = resultsPath / self.benchmarksFileName
-            if benchmarksJsonFile.exists():
-                bDict = self.__loadJsonDictFromFile(benchmarksJsonFile.as_posix())
-            else:
-                # FIXME: test
-                raise FileNotFoundError(f"{benchmarksJsonFile.as_posix()}")
-
-        for machineDir in resultsPath.iterdir():
-            # Each subdir under the results dir contains all results for a
-            # individual machine. The only non-dir (file) that may need to be
-            # read in the results dir is benchmarks.json, which would have been
-            # read above.
-            if machineDir.is_dir():
-                # Inside the individual machine dir, ;ook for and read
-                # machine.json first.  Assume this is not a valid results dir if
-                # no machine file and skip.
-                machineJsonFile = machineDir / self.machineFileName
-                if machineJsonFile.exists():
-                    mDict = self.__loadJsonDictFromFile(
-                        machineJsonFile.as_posix())
-                else :
-                    continue
+            bDict = self.__loadBenchmarksDictForJournal(
+                journalResults if includeJournal else None)
+
+        # The catalog has the machine.json contents and info for each results
+        # file, so results files only need to be read if their results are
+        # being returned.
+        for (resultsFile, mDict, entry) in \
+            self.__getCatalog().getResultsFiles(self.__loadCatalog()):
+            bi = self.__createBenchmarkInfo(mDict, entry)
+            journalResult = journalResults.pop(resultsFile, None)
+            if journalResult is not None:
+                bi = journalResult[0]
+
+            # If a filter was specified, at least one EXACT MATCH to the
+            # BenchmarkInfo obj must be present.
+            if filterByInfoObjs and not(bi in filterByInfoObjs):
+                continue
 
-                # Read each results file and populate the machineResults list.
-                # This will contain either BenchmarkInfo objs or tuples of
-                # (BenchmarkInfo, [BenchmarkResult objs, ...]) based on infoOnly
-                machineResults = []
-                for resultsFile in machineDir.iterdir():
-                    if resultsFile == machineJsonFile:
-                        continue
-                    rDict = self.__loadJsonDictFromFile(resultsFile.as_posix())
-
-                    resultsParams = rDict.get("params", {})
-                    # Each results file has a single BenchmarkInfo obj
-                    # describing it.
-                    bi = BenchmarkInfo(
-                        machineName=mDict.get("machine", ""),
-                        cudaVer=resultsParams.get("cuda", ""),
-                        osType=resultsParams.get("os", ""),
-                        pythonVer=resultsParams.get("python", ""),
-                        commitHash=rDict.get("commit_hash", ""),
-                        commitTime=rDict.get("date", ""),
-                        branch=rDict.get("branch", ""),
-                        gpuType=mDict.get("gpu", ""),
-                        cpuType=mDict.get("cpu", ""),
-                        arch=mDict.get("arch", ""),
-                        ram=mDict.get("ram", ""),
-                        gpuRam=mDict.get("gpuRam", ""),
-                        requirements=rDict.get("requirements", {})
-                    )
-
-                    # If a filter was specified, at least one EXACT MATCH to the
-                    # BenchmarkInfo obj must be present.
-                    if filterByInfoObjs and not(bi in filterByInfoObjs):
-                        continue
+            if infoOnly:
+                retList.append(bi)
+                continue
+
+            retList.append((bi, resultsFile,
+                            self.__readResultsFile(resultsFile,
+                                                   entry["version"]),
+                            journalResult))
+
+        # Results files that only exist in journal files
+        for (bi, results) in journalResults.values():
+            if filterByInfoObjs and not(bi in filterByInfoObjs):
+                continue
+            retList.append(bi if infoOnly
+                           else (bi, None, None, (bi, results)))
 
-                    if infoOnly:
-                        machineResults.append(bi)
-                    else:
-                        # FIXME: if results not in rDict, throw better error
-                        resultsDict = rDict["results"]
-                        # Populate the list of BenchmarkResult objs associated
-                        # with the BenchmarkInfo obj
-                        resultObjs = []
-                        for benchmarkName in resultsDict:
-                            # benchmarkSpec is the entry in benchmarks.json,
-                            # which is needed for the param names
-                            if benchmarkName not in bDict:
-                                print("WARNING: Encountered benchmark name "
-                                      "that is not in "
-                                      f"{self.benchmarksFileName}: "
-                                      f"file: {resultsFile.as_posix()} "
-                                      f"invalid name\"{benchmarkName}\", skipping.")
-                                continue
-
-                            benchmarkSpec = bDict[benchmarkName]
-                            # benchmarkResults is the entry in this particular
-                            # result file for this benchmark
-                            benchmarkResults = resultsDict[benchmarkName]
-
-                            paramNames = benchmarkSpec["param_names"]
-                            paramValues = benchmarkResults["params"]
-                            results = benchmarkResults["result"]
-                            # Inverse of the write operation described in
-                            # self.__updateResultJson()
-                            paramsCartProd = list(itertools.product(*paramValues))
-                            for (paramValueCombo, result) in zip(paramsCartProd, results):
-                                br = BenchmarkResult(
-                                    funcName=benchmarkName,
-                                    argNameValuePairs=zip(paramNames, paramValueCombo),
-                                    result=result)
-                                unit = benchmarkSpec.get("unit")
-                                if unit is not None:
-                                    br.unit = unit
-                                resultObjs.append(br)
-                        machineResults.append((bi, resultObjs))
-
-                retList += machineResults
+        return (bDict, retList)
 
+
+    def __createResultTuples(self, bDict, snapshot):
+        """
+        Return a list of (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples
+        for the results files read by __snapshotResults(), which does not
+        need the lock.
+        """
+        retList = []
+        for (bi, resultsFile, fileContents, journalResult) in snapshot:
+            if resultsFile is None:
+                retList.append((bi, list(journalResult[1].values())))
+                continue
+            rDict = self.__parseResultsFile(resultsFile, fileContents)
+            # The file could have been removed since the catalog was updated
+            # if trustCatalog is set.
+            if not(rDict):
+                continue
+            resultTuple = (bi, self.__createBenchmarkResults(
+                bDict, rDict, resultsFile))
+            if journalResult is not None:
+                resultTuple = mergeJournalResult(resultTuple, journalResult)
+            retList.append(resultTuple)
         return retList
 
 
-    def __updateFilesForInfo(self, benchmarkInfo):
+    def __loadBenchmarksDict(self):
+        """
+        Return the contents of benchmarks.json, which must exist.
+        """
+        bDict = self.__loadJsonDictFromFile(self.__getBenchmarksFileKey())
+        if not(bDict):
+            # FIXME: test
+            raise FileNotFoundError(f"{self.benchmarksFilePath}")
+        return bDict
+
+
+    def __createBenchmarkInfo(self, mDict, rDict):
+        """
+        Return the BenchmarkInfo obj describing the results file contents
+        rDict, from the machine.json contents mDict for the machine it is in.
+        Each results file has a single BenchmarkInfo obj describing it.
+        """
+        resultsParams = rDict.get("params", {})
+        return BenchmarkInfo(
+            machineName=mDict.get("machine", ""),
+            cudaVer=resultsParams.get("cuda", ""),
+            osType=resultsParams.get("os", ""),
+            pythonVer=resultsParams.get("python", ""),
+            commitHash=rDict.get("commit_hash", ""),
+            commitTime=rDict.get("date", ""),
+            branch=rDict.get("branch", ""),
+            gpuType=mDict.get("gpu", ""),
+            cpuType=mDict.get("cpu", ""),
+            arch=mDict.get("arch", ""),
+            ram=mDict.get("ram", ""),
+            gpuRam=mDict.get("gpuRam", ""),
+            requirements=rDict.get("requirements", {})
+        )
+
+
+    def __createBenchmarkResults(self, bDict, rDict, resultsFile):
+        """
+        Return the list of BenchmarkResult objs in the results file contents
+        rDict, using the benchmarks.json contents bDict for the param names and
+        units.
+        """
+        # FIXME: if results not in rDict, throw better error
+        resultsDict = rDict["results"]
+        resultObjs = []
+        for benchmarkName in resultsDict:
+            # benchmarkSpec is the entry in benchmarks.json, which is needed for
+            # the param names
+            if benchmarkName not in bDict:
+                print("WARNING: Encountered benchmark name "
+                      "that is not in "
+                      f"{self.benchmarksFileName}: "
+                      f"file: {resultsFile} "
+                      f"invalid name\"{benchmarkName}\", skipping.")
+                continue
+
+            benchmarkSpec = bDict[benchmarkName]
+            # benchmarkResults is the entry in this particular result file for
+            # this benchmark
+            benchmarkResults = resultsDict[benchmarkName]
+
+            paramNames = benchmarkSpec["param_names"]
+            paramValues = benchmarkResults["params"]
+            results = benchmarkResults["result"]
+            unit = benchmarkSpec.get("unit")
+            # Inverse of the write operation described in
+            # self.__updateResultJson()
+            paramsCartProd = itertools.product(*paramValues)
+            for (paramValueCombo, result) in zip(paramsCartProd, results):
+                br = BenchmarkResult(
+                    funcName=benchmarkName,
+                    argNameValuePairs=zip(paramNames, paramValueCombo),
+                    result=result)
+                if unit is not None:
+                    br.unit = unit
+                resultObjs.append(br)
+        return resultObjs
+
+
+    def __updateFilesForResultTuples(self, resultTupleList):
+        """
+        Updates all the db files, and the catalog, that are affected by the
+        results in resultTupleList.
         """
-        Updates all the db files that are affected by a new BenchmarkInfo obj.
+        machineUpdates = self.__updateFilesForInfos(
+            [benchmarkInfo for (benchmarkInfo, _) in resultTupleList])
+        resultsUpdates = self.__updateFilesForResults(resultTupleList)
+        self.__getCatalog().update(machineUpdates, resultsUpdates)
+        # Results already in the db (eg. from a re-run CI job) are not changes.
+        self.__getChangeFeed().append(
+            [(benchmarkInfo, benchmarkResults)
+             for (benchmarkInfo, benchmarkResults) in resultTupleList
+             if resultsUpdates.get(self.__getResultsFileKey(benchmarkInfo),
+                                   (None, None))[1] is not None])
+
+
+    def __updateFilesForInfos(self, benchmarkInfoList):
         """
-        # special case: if the benchmarkInfo has a new branch specified,
+        Updates all the db files that are affected by new BenchmarkInfo objs.
+        Return a dictionary of {machine.json key: (contents, new version)} for
+        the machine.json files updated, see Catalog.update().
+        """
+        # special case: if a benchmarkInfo has a new branch specified,
         # update self.branches so the conf files includes the new branch
         # name.
-        newBranch = benchmarkInfo.branch
-        if newBranch and newBranch not in self.branches:
-            self.branches.append(newBranch)
+        for benchmarkInfo in benchmarkInfoList:
+            newBranch = benchmarkInfo.branch
+            if newBranch and newBranch not in self.branches:
+                self.branches.append(newBranch)
 
         # The comments below assume default dirname values (mainly
         # "results"), which can be changed in the asv.conf.json file.
@@ -465,45 +1118,795 @@ class ASVDb:
         # <self.dbDir>/asv.conf.json
         self.__updateConfFile()
         # <self.dbDir>/results/<machine dir>/machine.json
-        self.__updateMachineJson(benchmarkInfo)
+        # Only the last BenchmarkInfo obj for each machine needs to be written,
+        # since each would overwrite the previous.
+        machineInfos = {}
+        for benchmarkInfo in benchmarkInfoList:
+            machineInfos.pop(benchmarkInfo.machineName, None)
+            machineInfos[benchmarkInfo.machineName] = benchmarkInfo
+        return dict(self.__updateMachineJson(benchmarkInfo)
+                    for benchmarkInfo in machineInfos.values())
 
 
-    def __updateFilesForResult(self, benchmarkInfo, benchmarkResult):
+    def __updateFilesForResults(self, resultTupleList):
         """
-        Updates all the db files that are affected by a new BenchmarkResult
-        obj. This also requires the corresponding BenchmarkInfo obj since some
-        results files also include info data.
+        Updates all the db files that are affected by new BenchmarkResult objs.
+        This also requires the corresponding BenchmarkInfo objs since some
+        results files also include info data. Return a dictionary of {results
+        file key: (contents, new version)} for the results files updated, see
+        Catalog.update().
         """
+        resultTupleList = [(benchmarkInfo, benchmarkResults)
+                           for (benchmarkInfo, benchmarkResults) in resultTupleList
+                           if benchmarkResults]
+        if not(resultTupleList):
+            return {}
+
         # <self.dbDir>/results/benchmarks.json
-        self.__updateBenchmarkJson(benchmarkResult)
+        self.__updateBenchmarkJson(
+            [resultObj for (_, benchmarkResults) in resultTupleList
+             for resultObj in benchmarkResults])
+
         # <self.dbDir>/results/<machine dir>/<result file name>.json
-        self.__updateResultJson(benchmarkResult, benchmarkInfo)
+        # Different BenchmarkInfo objs can map to the same results file.
+        resultTuplesByFile = {}
+        for (benchmarkInfo, benchmarkResults) in resultTupleList:
+            resultsFileKey = self.__getResultsFileKey(benchmarkInfo)
+            resultTuplesByFile.setdefault(resultsFileKey, []).append(
+                (benchmarkInfo, benchmarkResults))
+        return dict(self.__updateResultJson(resultsFileKey, resultTuples)
+                    for (resultsFileKey, resultTuples)
+                    in resultTuplesByFile.items())
+
+
+    def __readAllFiles(self):
+        """
+        Return a tuple of (benchmarks.json dict, {key: contents}), where the
+        dict contains the contents of all machine.json and results files keyed
+        by their path relative to the results dir. This also loads the conf
+        file.
+        """
+        self.loadConfFile()
+        try:
+            self.__getLock()
+            bDict = self.__loadJsonDictFromFile(self.__getBenchmarksFileKey())
+            keys = [key for machineFileKeys in
+                    self.__getMachineFileKeys().values()
+                    for key in machineFileKeys]
+            with ThreadPoolExecutor(max_workers=self.maxMergeThreads) \
+                 as executor:
+                contents = list(executor.map(self.storage.read, keys))
+
+        finally:
+            self.__releaseLock()
+
+        prefixLen = len(self.resultsDirName) + 1
+        return (bDict,
+                dict((key[prefixLen:], data) for (key, data) in
+                     zip(keys, contents) if data is not None))
+
+
+    def __mergeFiles(self, sources, sourceContents, conflict):
+        """
+        Merge the contents of the sources, read using __readAllFiles(), into
+        the files of this db. See merge().
+        """
+        # The conf file is updated with the branches from all sources, and the
+        # repo, project and commit URL from the first source if not set.
+        confDict = self.__loadJsonDictFromFile(self.confFileName)
+        self.resultsDirName = confDict.get("results_dir", self.resultsDirName)
+        self.repo = self.repo or confDict.get("repo")
+        self.projectName = self.projectName or confDict.get("project")
+        self.commitUrl = self.commitUrl or confDict.get("show_commit_url")
+        self.branches = list(self.branches or [])
+        for source in sources:
+            self.repo = self.repo or source.repo
+            self.projectName = self.projectName or source.projectName
+            self.commitUrl = self.commitUrl or source.commitUrl
+            self.branches += [b for b in source.branches or []
+                              if b not in self.branches]
+        self.__updateConfFile()
+
+        prefixLen = len(self.resultsDirName) + 1
+        existingKeys = set(key[prefixLen:] for machineFileKeys in
+                           self.__getMachineFileKeys().values()
+                           for key in machineFileKeys)
+
+        # {key: [contents from each source with the file]}, in source order
+        sourceFiles = {}
+        for (_, files) in sourceContents:
+            for (key, data) in files.items():
+                sourceFiles.setdefault(key, []).append(data)
+
+        # Determine all writes before writing anything, so conflict="error"
+        # leaves the db untouched.
+        writes = {}
+        numResultsFiles = 0
+        for (key, allData) in sourceFiles.items():
+            fileKey = posixpath.join(self.resultsDirName, key)
+            existingData = None
+            if key in existingKeys:
+                existingData = self.storage.read(fileKey)
+            if existingData is not None:
+                allData = [existingData] + allData
+            # Nothing to merge if all copies are identical.
+            if all(data == allData[0] for data in allData[1:]):
+                if existingData is None:
+                    writes[fileKey] = allData[0]
+                    if posixpath.basename(key) != self.machineFileName:
+                        numResultsFiles += 1
+                continue
+
+            if posixpath.basename(key) == self.machineFileName:
+                data = allData[-1] if conflict == "newest" else allData[0]
+                if data != existingData:
+                    writes[fileKey] = data
+                continue
+
+            mergedDict = self.__mergeResultsDicts(
+                [self.jsonCodec.loads(data) for data in allData], conflict,
+                fileKey)
+            writes[fileKey] = self.jsonCodec.dumps(mergedDict,
+                                                   self.compactJson)
+            numResultsFiles += 1
+
+        benchmarksFileKey = self.__getBenchmarksFileKey()
+        existingBDict = self.__loadJsonDictFromFile(benchmarksFileKey)
+        bDict = self.__mergeBenchmarksDicts(
+            [existingBDict] + [b for (b, _) in sourceContents], conflict)
+        if bDict != existingBDict:
+            writes[benchmarksFileKey] = self.jsonCodec.dumps(bDict,
+                                                             self.compactJson)
+
+        with ThreadPoolExecutor(max_workers=self.maxMergeThreads) as executor:
+            # {key: new version, or None if unchanged}, which also raises any
+            # exceptions from the writes
+            versions = dict(zip(writes, executor.map(
+                lambda item: self.storage.writeIfChanged(*item),
+                writes.items())))
+
+        # All results in the results files changed are changes.
+        mDicts = {}
+        resultTupleList = []
+        for (fileKey, data) in sorted(writes.items()):
+            machineName = posixpath.basename(posixpath.dirname(fileKey))
+            if (fileKey == benchmarksFileKey) or \
+               (posixpath.basename(fileKey) == self.machineFileName) or \
+               (versions[fileKey] is None):
+                continue
+            if machineName not in mDicts:
+                mDicts[machineName] = self.__loadJsonDictFromFile(
+                    self.__getMachineFileKey(machineName))
+            rDict = self.jsonCodec.loads(data)
+            resultTupleList.append(
+                (self.__createBenchmarkInfo(mDicts[machineName], rDict),
+                 self.__createBenchmarkResults(bDict, rDict, fileKey)))
+        self.__getChangeFeed().append(resultTupleList)
+
+        return numResultsFiles
+
+
+    def __mergeResultsDicts(self, rDicts, conflict, fileKey):
+        """
+        Return a results file dict containing the union of all results in the
+        rDicts list of results file dicts, where later dicts are newer.
+        """
+        mergedDict = dict(rDicts[0])
+        # {funcName: (params lists, param value sets, {param values: result})}
+        allResults = {}
+        for (i, rDict) in enumerate(rDicts):
+            if (i > 0) and (conflict == "newest"):
+                mergedDict.update((k, v) for (k, v) in rDict.items()
+                                  if k != "results")
+
+            for (funcName, resultDict) in rDict.get("results", {}).items():
+                paramValues = resultDict.get("params", [])
+                (mergedParamValues, valueSets, resultMap) = \
+                    allResults.setdefault(funcName, ([], [], {}))
+                if not(mergedParamValues):
+                    mergedParamValues.extend([] for _ in paramValues)
+                    valueSets.extend(set() for _ in paramValues)
+                elif len(mergedParamValues) != len(paramValues):
+                    raise ValueError("result for %s had %d params in one db, "
+                                     "but %d params in another (%s)"
+                                     % (funcName, len(mergedParamValues),
+                                        len(paramValues), fileKey))
+
+                for (values, mergedValues, valueSet) in \
+                    zip(paramValues, mergedParamValues, valueSets):
+                    for value in values:
+                        if value not in valueSet:
+                            mergedValues.append(value)
+                            valueSet.add(value)
+
+                # None results are placeholders for missing results, and
+                # never conflict.
+                for (paramValueCombo, result) in \
+                    zip(itertools.product(*paramValues),
+                        resultDict.get("result", [])):
+                    if result is None:
+                        continue
+                    existingResult = resultMap.get(paramValueCombo)
+                    if (existingResult is None) or (conflict == "newest"):
+                        resultMap[paramValueCombo] = result
+                    elif (existingResult != result) and (conflict == "error"):
+                        raise ValueError(f"Conflicting results for {funcName} "
+                                         f"{paramValueCombo} in {fileKey}: "
+                                         f"{existingResult} != {result}")
+
+        mergedDict["results"] = dict(
+            (funcName, {"params": paramValues,
+                        "result": [resultMap.get(paramValueCombo)
+                                   for paramValueCombo in
+                                   itertools.product(*paramValues)]})
+            for (funcName, (paramValues, _, resultMap)) in allResults.items())
+        return mergedDict
+
+
+    def __mergeBenchmarksDicts(self, bDicts, conflict):
+        """
+        Return a benchmarks.json dict containing the union of the benchmarks and
+        their param values in the bDicts list, where later dicts are newer.
+        """
+        mergedDict = {}
+        for bDict in bDicts:
+            for (funcName, benchDict) in bDict.items():
+                if not(isinstance(benchDict, dict)):
+                    continue
+                existingDict = mergedDict.get(funcName)
+                if existingDict is None:
+                    mergedDict[funcName] = dict(
+                        benchDict,
+                        params=[list(v) for v in benchDict.get("params", [])])
+                    continue
+
+                existingParamValues = existingDict["params"]
+                paramValues = benchDict.get("params", [])
+                if len(existingParamValues) != len(paramValues):
+                    raise ValueError("result for %s had %d params in one db, "
+                                     "but %d params in another"
+                                     % (funcName, len(existingParamValues),
+                                        len(paramValues)))
+                for (existingValues, values) in \
+                    zip(existingParamValues, paramValues):
+                    valueSet = set(existingValues)
+                    existingValues.extend(v for v in values
+                                          if v not in valueSet)
+                if conflict == "newest":
+                    existingDict.update((k, v) for (k, v) in benchDict.items()
+                                        if k not in ("params", "param_names"))
+
+        # a version key must always be present in benchmarks.json, "current"
+        # ASV version requires this to be 2 (or higher?)
+        mergedDict["version"] = 2
+        return mergedDict
+
+
+    def __updateResultsCache(self, resultsCache):
+        """
+        Update resultsCache, see updateResultsCache().
+        """
+        versions = self.storage.listVersions(self.resultsDirName)
+        oldVersions = resultsCache.get("versions", {})
+        results = resultsCache.setdefault("results", {})
+        machineDicts = resultsCache.setdefault("machines", {})
+        newVersions = {}
+
+        # Results files are parsed using the param names and units in
+        # benchmarks.json, so all files are re-read if those change. Only
+        # adding param values (the most common change) does not require this.
+        benchmarksFileKey = self.__getBenchmarksFileKey()
+        bDict = resultsCache.get("benchmarks")
+        readAll = False
+        if (bDict is None) or \
+           (versions.get(benchmarksFileKey) != oldVersions.get(benchmarksFileKey)):
+            newBDict = self.__loadBenchmarksDict()
+            readAll = (bDict is None) or \
+                (self.__getBenchmarksSignature(newBDict)
+                 != self.__getBenchmarksSignature(bDict))
+            bDict = newBDict
+        newVersions[benchmarksFileKey] = versions.get(benchmarksFileKey)
+
+        changedKeys = set()
+        seenKeys = set()
+        for (machineName, machineFileKeys) in \
+            self.__getMachineFileKeys(sorted(versions)).items():
+            machineJsonFile = self.__getMachineFileKey(machineName)
+            if machineJsonFile not in machineFileKeys:
+                continue
+            # A changed machine.json changes the BenchmarkInfo objs for all
+            # results files for the machine.
+            readMachine = readAll
+            mDict = machineDicts.get(machineJsonFile)
+            if (mDict is None) or \
+               (versions[machineJsonFile] != oldVersions.get(machineJsonFile)):
+                newMDict = self.__loadJsonDictFromFile(machineJsonFile)
+                readMachine = readMachine or (newMDict != mDict)
+                mDict = machineDicts[machineJsonFile] = newMDict
+            newVersions[machineJsonFile] = versions[machineJsonFile]
+
+            for resultsFile in machineFileKeys:
+                if resultsFile == machineJsonFile:
+                    continue
+                if not(readMachine) and (resultsFile in results) and \
+                   (versions[resultsFile] == oldVersions.get(resultsFile)):
+                    seenKeys.add(resultsFile)
+                    newVersions[resultsFile] = versions[resultsFile]
+                    continue
+
+                (data, version) = self.storage.readWithVersion(resultsFile)
+                # The file could have been removed after being listed.
+                if data is None:
+                    continue
+                rDict = self.jsonCodec.loads(data)
+                if any((benchmarkName not in bDict)
+                       for benchmarkName in rDict.get("results", {})):
+                    bDict = self.__loadBenchmarksDict()
+                results[resultsFile] = (
+                    self.__createBenchmarkInfo(mDict, rDict),
+                    self.__createBenchmarkResults(bDict, rDict, resultsFile))
+                seenKeys.add(resultsFile)
+                changedKeys.add(resultsFile)
+                newVersions[resultsFile] = version
+
+        removedKeys = set(results) - seenKeys
+        for key in removedKeys:
+            del results[key]
+        for machineJsonFile in set(machineDicts) - set(newVersions):
+            del machineDicts[machineJsonFile]
+
+        resultsCache["benchmarks"] = bDict
+        resultsCache["versions"] = newVersions
+        return (changedKeys, removedKeys)
+
+
+    def __getBenchmarksSignature(self, bDict):
+        """
+        Return the parts of the benchmarks.json dict bDict used when reading
+        results files.
+        """
+        return dict((funcName, (benchDict.get("param_names"),
+                                benchDict.get("unit")))
+                    for (funcName, benchDict) in bDict.items()
+                    if isinstance(benchDict, dict))
+
+
+    def __loadCatalog(self, verify=None):
+        """
+        Return the contents of the catalog (see asvdb.catalog). If verify is
+        True (the default unless trustCatalog is set), it is first brought up
+        to date with the files in the results dir.
+        """
+        if verify is None:
+            verify = not(self.trustCatalog)
+        return self.__getCatalog().load(verify)
+
+
+    def __getCatalog(self):
+        return Catalog(self.storage, self.jsonCodec, self.resultsDirName,
+                       self.machineFileName, self.catalogFileName,
+                       self.catalogVersion, self.debugPrint)
+
+
+    def __publishIncremental(self, htmlStorage, htmlDirKey):
+        """
+        Update the html files in htmlStorage (in the htmlDirKey dir) for the
+        results files that changed since the state recorded by the last
+        publish, see publishIncremental().
+        """
+        catalog = self.__loadCatalog()
+        benchmarks = dict((name, benchDict) for (name, benchDict) in
+                          self.__loadJsonDictFromFile(
+                              self.__getBenchmarksFileKey()).items()
+                          if isinstance(benchDict, dict))
+        resultsFiles = self.__getCatalog().getResultsFiles(catalog)
+
+        stateKey = posixpath.join(htmlDirKey, self.publishStateFileName)
+        state = self.__loadHtmlFile(htmlStorage, stateKey) or {}
+        # Without a state, the graph files in the html dir (if any, eg. from
+        # "asv publish") may number the revisions differently, so they are
+        # rewritten from scratch instead of updated.
+        resetState = (state.get("version") != self.publishStateVersion)
+        if resetState:
+            state = {"files": {}, "benchmarks": {}}
+
+        # {results file key: {"version", "revision", "params", "benchmarks"}},
+        # where params are the graph params of the results file: its results
+        # params and branch, with params only in other results files set to
+        # None (as done by ASV).
+        paramNames = set(["branch"])
+        for (_, _, entry) in resultsFiles:
+            paramNames.update(entry["params"])
+        revisions = publish.getRevisions(
+            dict((entry["commit_hash"], entry["date"])
+                 for (_, _, entry) in resultsFiles))
+        newFiles = {}
+        for (resultsFile, _, entry) in resultsFiles:
+            graphParams = dict((name, None) for name in paramNames)
+            graphParams.update((name, "" if value is None else value)
+                               for (name, value) in entry["params"].items())
+            graphParams["branch"] = entry["branch"]
+            newFiles[resultsFile] = {
+                "version": entry["version"],
+                "revision": revisions[entry["commit_hash"]],
+                "params": graphParams,
+                "benchmarks": [name for name in entry["benchmarks"]
+                               if name in benchmarks],
+            }
+        # The values of all points of a benchmark change if its params in
+        # benchmarks.json change.
+        benchmarkSignatures = dict(
+            (name, [benchDict.get("param_names"), benchDict.get("params")])
+            for (name, benchDict) in benchmarks.items())
+        changedBenchmarks = set(
+            name for (name, signature) in benchmarkSignatures.items()
+            if state["benchmarks"].get(name) != signature)
+
+        # {graph key: {revision: new value, or None to remove the point}}. The
+        # points of results files that changed or were removed are removed
+        # first, then the points of all changed results files are added.
+        pointUpdates = {}
+        affectedBenchmarks = set()
+        # {results file key: [names of the benchmarks to add points for]}
+        updatedFiles = {}
+        oldFiles = state["files"]
+        for resultsFile in sorted(set(oldFiles) | set(newFiles)):
+            oldFile = oldFiles.get(resultsFile)
+            newFile = newFiles.get(resultsFile)
+            if oldFile == newFile:
+                names = [name for name in newFile["benchmarks"]
+                         if name in changedBenchmarks]
+                if names:
+                    updatedFiles[resultsFile] = names
+                continue
+            if oldFile is not None:
+                for name in oldFile["benchmarks"]:
+                    graphKey = publish.getGraphKey(oldFile["params"], name)
+                    pointUpdates.setdefault(graphKey, {})[
+                        oldFile["revision"]] = None
+                    affectedBenchmarks.add(name)
+            if newFile is not None:
+                updatedFiles[resultsFile] = newFile["benchmarks"]
+
+        keys = sorted(updatedFiles)
+        with ThreadPoolExecutor(max_workers=self.maxMergeThreads) as executor:
+            rDicts = list(executor.map(self.__loadJsonDictFromFile, keys))
+        for (resultsFile, rDict) in zip(keys, rDicts):
+            newFile = newFiles[resultsFile]
+            resultsDict = rDict.get("results", {})
+            for name in updatedFiles[resultsFile]:
+                if name not in resultsDict:
+                    continue
+                graphKey = publish.getGraphKey(newFile["params"], name)
+                pointUpdates.setdefault(graphKey, {})[newFile["revision"]] = \
+                    publish.getGraphValue(benchmarks[name], resultsDict[name])
+                affectedBenchmarks.add(name)
+
+        # {graph key: points} for the graphs updated
+        graphs = {}
+        numWritten = 0
+        for (graphKey, updates) in sorted(pointUpdates.items()):
+            key = posixpath.join(htmlDirKey, graphKey)
+            if resetState:
+                points = {}
+            else:
+                points = dict(self.__loadHtmlFile(htmlStorage, key) or [])
+            for (revision, value) in updates.items():
+                if value is None:
+                    points.pop(revision, None)
+                else:
+                    points[revision] = value
+            graphs[graphKey] = [[revision, points[revision]]
+                                for revision in sorted(points)]
+            if self.__writeHtmlFile(htmlStorage, key, graphs[graphKey]):
+                numWritten += 1
+
+        # The summary graph of a benchmark combines all of its graphs.
+        graphKeysByBenchmark = {}
+        for newFile in newFiles.values():
+            for name in newFile["benchmarks"]:
+                if name in affectedBenchmarks:
+                    graphKeysByBenchmark.setdefault(name, set()).add(
+                        publish.getGraphKey(newFile["params"], name))
+        for name in sorted(affectedBenchmarks):
+            graphPoints = []
+            for graphKey in sorted(graphKeysByBenchmark.get(name, [])):
+                if graphKey not in graphs:
+                    graphs[graphKey] = self.__loadHtmlFile(
+                        htmlStorage, posixpath.join(htmlDirKey, graphKey)) or []
+                graphPoints.append(graphs[graphKey])
+            self.__writeHtmlFile(
+                htmlStorage,
+                posixpath.join(htmlDirKey, publish.getGraphKey(
+                    publish.summaryParams, name)),
+                publish.getSummaryPoints(graphPoints))
+
+        self.__writeHtmlFile(
+            htmlStorage, posixpath.join(htmlDirKey, publish.indexFileName),
+            self.__getPublishIndex(catalog, benchmarks, newFiles, revisions))
+        # The frontend adds the timestamp in info.json to the URLs of the files
+        # it reads, so it must change for browsers to not use cached files.
+        self.__writeHtmlFile(
+            htmlStorage, posixpath.join(htmlDirKey, publish.infoFileName),
+            publish.getInfo())
+        indexHtmlKey = posixpath.join(htmlDirKey, "index.html")
+        if htmlStorage.read(indexHtmlKey) is None:
+            for (key, data) in publish.iterFrontendFiles():
+                htmlStorage.write(posixpath.join(htmlDirKey, key), data)
+
+        self.__writeHtmlFile(htmlStorage, stateKey,
+                             {"version": self.publishStateVersion,
+                              "files": newFiles,
+                              "benchmarks": benchmarkSignatures,
+                              })
+        return numWritten
+
+
+    def __getPublishIndex(self, catalog, benchmarks, publishedFiles,
+                          revisions):
+        """
+        Return the contents of index.json for the results files in catalog,
+        where publishedFiles has the graph params of each results file (see
+        __publishIncremental()) and revisions is the dictionary of {commit
+        hash: revision} of all commits.
+        """
+        confDict = self.__loadJsonDictFromFile(self.confFileName)
+        repo = confDict.get("repo", self.repo) or ""
+        params = {}
+        graphParamList = []
+        for publishedFile in publishedFiles.values():
+            graphParams = publishedFile["params"]
+            for (name, value) in graphParams.items():
+                params.setdefault(name, set()).add(value)
+            if graphParams not in graphParamList:
+                graphParamList.append(graphParams)
+        commitDates = dict((entry["commit_hash"], int(entry["date"]))
+                           for (_, _, entry)
+                           in self.__getCatalog().getResultsFiles(catalog))
+
+        return {"project": confDict.get("project", self.projectName),
+                "project_url": confDict.get("project_url",
+                                            repo.replace(".git", "")),
+                "show_commit_url": confDict.get("show_commit_url",
+                                                self.commitUrl),
+                "hash_length": confDict.get("hash_length", 8),
+                "revision_to_hash": dict(
+                    (str(revision), commitHash)
+                    for (commitHash, revision) in revisions.items()),
+                "revision_to_date": dict(
+                    (str(revision), commitDates[commitHash])
+                    for (commitHash, revision) in revisions.items()),
+                "params": dict(
+                    (name, sorted(values, key=lambda v:
+                                  "[none]" if v is None else str(v)))
+                    for (name, values) in params.items()),
+                "graph_param_list": graphParamList,
+                "benchmarks": benchmarks,
+                "machines": dict((name, mEntry["machine"]) for (name, mEntry)
+                                 in catalog["machines"].items()),
+                "tags": {},
+                "pages": publish.pages,
+                }
+
+
+    def __loadHtmlFile(self, htmlStorage, key):
+        """
+        Return the parsed contents of the JSON file at key in htmlStorage, or
+        None if it does not exist.
+        """
+        data = htmlStorage.read(key)
+        if data is None:
+            return None
+        return self.jsonCodec.loads(data)
+
+
+    def __writeHtmlFile(self, htmlStorage, key, contents):
+        """
+        Write contents as JSON to key in htmlStorage, or remove the file if
+        contents is empty. Return True if the file changed.
+        """
+        if not(contents):
+            existed = htmlStorage.read(key) is not None
+            htmlStorage.delete(key)
+            return existed
+        return htmlStorage.writeIfChanged(
+            key, self.jsonCodec.dumps(contents, compact=True)) is not None
+
+
+    def __getConfArgs(self):
+        """
+        Return a dictionary of the CTOR args used to update the conf file, for
+        writing results elsewhere (a journal file or an ingestion daemon).
+        """
+        return {"repo": self.repo, "branches": self.branches,
+                "projectName": self.projectName, "commitUrl": self.commitUrl}
+
+
+    def __getJournal(self):
+        return Journal(self.storage, self.jsonCodec, self.__journalWriter,
+                       self.journalDirName, self.journalOffsetsFileName,
+                       self.journalSegmentMaxAge)
+
+
+    def __getJournalResults(self):
+        """
+        Return the results in journal files that have not been compacted, see
+        Journal.getResults().
+        """
+        return self.__getJournal().getResults(self.__getResultsFileKey)
+
+
+    def __loadBenchmarksDictForJournal(self, journalResults):
+        """
+        Return the contents of benchmarks.json, which may not exist yet if all
+        results are in journal files (journalResults is not empty, or None if
+        the journal files are not being read).
+        """
+        try:
+            return self.__loadBenchmarksDict()
+        except FileNotFoundError:
+            if journalResults == {}:
+                raise
+            return {}
+
+
+    def __getChangeFeed(self):
+        return ChangeFeed(self.storage, self.jsonCodec, self.changeFeedDirName,
+                          self.changeFeedHeadFileName,
+                          self.changeFeedSegmentSize,
+                          self.changeFeedMaxSegments, self.changeFeedMaxAge)
+
+
+    def __compactJournal(self):
+        """
+        Fold the results in all journal files not yet compacted into the ASV
+        files, see compactJournal().
+        """
+        records = self.__getJournal().compact(self.__writeJournalRecords)
+        return sum(len(benchmarkResults)
+                   for (_, resultTupleList) in records
+                   for (_, benchmarkResults) in resultTupleList)
+
+
+    def __writeJournalRecords(self, records):
+        """
+        Write the results in records, a list of (confArgs, resultTupleList)
+        records read from journal files, to the ASV files.
+        """
+        resultTupleList = []
+        for (confArgs, recordResultTuples) in records:
+            # Journal files may have been written by instances with different
+            # CTOR args, which are only used if not set for this instance.
+            for name in ["repo", "projectName", "commitUrl"]:
+                if (getattr(self, name) is None) and confArgs.get(name):
+                    setattr(self, name, confArgs[name])
+            self.branches = (self.branches or []) \
+                + [b for b in (confArgs.get("branches") or [])
+                   if b not in (self.branches or [])]
+            resultTupleList += recordResultTuples
+
+        if resultTupleList:
+            self.__updateFilesForResultTuples(resultTupleList)
+
+
+    def __pruneFiles(self, predicate):
+        """
+        Remove the results for which predicate returns True from the results
+        files, then compact benchmarks.json. See prune().
+        """
+        bDict = self.__loadBenchmarksDict()
+        # {funcName: [set of values used for each param]} for all remaining
+        # results.
+        usedParamValues = {}
+        numRemoved = 0
+
+        for (machineName, machineFileKeys) in self.__getMachineFileKeys().items():
+            machineJsonFile = self.__getMachineFileKey(machineName)
+            if machineJsonFile not in machineFileKeys:
+                continue
+            mDict = self.__loadJsonDictFromFile(machineJsonFile)
+
+            numResultsFiles = 0
+            numDeleted = 0
+            for resultsFile in machineFileKeys:
+                if resultsFile == machineJsonFile:
+                    continue
+                rDict = self.__loadJsonDictFromFile(resultsFile)
+                bi = self.__createBenchmarkInfo(mDict, rDict)
+                results = self.__createBenchmarkResults(bDict, rDict,
+                                                        resultsFile)
+                keptResults = [r for r in results if not(predicate(bi, r))]
+
+                # Files are only rewritten if results were removed from them.
+                if len(keptResults) < len(results):
+                    numRemoved += len(results) - len(keptResults)
+                    if not(keptResults):
+                        self.storage.delete(resultsFile)
+                        numDeleted += 1
+                        continue
+                    rDict["results"] = self.__getCompactedResultsDict(
+                        bDict, rDict["results"], keptResults)
+                    self.__writeJsonDictToFile(rDict, resultsFile)
+
+                numResultsFiles += 1
+                for (funcName, resultDict) in rDict.get("results", {}).items():
+                    valueSets = usedParamValues.setdefault(funcName, [])
+                    for (i, values) in enumerate(resultDict.get("params", [])):
+                        if i == len(valueSets):
+                            valueSets.append(set())
+                        valueSets[i].update(values)
+
+            # Remove machine dirs that no longer have any results.
+            if numDeleted and not(numResultsFiles):
+                self.storage.delete(machineJsonFile)
+
+        if numRemoved:
+            self.__compactBenchmarkJson(bDict, usedParamValues)
+        return numRemoved
+
+
+    def __getCompactedResultsDict(self, bDict, allResultsDict, keptResults):
+        """
+        Return a new "results" dict for a results file with the existing
+        allResultsDict, containing only keptResults. The params lists only
+        contain values used by keptResults, in their existing order.
+        """
+        # Benchmarks that are not in benchmarks.json were never read and are
+        # left as-is.
+        newResultsDict = dict((funcName, resultDict) for (funcName, resultDict)
+                              in allResultsDict.items()
+                              if funcName not in bDict)
+
+        resultsByFuncName = {}
+        for benchmarkResult in keptResults:
+            resultsByFuncName.setdefault(benchmarkResult.funcName, []) \
+                             .append(benchmarkResult)
+
+        for (funcName, funcResults) in resultsByFuncName.items():
+            # None results are usually placeholders for combinations of param
+            # values that were never run, so only keep them if there are no
+            # actual results.
+            funcResults = [r for r in funcResults if r.result is not None] \
+                or funcResults
+            resultDict = {}
+            self.__updateResultDict(resultDict, funcResults)
+            newResultsDict[funcName] = resultDict
+
+        return newResultsDict
+
+
+    def __compactBenchmarkJson(self, bDict, usedParamValues):
+        """
+        Write benchmarks.json with only the benchmarks and param values in
+        usedParamValues.
+        """
+        newBDict = {}
+        for (funcName, benchDict) in bDict.items():
+            if not(isinstance(benchDict, dict)):
+                # eg. "version"
+                newBDict[funcName] = benchDict
+                continue
+            if funcName not in usedParamValues:
+                continue
+            benchDict["params"] = [
+                [v for v in values if v in valueSet] for (values, valueSet)
+                in zip(benchDict.get("params", []), usedParamValues[funcName])]
+            newBDict[funcName] = benchDict
+
+        self.__writeJsonDictToFile(newBDict, self.__getBenchmarksFileKey())
 
 
     def __assertDbDirExists(self):
-        # FIXME: update for support S3 - this method should return True if
-        # self.dbDir is a valid S3 URL or a valid path on disk.
-        if self.__isS3URL(self.dbDir):
-            self.s3Resource.Bucket(self.bucketName).objects
-        else:
-            if not(path.isdir(self.dbDir)):
-                raise FileNotFoundError(f"{self.dbDir} does not exist or is "
-                                        "not a directory")
+        if not(self.storage.exists()):
+            raise FileNotFoundError(f"{self.dbDir} does not exist or is "
+                                    "not a directory")
 
 
     def __ensureDbDirExists(self):
-        # FIXME: for S3 support, if self.dbDir is a S3 URL then simply check if
-        # it's valid and exists, but don't try to create it (raise an exception
-        # if it does not exist).  For a local file path, create it if it does
-        # not exist, like already being done below.
-        if self.__isS3URL(self.dbDir):
-            self.s3Resource.Bucket(self.bucketName).objects
-        else:
-            if not(path.exists(self.dbDir)):
-                os.mkdir(self.dbDir)
-                # Hack: os.mkdir() seems to return before the filesystem catches up,
-                # so pause before returning to help ensure the dir actually exists
-                time.sleep(0.1)
+        # For a local file path, this creates the dir if it does not exist. S3
+        # buckets are never created, so this raises an exception if the bucket
+        # does not exist.
+        self.storage.create()
 
 
     def __updateConfFile(self):
@@ -514,7 +1917,7 @@ class ASVDb:
             raise AttributeError("repo must be set to non-None before "
                                  f"writing {self.confFilePath}")
 
-        d = self.__loadJsonDictFromFile(self.confFilePath)
+        d = self.__loadJsonDictFromFile(self.confFileName)
         # ASVDb is git-only for now, so ensure .git extension
         d["repo"] = self.repo + (".git" if not self.repo.endswith(".git") else "")
         currentBranches = d.get("branches", [])
@@ -526,10 +1929,10 @@ class ASVDb:
                                 + ("/" if not self.repo.endswith("/") else "") \
                                 + "commit/")
 
-        self.__writeJsonDictToFile(d, self.confFilePath)
+        self.__writeJsonDictToFile(d, self.confFileName)
 
 
-    def __updateBenchmarkJson(self, benchmarkResult):
+    def __updateBenchmarkJson(self, benchmarkResultList):
         # The following is an example of the schema ASV expects for
         # `benchmarks.json`.  If param names are A, B, and C
         #
@@ -558,51 +1961,61 @@ class ASVDb:
         #     }
         # }
 
-        newParamNames = []
-        newParamValues = []
-        for (n, v) in benchmarkResult.argNameValuePairs:
-            newParamNames.append(n)
-            newParamValues.append(v)
-
-        d = self.__loadJsonDictFromFile(self.benchmarksFilePath)
-
-        benchDict = d.setdefault(benchmarkResult.funcName,
-                                 self.__getDefaultBenchmarkDescrDict(
-                                     benchmarkResult.funcName, newParamNames))
-        benchDict["unit"] = benchmarkResult.unit
-
-        existingParamNames = benchDict["param_names"]
-        existingParamValues = benchDict["params"]
-
-        numExistingParams = len(existingParamNames)
-        numExistingParamValues = len(existingParamValues)
-        numNewParams = len(newParamNames)
-
-        # Check for the case where a result came in for the function, but it has
-        # a different number of args vs. what was saved previously
-        if numExistingParams != numNewParams:
-            raise ValueError("result for %s had %d params in benchmarks.json, "
-                             "but new result has %d params" \
-                             % (benchmarkResult.funcName, numExistingParams,
-                                numNewParams))
-        numParams = numNewParams
-
-        cartProd = list(itertools.product(*existingParamValues))
-        if tuple(newParamValues) not in cartProd:
-            if numExistingParamValues == 0:
+        benchmarksFileKey = self.__getBenchmarksFileKey()
+        d = self.__loadJsonDictFromFile(benchmarksFileKey)
+
+        # The existing param values for each benchmark are also kept in sets to
+        # avoid searching the lists for every new result.
+        paramValueSets = {}
+
+        for benchmarkResult in benchmarkResultList:
+            newParamNames = []
+            newParamValues = []
+            for (n, v) in benchmarkResult.argNameValuePairs:
+                newParamNames.append(n)
+                newParamValues.append(v)
+
+            benchDict = d.setdefault(benchmarkResult.funcName,
+                                     self.__getDefaultBenchmarkDescrDict(
+                                         benchmarkResult.funcName, newParamNames))
+            benchDict["unit"] = benchmarkResult.unit
+
+            existingParamNames = benchDict["param_names"]
+            existingParamValues = benchDict["params"]
+
+            numExistingParams = len(existingParamNames)
+            numNewParams = len(newParamNames)
+
+            # Check for the case where a result came in for the function, but it
+            # has a different number of args vs. what was saved previously
+            if numExistingParams != numNewParams:
+                raise ValueError("result for %s had %d params in benchmarks.json, "
+                                 "but new result has %d params" \
+                                 % (benchmarkResult.funcName, numExistingParams,
+                                    numNewParams))
+
+            valueSets = paramValueSets.setdefault(
+                benchmarkResult.funcName,
+                [set(values) for values in existingParamValues])
+
+            # Only add values that are not already present
+            if len(existingParamValues) == 0:
                 for newVal in newParamValues:
                     existingParamValues.append([newVal])
+                    valueSets.append(set([newVal]))
             else:
-                for i in range(numParams):
-                    if newParamValues[i] not in existingParamValues[i]:
-                        existingParamValues[i].append(newParamValues[i])
+                for (newVal, values, valueSet) in \
+                    zip(newParamValues, existingParamValues, valueSets):
+                    if newVal not in valueSet:
+                        values.append(newVal)
+                        valueSet.add(newVal)
 
-        d[benchmarkResult.funcName] = benchDict
+            d[benchmarkResult.funcName] = benchDict
 
-        # a version key must always be present in self.benchmarksFilePath,
-        # "current" ASV version requires this to be 2 (or higher?)
+        # a version key must always be present in benchmarks.json, "current"
+        # ASV version requires this to be 2 (or higher?)
         d["version"] = 2
-        self.__writeJsonDictToFile(d, self.benchmarksFilePath)
+        self.__writeJsonDictToFile(d, benchmarksFileKey)
 
 
     def __updateMachineJson(self, benchmarkInfo):
@@ -617,10 +2030,8 @@ class ASVDb:
         #     "version": 1,
         # }
 
-        machineFilePath = path.join(self.resultsDirPath,
-                                    benchmarkInfo.machineName,
-                                    self.machineFileName)
-        d = self.__loadJsonDictFromFile(machineFilePath)
+        machineFileKey = self.__getMachineFileKey(benchmarkInfo.machineName)
+        d = self.__loadJsonDictFromFile(machineFileKey)
         d["arch"] = benchmarkInfo.arch
         d["cpu"] = benchmarkInfo.cpuType
         d["gpu"] = benchmarkInfo.gpuType
@@ -630,10 +2041,11 @@ class ASVDb:
         d["ram"] = benchmarkInfo.ram
         d["gpuRam"] = benchmarkInfo.gpuRam
         d["version"] = 1
-        self.__writeJsonDictToFile(d, machineFilePath)
+        return (machineFileKey,
+                (d, self.__writeJsonDictToFile(d, machineFileKey)))
 
 
-    def __updateResultJson(self, benchmarkResult, benchmarkInfo):
+    def __updateResultJson(self, resultsFileKey, resultTupleList):
         # The following is an example of the schema ASV expects for
         # '<machine>-<commit_hash>.json'. If param names are A, B, and C
         #
@@ -671,19 +2083,45 @@ class ASVDb:
         #     "version": 1,
         # }
 
-        resultsFilePath = self.__getResultsFilePath(benchmarkInfo)
-        d = self.__loadJsonDictFromFile(resultsFilePath)
-        d["params"] = {"gpu": benchmarkInfo.gpuType,
-                       "cuda": benchmarkInfo.cudaVer,
-                       "machine": benchmarkInfo.machineName,
-                       "os": benchmarkInfo.osType,
-                       "python": benchmarkInfo.pythonVer,
-                       }
-        d["requirements"] = benchmarkInfo.requirements
+        d = self.__loadJsonDictFromFile(resultsFileKey)
+
+        for (benchmarkInfo, benchmarkResults) in resultTupleList:
+            d["params"] = {"gpu": benchmarkInfo.gpuType,
+                           "cuda": benchmarkInfo.cudaVer,
+                           "machine": benchmarkInfo.machineName,
+                           "os": benchmarkInfo.osType,
+                           "python": benchmarkInfo.pythonVer,
+                           }
+            d["requirements"] = benchmarkInfo.requirements
+
+            allResultsDict = d.setdefault("results", {})
+
+            # Group the new results by benchmark so each benchmark's results
+            # list is only recomputed once.
+            resultsByFuncName = {}
+            for benchmarkResult in benchmarkResults:
+                resultsByFuncName.setdefault(benchmarkResult.funcName, []) \
+                                 .append(benchmarkResult)
 
-        allResultsDict = d.setdefault("results", {})
-        resultDict = allResultsDict.setdefault(benchmarkResult.funcName, {})
+            for (funcName, funcResults) in resultsByFuncName.items():
+                resultDict = allResultsDict.setdefault(funcName, {})
+                self.__updateResultDict(resultDict, funcResults)
 
+            d["commit_hash"] = benchmarkInfo.commitHash
+            d["branch"] = benchmarkInfo.branch
+            d["date"] = int(benchmarkInfo.commitTime)
+            d["python"] = benchmarkInfo.pythonVer
+            d["version"] = 1
+
+        return (resultsFileKey,
+                (d, self.__writeJsonDictToFile(d, resultsFileKey)))
+
+
+    def __updateResultDict(self, resultDict, benchmarkResults):
+        """
+        Add the benchmarkResults, all for the same benchmark, to resultDict,
+        the entry for the benchmark in a results file.
+        """
         existingParamValuesList = resultDict.setdefault("params", [])
         existingResultValueList = resultDict.setdefault("result", [])
 
@@ -697,48 +2135,39 @@ class ASVDb:
 
         # store existing results in map based on cartesian product of all
         # current params.
-        paramsCartProd = list(itertools.product(*existingParamValuesList))
+        paramsCartProd = itertools.product(*existingParamValuesList)
         # Assume there is an equal number of results for cartProd values
         # (some will be None)
         paramsResultMap = dict(zip(paramsCartProd, existingResultValueList))
-
-        # FIXME: dont assume these are ordered properly (ie. the same way as
-        # defined in benchmarks.json)
-        newResultParamValues = tuple(v for (_, v) in benchmarkResult.argNameValuePairs)
-
-        # Update the "params" lists with the new param settings for the new result.
-        # Only add values that are not already present
-        numExistingParamValues = len(existingParamValuesList)
-        if numExistingParamValues == 0:
-            for newParamValue in newResultParamValues:
-                existingParamValuesList.append([newParamValue])
-            results = [benchmarkResult.result]
-
-        else:
-            for i in range(numExistingParamValues):
-                if newResultParamValues[i] not in existingParamValuesList[i]:
-                    existingParamValuesList[i].append(newResultParamValues[i])
+        valueSets = [set(values) for values in existingParamValuesList]
+
+        for benchmarkResult in benchmarkResults:
+            # FIXME: dont assume these are ordered properly (ie. the same way as
+            # defined in benchmarks.json)
+            newResultParamValues = tuple(v for (_, v) in benchmarkResult.argNameValuePairs)
+
+            # Update the "params" lists with the new param settings for the new
+            # result.  Only add values that are not already present
+            if len(existingParamValuesList) == 0:
+                for newParamValue in newResultParamValues:
+                    existingParamValuesList.append([newParamValue])
+                    valueSets.append(set([newParamValue]))
+            else:
+                for (newParamValue, values, valueSet) in \
+                    zip(newResultParamValues, existingParamValuesList, valueSets):
+                    if newParamValue not in valueSet:
+                        values.append(newParamValue)
+                        valueSet.add(newParamValue)
 
             # Add the new result
             paramsResultMap[newResultParamValues] = benchmarkResult.result
 
-            # Re-compute the cartesian product of all param values now that the
-            # new values are added. Use this to determine where to place the new
-            # result in the result list.
-            results = []
-            for paramVals in itertools.product(*existingParamValuesList):
-                results.append(paramsResultMap.get(paramVals))
-
+        # Re-compute the cartesian product of all param values now that the new
+        # values are added. Use this to determine where to place the new results
+        # in the result list.
         resultDict["params"] = existingParamValuesList
-        resultDict["result"] = results
-
-        d["commit_hash"] = benchmarkInfo.commitHash
-        d["branch"] = benchmarkInfo.branch
-        d["date"] = int(benchmarkInfo.commitTime)
-        d["python"] = benchmarkInfo.pythonVer
-        d["version"] = 1
-
-        self.__writeJsonDictToFile(d, resultsFilePath)
+        resultDict["result"] = [paramsResultMap.get(paramVals) for paramVals in
+                                itertools.product(*existingParamValuesList)]
 
 
     def __getDefaultBenchmarkDescrDict(self, funcName, paramNames):
@@ -753,7 +2182,7 @@ class ASVDb:
                 }
 
 
-    def __getResultsFilePath(self, benchmarkInfo):
+    def __getResultsFileKey(self, benchmarkInfo):
         # The path to the resultsFile will be based on additional params present
         # in the benchmarkInfo obj.
         fileNameParts = [benchmarkInfo.commitHash,
@@ -762,397 +2191,178 @@ class ASVDb:
                          benchmarkInfo.osType,
                         ]
         fileName = "-".join(fileNameParts) + ".json"
-        return path.join(self.resultsDirPath,
-                         benchmarkInfo.machineName,
-                         fileName)
-
-
-    def __loadJsonDictFromFile(self, jsonFile):
-        """
-        Return a dictionary representing the contents of jsonFile by
-        either reading in the existing file or returning {}
-        """
-        if path.exists(jsonFile):
-            with open(jsonFile) as fobj:
-                # FIXME: ideally this could use flock(), but some situations do
-                # not allow grabbing a file lock (NFS?)
-                # fcntl.flock(fobj, fcntl.LOCK_EX)
-                # FIXME: error checking
-                return json.load(fobj)
-
-        return {}
-
-
-    def __writeJsonDictToFile(self, jsonDict, filePath):
-        # FIXME: error checking
-        dirPath = path.dirname(filePath)
-        if not path.isdir(dirPath):
-            os.makedirs(dirPath)
+        return posixpath.join(self.resultsDirName,
+                              benchmarkInfo.machineName,
+                              fileName)
 
-        with open(filePath, "w") as fobj:
-            # FIXME: ideally this could use flock(), but some situations do not
-            # allow grabbing a file lock (NFS?)
-            # fcntl.flock(fobj, fcntl.LOCK_EX)
-            json.dump(jsonDict, fobj, indent=2)
 
+    def __getBenchmarksFileKey(self):
+        return posixpath.join(self.resultsDirName, self.benchmarksFileName)
 
-    ###########################################################################
-    # ASVDb private locking methods
-    ###########################################################################
-    def __getLock(self, dirPath):
-        if self.__isS3URL(dirPath):
-            self.__getS3Lock()
-        else:
-            self.__getLocalFileLock(dirPath)
-
-
-    def __getLocalFileLock(self, dirPath):
-        """
-        Gets a lock on dirPath against other ASVDb instances (in other
-        processes, possibily on other machines) using the following technique:
-
-        * Check for other locks and clear them if they've been seen for longer
-          than self.lockfileTimeout (do this to help cleanup after others that
-          may have died prematurely)
-
-        * Once all locks are clear - either by their owner because they
-          finished their read/write, or by removing them because they're
-          presumed dead - create a lock for this instance
-
-        * If a race condition was detected, probably because multiple ASVDbs
-          saw all locks were cleared at the same time and created their locks
-          at the same time, remove this lock, and wait a random amount of time
-          before trying again.  The random time prevents yet another race.
-        """
-        otherLockfileTimes = {}
-        thisLockfile = path.join(dirPath, self.lockfileName)
-        # FIXME: This shouldn't be needed? But if so, be smarter about
-        # preventing an infintite loop?
-        i = 0
-        while i < 1000:
-            # Keep checking for other locks to clear
-            self.__updateOtherLockfileTimes(dirPath, otherLockfileTimes)
-            # FIXME: potential infintite loop due to starvation?
-            otherLocks = list(otherLockfileTimes.keys())
-            while otherLocks:
-                if self.debugPrint:
-                    print(f"This lock file will be {thisLockfile} but other "
-                          f"locks present: {otherLocks}, waiting to try to "
-                          "lock again...")
-                time.sleep(0.2)
-                self.__updateOtherLockfileTimes(dirPath, otherLockfileTimes)
-                otherLocks = list(otherLockfileTimes.keys())
-
-            # All clear, create lock
-            if self.debugPrint:
-                print(f"All clear, setting lock {thisLockfile}")
-            self.__createLockfile(dirPath)
-
-            # Check for a race condition where another lock could have been created
-            # while creating the lock for this instance.
-            self.__updateOtherLockfileTimes(dirPath, otherLockfileTimes)
-
-            # If another lock snuck in while this instance was creating its
-            # lock, remove this lock and wait a random amount of time before
-            # trying again (random time to prevent another race condition with
-            # the competing instance, this way someone will clearly get there
-            # first)
-            if otherLockfileTimes:
-                self.__releaseLock(dirPath)
-                randTime = (int(5 * random.random()) + 1) + random.random()
-                if self.debugPrint:
-                    print(f"Collision - waiting {randTime} seconds before "
-                          "trying to lock again.")
-                time.sleep(randTime)
-            else:
-                break
-
-            i += 1
 
+    def __getMachineFileKey(self, machineName):
+        return posixpath.join(self.resultsDirName, machineName,
+                              self.machineFileName)
 
-    def __releaseLock(self, dirPath):
-        if self.__isS3URL(dirPath):
-            self.__releaseS3Lock()
-        else:
-            self.__releaseLocalFileLock(dirPath)
-
-
-    def __releaseLocalFileLock(self, dirPath):
-        thisLockfile = path.join(dirPath, self.lockfileName)
-        if self.debugPrint:
-            print(f"Removing lock {thisLockfile}")
-        self.__removeFiles([thisLockfile])
 
-
-    def __updateOtherLockfileTimes(self, dirPath, lockfileTimes):
+    def __getMachineFileKeys(self, keys=None):
         """
-        Return a list of lockfiles that have "timed out", probably because their
-        process was killed. This will never include the lockfile for this
-        instance.  Update the lockfileTimes dict as a side effect with the
-        discovery time of any new lockfiles and remove any lockfiles that are no
-        longer present.
+        Return a dictionary of {machine name: [keys of the JSON files in that
+        machine dir]} for all machine dirs in the results dir. keys is the list
+        of all files in the results dir, and is read from storage if None.
         """
-        thisLockfile = path.join(dirPath, self.lockfileName)
-        now = time.time()
-        expired = []
-
-        allLockfiles = glob.glob(path.join(dirPath, self.lockfilePrefix) + "*")
-
-        if self.debugPrint:
-            print(f"   This lockfile is {thisLockfile}, allLockfiles is "
-                  f"{allLockfiles}, lockfileTimes is {lockfileTimes}")
-        # Remove lockfiles from the lockfileTimes dict that are no longer
-        # present on disk
-        lockfilesToRemove = set(lockfileTimes.keys()) - set(allLockfiles)
-        for removedLockfile in lockfilesToRemove:
-            lockfileTimes.pop(removedLockfile)
+        if keys is None:
+            keys = self.storage.listFiles(self.resultsDirName)
+        return getMachineFileKeys(self.resultsDirName, keys)
 
-        # check for expired lockfiles while also setting the discovery time on
-        # new lockfiles in the lockfileTimes dict.
-        for lockfile in allLockfiles:
-            if lockfile == thisLockfile:
-                continue
-            if (now - lockfileTimes.setdefault(lockfile, now)) > \
-               self.lockfileTimeout:
-                expired.append(lockfile)
-
-        if self.debugPrint:
-            print(f"   This lockfile is {thisLockfile}, lockfileTimes is "
-                  f"{lockfileTimes}, now is {now}, expired is {expired}")
-        self.__removeFiles(expired)
 
-
-    def __createLockfile(self, dirPath):
+    def __loadJsonDictFromFile(self, jsonFileKey):
         """
-        low-level lockfile creation - consider calling __getLock() instead.
+        Return a dictionary representing the contents of jsonFileKey by
+        either reading in the existing file or returning {}
         """
-        thisLockfile = path.join(dirPath, self.lockfileName)
-        open(thisLockfile, "w").close()
-        # Make the lockfile read/write to all so others can remove it if this
-        # process dies prematurely
-        os.chmod(thisLockfile, (stat.S_IRUSR | stat.S_IWUSR
-                                | stat.S_IRGRP | stat.S_IWGRP
-                                | stat.S_IROTH | stat.S_IWOTH))
+        data = self.storage.read(jsonFileKey)
+        if data is not None:
+            # FIXME: error checking
+            return self.jsonCodec.loads(data)
 
+        return {}
 
-    ###########################################################################
-    # S3 Locking methods
-    ###########################################################################
-    def __getS3Lock(self):
-        thisLockfile = path.join(self.bucketKey, self.lockfileName)
-        # FIXME: This shouldn't be needed? But if so, be smarter about
-        # preventing an infintite loop?
-        i = 0
-
-        # otherLockfileTimes is a tuple representing (<List of lockfiles>, <Length of List>)
-        otherLockfileTimes = ([], 0)
-        while i < 1000:
-            otherLockfileTimes = self.__updateS3LockfileTimes()
-            debugCounter = 0
-
-            while otherLockfileTimes[1] != 0:
-                if self.debugPrint:
-                    lockfileList = []
-                    for each in otherLockfileTimes[0]:
-                        lockfileList.append(each.key)
-
-                    print(f"This lock file will be {thisLockfile} but other "
-                          f"locks present: {lockfileList}, waiting to try to "
-                          "lock again...")
-
-                time.sleep(1)
-                otherLockfileTimes = self.__updateS3LockfileTimes()
-
-            # All clear, create lock
-            if self.debugPrint:
-                print(f"All clear, setting lock {thisLockfile}")
-            self.s3Resource.Object(self.bucketName, thisLockfile).put()
-
-            #Give S3 time to see the new lock
-            time.sleep(1)
-
-            # Check for a race condition where another lock could have been created
-            # while creating the lock for this instance.
-            otherLockfileTimes = self.__updateS3LockfileTimes()
-
-            if otherLockfileTimes[1] != 0:
-                self.__releaseS3Lock()
-                randTime = (int(30 * random.random()) + 5) + random.random()
-                if self.debugPrint:
-                    print(f"Collision - waiting {randTime} seconds before "
-                          "trying to lock again.")
-                time.sleep(randTime)
-            else:
-                break
-
-            i += 1
-
-
-    def __updateS3LockfileTimes(self):
-        # Find lockfiles in S3 Bucket
-        response = self.s3Resource.Bucket(self.bucketName).objects \
-            .filter(Prefix=path.join(self.bucketKey, self.lockfilePrefix))
-
-        length = 0
-        for lockfile in response:
-            length += 1
-            if self.lockfileName in lockfile.key:
-                lockfile.delete()
-                length -= 1
 
-        return (response, length)
+    def __readResultsFile(self, resultsFileKey, version):
+        """
+        Return a tuple of (parsed contents, or None, unparsed contents, or None,
+        version) for the results file resultsFileKey, which is passed to
+        __parseResultsFile(). The contents last parsed by any instance in this
+        process are returned (and must not be modified) if they were parsed
+        from version of the file, the version in the catalog. If version is
+        None (not in the catalog), the file is read first to get its version,
+        but still not parsed again if unchanged. This only reads the file, so
+        the lock can be released before parsing it.
+        """
+        cacheKey = (self.storage.getRootURL(), resultsFileKey)
+        data = None
+        if version is None:
+            (data, version) = self.storage.readWithVersion(resultsFileKey)
+            if data is None:
+                return (None, None, None)
+        rDict = self.parsedFileCache.get(cacheKey, version)
+        if rDict is not None:
+            return (rDict, None, version)
+        if data is None:
+            (data, version) = self.storage.readWithVersion(resultsFileKey)
+        return (None, data, version)
+
+
+    def __parseResultsFile(self, resultsFileKey, fileContents):
+        """
+        Return the contents of the results file resultsFileKey, from the tuple
+        returned by __readResultsFile(), or {} if it does not exist. The
+        contents parsed are cached for other reads of the same version.
+        """
+        (rDict, data, version) = fileContents
+        if (rDict is None) and (data is not None):
+            rDict = self.jsonCodec.loads(data)
+            self.parsedFileCache.put(
+                (self.storage.getRootURL(), resultsFileKey), version, rDict)
+        return rDict or {}
 
 
-    def __releaseS3Lock(self):
-        thisLockfile = path.join(self.bucketKey, self.lockfileName)
-        if self.debugPrint:
-            print(f"Removing lock {thisLockfile}")
-        self.s3Resource.Object(self.bucketName, thisLockfile).delete()
+    def __writeJsonDictToFile(self, jsonDict, fileKey):
+        """
+        Write jsonDict to fileKey, and return the new version of the file, or
+        None if its contents did not change.
+        """
+        # FIXME: error checking
+        # Files are often rewritten with the same contents (eg. machine.json
+        # for every result added), which are skipped.
+        return self.storage.writeIfChanged(
+            fileKey, self.jsonCodec.dumps(jsonDict, self.compactJson))
 
 
     ###########################################################################
-    # S3 utilities
+    # ASVDb private locking methods
     ###########################################################################
-    def __downloadIfS3(self, bInfo=BenchmarkInfo(), results=False):
-        def downloadS3(bucket, ext):
-            bucket.download_file(
-                path.join(self.bucketKey, ext),
-                path.join(self.localS3Copy.name, ext)
-            )
-
-        if not self.__isS3URL(self.dbDir):
+    def __addResultTuples(self, resultTupleList, lockfileName):
+        """
+        Add the results in resultTupleList to the DB, see addResultTuples().
+        lockfileName is used to get the lock, so the background writer thread
+        can use a different one than the thread(s) using this instance.
+        """
+        if self.ingestSocket is not None:
+            self.__getIngestClient().addResultTuples(
+                self.dbDir, self.__getConfArgs(), resultTupleList)
+            return
+        if self.journaled:
+            self.__ensureDbDirExists()
+            self.__getJournal().append(resultTupleList, self.__getConfArgs())
             return
 
-        self.localS3Copy = tempfile.TemporaryDirectory()
-        os.makedirs(path.join(self.localS3Copy.name, self.defaultResultsDirName))
-        bucket = self.s3Resource.Bucket(self.bucketName)
-        # If results isn't set, only download key files, else download key files and results
-        if results == False:
-            keyFileExts = [self.confFileExt, self.machineFileExt, self.benchmarksFileExt]
-            # Use Try/Except to catch file Not Found errors and continue, avoids additional API calls
-            for fileExt in keyFileExts:
-                try:
-                    downloadS3(bucket, fileExt)
-                except exceptions.ClientError as e:
-                    err = "Not Found"
-                    if err not in e.response["Error"]["Message"]:
-                        raise
-
-            # Download specific result file for updating results if BenchmarkInfo is sent
-            try:
-                if bInfo.machineName != "":
-                    commitHash, pyVer, cuVer, osType = bInfo.commitHash, bInfo.pythonVer, bInfo.cudaVer, bInfo.osType
-                    filename = f"{commitHash}-python{pyVer}-cuda{cuVer}-{osType}.json"
-                    os.makedirs(path.join(self.localS3Copy.name, self.defaultResultsDirName, bInfo.machineName), exist_ok=True)
-                    resultFileExt = path.join(self.defaultResultsDirName, bInfo.machineName, filename)
-                    downloadS3(bucket, resultFileExt)
-
-            except exceptions.ClientError as e:
-                err = "Not Found"
-                if err not in e.response["Error"]["Message"]:
-                    raise
-
-        else:
-            try:
-                downloadS3(bucket, self.confFileExt)
-            except exceptions.ClientError as e:
-                err = "Not Found"
-                if err not in e.response["Error"]["Message"]:
-                    raise
-
-            try:
-                resultsBucketPath = path.join(self.bucketKey, self.defaultResultsDirName)
-                resultsLocalPath = path.join(self.localS3Copy.name, self.defaultResultsDirName)
-
-                # Loop over ASV results folder and download everything.
-                # objectExt represents the file extension starting from the base resultsBucketPath
-                # For example: resultsBucketPath = "asvdb/results"
-                #            : objectKey = "asvdb/results/machine_name/results.json
-                #            : objectExt = "machine_name/results.json"
-                for bucketObj in bucket.objects.filter(Prefix=resultsBucketPath):
-                    objectExt = bucketObj.key.replace(resultsBucketPath + "/", "")
-                    if len(objectExt.split("/")) > 1:
-                        os.makedirs(path.join(resultsLocalPath, objectExt.split("/")[0]), exist_ok=True)
-                    bucket.download_file(bucketObj.key, path.join(resultsLocalPath, objectExt))
-
-            except exceptions.ClientError as e:
-                err = "Not Found"
-                if err not in e.response["Error"]["Message"]:
-                    raise e
-
-        # Set all the internal locations to point to the downloaded files:
-        self.confFilePath = path.join(self.localS3Copy.name, self.confFileName)
-        self.resultsDirPath = path.join(self.localS3Copy.name, self.resultsDirName)
-        self.benchmarksFilePath = path.join(self.resultsDirPath, self.benchmarksFileName)
+        self.__ensureDbDirExists()
+        try:
+            self.__getLock(lockfileName)
+            if self.__waitForWrite():
+                self.__updateFilesForResultTuples(resultTupleList)
 
+        finally:
+            self.__releaseLock(lockfileName)
 
-    def __uploadIfS3(self):
-        def recursiveUpload(base, ext=""):
-            root, dirs, files = next(os.walk(path.join(base, ext), topdown=True))
 
-            # Upload files in this folder
-            for name in files:
-                self.s3Resource.Bucket(self.bucketName) \
-                    .upload_file(path.join(base, ext, name), path.join(self.bucketKey, ext, name))
+    def __getAsyncWriter(self):
+        with self.__asyncWriterLock:
+            if self.__asyncWriter is None:
+                lockfileName = self.lockfileName + "-async"
+                self.__asyncWriter = BatchWriter(
+                    lambda items: self.__addResultTuples(
+                        [resultTuple for item in items
+                         for resultTuple in item], lockfileName),
+                    maxDelay=self.asyncMaxDelay,
+                    maxBatchSize=self.asyncMaxBatchSize,
+                    getSize=lambda item: sum(len(benchmarkResults)
+                                             for (_, benchmarkResults)
+                                             in item))
+            return self.__asyncWriter
 
-            # Call upload again for each folder
-            if len(dirs) != 0:
-                for folder in dirs:
-                    ext = path.join(ext, folder)
-                    recursiveUpload(base, ext)
 
-        if self.__isS3URL(self.dbDir):
-            recursiveUpload(self.localS3Copy.name)
-            # Give S3 time to see the new uploads before releasing lock
-            time.sleep(1)
+    def __getIngestClient(self):
+        with self.__ingestClientLock:
+            if self.__ingestClient is None:
+                from .ingest import IngestClient
+                self.__ingestClient = IngestClient(self.ingestSocket)
+            return self.__ingestClient
 
 
-    def __removeLocalS3Copy(self):
-        if not self.__isS3URL(self.dbDir):
-            return
+    def __getLock(self, lockfileName=None):
+        self.storage.acquireLock(lockfileName or self.lockfileName,
+                                 self.lockfileTimeout, self.debugPrint)
 
-        self.localS3Copy.cleanup()
-        self.localS3Copy = None
 
-        self.confFilePath = path.join(self.dbDir, self.confFileName)
-        self.resultsDirPath = path.join(self.dbDir, self.resultsDirName)
-        self.benchmarksFilePath = path.join(self.resultsDirPath, self.benchmarksFileName)
+    def __releaseLock(self, lockfileName=None):
+        self.storage.releaseLock(lockfileName or self.lockfileName,
+                                 self.debugPrint)
 
 
     ###########################################################################
-    def __removeFiles(self, fileList):
-        for f in fileList:
-            try:
-                os.remove(f)
-            except FileNotFoundError:
-                pass
-
-
-    def __isS3URL(self, url):
-        """
-        Returns True if url is a S3 URL, False otherwise.
-        """
-        if url.startswith("s3:"):
-            return True
-
-        return False
-
-
     def __waitForWrite(self):
         """
         Testing helper: pause for self.writeDelay seconds, or until
-        self.cancelWrite turns True. Always set self.cancelWrite back to False
-        so future writes can take place by default.
+        self.cancelWrite is set to True. Only the writes delayed when
+        cancelWrite is set are cancelled (or the next one, if none are), so
+        future writes, and writes in other threads, take place by default.
 
         Return True to indicate a write operation should take place, False to
         cancel the write operation, based on if the write was cancelled or not.
         """
-        if not(self.cancelWrite):
-            st = now = time.time()
-            while ((now - st) < self.writeDelay) and not(self.cancelWrite):
-                time.sleep(0.01)
-                now = time.time()
-
-        retVal = not(self.cancelWrite)
-        self.cancelWrite = False
-        return retVal
+        with self.__delayedWritesLock:
+            if self.__pendingCancelWrite:
+                self.__pendingCancelWrite = False
+                return False
+            if not(self.writeDelay):
+                return True
+            cancelEvent = threading.Event()
+            self.__delayedWrites.add(cancelEvent)
+
+        cancelled = cancelEvent.wait(self.writeDelay)
+        with self.__delayedWritesLock:
+            self.__delayedWrites.discard(cancelEvent)
+        return not(cancelled)
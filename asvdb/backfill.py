@@ -0,0 +1,47 @@
+"""
+Adds results for many historical commits at once, eg. when benchmarking the
+past history of a project.
+
+The commit hashes, times and branches are resolved in bulk by
+asvdb.utils.iterCommitInfos() or getCommitInfos(), and the results for many
+commits are added to the db in batches, so neither a git command nor a locked
+write of the db is needed per commit:
+
+    commitInfos = utils.iterCommitInfos("v1.0..main", repoDir="/path/to/repo")
+    backfill(db, commitInfos, runBenchmarks, benchmarkInfo)
+"""
+import copy
+
+
+def backfill(db, commitInfos, getResultsFunc, benchmarkInfo, batchSize=100):
+    """
+    Add results to db for each (commit hash, commit time, branch) tuple in
+    commitInfos, as generated by asvdb.utils.iterCommitInfos() (or the values
+    of the dictionary returned by getCommitInfos()).
+
+    getResultsFunc(commitHash) returns the list of BenchmarkResult objs for a
+    commit, or None (or []) to skip the commit. The results are added with a
+    copy of benchmarkInfo with the commit hash, time and branch of the commit
+    (the branch of benchmarkInfo is used if the commit's branch is empty).
+    Results are added for batchSize commits at a time, with a single
+    db.addResultTuples() call per batch. Return the number of results added.
+    """
+    numAdded = 0
+    batch = []
+    for (commitHash, commitTime, branch) in commitInfos:
+        results = getResultsFunc(commitHash)
+        if not(results):
+            continue
+        commitBenchmarkInfo = copy.copy(benchmarkInfo)
+        commitBenchmarkInfo.commitHash = commitHash
+        commitBenchmarkInfo.commitTime = int(commitTime)
+        commitBenchmarkInfo.branch = branch or benchmarkInfo.branch
+        batch.append((commitBenchmarkInfo, results))
+        numAdded += len(results)
+        if len(batch) >= batchSize:
+            db.addResultTuples(batch)
+            batch = []
+
+    if batch:
+        db.addResultTuples(batch)
+    return numAdded
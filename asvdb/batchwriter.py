@@ -0,0 +1,185 @@
+"""
+A background writer thread that coalesces items submitted by many callers into
+batches, so the cost of a write (taking the db lock, rewriting each file) is
+paid once per batch instead of once per item.
+"""
+import atexit
+from concurrent.futures import Future
+import queue
+import threading
+import time
+import weakref
+
+# Queue entries used to tell the writer thread to write the current batch
+# immediately, or to write it and exit.
+_flushMarker = object()
+_stopMarker = object()
+
+# Writers with a running writer thread, closed at exit so items are not lost if
+# the process exits without close() being called. Writers are only referenced
+# weakly, so writers that are no longer used can be garbage collected.
+_openWriters = weakref.WeakSet()
+_openWritersLock = threading.Lock()
+
+
+@atexit.register
+def _closeOpenWriters():
+    with _openWritersLock:
+        writers = list(_openWriters)
+    for writer in writers:
+        writer.close()
+
+
+class BatchWriter:
+    """
+    Calls writeFunc(items), with items being a list of submitted items, from a
+    background thread. A batch is written once maxDelay seconds have passed
+    since its first item was submitted, once the total size of its items (using
+    getSize(item)) reaches maxBatchSize, or when flush() or close() is called.
+    writeFunc can return a list of the exception (or None) for each item, to
+    only fail some of the items of a batch.
+    The writer thread exits once no items have been submitted for maxIdleTime
+    seconds (so it does not keep the writer alive), and is restarted by the
+    next submit().
+    """
+    def __init__(self, writeFunc, maxDelay=0.05, maxBatchSize=10000,
+                 getSize=None, maxIdleTime=10):
+        self.writeFunc = writeFunc
+        self.maxDelay = maxDelay
+        self.maxBatchSize = maxBatchSize
+        self.getSize = getSize or (lambda item: 1)
+        self.maxIdleTime = maxIdleTime
+
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__closed = False
+
+
+    def submit(self, item):
+        """
+        Queue item to be written, and return a concurrent.futures.Future whose
+        result is set to None once item has been written, or to the exception
+        raised by writeFunc if writing its batch failed.
+        """
+        future = Future()
+        with self.__lock:
+            if self.__closed:
+                raise RuntimeError("Cannot submit to a closed BatchWriter")
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run,
+                                                 daemon=True)
+                self.__thread.start()
+                with _openWritersLock:
+                    _openWriters.add(self)
+            self.__queue.put((item, future))
+        return future
+
+
+    def flush(self):
+        """
+        Write all items submitted so far, and wait for them to be written.
+        Errors are reported through the futures returned by submit(), not
+        raised here.
+        """
+        with self.__lock:
+            # After close() the writer thread has been told to write all
+            # remaining items and exit, so there is nothing to flush.
+            if (self.__thread is None) or self.__closed:
+                return
+            future = Future()
+            self.__queue.put((_flushMarker, future))
+        future.result()
+
+
+    def close(self):
+        """
+        Write all items submitted so far and stop the writer thread. No items
+        can be submitted after this.
+        """
+        with self.__lock:
+            if self.__closed:
+                return
+            self.__closed = True
+            thread = self.__thread
+            if thread is not None:
+                self.__queue.put((_stopMarker, None))
+        if thread is not None:
+            thread.join()
+        with _openWritersLock:
+            _openWriters.discard(self)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def __run(self):
+        """
+        Writer thread loop.
+        """
+        while True:
+            try:
+                (item, future) = self.__queue.get(timeout=self.maxIdleTime)
+            except queue.Empty:
+                # Items are only queued while holding the lock and with a
+                # writer thread, so none can be lost once this thread is gone.
+                with self.__lock:
+                    if self.__queue.empty():
+                        self.__thread = None
+                        with _openWritersLock:
+                            _openWriters.discard(self)
+                        return
+                continue
+            batch = []
+            batchSize = 0
+            flushFutures = []
+            stop = False
+            deadline = time.monotonic() + self.maxDelay
+            while True:
+                if item is _stopMarker:
+                    stop = True
+                    break
+                if item is _flushMarker:
+                    flushFutures.append(future)
+                    break
+                batch.append((item, future))
+                batchSize += self.getSize(item)
+                if batchSize >= self.maxBatchSize:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    (item, future) = self.__queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            self.__writeBatch(batch)
+            for future in flushFutures:
+                future.set_result(None)
+            if stop:
+                return
+
+
+    def __writeBatch(self, batch):
+        # Items whose futures were cancelled are not written.
+        batch = [(item, future) for (item, future) in batch
+                 if future.set_running_or_notify_cancel()]
+        if not(batch):
+            return
+        try:
+            errors = self.writeFunc([item for (item, _) in batch])
+        except Exception as e:
+            errors = [e] * len(batch)
+        if not(isinstance(errors, list)):
+            errors = [None] * len(batch)
+        for ((_, future), error) in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
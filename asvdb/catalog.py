@@ -0,0 +1,263 @@
+"""
+The catalog of the results dir of an asvdb, used by ASVDb to read results
+without parsing every machine.json and results file.
+
+The catalog is a single JSON file in the results dir (.asvdb-index.json by
+default) containing:
+    {"version": <catalog format version>,
+     "machines": {<machine name>:
+                      {"machine": <machine.json contents>,
+                       "version": <machine.json version>,
+                       "files": {<results file name>: <entry>, ...}},
+                  ...}}
+where each entry has the keys of the results file needed to create its
+BenchmarkInfo obj ("commit_hash", "date", "branch", "params", "requirements"),
+the names of the benchmarks in the file ("benchmarks"), and the version of the
+file reported by the storage backend ("version").
+
+Writers update the entries of the files they write. Readers compare the
+versions in the catalog with a listing of the results dir, and only read the
+files that changed. The catalog is always written with conditionalWrite(), so
+an update by a writer not holding the lock (eg. with S3, where the lock is not
+atomic) is never overwritten.
+"""
+import posixpath
+
+
+def getMachineFileKeys(resultsDirName, keys):
+    """
+    Return a dictionary of {machine name: [keys of the JSON files in that
+    machine dir]} for all machine dirs in keys, the list of all files in the
+    results dir resultsDirName.
+    """
+    machineFileKeys = {}
+    for key in keys:
+        parts = key[len(resultsDirName) + 1:].split("/")
+        # Only files directly within a machine dir are of interest. Hidden
+        # files are never ASV files.
+        if (len(parts) != 2) or parts[1].startswith(".") \
+           or not(parts[1].endswith(".json")):
+            continue
+        machineFileKeys.setdefault(parts[0], []).append(key)
+    return machineFileKeys
+
+
+def getCatalogEntry(rDict, version):
+    """
+    Return the catalog entry for the results file contents rDict, which has
+    the same keys as rDict used to create its BenchmarkInfo obj, the names of
+    the benchmarks in the file, and the version of the file.
+    """
+    return {"commit_hash": rDict.get("commit_hash", ""),
+            "date": rDict.get("date", ""),
+            "branch": rDict.get("branch", ""),
+            "params": rDict.get("params", {}),
+            "requirements": rDict.get("requirements", {}),
+            "benchmarks": sorted(rDict.get("results", {})),
+            "version": version,
+            }
+
+
+class Catalog:
+    """
+    The catalog file fileName, in format version, for the results dir
+    resultsDirName in storage (a StorageBackend). machineFileName is the name
+    of the machine.json file in each machine dir.
+    """
+    def __init__(self, storage, jsonCodec, resultsDirName, machineFileName,
+                 fileName, version, debugPrint=False):
+        self.storage = storage
+        self.jsonCodec = jsonCodec
+        self.resultsDirName = resultsDirName
+        self.machineFileName = machineFileName
+        self.key = posixpath.join(resultsDirName, fileName)
+        self.version = version
+        self.debugPrint = debugPrint
+
+
+    def load(self, verify):
+        """
+        Return the contents of the catalog, for all machines with a
+        machine.json file.
+
+        The catalog is rebuilt if it does not exist or is in an older format.
+        If verify is True, it is also brought up to date with the files in the
+        results dir by reading only the files whose version changed. The
+        catalog is written back if it changed.
+        """
+        (catalog, catalogVersion) = self.__read()
+        changed = False
+        if catalog.get("version") != self.version:
+            catalog = {"version": self.version, "machines": {}}
+            changed = True
+            verify = True
+
+        if verify:
+            versions = self.storage.listVersions(self.resultsDirName)
+            changed = self.__refresh(catalog, versions) or changed
+            # Do not create a results dir just for the catalog of an empty db
+            if changed and versions:
+                # The catalog is not written if it changed since it was read,
+                # since that may have been by a writer not holding the lock
+                # (eg. with S3), in which case it is only used for this read
+                # and refreshed again by the next one.
+                try:
+                    written = self.__write(catalog, catalogVersion)
+                except Exception:
+                    # The db may be read-only to this instance (eg. a public
+                    # S3 bucket), in which case the catalog is only used for
+                    # this read.
+                    written = False
+                if not(written) and self.debugPrint:
+                    print(f"Could not write the catalog {self.key}")
+        return catalog
+
+
+    def rebuild(self):
+        """
+        Rebuild the catalog from the contents of all results files, and return
+        its contents.
+        """
+        self.storage.delete(self.key)
+        return self.load(verify=True)
+
+
+    def update(self, machineUpdates, resultsUpdates):
+        """
+        Update the catalog with the machine.json and results files just
+        written, given as dictionaries of {key: (contents, new version)} where
+        the version is None if the file was not changed (so its entry is
+        already up to date, if present). A missing catalog is not created
+        here, since that requires reading all results files, and is instead
+        rebuilt by the next load().
+
+        The catalog is only written if it did not change since it was read, so
+        updates by others not holding the lock are not lost, and the updates
+        are applied again otherwise.
+        """
+        while True:
+            (catalog, catalogVersion) = self.__read()
+            if catalog.get("version") != self.version:
+                return
+            if not(self.__updateEntries(catalog, machineUpdates,
+                                        resultsUpdates)):
+                return
+            if self.__write(catalog, catalogVersion):
+                return
+            if self.debugPrint:
+                print(f"The catalog {self.key} changed while updating it, "
+                      "updating it again")
+
+
+    def getResultsFiles(self, catalog):
+        """
+        Return a list of (results file key, machine.json contents, catalog
+        entry) tuples for all results files in catalog, the contents returned
+        by load(), sorted by key.
+        """
+        resultsFiles = []
+        for (machineName, mEntry) in catalog["machines"].items():
+            for (fileName, entry) in mEntry["files"].items():
+                resultsFiles.append(
+                    (posixpath.join(self.resultsDirName, machineName, fileName),
+                     mEntry["machine"], entry))
+        return sorted(resultsFiles, key=lambda f: f[0])
+
+
+    def __read(self):
+        """
+        Return a tuple of (catalog contents, or {} if there is no catalog,
+        version of the catalog file, or None).
+        """
+        (data, version) = self.storage.readWithVersion(self.key)
+        if data is None:
+            return ({}, None)
+        return (self.jsonCodec.loads(data), version)
+
+
+    def __write(self, catalog, catalogVersion):
+        """
+        Write catalog if the catalog file is still at catalogVersion (None if
+        it did not exist), and return True if it was written.
+        """
+        return self.storage.conditionalWrite(
+            self.key, self.jsonCodec.dumps(catalog, compact=True),
+            catalogVersion) is not None
+
+
+    def __refresh(self, catalog, versions):
+        """
+        Update catalog for the changes to the files in the results dir, where
+        versions is a dictionary of {key: version} for all the files. Return
+        True if the catalog changed.
+        """
+        machines = catalog["machines"]
+        changed = False
+        seenMachines = set()
+        for (machineName, machineFileKeys) in \
+            getMachineFileKeys(self.resultsDirName, sorted(versions)).items():
+            # Assume this is not a valid results dir if no machine file.
+            machineJsonFile = posixpath.join(self.resultsDirName, machineName,
+                                             self.machineFileName)
+            if machineJsonFile not in machineFileKeys:
+                continue
+            seenMachines.add(machineName)
+            mEntry = machines.setdefault(machineName, {"files": {}})
+            if ("machine" not in mEntry) or \
+               (mEntry.get("version") != versions[machineJsonFile]):
+                data = self.storage.read(machineJsonFile)
+                mEntry["machine"] = {} if data is None \
+                    else self.jsonCodec.loads(data)
+                mEntry["version"] = versions[machineJsonFile]
+                changed = True
+
+            files = mEntry["files"]
+            seenFiles = set()
+            for resultsFile in machineFileKeys:
+                if resultsFile == machineJsonFile:
+                    continue
+                fileName = posixpath.basename(resultsFile)
+                entry = files.get(fileName)
+                if (entry is None) or \
+                   (entry.get("version") != versions[resultsFile]):
+                    (data, version) = self.storage.readWithVersion(resultsFile)
+                    # The file could have been removed after being listed.
+                    if data is None:
+                        continue
+                    files[fileName] = getCatalogEntry(
+                        self.jsonCodec.loads(data), version)
+                    changed = True
+                seenFiles.add(fileName)
+
+            for fileName in set(files) - seenFiles:
+                del files[fileName]
+                changed = True
+
+        for machineName in set(machines) - seenMachines:
+            del machines[machineName]
+            changed = True
+        return changed
+
+
+    def __updateEntries(self, catalog, machineUpdates, resultsUpdates):
+        """
+        Update the entries in catalog for machineUpdates and resultsUpdates,
+        see update(). Return True if the catalog changed.
+        """
+        machines = catalog["machines"]
+        changed = False
+        for (machineFileKey, (mDict, version)) in machineUpdates.items():
+            machineName = posixpath.basename(posixpath.dirname(machineFileKey))
+            mEntry = machines.setdefault(machineName, {"files": {}})
+            if (version is not None) or ("machine" not in mEntry):
+                mEntry["machine"] = mDict
+                mEntry["version"] = version
+                changed = True
+        for (resultsFileKey, (rDict, version)) in resultsUpdates.items():
+            machineName = posixpath.basename(posixpath.dirname(resultsFileKey))
+            files = machines.setdefault(machineName, {"files": {}})["files"]
+            fileName = posixpath.basename(resultsFileKey)
+            if (version is not None) or (fileName not in files):
+                files[fileName] = getCatalogEntry(rDict, version)
+                changed = True
+        return changed
@@ -0,0 +1,176 @@
+"""
+The change feed of an asvdb, a record of the results written by each write
+used by ASVDb.getResultsSince() to return only the results written after a
+token.
+
+The change feed dir (.asvdb-changes by default) contains:
+    head.json               - {"seq": <sequence number of the last record>,
+                               "first": <oldest valid token>,
+                               "segments": {<segment>: <time of its last
+                                            record>}}
+    <segment>.jsonl         - the records with sequence numbers from
+                              segment * segmentSize + 1 to (segment + 1) *
+                              segmentSize, where segment is zero-padded to 8
+                              digits. Each line is a record {"seq": <sequence
+                              number>, "time": <time written>, "results":
+                              <results encoded by encodeResultTuples()>}
+
+The sequence number of the last record is the token for the results written
+up to then. Only the last maxSegments segments, and those with records newer
+than maxAge seconds, are kept, so older tokens expire. The segment size must
+be the same for all writers. All changes must be made while holding the DB
+lock.
+"""
+import posixpath
+import time
+
+
+class ChangeFeed:
+    """
+    The change feed in the dir dirName in storage (a StorageBackend), with the
+    head file headFileName, segmentSize records per segment, and keeping the
+    last maxSegments segments and those with records newer than maxAge seconds
+    (None for no limit).
+    """
+    def __init__(self, storage, jsonCodec, dirName, headFileName, segmentSize,
+                 maxSegments, maxAge):
+        self.storage = storage
+        self.jsonCodec = jsonCodec
+        self.dirName = dirName
+        self.headFileKey = posixpath.join(dirName, headFileName)
+        self.segmentSize = segmentSize
+        self.maxSegments = maxSegments
+        self.maxAge = maxAge
+
+
+    def append(self, resultTupleList):
+        """
+        Append a record of the results in resultTupleList, a list of
+        (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples just written to
+        the ASV files, with the next sequence number.
+        """
+        # asvdb.asvdb imports this module.
+        from .asvdb import encodeResultTuples
+
+        resultTupleList = [(benchmarkInfo, benchmarkResults)
+                           for (benchmarkInfo, benchmarkResults)
+                           in resultTupleList if benchmarkResults]
+        if not(resultTupleList):
+            return
+        head = self.loadHead()
+        seq = head.get("seq", 0) + 1
+        segment = (seq - 1) // self.segmentSize
+        now = time.time()
+        record = self.jsonCodec.dumps(
+            {"seq": seq,
+             "time": now,
+             "results": encodeResultTuples(resultTupleList),
+             }, compact=True) + b"\n"
+        # The head is written after the record, so a record is never missing
+        # for a sequence number in the head. If the head is not written (eg.
+        # the process is killed), the record is returned along with the next
+        # record, which reuses its sequence number.
+        self.storage.append(self.__getSegmentFileKey(segment), record)
+        head["seq"] = seq
+        head.setdefault("segments", {})[str(segment)] = now
+        self.__trim(head)
+        self.__writeHead(head)
+
+
+    def loadHead(self):
+        """
+        Return the contents of the head file, or {} if there are no records.
+        """
+        data = self.storage.read(self.headFileKey)
+        if data is None:
+            return {}
+        return self.jsonCodec.loads(data)
+
+
+    def trim(self):
+        """
+        Remove the segments that are not among the last maxSegments or that
+        have no records newer than maxAge seconds.
+        """
+        head = self.loadHead()
+        if self.__trim(head):
+            self.__writeHead(head)
+
+
+    def read(self, token, head):
+        """
+        Return the list of (BenchmarkInfo obj, [BenchmarkResult obj, ...])
+        tuples in the records after the sequence number token, up to the last
+        record in head (the contents returned by loadHead()). Raise a
+        ValueError if token is invalid or has expired.
+        """
+        # asvdb.asvdb imports this module.
+        from .asvdb import decodeResultTuples
+
+        headSeq = head.get("seq", 0)
+        if (token < 0) or (token > headSeq):
+            raise ValueError(f"Invalid change feed token {token}, the last "
+                             f"change in {self.storage.getRootURL()} is "
+                             f"{headSeq}")
+        if token < head.get("first", 0):
+            raise ValueError(f"Change feed token {token} has expired, the "
+                             "oldest change kept in "
+                             f"{self.storage.getRootURL()} is after "
+                             f"{head['first']}. Read all results again with "
+                             "a token of None.")
+        retList = []
+        if token == headSeq:
+            return retList
+        for segment in range(token // self.segmentSize,
+                             ((headSeq - 1) // self.segmentSize) + 1):
+            fileKey = self.__getSegmentFileKey(segment)
+            data = self.storage.read(fileKey)
+            if data is None:
+                raise ValueError(f"Change feed token {token} is no longer "
+                                 f"valid, {fileKey} does not exist")
+            # A record being appended (without its trailing newline yet) is not
+            # included.
+            for line in data[:data.rfind(b"\n") + 1].splitlines():
+                record = self.jsonCodec.loads(line)
+                if token < record["seq"] <= headSeq:
+                    retList += decodeResultTuples(record["results"])
+        return retList
+
+
+    def __writeHead(self, head):
+        self.storage.write(self.headFileKey,
+                           self.jsonCodec.dumps(head, compact=True))
+
+
+    def __trim(self, head):
+        """
+        Remove the oldest segments that are not among the last maxSegments or
+        that have no records newer than maxAge seconds, other than the current
+        segment, and update head to match. Return True if any segments were
+        removed.
+        """
+        segmentTimes = head.get("segments", {})
+        if not(segmentTimes):
+            return False
+        currentSegment = (head["seq"] - 1) // self.segmentSize
+        minTime = None
+        if self.maxAge is not None:
+            minTime = time.time() - self.maxAge
+        removed = False
+        # Only the oldest segments are removed, so the remaining records are
+        # always all those after head["first"].
+        for segment in sorted(int(s) for s in segmentTimes):
+            if (segment == currentSegment) or \
+               ((segment > currentSegment - self.maxSegments)
+                and ((minTime is None)
+                     or (segmentTimes[str(segment)] >= minTime))):
+                break
+            self.storage.delete(self.__getSegmentFileKey(segment))
+            del segmentTimes[str(segment)]
+            head["first"] = (segment + 1) * self.segmentSize
+            removed = True
+        return removed
+
+
+    def __getSegmentFileKey(self, segment):
+        return posixpath.join(self.dirName, f"{segment:08d}.jsonl")
@@ -0,0 +1,167 @@
+"""
+JSON codecs used to read and write the files of an ASV "database".
+
+The fastest codec installed (orjson, ujson, then simdjson) is used by default,
+falling back to the stdlib json module. The ASVDB_JSON_CODEC env var, or
+ASVDb.jsonCodecName, can be set to the name of a codec to use instead.
+
+Some files written by ASV or the stdlib contain NaN or Infinity, which are not
+valid JSON and are rejected by some of the faster parsers, so those files are
+parsed with the stdlib instead. Objects containing NaN or Infinity are also
+written with the stdlib, since orjson would write them as null, so that they
+are read back the same with any codec.
+"""
+import json
+import math
+import os
+
+codecEnvVar = "ASVDB_JSON_CODEC"
+
+
+class JsonCodec:
+    """
+    Converts between objects and JSON bytes. dumps() writes with 2-space
+    indentation (as ASV does) unless compact is True, in which case no
+    whitespace is written.
+    """
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+    def dumps(self, obj, compact=False):
+        if compact:
+            return json.dumps(obj, separators=(",", ":")).encode()
+        return json.dumps(obj, indent=2).encode()
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+
+    def loads(self, data):
+        try:
+            return self.orjson.loads(data)
+        except self.orjson.JSONDecodeError:
+            return json.loads(data)
+
+
+    def dumps(self, obj, compact=False):
+        option = self.orjson.OPT_NON_STR_KEYS
+        if not(compact):
+            option |= self.orjson.OPT_INDENT_2
+        data = self.orjson.dumps(obj, option=option)
+        # Non-finite floats are written as null, so only objects written with
+        # a null need to be checked for them.
+        if (b"null" in data) and _hasNonFiniteFloat(obj):
+            return JsonCodec.dumps(self, obj, compact)
+        return data
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+
+    def loads(self, data):
+        try:
+            return self.ujson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+
+    def dumps(self, obj, compact=False):
+        # Some versions of ujson cannot write non-finite floats.
+        try:
+            return self.ujson.dumps(obj, indent=0 if compact else 2,
+                                    ensure_ascii=False).encode()
+        except OverflowError:
+            return JsonCodec.dumps(self, obj, compact)
+
+
+class SimdjsonCodec(JsonCodec):
+    """
+    simdjson can only parse, so this writes using the stdlib.
+    """
+    name = "simdjson"
+
+    def __init__(self):
+        import simdjson
+        self.simdjson = simdjson
+
+
+    def loads(self, data):
+        try:
+            return self.simdjson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+
+def _hasNonFiniteFloat(obj):
+    """
+    Return True if obj, or any of the values it contains, is a NaN or infinite
+    float.
+    """
+    if isinstance(obj, float):
+        return not(math.isfinite(obj))
+    if isinstance(obj, dict):
+        return any(_hasNonFiniteFloat(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(_hasNonFiniteFloat(v) for v in obj)
+    return False
+
+
+# In order of preference
+codecClasses = {
+    "orjson": OrjsonCodec,
+    "ujson": UjsonCodec,
+    "simdjson": SimdjsonCodec,
+    "json": JsonCodec,
+}
+_codecs = {}
+
+
+def getCodec(name=None):
+    """
+    Return the codec instance for name (a key in codecClasses), or if None,
+    the codec named by the ASVDB_JSON_CODEC env var or else the fastest
+    installed codec. Raises ImportError if the named codec is not installed.
+    """
+    name = name or os.environ.get(codecEnvVar)
+    if name is None:
+        for codecName in codecClasses:
+            if getCodecIfInstalled(codecName) is not None:
+                return _codecs[codecName]
+
+    codecClass = codecClasses.get(name)
+    if codecClass is None:
+        raise ValueError(f"Unknown JSON codec '{name}', must be one of: "
+                         f"{', '.join(codecClasses)}")
+    if name not in _codecs:
+        _codecs[name] = codecClass()
+    return _codecs[name]
+
+
+def getCodecIfInstalled(name):
+    """
+    Return the codec instance for name, or None if it is not installed.
+    """
+    try:
+        return getCodec(name)
+    except ImportError:
+        return None
+
+
+def getInstalledCodecs():
+    """
+    Return a list of all installed codec instances, in order of preference.
+    """
+    return [c for c in map(getCodecIfInstalled, codecClasses) if c is not None]
@@ -0,0 +1,369 @@
+"""
+Export (BenchmarkInfo, [BenchmarkResult, ...]) tuples to tabular file formats.
+
+Each row is a single result and has a column for each BenchmarkInfo and
+BenchmarkResult member, followed by a "param_<name>" column for each param
+name passed to the exporter. Rows are converted and written a batch at a time,
+so exporting a large DB is bound by I/O rather than per-row overhead.
+"""
+import csv
+import json
+from os import path
+import sys
+
+# Column order of the BenchmarkInfo and BenchmarkResult members (the same
+# members listed in BenchmarkInfoKeys and BenchmarkResultKeys).
+infoColumns = [
+    "machineName",
+    "cudaVer",
+    "osType",
+    "pythonVer",
+    "commitHash",
+    "commitTime",
+    "branch",
+    "gpuType",
+    "cpuType",
+    "arch",
+    "ram",
+    "gpuRam",
+    "requirements",
+]
+resultColumns = [
+    "funcName",
+    "argNameValuePairs",
+    "result",
+    "unit",
+]
+paramColumnPrefix = "param_"
+
+# Size of the write buffer used for text formats.
+bufferSize = 1024 * 1024
+
+
+def getExporter(formatName, outputPath, paramNames):
+    """
+    Return an Exporter instance for formatName ("csv", "jsonl" or "parquet")
+    which writes to outputPath ("-" for STDOUT, or an open file obj), with a
+    param column for each name in paramNames.
+    """
+    exporterClass = exporterClasses.get(formatName)
+    if exporterClass is None:
+        raise ValueError(f"Unsupported export format '{formatName}', must be "
+                         f"one of: {', '.join(exporterClasses)}")
+    return exporterClass(outputPath, paramNames)
+
+
+def getParamNames(resultTupleList):
+    """
+    Return a sorted list of all param names used by the results in
+    resultTupleList.
+    """
+    paramNames = set()
+    for (_, benchmarkResults) in resultTupleList:
+        for benchmarkResult in benchmarkResults:
+            paramNames.update(n for (n, _) in benchmarkResult.argNameValuePairs)
+    return sorted(paramNames)
+
+
+def exportResults(resultTupleList, formatName, outputPath, paramNames=None):
+    """
+    Write the results in resultTupleList to outputPath in the formatName
+    format. If paramNames is not specified, a param column is added for every
+    param used in resultTupleList.
+    """
+    if paramNames is None:
+        paramNames = getParamNames(resultTupleList)
+    with getExporter(formatName, outputPath, paramNames) as exporter:
+        exporter.writeResults(resultTupleList)
+
+
+def getFormatForPath(outputPath):
+    """
+    Return the export format name for outputPath based on its file extension,
+    or "csv" if outputPath is "-" (STDOUT).
+    """
+    if outputPath in (None, "-"):
+        return "csv"
+    ext = path.splitext(outputPath)[1].lstrip(".").lower()
+    if ext not in exporterClasses:
+        raise ValueError(f"Cannot determine the export format for "
+                         f"'{outputPath}', the extension must be one of: "
+                         f"{', '.join(exporterClasses)}")
+    return ext
+
+
+def writeTable(columns, rows, formatName, outputPath):
+    """
+    Write rows, a list of lists of values in the same order as the column names
+    in columns, to outputPath ("-" for STDOUT) in the formatName format. Unlike
+    the Exporter classes, this is used for arbitrary tables (eg. aggregations).
+    """
+    if formatName not in exporterClasses:
+        raise ValueError(f"Unsupported export format '{formatName}', must be "
+                         f"one of: {', '.join(exporterClasses)}")
+
+    if formatName == "parquet":
+        if outputPath in (None, "-"):
+            raise ValueError("Parquet output must be written to a file")
+        pyarrow = _importPyarrow()
+        columnValues = [list(c) for c in zip(*rows)] or [[] for _ in columns]
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_pydict(dict(zip(columns, columnValues))),
+            outputPath)
+        return
+
+    if outputPath in (None, "-"):
+        fileObj = sys.stdout
+    else:
+        fileObj = open(outputPath, "w", newline="", buffering=bufferSize)
+    try:
+        if formatName == "csv":
+            writer = csv.writer(fileObj)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            fileObj.writelines(json.dumps(dict(zip(columns, row))) + "\n"
+                               for row in rows)
+    finally:
+        if fileObj is sys.stdout:
+            fileObj.flush()
+        else:
+            fileObj.close()
+
+
+def _importPyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("pyarrow is required for Parquet export, "
+                          "install it with 'pip install pyarrow'")
+    return pyarrow
+
+
+class Exporter:
+    """
+    Base class for writers that export batches of results to a file. Params
+    not in paramNames are only present in the argNameValuePairs column.
+    """
+    def __init__(self, outputPath, paramNames):
+        self.outputPath = outputPath
+        self.paramNames = list(paramNames)
+        self.columns = infoColumns + resultColumns \
+            + [paramColumnPrefix + n for n in self.paramNames]
+        self.__paramValuesCache = {}
+
+
+    def writeResults(self, resultTupleList):
+        """
+        Write a row for each result in resultTupleList, a list of
+        (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples.
+        """
+        raise NotImplementedError
+
+
+    def close(self):
+        """
+        Finish writing the output.
+        """
+        raise NotImplementedError
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _iterRows(self, resultTupleList, encodeObjs):
+        """
+        Return a generator of lists of values, in column order, for each result
+        in resultTupleList. If encodeObjs is True, the requirements and
+        argNameValuePairs values are encoded as JSON strings.
+        """
+        for (benchmarkInfo, benchmarkResults) in resultTupleList:
+            infoValues = [getattr(benchmarkInfo, c) for c in infoColumns]
+            if encodeObjs:
+                infoValues[-1] = json.dumps(infoValues[-1])
+            for benchmarkResult in benchmarkResults:
+                (argNameValuePairs, paramValues) = \
+                    self._getParamValues(benchmarkResult, encodeObjs)
+                yield infoValues \
+                    + [benchmarkResult.funcName, argNameValuePairs,
+                       benchmarkResult.result, benchmarkResult.unit] \
+                    + paramValues
+
+
+    def _getParamValues(self, benchmarkResult, encodeObjs):
+        """
+        Return a tuple of the argNameValuePairs column value and the list of
+        param column values for benchmarkResult. The values are cached since
+        the same params are typically used by many results.
+        """
+        key = (tuple(benchmarkResult.argNameValuePairs), encodeObjs)
+        values = self.__paramValuesCache.get(key)
+        if values is None:
+            argNameValuePairs = [list(p) for p in key[0]]
+            params = dict(key[0])
+            values = (json.dumps(argNameValuePairs) if encodeObjs
+                      else argNameValuePairs,
+                      [params.get(n) for n in self.paramNames])
+            self.__paramValuesCache[key] = values
+        return values
+
+
+class _TextExporter(Exporter):
+    """
+    Base class for exporters that write text, either to a file, STDOUT, or an
+    open file obj (which is not closed).
+    """
+    def __init__(self, outputPath, paramNames):
+        super().__init__(outputPath, paramNames)
+        self.ownsFileObj = False
+        if outputPath in (None, "-"):
+            self.fileObj = sys.stdout
+        elif hasattr(outputPath, "write"):
+            self.fileObj = outputPath
+        else:
+            self.fileObj = open(outputPath, "w", newline="",
+                                buffering=bufferSize)
+            self.ownsFileObj = True
+
+
+    def close(self):
+        if self.ownsFileObj:
+            self.fileObj.close()
+        else:
+            self.fileObj.flush()
+
+
+class CSVExporter(_TextExporter):
+    """
+    Writes results as CSV with a header row. requirements and
+    argNameValuePairs values are JSON strings, and missing values are empty.
+    """
+    def __init__(self, outputPath, paramNames):
+        super().__init__(outputPath, paramNames)
+        self.writer = csv.writer(self.fileObj)
+        self.writer.writerow(self.columns)
+
+
+    def writeResults(self, resultTupleList):
+        self.writer.writerows(self._iterRows(resultTupleList, encodeObjs=True))
+
+
+class JSONLExporter(_TextExporter):
+    """
+    Writes results as JSON Lines, one JSON object per result.
+    """
+    def writeResults(self, resultTupleList):
+        # The BenchmarkInfo members are encoded once for all its results, and
+        # each line is the concatenation of that and the encoded result members.
+        resultColumnNames = self.columns[len(infoColumns):]
+        lines = []
+        for (benchmarkInfo, benchmarkResults) in resultTupleList:
+            infoJson = json.dumps(
+                {c: getattr(benchmarkInfo, c) for c in infoColumns})[:-1]
+            for benchmarkResult in benchmarkResults:
+                (argNameValuePairs, paramValues) = \
+                    self._getParamValues(benchmarkResult, encodeObjs=False)
+                resultJson = json.dumps(dict(zip(
+                    resultColumnNames,
+                    [benchmarkResult.funcName, argNameValuePairs,
+                     benchmarkResult.result, benchmarkResult.unit]
+                    + paramValues)))
+                lines.append(f"{infoJson}, {resultJson[1:]}")
+        if lines:
+            lines.append("")
+            self.fileObj.write("\n".join(lines))
+
+
+class ParquetExporter(Exporter):
+    """
+    Writes results as a Parquet file using pyarrow, one row group per batch.
+    requirements and argNameValuePairs values are JSON strings, commitTime is
+    an int64 column, and all others are strings except result. result is a
+    float64 column, unless a result is not a number (eg. a list or str set by
+    --exec), in which case it is a string column of JSON values (str values
+    are written as-is).
+    """
+    def __init__(self, outputPath, paramNames):
+        super().__init__(outputPath, paramNames)
+        if outputPath in (None, "-"):
+            raise ValueError("Parquet output must be written to a file")
+        pyarrow = _importPyarrow()
+        self.pyarrow = pyarrow
+        self.__resultIndex = self.columns.index("result")
+        self.__createWriter(pyarrow.float64())
+
+
+    def writeResults(self, resultTupleList):
+        rows = list(self._iterRows(resultTupleList, encodeObjs=True))
+        if not(rows):
+            return
+        columnValues = list(zip(*rows))
+        if (self.schema.field("result").type == self.pyarrow.float64()) and \
+           not(all(_isFloatResult(v)
+                   for v in columnValues[self.__resultIndex])):
+            self.__convertResultsToStrings()
+        arrays = []
+        for (field, values) in zip(self.schema, columnValues):
+            if field.name == "result" and \
+               (field.type == self.pyarrow.string()):
+                values = [_encodeResult(v) for v in values]
+            elif field.type == self.pyarrow.string():
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(self.pyarrow.array(values, type=field.type))
+        self.writer.write_table(
+            self.pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+
+    def close(self):
+        self.writer.close()
+
+
+    def __createWriter(self, resultType):
+        columnTypes = {"commitTime": self.pyarrow.int64(),
+                       "result": resultType}
+        self.schema = self.pyarrow.schema(
+            [(c, columnTypes.get(c, self.pyarrow.string()))
+             for c in self.columns])
+        self.writer = self.pyarrow.parquet.ParquetWriter(self.outputPath,
+                                                         self.schema)
+
+
+    def __convertResultsToStrings(self):
+        """
+        Rewrite the rows written so far with a string result column, and use
+        it for the rest of the rows. This is only needed once, so exports of
+        numeric results do not pay for it.
+        """
+        self.writer.close()
+        table = self.pyarrow.parquet.read_table(self.outputPath)
+        results = self.pyarrow.array(
+            [_encodeResult(v) for v in table.column("result").to_pylist()],
+            type=self.pyarrow.string())
+        self.__createWriter(self.pyarrow.string())
+        if table.num_rows:
+            self.writer.write_table(
+                table.set_column(self.__resultIndex, "result", results))
+
+
+def _isFloatResult(value):
+    return (value is None) or \
+        (isinstance(value, (int, float)) and not(isinstance(value, bool)))
+
+
+def _encodeResult(value):
+    if (value is None) or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+exporterClasses = {
+    "csv": CSVExporter,
+    "jsonl": JSONLExporter,
+    "parquet": ParquetExporter,
+}
@@ -0,0 +1,56 @@
+"""
+A cache of parsed file contents shared by all threads (and all ASVDb
+instances) in a process, so concurrent readers of the same db parse each
+version of a file once.
+"""
+import collections
+import threading
+
+
+class FileCache:
+    """
+    Least-recently-used cache of up to maxSize parsed files, keyed by (db root
+    URL, file key). Each entry is only returned for the version of the file it
+    was parsed from. The contents returned are shared, and must not be
+    modified.
+    """
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+
+    def get(self, key, version):
+        """
+        Return the contents cached for key if they were parsed from version of
+        the file, otherwise None.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if (entry is None) or (entry[0] != version):
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+
+    def put(self, key, version, contents):
+        """
+        Cache contents, parsed from version of the file at key. Nothing is
+        cached if version is None (unknown).
+        """
+        if (version is None) or (self.maxSize <= 0):
+            return
+        with self.__lock:
+            self.__entries[key] = (version, contents)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxSize:
+                self.__entries.popitem(last=False)
+
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
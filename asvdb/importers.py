@@ -0,0 +1,243 @@
+"""
+Import the JSON reports written by other benchmarking tools as (BenchmarkInfo,
+[BenchmarkResult, ...]) tuples, which can then be added to a db with a single
+ASVDb.addResultTuples() call (one write per results file).
+
+Supported formats are:
+    pytest-benchmark  - "pytest --benchmark-json=PATH". The test params are
+                        used as the params of each result, and the machine and
+                        commit info in the report are used for the
+                        BenchmarkInfo.
+    google-benchmark  - "--benchmark_format=json" or "--benchmark_out=PATH".
+                        Args in benchmark names ("BM_Foo/8/threads:2") are used
+                        as params ("arg0", "threads"). Reports have no commit
+                        info, which must be passed in infoDefaults (or set with
+                        --exec when using the CLI).
+
+Many report files are parsed in parallel by importFiles().
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import glob
+import os
+import statistics
+
+from .asvdb import BenchmarkInfo, BenchmarkResult
+from .codec import getCodec
+
+# Seconds per unit of the times in Google Benchmark reports
+timeUnits = {"ns": 1e-9, "us": 1e-6, "ms": 1e-3, "s": 1}
+
+
+def getImporter(formatName, stat=None, infoDefaults=None):
+    """
+    Return an Importer instance for formatName (a key in importerClasses).
+    stat is the statistic used as the result (default: each importer's
+    defaultStat), and infoDefaults is a dictionary of BenchmarkInfo CTOR args
+    used for info not in the reports (eg. {"commitHash": ...}).
+    """
+    importerClass = importerClasses.get(formatName)
+    if importerClass is None:
+        raise ValueError(f"Unsupported import format '{formatName}', must be "
+                         f"one of: {', '.join(importerClasses)}")
+    return importerClass(stat, infoDefaults)
+
+
+def parseImportSpec(spec):
+    """
+    Return a tuple of (format name, sorted list of paths) for spec, which is
+    of the form "FORMAT:GLOB".
+    """
+    (formatName, sep, pattern) = spec.partition(":")
+    if not(sep) or not(pattern):
+        raise ValueError(f"Invalid import spec '{spec}', must be of the form "
+                         "FORMAT:GLOB")
+    if formatName not in importerClasses:
+        raise ValueError(f"Unsupported import format '{formatName}', must be "
+                         f"one of: {', '.join(importerClasses)}")
+    return (formatName, sorted(glob.glob(pattern, recursive=True)))
+
+
+def importFiles(formatName, paths, stat=None, infoDefaults=None,
+                maxWorkers=None):
+    """
+    Return a list of (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples,
+    one for each report file in paths, in the same order. Files are parsed in
+    parallel by up to maxWorkers processes (default: the number of CPUs).
+    """
+    importer = getImporter(formatName, stat, infoDefaults)
+    paths = list(paths)
+    maxWorkers = min(maxWorkers or os.cpu_count() or 1, len(paths))
+    # Starting processes is not worth it for a few files or a single CPU.
+    if (maxWorkers < 2) or (len(paths) < 4):
+        return [importer.importFile(p) for p in paths]
+
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        return list(executor.map(importer.importFile, paths,
+                                 chunksize=max(1, len(paths)
+                                               // (maxWorkers * 4))))
+
+
+class Importer:
+    """
+    Base class for the importer of a report format. Subclasses implement
+    getResultTuple() for the parsed JSON contents of a report.
+    """
+    defaultStat = None
+
+    def __init__(self, stat=None, infoDefaults=None):
+        self.stat = stat or self.defaultStat
+        self.infoDefaults = infoDefaults or {}
+
+
+    def importFile(self, filePath):
+        """
+        Return the (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuple for
+        the report at filePath.
+        """
+        with open(filePath, "rb") as fobj:
+            report = getCodec().loads(fobj.read())
+        try:
+            return self.getResultTuple(report)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Could not import {filePath}: "
+                             f"{e.__class__.__name__}: {e}") from e
+
+
+    def getResultTuple(self, report):
+        raise NotImplementedError
+
+
+    def createBenchmarkInfo(self, **kwargs):
+        """
+        Return a BenchmarkInfo obj from kwargs, with infoDefaults used for all
+        args not in kwargs or that are empty.
+        """
+        for (name, value) in self.infoDefaults.items():
+            if not(kwargs.get(name)):
+                kwargs[name] = value
+        return BenchmarkInfo(**kwargs)
+
+
+class PytestBenchmarkImporter(Importer):
+    """
+    Imports the JSON reports written by pytest-benchmark. The funcName of each
+    result is the test's fully qualified name (eg. "tests.test_algos.test_bfs"
+    for "tests/test_algos.py::test_bfs[dataset-10]") and stat is one of the
+    stats computed by pytest-benchmark (eg. "median", "mean", "min").
+    """
+    defaultStat = "median"
+
+    def getResultTuple(self, report):
+        machineInfo = report.get("machine_info", {})
+        commitInfo = report.get("commit_info", {})
+        commitTime = 0
+        if commitInfo.get("time"):
+            commitTime = int(datetime.fromisoformat(
+                commitInfo["time"]).timestamp() * 1000)
+        pythonVer = machineInfo.get("python_version", "")
+        cpuInfo = machineInfo.get("cpu", {})
+
+        benchmarkInfo = self.createBenchmarkInfo(
+            machineName=machineInfo.get("node", ""),
+            osType=" ".join(filter(None, [machineInfo.get("system"),
+                                          machineInfo.get("release")])),
+            pythonVer=".".join(pythonVer.split(".")[:2]),
+            commitHash=commitInfo.get("id", ""),
+            commitTime=commitTime,
+            branch=commitInfo.get("branch", ""),
+            cpuType=cpuInfo.get("brand_raw") or cpuInfo.get("brand")
+                    or machineInfo.get("processor", ""),
+            arch=machineInfo.get("machine", ""))
+
+        results = []
+        for benchmark in report["benchmarks"]:
+            funcName = benchmark.get("fullname") or benchmark["name"]
+            # Remove the param IDs, which are replaced by the params
+            funcName = funcName.split("[")[0]
+            funcName = funcName.replace(".py::", ".").replace("::", ".") \
+                               .replace("/", ".")
+            results.append(BenchmarkResult(
+                funcName=funcName,
+                argNameValuePairs=list((benchmark.get("params") or {}).items()),
+                result=benchmark["stats"][self.stat]))
+        return (benchmarkInfo, results)
+
+
+class GoogleBenchmarkImporter(Importer):
+    """
+    Imports the JSON reports written by Google Benchmark. The funcName of each
+    result is the benchmark name without its args, and the result is the
+    real_time in seconds. stat is the aggregate used when benchmarks were run
+    with repetitions (eg. "median", "mean", "min"). If the report has no
+    aggregate for stat, the median of the repetitions is used.
+    """
+    defaultStat = "median"
+    # Parts of benchmark names that are options rather than args
+    ignoredNameParts = ["real_time", "manual_time", "process_time"]
+
+    def getResultTuple(self, report):
+        context = report.get("context", {})
+        benchmarkInfo = self.createBenchmarkInfo(
+            machineName=context.get("host_name", ""))
+
+        # {run name: [result for each repetition]} and {run name: aggregate}
+        iterationTimes = {}
+        aggregateTimes = {}
+        for benchmark in report["benchmarks"]:
+            if benchmark.get("error_occurred"):
+                continue
+            runName = benchmark.get("run_name")
+            if runName is None:
+                # Older versions only have the name, which has a suffix for
+                # aggregates (eg. "BM_Foo/8_median").
+                runName = benchmark["name"]
+                if benchmark.get("run_type") == "aggregate":
+                    suffix = "_" + benchmark.get("aggregate_name", "")
+                    if runName.endswith(suffix):
+                        runName = runName[:-len(suffix)]
+            seconds = benchmark["real_time"] \
+                * timeUnits[benchmark.get("time_unit", "ns")]
+            if benchmark.get("run_type") == "aggregate":
+                if benchmark.get("aggregate_name") == self.stat:
+                    aggregateTimes[runName] = seconds
+            else:
+                iterationTimes.setdefault(runName, []).append(seconds)
+
+        results = []
+        for runName in dict.fromkeys(list(iterationTimes)
+                                     + list(aggregateTimes)):
+            result = aggregateTimes.get(runName)
+            if result is None:
+                result = statistics.median(iterationTimes[runName])
+            (funcName, argNameValuePairs) = self.__parseRunName(runName)
+            results.append(BenchmarkResult(funcName=funcName,
+                                           argNameValuePairs=argNameValuePairs,
+                                           result=result))
+        return (benchmarkInfo, results)
+
+
+    def __parseRunName(self, runName):
+        """
+        Return a tuple of (funcName, argNameValuePairs) for a run name such as
+        "BM_Foo/8/size:16/threads:2/real_time".
+        """
+        (funcName, *parts) = runName.split("/")
+        argNameValuePairs = []
+        numArgs = 0
+        for part in parts:
+            if part in self.ignoredNameParts:
+                continue
+            (name, sep, value) = part.partition(":")
+            if sep:
+                argNameValuePairs.append((name, value))
+            else:
+                argNameValuePairs.append((f"arg{numArgs}", part))
+                numArgs += 1
+        return (funcName, argNameValuePairs)
+
+
+importerClasses = {
+    "pytest-benchmark": PytestBenchmarkImporter,
+    "google-benchmark": GoogleBenchmarkImporter,
+}
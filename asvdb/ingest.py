@@ -0,0 +1,300 @@
+"""
+A local ingestion daemon which coalesces results added by many processes.
+
+Processes (eg. pytest workers on a shared benchmark host) create their ASVDb
+with ingestSocket=PATH, and their addResult()/addResults()/addResultTuples()
+calls send the results to the daemon listening on the Unix socket PATH instead
+of writing the db. The daemon batches all results it receives for a db within a
+short window and adds them with a single lock acquisition and a single write per
+file. Each call still returns only once its results have been written, and
+raises a RuntimeError if writing them failed.
+
+Run with "python -m asvdb ingest --socket PATH --db DB [--db DB ...]". A single
+daemon can write to any number of dbs, but only to those given with --db.
+Requests for other dbs are rejected. The socket is only accessible by the user
+running the daemon.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from .asvdb import ASVDb, encodeResultTuples, decodeResultTuples
+from .batchwriter import BatchWriter
+
+# ASVDb CTOR args sent with each request, which the daemon uses when updating
+# the conf file.
+confArgNames = ["repo", "branches", "projectName", "commitUrl"]
+
+
+class IngestClient:
+    """
+    Sends results to the ingestion daemon listening on socketPath. A single
+    connection is used for all requests, and is shared by all threads.
+    """
+    def __init__(self, socketPath):
+        self.socketPath = socketPath
+        self.__lock = threading.Lock()
+        self.__sock = None
+        self.__fileObj = None
+
+
+    def addResultTuples(self, dbDir, confArgs, resultTupleList):
+        """
+        Send the results in resultTupleList to be added to the db at dbDir,
+        using confArgs (a dictionary of ASVDb CTOR args) to update its conf
+        file, and wait for the daemon to write them.
+        """
+        # The daemon may not be running in the same dir as the client.
+        if "://" not in dbDir:
+            dbDir = os.path.abspath(dbDir)
+        request = json.dumps({"dbDir": dbDir,
+                              "conf": confArgs,
+                              "results": encodeResultTuples(resultTupleList),
+                              }).encode() + b"\n"
+        with self.__lock:
+            try:
+                response = self.__sendRequest(request)
+            except OSError:
+                # The daemon may have been restarted, so reconnect and retry
+                # once. Re-adding results that were already added does not
+                # change the db.
+                self.__disconnect()
+                response = self.__sendRequest(request)
+
+        if "error" in response:
+            raise RuntimeError(f"Ingest daemon at {self.socketPath} failed to "
+                               f"add results: {response['error']}")
+
+
+    def close(self):
+        with self.__lock:
+            self.__disconnect()
+
+
+    def __sendRequest(self, request):
+        if self.__sock is None:
+            self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.__sock.connect(self.socketPath)
+            self.__fileObj = self.__sock.makefile("rb")
+        self.__sock.sendall(request)
+        line = self.__fileObj.readline()
+        if not(line):
+            raise ConnectionResetError("Ingest daemon closed the connection")
+        return json.loads(line)
+
+
+    def __disconnect(self):
+        if self.__sock is not None:
+            self.__fileObj.close()
+            self.__sock.close()
+        self.__sock = None
+        self.__fileObj = None
+
+
+class IngestRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a client connection, which sends one JSON request per line and
+    receives one JSON response per line.
+    """
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                resultTupleList = decodeResultTuples(request["results"])
+                # Invalid results are rejected before being batched with the
+                # results of other clients.
+                validateResultTuples(resultTupleList)
+                self.server.submit(request["dbDir"], request.get("conf", {}),
+                                   resultTupleList).result()
+                response = {"ok": True}
+            except Exception as e:
+                response = {"error": f"{e.__class__.__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class IngestServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The ingestion daemon, which only writes to the dbs in dbDirs (a list of db
+    dirs or URLs). Results for each db are written by a BatchWriter, which adds
+    all results received within batchWindow seconds (or until maxBatchSize
+    results are received) in a single ASVDb.addResultTuples() call.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketPath, dbDirs, batchWindow=0.05,
+                 maxBatchSize=10000):
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        self.dbDirs = set(_normalizeDbDir(dbDir) for dbDir in dbDirs)
+        if not(self.dbDirs):
+            raise ValueError("At least one db must be given")
+        super().__init__(socketPath, IngestRequestHandler)
+        self.batchWindow = batchWindow
+        self.maxBatchSize = maxBatchSize
+        self.__writers = {}
+        self.__writersLock = threading.Lock()
+
+
+    def submit(self, dbDir, confArgs, resultTupleList):
+        """
+        Queue resultTupleList to be added to the db at dbDir, and return a
+        Future for the write (see BatchWriter.submit()). Raises a ValueError if
+        dbDir is not one of the dbs this daemon writes to.
+        """
+        dbDir = _normalizeDbDir(dbDir)
+        if dbDir not in self.dbDirs:
+            raise ValueError(f"The db {dbDir} is not one of the dbs this "
+                             "ingest daemon writes to")
+        with self.__writersLock:
+            writer = self.__writers.get(dbDir)
+            if writer is None:
+                db = ASVDb(dbDir, branches=[])
+                writer = BatchWriter(
+                    lambda items: self.__writeBatch(db, items),
+                    maxDelay=self.batchWindow, maxBatchSize=self.maxBatchSize,
+                    getSize=lambda item: sum(len(benchmarkResults)
+                                             for (_, benchmarkResults)
+                                             in item[1]))
+                self.__writers[dbDir] = writer
+        return writer.submit((confArgs, resultTupleList))
+
+
+    def server_bind(self):
+        super().server_bind()
+        # Only the user running the daemon can connect. The socket does not
+        # accept connections until server_activate() is called.
+        os.chmod(self.server_address, 0o600)
+
+
+    def server_close(self):
+        super().server_close()
+        with self.__writersLock:
+            writers = list(self.__writers.values())
+            self.__writers = {}
+        for writer in writers:
+            writer.close()
+
+
+    def __writeBatch(self, db, items):
+        """
+        Write all items in a single ASVDb.addResultTuples() call. If that
+        fails, each item is written again on its own, so only the requests
+        that fail get an error. Re-adding results that were already written
+        does not change the db.
+        """
+        try:
+            self.__writeItems(db, items)
+        except Exception as e:
+            if len(items) == 1:
+                return [e]
+        else:
+            return None
+        errors = []
+        for item in items:
+            try:
+                self.__writeItems(db, [item])
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+        return errors
+
+
+    def __writeItems(self, db, items):
+        for (confArgs, _) in items:
+            for name in confArgNames:
+                value = confArgs.get(name)
+                if value is None:
+                    continue
+                if name == "branches":
+                    db.branches = db.branches \
+                        + [b for b in value if b not in db.branches]
+                else:
+                    setattr(db, name, value)
+        db.addResultTuples([resultTuple for (_, resultTupleList) in items
+                            for resultTuple in resultTupleList])
+
+
+def validateResultTuples(resultTupleList):
+    """
+    Raise a ValueError if resultTupleList, a list of (BenchmarkInfo obj,
+    [BenchmarkResult obj, ...]) tuples, contains values that cannot be written
+    to a db.
+    """
+    scalarTypes = (str, int, float, bool, type(None))
+    for (benchmarkInfo, benchmarkResults) in resultTupleList:
+        for name in ["machineName", "commitHash"]:
+            if not(isinstance(getattr(benchmarkInfo, name), str)):
+                raise ValueError(f"{name} must be a str, got "
+                                 f"{getattr(benchmarkInfo, name)!r}")
+        for benchmarkResult in benchmarkResults:
+            if not(isinstance(benchmarkResult.funcName, str)) or \
+               not(benchmarkResult.funcName):
+                raise ValueError("funcName must be a non-empty str, got "
+                                 f"{benchmarkResult.funcName!r}")
+            for pair in benchmarkResult.argNameValuePairs:
+                if (len(pair) != 2) or not(isinstance(pair[0], str)) or \
+                   not(isinstance(pair[1], scalarTypes)):
+                    raise ValueError("argNameValuePairs of "
+                                     f"{benchmarkResult.funcName} must be "
+                                     "(name, value) pairs with scalar "
+                                     f"values, got {pair!r}")
+            result = benchmarkResult.result
+            values = result if isinstance(result, list) else [result]
+            if not(all(isinstance(v, scalarTypes) for v in values)):
+                raise ValueError(f"The result of {benchmarkResult.funcName} "
+                                 "must be a scalar or a list of scalars, got "
+                                 f"{benchmarkResult.result!r}")
+
+
+def _normalizeDbDir(dbDir):
+    """
+    Return dbDir, as an absolute path with symlinks resolved if it is not a
+    URL, so the same db is always named the same.
+    """
+    if "://" in dbDir:
+        return dbDir
+    return os.path.realpath(dbDir)
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="asvdb ingest",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Run a daemon which coalesces results added to ASV "
+        "'databases' by many processes.",
+        epilog=__doc__
+    )
+    parser.add_argument("--socket", type=str, metavar="PATH", required=True,
+                        help="Path of the Unix socket to listen on (the "
+                        "ingestSocket passed to ASVDb).")
+    parser.add_argument("--db", type=str, metavar="DB", required=True,
+                        action="append", dest="dbs",
+                        help="Dir or URL of a db the daemon writes to. Can be "
+                        "given multiple times, requests for other dbs are "
+                        "rejected.")
+    parser.add_argument("--batch-window", type=float, default=0.05,
+                        metavar="SECONDS",
+                        help="How long to wait for more results before "
+                        "writing (default: %(default)s).")
+    parser.add_argument("--max-batch-size", type=int, default=10000,
+                        metavar="N",
+                        help="Max number of results written at once "
+                        "(default: %(default)s).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    server = IngestServer(args.socket, args.dbs,
+                          batchWindow=args.batch_window,
+                          maxBatchSize=args.max_batch_size)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
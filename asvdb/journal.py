@@ -0,0 +1,214 @@
+"""
+The journal written by ASVDb instances in journaled mode, where results added
+are appended to a journal file instead of being written to the ASV files, and
+later folded into them by ASVDb.compactJournal().
+
+The journal dir (.asvdb-journal by default) contains:
+    <writer ID>-<segment>.jsonl
+                            - the journal files of each writer (ASVDb
+                              instance), where the segment is the time the
+                              file was started in ms. Each line is a record
+                              {"time": <time written>, "conf": <CTOR args used
+                              to update the conf file>, "results": <results
+                              encoded by encodeResultTuples()>}
+    compacted.json          - {<journal file key>: <offset>} the number of
+                              bytes of each journal file already compacted
+
+Each writer only appends to its own journal files, so appends do not need the
+DB lock. A writer starts a new segment each time it compacts, and when its
+current segment is older than the segment max age, so compacted segments that
+are no longer appended to can be removed. The segment max age must be the same
+for all writers.
+"""
+import posixpath
+import re
+import threading
+import time
+import uuid
+
+_segmentRegex = re.compile(r"-([0-9]+)\.jsonl$")
+
+
+class JournalWriter:
+    """
+    The journal files appended to by one ASVDb instance: a unique writer ID,
+    the current segment, and the lock that must be held to append to or
+    change it.
+    """
+    def __init__(self):
+        self.writerId = uuid.uuid4().hex
+        self.segment = int(time.time() * 1000)
+        self.lock = threading.Lock()
+
+
+    def startSegment(self):
+        """
+        Start a new journal file. Must be called while holding the lock.
+        """
+        self.segment = max(self.segment + 1, int(time.time() * 1000))
+
+
+class Journal:
+    """
+    The journal in the dir dirName in storage (a StorageBackend), appended to
+    by writer (a JournalWriter). offsetsFileName is the name of the file
+    recording how much of each journal file has been compacted, and writers
+    start a new segment at least every segmentMaxAge seconds.
+    """
+    def __init__(self, storage, jsonCodec, writer, dirName, offsetsFileName,
+                 segmentMaxAge):
+        self.storage = storage
+        self.jsonCodec = jsonCodec
+        self.writer = writer
+        self.dirName = dirName
+        self.offsetsFileKey = posixpath.join(dirName, offsetsFileName)
+        self.segmentMaxAge = segmentMaxAge
+
+
+    def append(self, resultTupleList, confArgs):
+        """
+        Append a record of the results in resultTupleList, a list of
+        (BenchmarkInfo obj, [BenchmarkResult obj, ...]) tuples, and the CTOR
+        args confArgs to the current journal file of the writer.
+        """
+        # asvdb.asvdb imports this module.
+        from .asvdb import encodeResultTuples
+
+        record = self.jsonCodec.dumps(
+            {"time": time.time(),
+             "conf": confArgs,
+             "results": encodeResultTuples(resultTupleList),
+             }, compact=True) + b"\n"
+        with self.writer.lock:
+            if (time.time() - (self.writer.segment / 1000)) \
+               > self.segmentMaxAge:
+                self.writer.startSegment()
+            self.storage.append(self.__getFileKey(), record)
+
+
+    def startSegment(self):
+        """
+        Start a new journal file for the writer, so the current one is no
+        longer appended to and can be removed once compacted.
+        """
+        with self.writer.lock:
+            self.writer.startSegment()
+
+
+    def getResults(self, getResultsFileKey):
+        """
+        Return a dictionary of {results file key: (BenchmarkInfo obj,
+        {(funcName, argNameValuePairs tuple): BenchmarkResult obj})} for all
+        results in journal files that have not been compacted, where
+        getResultsFileKey(benchmarkInfo) returns the key of the results file
+        of a BenchmarkInfo obj. Results added later replace earlier results
+        for the same benchmark and params.
+        """
+        (records, _, _) = self.__read(self.__loadOffsets())
+        journalResults = {}
+        for (_, resultTupleList) in records:
+            for (benchmarkInfo, benchmarkResults) in resultTupleList:
+                resultsFileKey = getResultsFileKey(benchmarkInfo)
+                results = journalResults.get(resultsFileKey, (None, {}))[1]
+                for benchmarkResult in benchmarkResults:
+                    results[(benchmarkResult.funcName,
+                             tuple(benchmarkResult.argNameValuePairs))] = \
+                        benchmarkResult
+                journalResults[resultsFileKey] = (benchmarkInfo, results)
+        return journalResults
+
+
+    def compact(self, applyRecords):
+        """
+        Call applyRecords(records) with the list of (confArgs,
+        resultTupleList) records in all journal files that have not been
+        compacted, ordered by the time each was written, then record them as
+        compacted and remove the journal files that are no longer appended to:
+        the previous journal files of the writer, and those of any writer
+        started more than twice segmentMaxAge ago. Return the records. Must be
+        called while holding the DB lock.
+        """
+        offsets = self.__loadOffsets()
+        (records, newOffsets, completeKeys) = self.__read(offsets)
+        applyRecords(records)
+
+        currentKey = self.__getFileKey()
+        ownKeyPrefix = posixpath.join(self.dirName, f"{self.writer.writerId}-")
+        maxSegment = (time.time() - (2 * self.segmentMaxAge)) * 1000
+        for key in list(newOffsets):
+            if (key not in completeKeys) or (key == currentKey):
+                continue
+            segmentMatch = _segmentRegex.search(key)
+            if key.startswith(ownKeyPrefix) or \
+               (segmentMatch and (int(segmentMatch.group(1)) < maxSegment)):
+                self.storage.delete(key)
+                del newOffsets[key]
+
+        if newOffsets != offsets:
+            self.storage.write(self.offsetsFileKey,
+                               self.jsonCodec.dumps(newOffsets, compact=True))
+        return records
+
+
+    def __getFileKey(self):
+        return posixpath.join(self.dirName,
+                              f"{self.writer.writerId}-{self.writer.segment}"
+                              ".jsonl")
+
+
+    def __loadOffsets(self):
+        data = self.storage.read(self.offsetsFileKey)
+        if data is None:
+            return {}
+        return self.jsonCodec.loads(data)
+
+
+    def __read(self, offsets):
+        """
+        Return a tuple of (list of (confArgs, resultTupleList) records in all
+        journal files after the byte offsets in offsets (a dictionary of
+        {journal file key: offset}), ordered by the time each was written,
+        dictionary of {journal file key: offset after the last record}, set of
+        keys of the files that end with a complete record). A record being
+        appended (without its trailing newline yet) is not included. Only the
+        part of each file after its offset is read.
+        """
+        # asvdb.asvdb imports this module.
+        from .asvdb import decodeResultTuples
+
+        records = []
+        newOffsets = {}
+        completeKeys = set()
+        for key in self.storage.listFiles(self.dirName):
+            if not(key.endswith(".jsonl")):
+                continue
+            offset = offsets.get(key, 0)
+            data = self.storage.readFrom(key, offset)
+            if data is None:
+                continue
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                record = self.jsonCodec.loads(line)
+                records.append((record["time"], record.get("conf", {}),
+                                decodeResultTuples(record["results"])))
+            newOffsets[key] = offset + end
+            if end == len(data):
+                completeKeys.add(key)
+
+        records.sort(key=lambda record: record[0])
+        return ([(confArgs, resultTupleList)
+                 for (_, confArgs, resultTupleList) in records], newOffsets,
+                completeKeys)
+
+
+def mergeJournalResult(resultTuple, journalResult):
+    """
+    Return resultTuple, a (BenchmarkInfo obj, [BenchmarkResult obj, ...])
+    tuple read from a results file, updated with journalResult, an item from
+    the dictionary returned by Journal.getResults() for the same results file.
+    """
+    (benchmarkInfo, results) = journalResult
+    mergedResults = dict(((r.funcName, tuple(r.argNameValuePairs)), r)
+                         for r in resultTuple[1])
+    mergedResults.update(results)
+    return (benchmarkInfo, list(mergedResults.values()))
@@ -0,0 +1,373 @@
+"""
+A load test of concurrent writers and readers of an ASV "database".
+
+N processes each repeatedly add a batch of results with addResults() or read
+the whole db with getResults() (chosen at random, see --read-fraction) for a
+fixed duration. All writers add results for the same machine and a small set
+of commits, so they contend for both the db lock and the same results files.
+Each process adds results for its own "worker" param value, so the last result
+each process added for each commit and benchmark is known, and the db is
+checked for all of them at the end.
+
+Reported are the throughput, percentiles of the end-to-end latency of each
+write and read and of the time spent waiting for the lock, the number of lock
+collisions (where two processes set their lock at the same time and both back
+off), errors, and the result of the integrity check.
+
+Run with "python -m asvdb.loadtest [--db PATH | --s3-stand-in] [options]". The
+db is a temporary local dir by default. --s3-stand-in starts a local S3
+stand-in server (requires moto) and uses a bucket on it.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+from .aggregate import _percentile
+from .asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+from .synthetic import getCommitHash, firstCommitTime, commitInterval
+
+repo = "https://github.com/rapidsai/asvdb-loadtest"
+branch = "main"
+machineName = "loadtest"
+s3BucketName = "asvdb-loadtest"
+percentiles = [50, 95, 99]
+
+
+def getLatencyStats(latencies):
+    """
+    Return a dictionary of the count, percentiles and max (in ms) of
+    latencies (in seconds).
+    """
+    latencies = sorted(latencies)
+    stats = {"count": len(latencies)}
+    for q in percentiles:
+        stats[f"p{q}"] = _percentile(latencies, q) * 1000 \
+            if latencies else None
+    stats["max"] = latencies[-1] * 1000 if latencies else None
+    return stats
+
+
+def runWorker(workerNum, dbUrl, duration, readFraction, resultsPerWrite,
+              numCommits, lockTimeout, seed, barrier, resultQueue):
+    """
+    Run the reads and writes for a single worker process for duration seconds
+    (once all workers are ready), and put a dictionary of its stats and the
+    results it wrote on resultQueue.
+    """
+    rng = random.Random(seed + workerNum)
+    db = ASVDb(dbUrl, repo, [branch])
+    db.lockfileTimeout = lockTimeout
+
+    # Time every lock acquisition made by db.
+    lockWaits = []
+    acquireLock = db.storage.acquireLock
+    def timedAcquireLock(*args, **kwargs):
+        st = time.perf_counter()
+        try:
+            return acquireLock(*args, **kwargs)
+        finally:
+            lockWaits.append(time.perf_counter() - st)
+    db.storage.acquireLock = timedAcquireLock
+
+    writeLatencies = []
+    readLatencies = []
+    errors = []
+    # The last result written for each (commitHash, funcName)
+    written = {}
+
+    barrier.wait()
+    st = time.perf_counter()
+    endTime = st + duration
+    while time.perf_counter() < endTime:
+        opSt = time.perf_counter()
+        try:
+            if rng.random() < readFraction:
+                db.getResults()
+                readLatencies.append(time.perf_counter() - opSt)
+            else:
+                commitNum = rng.randrange(numCommits)
+                bInfo = BenchmarkInfo(machineName=machineName,
+                                      commitHash=getCommitHash(commitNum),
+                                      commitTime=firstCommitTime
+                                      + (commitNum * commitInterval),
+                                      branch=branch)
+                bResults = [BenchmarkResult(
+                    funcName=f"bench_{i}",
+                    argNameValuePairs=[("worker", str(workerNum))],
+                    result=rng.uniform(0.001, 10))
+                            for i in range(resultsPerWrite)]
+                db.addResults(bInfo, bResults)
+                writeLatencies.append(time.perf_counter() - opSt)
+                for r in bResults:
+                    written[(bInfo.commitHash, r.funcName)] = r.result
+        except Exception as e:
+            errors.append(f"{e.__class__.__name__}: {e}")
+
+    resultQueue.put({"workerNum": workerNum,
+                     "elapsed": time.perf_counter() - st,
+                     "writeLatencies": writeLatencies,
+                     "readLatencies": readLatencies,
+                     "lockWaits": lockWaits,
+                     "collisions": db.storage.lockCollisions,
+                     "errors": errors,
+                     "written": written,
+                     })
+
+
+def checkIntegrity(db, writtenByWorker):
+    """
+    Return a dictionary of the number of results expected in db, and the
+    lists of (workerNum, commitHash, funcName) keys for results which are
+    missing or do not have the last value written, where writtenByWorker maps
+    each worker number to the results it wrote (see runWorker()).
+    """
+    found = {}
+    for (bInfo, bResults) in db.getResults():
+        for r in bResults:
+            workerNum = dict(r.argNameValuePairs).get("worker")
+            if (r.result is not None) and (workerNum is not None):
+                found[(int(workerNum), bInfo.commitHash, r.funcName)] = \
+                    r.result
+
+    missing = []
+    mismatched = []
+    numExpected = 0
+    for (workerNum, written) in sorted(writtenByWorker.items()):
+        for ((commitHash, funcName), result) in sorted(written.items()):
+            numExpected += 1
+            key = (workerNum, commitHash, funcName)
+            if key not in found:
+                missing.append(key)
+            elif found[key] != result:
+                mismatched.append(key)
+
+    return {"expected": numExpected,
+            "missing": missing,
+            "mismatched": mismatched,
+            "ok": not(missing or mismatched),
+            }
+
+
+def runLoadTest(dbUrl, numProcesses=4, duration=10, readFraction=0.2,
+                resultsPerWrite=10, numCommits=10, lockTimeout=5, seed=0):
+    """
+    Run numProcesses worker processes against the db at dbUrl for duration
+    seconds, and return a dictionary of the combined stats (see
+    formatReport()).
+    """
+    if dbUrl.startswith("memory:"):
+        raise ValueError("In-memory dbs cannot be shared by processes")
+
+    # Create the db before starting, so workers only contend for the lock to
+    # add results. getResults() raises FileNotFoundError for a db with no
+    # results, so it is created with a result not checked by checkIntegrity().
+    ASVDb(dbUrl, repo, [branch]).addResult(
+        BenchmarkInfo(machineName=machineName, commitHash=getCommitHash(0),
+                      commitTime=firstCommitTime, branch=branch),
+        BenchmarkResult(funcName="setup", result=0))
+
+    ctx = multiprocessing.get_context("spawn")
+    # Workers wait for each other to start before running, but not forever if
+    # one fails to start.
+    barrier = ctx.Barrier(numProcesses, timeout=60)
+    resultQueue = ctx.Queue()
+    procs = [ctx.Process(target=runWorker,
+                         args=(n, dbUrl, duration, readFraction,
+                               resultsPerWrite, numCommits, lockTimeout, seed,
+                               barrier, resultQueue))
+             for n in range(numProcesses)]
+    for proc in procs:
+        proc.start()
+    # Read all worker stats before joining, since a worker does not exit until
+    # its stats have been read from the queue.
+    workerStats = []
+    while len(workerStats) < numProcesses:
+        if not(any(proc.is_alive() for proc in procs)) and resultQueue.empty():
+            raise RuntimeError(f"{numProcesses - len(workerStats)} worker "
+                               "process(es) exited without reporting stats")
+        try:
+            workerStats.append(resultQueue.get(timeout=1))
+        except queue.Empty:
+            pass
+    for proc in procs:
+        proc.join()
+
+    elapsed = max(s["elapsed"] for s in workerStats)
+    writeLatencies = [t for s in workerStats for t in s["writeLatencies"]]
+    readLatencies = [t for s in workerStats for t in s["readLatencies"]]
+    numResultsWritten = len(writeLatencies) * resultsPerWrite
+    integrity = checkIntegrity(
+        ASVDb(dbUrl, repo, [branch]),
+        {s["workerNum"]: s["written"] for s in workerStats})
+
+    return {"dbUrl": dbUrl,
+            "processes": numProcesses,
+            "elapsed": elapsed,
+            "throughput": {
+                "writesPerSec": len(writeLatencies) / elapsed,
+                "readsPerSec": len(readLatencies) / elapsed,
+                "resultsWrittenPerSec": numResultsWritten / elapsed,
+            },
+            "write": getLatencyStats(writeLatencies),
+            "read": getLatencyStats(readLatencies),
+            "lockWait": getLatencyStats([t for s in workerStats
+                                         for t in s["lockWaits"]]),
+            "collisions": sum(s["collisions"] for s in workerStats),
+            "errors": [e for s in workerStats for e in s["errors"]],
+            "integrity": integrity,
+            }
+
+
+def formatReport(report):
+    """
+    Return the report returned by runLoadTest() as a human-readable string.
+    """
+    def fmt(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    throughput = report["throughput"]
+    lines = [f"db:          {report['dbUrl']}",
+             f"processes:   {report['processes']}",
+             f"elapsed:     {report['elapsed']:.1f} s",
+             f"throughput:  {throughput['writesPerSec']:.1f} writes/s, "
+             f"{throughput['readsPerSec']:.1f} reads/s, "
+             f"{throughput['resultsWrittenPerSec']:.1f} results written/s",
+             "",
+             f"{'latency (ms)':<14}{'count':>8}"
+             + "".join(f"{'p' + str(q):>10}" for q in percentiles)
+             + f"{'max':>10}"]
+    for (name, label) in [("write", "addResults"), ("read", "getResults"),
+                          ("lockWait", "lock wait")]:
+        stats = report[name]
+        lines.append(f"{label:<14}{stats['count']:>8}"
+                     + "".join(f"{fmt(stats['p' + str(q)]):>10}"
+                               for q in percentiles)
+                     + f"{fmt(stats['max']):>10}")
+
+    integrity = report["integrity"]
+    lines += ["",
+              f"collisions:  {report['collisions']}",
+              f"errors:      {len(report['errors'])}"]
+    lines += [f"  {e}" for e in report["errors"][:10]]
+    lines.append(f"integrity:   {'OK' if integrity['ok'] else 'FAILED'} "
+                 f"({integrity['expected']} results expected, "
+                 f"{len(integrity['missing'])} missing, "
+                 f"{len(integrity['mismatched'])} mismatched)")
+    return "\n".join(lines)
+
+
+def startS3StandIn():
+    """
+    Start a local S3 stand-in server, point boto3 (in this process and any
+    processes it starts) at it, create a bucket, and return (server, URL of a
+    new db in the bucket).
+    """
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as e:
+        raise ImportError("moto is required for --s3-stand-in, install it "
+                          "using 'pip install moto[server]'") from e
+    import boto3
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Do not log every request
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    os.environ["AWS_ENDPOINT_URL_S3"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    boto3.client("s3").create_bucket(Bucket=s3BucketName)
+    return (server, f"s3://{s3BucketName}/{uuid.uuid4().hex}")
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m asvdb.loadtest",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Load test concurrent writers and readers of an ASV "
+        "'database'.",
+        epilog=__doc__
+    )
+    dbGroup = parser.add_mutually_exclusive_group()
+    dbGroup.add_argument("--db", type=str, metavar="PATH",
+                         help="Path (or URL) of the db to use (default: a new "
+                         "temporary dir).")
+    dbGroup.add_argument("--s3-stand-in", action="store_true",
+                         help="Use a db on a local S3 stand-in server.")
+    parser.add_argument("--processes", type=int, default=4, metavar="N",
+                        help="Number of worker processes (default: "
+                        "%(default)s).")
+    parser.add_argument("--duration", type=float, default=10,
+                        metavar="SECONDS",
+                        help="How long to run (default: %(default)s).")
+    parser.add_argument("--read-fraction", type=float, default=0.2,
+                        metavar="F",
+                        help="Fraction of operations which are reads "
+                        "(default: %(default)s).")
+    parser.add_argument("--results-per-write", type=int, default=10,
+                        metavar="N",
+                        help="Number of results added by each write "
+                        "(default: %(default)s).")
+    parser.add_argument("--commits", type=int, default=10, metavar="N",
+                        help="Number of commits results are added for "
+                        "(default: %(default)s).")
+    parser.add_argument("--lock-timeout", type=float, default=5,
+                        metavar="SECONDS",
+                        help="ASVDb.lockfileTimeout (default: %(default)s).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true",
+                        help="Print the report as JSON.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Run the load test and print the report. Returns 1 if there were errors or
+    the integrity check failed.
+    """
+    args = parseArgs(argv)
+    s3Server = None
+    tmpDir = None
+    if args.s3_stand_in:
+        (s3Server, dbUrl) = startS3StandIn()
+    elif args.db:
+        dbUrl = args.db
+    else:
+        tmpDir = tempfile.TemporaryDirectory()
+        dbUrl = os.path.join(tmpDir.name, "asv")
+
+    try:
+        report = runLoadTest(dbUrl, numProcesses=args.processes,
+                             duration=args.duration,
+                             readFraction=args.read_fraction,
+                             resultsPerWrite=args.results_per_write,
+                             numCommits=args.commits,
+                             lockTimeout=args.lock_timeout, seed=args.seed)
+    finally:
+        if s3Server is not None:
+            s3Server.stop()
+        if tmpDir is not None:
+            tmpDir.cleanup()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(formatReport(report))
+    return 0 if (report["integrity"]["ok"] and not(report["errors"])) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
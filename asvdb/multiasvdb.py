@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .asvdb import ASVDb
+
+
+class MultiASVDb:
+    """
+    A read-only facade over multiple ASVDb instances (eg. local dirs and S3
+    URLs), which reads from all of them concurrently.
+    """
+    def __init__(self, sources, maxWorkers=8):
+        """
+        sources - list of ASVDb objs, or dirs/URLs to create ASVDb objs for.
+        maxWorkers - max number of sources read at the same time.
+        """
+        self.dbs = [s if isinstance(s, ASVDb) else ASVDb(s) for s in sources]
+        self.maxWorkers = maxWorkers
+
+
+    def iterResults(self, filterInfoObjList=None, filterFunc=None):
+        """
+        Return a generator of (source, BenchmarkInfo obj, [BenchmarkResult obj,
+        ...]) tuples from all sources, where source is the dbDir of the ASVDb
+        the results were read from. The results from each source are generated
+        as soon as that source has been read, so the order of the sources is
+        the order they complete in.
+
+        filterInfoObjList is passed to ASVDb.getResults() for each source.
+        filterFunc, if specified, is called as filterFunc(benchmarkInfo,
+        benchmarkResult) while reading each source, and only results it returns
+        True for are included.
+
+        If reading a source raises an exception, the exception is raised by the
+        generator and the sources not yet read are cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        futures = [executor.submit(self.__readResults, db, filterInfoObjList,
+                                   filterFunc)
+                   for db in self.dbs]
+        try:
+            for future in as_completed(futures):
+                yield from future.result()
+
+        finally:
+            # Stop reading sources if the generator is not fully consumed,
+            # without waiting for the sources being read to finish.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def getResults(self, filterInfoObjList=None, filterFunc=None):
+        """
+        Return a list of all (source, BenchmarkInfo obj, [BenchmarkResult obj,
+        ...]) tuples from all sources. See iterResults().
+        """
+        return list(self.iterResults(filterInfoObjList, filterFunc))
+
+
+    def getInfo(self):
+        """
+        Return a list of (source, BenchmarkInfo obj) tuples from all sources,
+        read concurrently.
+        """
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            infoLists = executor.map(lambda db: db.getInfo(), self.dbs)
+            return [(db.dbDir, benchmarkInfo)
+                    for (db, infoList) in zip(self.dbs, infoLists)
+                    for benchmarkInfo in infoList]
+
+
+    def __readResults(self, db, filterInfoObjList, filterFunc):
+        """
+        Return the list of (source, BenchmarkInfo obj, [BenchmarkResult obj,
+        ...]) tuples read from db.
+        """
+        retList = []
+        for (benchmarkInfo, benchmarkResults) in \
+            db.getResults(filterInfoObjList=filterInfoObjList):
+            if filterFunc is not None:
+                benchmarkResults = [r for r in benchmarkResults
+                                    if filterFunc(benchmarkInfo, r)]
+                if not(benchmarkResults):
+                    continue
+            retList.append((db.dbDir, benchmarkInfo, benchmarkResults))
+        return retList
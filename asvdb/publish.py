@@ -0,0 +1,224 @@
+"""
+Helpers for writing the files read by the ASV web frontend (the output of
+"asv publish") from an asvdb, used by ASVDb.publishIncremental().
+
+The html dir contains:
+    index.json              - the params, commits, benchmarks and machines
+    info.json               - the time of the last publish, which the frontend
+                              uses to avoid stale cached graph files
+    graphs/<params>/<benchmark name>.json
+                            - a graph file per benchmark and combination of
+                              results params (machine, python, cuda, branch,
+                              etc.), a list of [revision, value] points where
+                              value is a list (one item per combination of the
+                              benchmark's params) for benchmarks with params
+    graphs/summary/<benchmark name>.json
+                            - the geometric mean of all graphs of a benchmark,
+                              shown by the grid view
+    <static files>          - the frontend itself, copied from the asv package
+                              if it is installed (otherwise run "asv publish"
+                              once to create them)
+
+ASV numbers commits by their position in the git history, which asvdb does not
+have access to. Commits are instead numbered by their commit time in ms, so
+adding a commit does not change the number (and graph points) of any other.
+"""
+import datetime
+import itertools
+import math
+import os
+import re
+
+graphsDirName = "graphs"
+indexFileName = "index.json"
+infoFileName = "info.json"
+summaryParams = {"summary": ""}
+# The pages listed in index.json. The list view and regressions pages require
+# the step detection done by "asv publish".
+pages = [["", "Grid view", "Display as a agrid"]]
+
+_badFileNameCharsRegex = re.compile('[<>:"/\\\\^|?*\x00-\x1f]')
+_reservedFileNames = set(["CON", "PRN", "AUX", "NUL"]
+                         + [f"COM{i}" for i in range(1, 10)]
+                         + [f"LPT{i}" for i in range(1, 10)])
+
+
+def sanitizeFileName(name):
+    """
+    Return name with the characters that are not allowed in file names
+    replaced, the same way as ASV (and its frontend) does.
+    """
+    name = _badFileNameCharsRegex.sub("_", name)
+    if name.upper() in _reservedFileNames:
+        name += "_"
+    return name
+
+
+def getGraphKey(graphParams, benchmarkName):
+    """
+    Return the key (relative to the html dir) of the graph file for the
+    benchmark named benchmarkName and the dictionary of results params
+    graphParams, as expected by the frontend.
+    """
+    parts = []
+    for (name, value) in graphParams.items():
+        if value is None:
+            part = f"{name}-null"
+        elif value:
+            part = f"{name}-{value}"
+        else:
+            part = name
+        parts.append(sanitizeFileName(part))
+    parts.sort()
+    return "/".join([graphsDirName] + parts
+                    + [sanitizeFileName(benchmarkName)]) + ".json"
+
+
+def getGraphValue(benchmarkDict, resultDict):
+    """
+    Return the value of the graph point for the entry of a benchmark in a
+    results file, resultDict, given the entry of the benchmark in
+    benchmarks.json, benchmarkDict. Benchmarks with params have a list of
+    values, one for each combination of the params in benchmarks.json (None
+    for combinations not in the results file). Return None if there are no
+    values.
+    """
+    results = resultDict.get("result") or []
+    benchmarkParams = benchmarkDict.get("params") or []
+    if not(benchmarkParams):
+        return results[0] if results else None
+
+    resultsMap = dict(zip(itertools.product(*resultDict.get("params", [])),
+                          results))
+    value = [resultsMap.get(paramValues)
+             for paramValues in itertools.product(*benchmarkParams)]
+    if all(v is None for v in value):
+        return None
+    return value
+
+
+def getRevisions(commitDates):
+    """
+    Return a dictionary of {commit hash: revision} for commitDates, a
+    dictionary of {commit hash: commit time in ms}. The revision is the commit
+    time, plus the number of commits with the same or a later time that
+    sort before it (by time and then hash), so all revisions are unique and
+    increasing with commit time.
+    """
+    revisions = {}
+    prevRevision = None
+    for (date, commitHash) in sorted((int(date), commitHash)
+                                     for (commitHash, date)
+                                     in commitDates.items()):
+        revision = date
+        if (prevRevision is not None) and (revision <= prevRevision):
+            revision = prevRevision + 1
+        revisions[commitHash] = revision
+        prevRevision = revision
+    return revisions
+
+
+def getSummaryPoints(graphs):
+    """
+    Return the points of the summary graph for graphs, a list of the points of
+    all graphs of a benchmark: the geometric mean of the values of all graphs
+    (and of all items of list values) at each revision. Small gaps in each
+    series are filled by interpolation first, as done by ASV.
+    """
+    revisions = sorted(set(revision for points in graphs
+                           for (revision, _) in points))
+    revisionIndexes = dict((revision, i) for (i, revision)
+                           in enumerate(revisions))
+    series = []
+    for points in graphs:
+        numSeries = max([len(value) for (_, value) in points
+                         if isinstance(value, list)] or [1])
+        graphSeries = [[None] * len(revisions) for _ in range(numSeries)]
+        for (revision, value) in points:
+            if not(isinstance(value, list)):
+                value = [value]
+            for (values, v) in zip(graphSeries, value):
+                values[revisionIndexes[revision]] = v
+        series += graphSeries
+
+    filled = [_fillMissingValues(values) for values in series]
+    summaryPoints = []
+    for (i, revision) in enumerate(revisions):
+        if any(values[i] is not None for values in series):
+            summaryPoints.append(
+                [revision, _geometricMean([values[i] for values in filled])])
+    return summaryPoints
+
+
+def getInfo():
+    """
+    Return the contents of info.json, which has the time of this publish.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {"asv-version": _getAsvVersion(),
+            "timestamp": int(now.timestamp() * 1000)}
+
+
+def iterFrontendFiles():
+    """
+    Generate (key, contents) tuples for the static files of the ASV frontend
+    (index.html, asv.js, etc.) in the installed asv package, or nothing if asv
+    is not installed.
+    """
+    try:
+        import asv
+    except ImportError:
+        return
+    wwwDir = os.path.join(os.path.dirname(asv.__file__), "www")
+    for (dirPath, _, fileNames) in os.walk(wwwDir):
+        for fileName in fileNames:
+            filePath = os.path.join(dirPath, fileName)
+            with open(filePath, "rb") as fobj:
+                yield (os.path.relpath(filePath, wwwDir).replace(os.sep, "/"),
+                       fobj.read())
+
+
+def _fillMissingValues(values, maxGapFraction=0.1):
+    """
+    Return a copy of values with gaps (None) between two values filled by
+    linear interpolation, for gaps up to maxGapFraction of the number of
+    values that are not None.
+    """
+    maxGapSize = math.ceil(maxGapFraction
+                           * sum(v is not None for v in values))
+    filled = list(values)
+    prevIndex = None
+    for (i, v) in enumerate(values):
+        if v is None:
+            continue
+        if prevIndex is not None:
+            gapSize = i - prevIndex - 1
+            if 0 < gapSize <= maxGapSize:
+                prev = values[prevIndex]
+                for k in range(1, gapSize + 1):
+                    filled[prevIndex + k] = \
+                        (v * k + prev * (gapSize + 1 - k)) / (gapSize + 1)
+        prevIndex = i
+    return filled
+
+
+def _geometricMean(values):
+    """
+    Return the geometric mean of the values that are not None, with the sign
+    of their sum (as done by ASV), or None if there are none.
+    """
+    values = [v for v in values if v is not None]
+    if not(values):
+        return None
+    product = 1.0
+    for v in values:
+        product *= abs(v) ** (1 / len(values))
+    return product if sum(values) >= 0 else -product
+
+
+def _getAsvVersion():
+    try:
+        import asv
+    except ImportError:
+        return None
+    return getattr(asv, "__version__", None)
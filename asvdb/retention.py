@@ -0,0 +1,129 @@
+"""
+Retention policies, which determine which commits to remove from a DB using
+ASVDb.prune().
+
+A policy decides which commits (identified by branch and commitHash) to keep,
+based on the BenchmarkInfo objs for all results in the DB (see
+ASVDb.getInfo()). A commit is removed if any of the policies used removes it.
+"""
+import time
+
+secondsPerDay = 24 * 60 * 60
+secondsPerWeek = 7 * secondsPerDay
+
+
+def parseRetentionPolicy(spec):
+    """
+    Return a retention policy obj for the spec string, which is one of:
+      last:N          - keep the last N commits for each branch
+      weekly-after:D  - keep only the latest commit per week for each branch
+                        for commits older than D days
+    """
+    (name, _, arg) = spec.partition(":")
+    policyClass = policyClasses.get(name.strip())
+    if policyClass is None:
+        raise ValueError(f"Invalid retention policy '{spec}', must be one of: "
+                         f"{', '.join(n + ':N' for n in policyClasses)}")
+    try:
+        value = int(arg)
+    except ValueError:
+        raise ValueError(f"Invalid retention policy '{spec}', '{arg}' is not "
+                         "an integer") from None
+    if value < 0:
+        raise ValueError(f"Invalid retention policy '{spec}', must not be "
+                         "negative")
+    return policyClass(value)
+
+
+def getPrunePredicate(policies, benchmarkInfoList):
+    """
+    Return a predicate for ASVDb.prune() that removes the results of all
+    commits in benchmarkInfoList removed by any of the policies. Results for
+    commits not in benchmarkInfoList (eg. added after the list was read) are
+    never removed.
+    """
+    commitsToRemove = set()
+    for policy in policies:
+        commitsToRemove.update(policy.getCommitsToRemove(benchmarkInfoList))
+
+    def predicate(benchmarkInfo, benchmarkResult):
+        return (benchmarkInfo.branch, benchmarkInfo.commitHash) \
+            in commitsToRemove
+    return predicate
+
+
+def getCommitTimeSeconds(commitTime):
+    """
+    Return commitTime in seconds. ASV expects commit times in milliseconds,
+    but some DBs use seconds, so values too large to be seconds are assumed to
+    be milliseconds.
+    """
+    if commitTime > 1e11:
+        return commitTime / 1000
+    return commitTime
+
+
+def _getCommitsByBranch(benchmarkInfoList):
+    """
+    Return a dictionary of {branch: [(commitTime, commitHash), ...]} with the
+    commits for each branch sorted newest first.
+    """
+    commits = {}
+    for benchmarkInfo in benchmarkInfoList:
+        commits.setdefault(benchmarkInfo.branch, {})[benchmarkInfo.commitHash] \
+            = benchmarkInfo.commitTime
+    return dict(
+        (branch, sorted(((t, h) for (h, t) in branchCommits.items()),
+                        reverse=True))
+        for (branch, branchCommits) in commits.items())
+
+
+class KeepLastCommits:
+    """
+    Keep the numCommits most recent commits (by commitTime) on each branch.
+    """
+    def __init__(self, numCommits):
+        self.numCommits = numCommits
+
+
+    def getCommitsToRemove(self, benchmarkInfoList):
+        return set((branch, commitHash)
+                   for (branch, commits) in
+                   _getCommitsByBranch(benchmarkInfoList).items()
+                   for (_, commitHash) in commits[self.numCommits:])
+
+
+class DownsampleWeekly:
+    """
+    For commits older than afterDays days, keep only the most recent commit
+    (by commitTime) in each week on each branch.
+    """
+    def __init__(self, afterDays, now=None):
+        self.afterDays = afterDays
+        self.now = now
+
+
+    def getCommitsToRemove(self, benchmarkInfoList):
+        now = self.now if self.now is not None else time.time()
+        cutoff = now - (self.afterDays * secondsPerDay)
+        commitsToRemove = set()
+        for (branch, commits) in _getCommitsByBranch(benchmarkInfoList).items():
+            weeksSeen = set()
+            # Commits are sorted newest first, so the first commit seen in a
+            # week is the one kept.
+            for (commitTime, commitHash) in commits:
+                seconds = getCommitTimeSeconds(commitTime)
+                if seconds >= cutoff:
+                    continue
+                week = int(seconds // secondsPerWeek)
+                if week in weeksSeen:
+                    commitsToRemove.add((branch, commitHash))
+                else:
+                    weeksSeen.add(week)
+        return commitsToRemove
+
+
+policyClasses = {
+    "last": KeepLastCommits,
+    "weekly-after": DownsampleWeekly,
+}
@@ -0,0 +1,468 @@
+"""
+A long-running query server which keeps the results of a db parsed and indexed
+in memory, so queries do not pay for process startup or reading the db.
+
+Run with "python -m asvdb serve --read-from PATH". The results are refreshed in
+the background, and only results files that changed are re-read. Queries are
+HTTP GET requests, over TCP or a Unix socket, with the query args in the URL
+and JSON responses (except for /export):
+
+  /status                  number of results, last refresh time, etc.
+  /filter?expr=EXPR        results for which the python expression EXPR (as
+                           used by --filter) evaluates to True
+  /history?funcName=NAME   results for a benchmark ordered by commitTime
+  /compare?base=H1&head=H2 results for commit H2 paired with the results for
+                           commit H1 with the same benchmark, params and
+                           machine details, and the ratio of the two
+  /export?format=FORMAT    results as csv, jsonl or parquet
+  /refresh                 refresh the results now (POST only)
+
+All queries also accept KEY=VALUE args (eg. machineName=my_machine or
+param_dataset=hollywood.csv) to only include results with those values, and
+/filter, /history and /export accept expr=EXPR and limit=N.
+
+Since queries can come from anywhere (eg. any web page, for a server on
+localhost), EXPR can only use the keys of a result, constants, comparisons,
+"and", "or" and "not" (eg. "result > 2 and funcName in ('bfs', 'sssp')"), and
+is evaluated without any builtins.
+"""
+import argparse
+import ast
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+
+from .asvdb import ASVDb, BenchmarkInfoKeys, BenchmarkResultKeys
+from . import export
+
+paramKeyPrefix = "param_"
+# Keys used to match results from different commits in compare queries.
+compareKeys = ["machineName", "cudaVer", "osType", "pythonVer", "gpuType",
+               "cpuType", "arch", "funcName"]
+
+
+# The only AST nodes allowed in query expressions.
+_allowedExprNodes = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp,
+                     ast.Not, ast.USub, ast.UAdd, ast.Compare, ast.Eq,
+                     ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In,
+                     ast.NotIn, ast.Is, ast.IsNot, ast.Name, ast.Load,
+                     ast.Constant, ast.Tuple, ast.List)
+
+
+@lru_cache(maxsize=256)
+def compileExpr(expr):
+    """
+    Return the code for the query expression expr, which can only contain the
+    nodes in _allowedExprNodes. Raise a ValueError for any other expression.
+    """
+    tree = ast.parse(expr, "<expr>", "eval")
+    for node in ast.walk(tree):
+        if not(isinstance(node, _allowedExprNodes)):
+            raise ValueError(f"{node.__class__.__name__} is not allowed in "
+                             "query expressions")
+        if isinstance(node, ast.Name) and node.id.startswith("__"):
+            raise ValueError(f"Name '{node.id}' is not allowed in query "
+                             "expressions")
+    return compile(tree, "<expr>", "eval")
+
+
+def rowToDict(benchmarkInfo, benchmarkResult):
+    """
+    Return a JSON-serializable dictionary of all keys for the result.
+    """
+    d = dict(benchmarkInfo.__dict__)
+    d.update(benchmarkResult.__dict__)
+    d["argNameValuePairs"] = [list(p) for p in benchmarkResult.argNameValuePairs]
+    return d
+
+
+class _Snapshot:
+    """
+    An immutable, indexed set of results. Queries use the snapshot current
+    when they start, so refreshes never affect queries in progress.
+    """
+    def __init__(self, resultTuples):
+        rows = [(benchmarkInfo, benchmarkResult)
+                for (benchmarkInfo, benchmarkResults) in resultTuples
+                for benchmarkResult in benchmarkResults]
+        rows.sort(key=lambda row: row[0].commitTime)
+        self.rows = rows
+        self.numResultsFiles = len(resultTuples)
+        self.byFuncName = {}
+        self.byCommitHash = {}
+        for (i, (benchmarkInfo, benchmarkResult)) in enumerate(rows):
+            self.byFuncName.setdefault(benchmarkResult.funcName, []).append(i)
+            self.byCommitHash.setdefault(benchmarkInfo.commitHash, []).append(i)
+
+
+class ResultsIndex:
+    """
+    The results in an ASVDb, kept in memory and indexed for queries.
+    refresh() only re-reads the results files that changed.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.lastRefreshTime = None
+        self.__cache = {}
+        self.__refreshLock = threading.Lock()
+        self.__snapshot = _Snapshot([])
+
+
+    def refresh(self):
+        """
+        Read any results files that changed since the last refresh and update
+        the index. Return a tuple of (set of results file keys added or
+        changed, set of keys removed).
+        """
+        with self.__refreshLock:
+            firstRefresh = self.lastRefreshTime is None
+            (changedKeys, removedKeys) = \
+                self.db.updateResultsCache(self.__cache)
+            if changedKeys or removedKeys or firstRefresh:
+                self.__snapshot = _Snapshot(
+                    list(self.__cache["results"].values()))
+            self.lastRefreshTime = time.time()
+        return (changedKeys, removedKeys)
+
+
+    def getStatus(self):
+        snapshot = self.__snapshot
+        return {"dbDir": self.db.dbDir,
+                "numResults": len(snapshot.rows),
+                "numResultsFiles": snapshot.numResultsFiles,
+                "lastRefreshTime": self.lastRefreshTime,
+                }
+
+
+    def filter(self, expr=None, limit=None, **keyValues):
+        """
+        Return a list of (BenchmarkInfo obj, BenchmarkResult obj) tuples,
+        ordered by commitTime, for all results with the values (compared as
+        strings) in keyValues and for which the expression expr evaluates to
+        True.
+        """
+        snapshot = self.__snapshot
+        code = compileExpr(expr) if expr else None
+        checks = [self.__getKeyCheck(k, v) for (k, v) in keyValues.items()]
+
+        # Use an index to narrow the rows checked, if possible.
+        if "funcName" in keyValues:
+            rows = [snapshot.rows[i] for i in
+                    snapshot.byFuncName.get(keyValues["funcName"], [])]
+        elif "commitHash" in keyValues:
+            rows = [snapshot.rows[i] for i in
+                    snapshot.byCommitHash.get(keyValues["commitHash"], [])]
+        else:
+            rows = snapshot.rows
+
+        retList = []
+        for (benchmarkInfo, benchmarkResult) in rows:
+            if not(all(check(benchmarkInfo, benchmarkResult)
+                       for check in checks)):
+                continue
+            if code is not None:
+                namespace = dict(benchmarkInfo.__dict__)
+                namespace.update(benchmarkResult.__dict__)
+                if not(eval(code, {"__builtins__": {}}, namespace)):
+                    continue
+            retList.append((benchmarkInfo, benchmarkResult))
+            if (limit is not None) and (len(retList) >= limit):
+                break
+        return retList
+
+
+    def history(self, funcName, expr=None, limit=None, **keyValues):
+        """
+        Return the results for funcName, ordered by commitTime. See filter().
+        """
+        return self.filter(expr=expr, limit=limit, funcName=funcName,
+                           **keyValues)
+
+
+    def compare(self, base, head, **keyValues):
+        """
+        Return a list of (BenchmarkInfo obj, base BenchmarkResult obj, head
+        BenchmarkResult obj) tuples for all results for the head commitHash
+        that have a result for the base commitHash with the same benchmark,
+        params and machine details.
+        """
+        def getMatchKey(benchmarkInfo, benchmarkResult):
+            return tuple(getattr(benchmarkInfo, k, None)
+                         if k in BenchmarkInfoKeys
+                         else getattr(benchmarkResult, k)
+                         for k in compareKeys) \
+                + tuple(benchmarkResult.argNameValuePairs)
+
+        baseResults = dict(
+            (getMatchKey(benchmarkInfo, benchmarkResult), benchmarkResult)
+            for (benchmarkInfo, benchmarkResult) in
+            self.filter(commitHash=base, **keyValues))
+
+        retList = []
+        for (benchmarkInfo, benchmarkResult) in \
+            self.filter(commitHash=head, **keyValues):
+            baseResult = baseResults.get(getMatchKey(benchmarkInfo,
+                                                     benchmarkResult))
+            if baseResult is not None:
+                retList.append((benchmarkInfo, baseResult, benchmarkResult))
+        return retList
+
+
+    def __getKeyCheck(self, key, value):
+        """
+        Return a callable that returns True if a result has value (as a string)
+        for key.
+        """
+        if key in BenchmarkInfoKeys:
+            return lambda bi, br: str(getattr(bi, key)) == value
+        if key in BenchmarkResultKeys:
+            return lambda bi, br: str(getattr(br, key)) == value
+        if key.startswith(paramKeyPrefix):
+            pair = (key[len(paramKeyPrefix):], value)
+            return lambda bi, br: pair in br.argNameValuePairs
+        raise ValueError(f"Unknown key '{key}'")
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles queries for the ResultsIndex in self.server.resultsIndex.
+    """
+    def do_GET(self):
+        self.__handle({"/status": self.__status,
+                       "/filter": self.__filter,
+                       "/history": self.__history,
+                       "/compare": self.__compare,
+                       "/export": self.__export,
+                       },
+                      {"/refresh": "POST"})
+
+
+    def do_POST(self):
+        # Queries that change the state of the server are only allowed as
+        # POST requests. Their args are in the URL, so any body is ignored.
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.__handle({"/refresh": self.__refresh},
+                      dict.fromkeys(["/status", "/filter", "/history",
+                                     "/compare", "/export"], "GET"))
+
+
+    def __handle(self, handlers, otherMethods):
+        """
+        Call the handler in handlers for the query path with the query args,
+        sending a 405 response for paths only allowed for the methods in
+        otherMethods, and a 400 response for any error in the query.
+        """
+        url = urllib.parse.urlsplit(self.path)
+        args = dict((k, v[-1]) for (k, v) in
+                    urllib.parse.parse_qs(url.query).items())
+        handler = handlers.get(url.path)
+        if handler is None:
+            if url.path in otherMethods:
+                self.__sendJson({"error": f"{url.path} must be a "
+                                 f"{otherMethods[url.path]} request"}, 405)
+            else:
+                self.__sendJson({"error": f"Unknown query '{url.path}'"},
+                                404)
+            return
+        try:
+            handler(args)
+        except Exception as e:
+            # The query (eg. expr) is evaluated before any response is sent.
+            self.__sendJson({"error": f"{e.__class__.__name__}: {e}"}, 400)
+
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            sys.stderr.write("%s\n" % (format % args))
+
+
+    def __status(self, args):
+        self.__sendJson(self.server.resultsIndex.getStatus())
+
+
+    def __filter(self, args):
+        self.__sendRows(self.server.resultsIndex.filter(
+            **self.__getFilterArgs(args)))
+
+
+    def __history(self, args):
+        if "funcName" not in args:
+            raise ValueError("funcName must be specified")
+        self.__sendRows(self.server.resultsIndex.filter(
+            **self.__getFilterArgs(args)))
+
+
+    def __compare(self, args):
+        base = args.pop("base")
+        head = args.pop("head")
+        retList = []
+        for (benchmarkInfo, baseResult, headResult) in \
+            self.server.resultsIndex.compare(base, head, **args):
+            row = rowToDict(benchmarkInfo, headResult)
+            row["baseResult"] = baseResult.result
+            try:
+                row["ratio"] = headResult.result / baseResult.result
+            except (TypeError, ZeroDivisionError):
+                row["ratio"] = None
+            retList.append(row)
+        self.__sendJson(retList)
+
+
+    def __export(self, args):
+        formatName = args.pop("format", "csv")
+        rows = self.server.resultsIndex.filter(**self.__getFilterArgs(args))
+        resultTuples = [(benchmarkInfo, [benchmarkResult])
+                        for (benchmarkInfo, benchmarkResult) in rows]
+        paramNames = export.getParamNames(resultTuples)
+
+        if formatName == "parquet":
+            fileObj = io.BytesIO()
+        else:
+            fileObj = io.StringIO(newline="")
+        with export.getExporter(formatName, fileObj, paramNames) as exporter:
+            exporter.writeResults(resultTuples)
+        data = fileObj.getvalue()
+        if isinstance(data, str):
+            data = data.encode()
+
+        contentType = {"csv": "text/csv",
+                       "jsonl": "application/x-ndjson",
+                       }.get(formatName, "application/octet-stream")
+        self.__send(data, contentType)
+
+
+    def __refresh(self, args):
+        (changedKeys, removedKeys) = self.server.resultsIndex.refresh()
+        self.__sendJson({"changed": sorted(changedKeys),
+                         "removed": sorted(removedKeys)})
+
+
+    def __getFilterArgs(self, args):
+        if "limit" in args:
+            args["limit"] = int(args["limit"])
+        return args
+
+
+    def __sendRows(self, rows):
+        self.__sendJson([rowToDict(benchmarkInfo, benchmarkResult)
+                         for (benchmarkInfo, benchmarkResult) in rows])
+
+
+    def __sendJson(self, obj, status=200):
+        self.__send(json.dumps(obj).encode(), "application/json", status)
+
+
+    def __send(self, data, contentType, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A HTTP server listening on a Unix socket, which only the user running the
+    server can connect to.
+    """
+    daemon_threads = True
+
+    def server_bind(self):
+        super().server_bind()
+        # The socket does not accept connections until server_activate() is
+        # called.
+        os.chmod(self.server_address, 0o600)
+
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        (request, _) = super().get_request()
+        return (request, ("local", 0))
+
+
+def createServer(resultsIndex, host="127.0.0.1", port=8080, unixSocket=None,
+                 verbose=False):
+    """
+    Return a HTTP server (not yet serving) for queries on resultsIndex,
+    listening on host:port, or on the Unix socket path unixSocket if
+    specified.
+    """
+    if unixSocket is not None:
+        if os.path.exists(unixSocket):
+            os.remove(unixSocket)
+        server = UnixHTTPServer(unixSocket, QueryRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), QueryRequestHandler)
+    server.resultsIndex = resultsIndex
+    server.verbose = verbose
+    return server
+
+
+def startRefreshThread(resultsIndex, refreshInterval):
+    """
+    Start a daemon thread that refreshes resultsIndex every refreshInterval
+    seconds.
+    """
+    def refreshLoop():
+        while True:
+            time.sleep(refreshInterval)
+            try:
+                resultsIndex.refresh()
+            except Exception as e:
+                sys.stderr.write(f"Error refreshing results: {e}\n")
+
+    thread = threading.Thread(target=refreshLoop, daemon=True)
+    thread.start()
+    return thread
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="asvdb serve",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Serve queries on an ASV 'database' kept in memory.",
+        epilog=__doc__
+    )
+    parser.add_argument("--read-from", type=str, metavar="PATH", required=True,
+                        help="Path to ASV db dir to serve.")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                        help="Host to listen on (default: %(default)s).")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="Port to listen on (default: %(default)s).")
+    parser.add_argument("--unix-socket", type=str, metavar="PATH",
+                        help="Listen on the Unix socket at %(metavar)s instead "
+                        "of --host/--port. Only the user running the server "
+                        "can connect to it.")
+    parser.add_argument("--refresh-interval", type=float, default=5,
+                        metavar="SECONDS",
+                        help="How often to check the db for changed results "
+                        "files (default: %(default)s).")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Log each request to STDERR.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+
+    db = ASVDb(args.read_from)
+    db.loadConfFile()
+    resultsIndex = ResultsIndex(db)
+    resultsIndex.refresh()
+    startRefreshThread(resultsIndex, args.refresh_interval)
+
+    server = createServer(resultsIndex, host=args.host, port=args.port,
+                          unixSocket=args.unix_socket, verbose=args.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,885 @@
+import hashlib
+import os
+from os import path
+import posixpath
+import glob
+import time
+import random
+import stat
+import threading
+import uuid
+from urllib.parse import urlparse
+
+# All lockfiles (or lock objects) start with this prefix so locks held by other
+# ASVDb instances can be found.
+lockfilePrefix = ".asvdbLOCK"
+
+# {root URL: threading.RLock} for each db locked by this process. The lock is
+# held (in addition to the lockfile) by the thread holding the db lock, so
+# threads in the same process wait for each other instead of colliding on
+# lockfiles, and threads using the same ASVDb instance (and so the same
+# lockfile name) cannot release each other's lock.
+_processLocks = {}
+_processLocksLock = threading.Lock()
+
+
+def getStorageForURL(url):
+    """
+    Return a StorageBackend instance appropriate for url. "s3://" URLs use S3,
+    "memory://" URLs use a named in-memory store, and everything else is
+    treated as a path on the local file system.
+    """
+    if url.startswith("s3:"):
+        return S3Storage(url)
+    if url.startswith("memory:"):
+        return MemoryStorage(url)
+    return LocalStorage(url)
+
+
+def _getProcessLock(rootURL):
+    with _processLocksLock:
+        return _processLocks.setdefault(rootURL, threading.RLock())
+
+
+def _releaseProcessLock(rootURL):
+    try:
+        _getProcessLock(rootURL).release()
+    except RuntimeError:
+        # Not held by this thread, because acquireLock() failed before
+        # acquiring it.
+        pass
+
+
+class StorageBackend:
+    """
+    Interface to the storage holding the files of an ASV "database".
+
+    Files are identified by keys, which are "/"-separated paths relative to the
+    root of the database (eg. "results/benchmarks.json"). Contents are always
+    bytes. Each file also has an opaque version string which changes every time
+    the file is written, which is used for conditional writes.
+    """
+    # Number of times acquireLock() found another lock was set at the same
+    # time as its own and had to back off and retry.
+    lockCollisions = 0
+
+    def getRootURL(self):
+        """
+        Return a URL (or absolute path) identifying the root of the database,
+        which is the same for all instances using the same database.
+        """
+        raise NotImplementedError
+
+
+    def exists(self):
+        """
+        Return True if the root of the database exists.
+        """
+        raise NotImplementedError
+
+
+    def create(self):
+        """
+        Create the root of the database if it does not exist.
+        """
+        raise NotImplementedError
+
+
+    def listFiles(self, prefix=""):
+        """
+        Return a sorted list of keys for all files under prefix.
+        """
+        return sorted(self.listVersions(prefix))
+
+
+    def listVersions(self, prefix=""):
+        """
+        Return a dictionary of {key: version} for all files under prefix.
+        """
+        raise NotImplementedError
+
+
+    def read(self, key):
+        """
+        Return the contents of the file at key, or None if it does not exist.
+        """
+        return self.readWithVersion(key)[0]
+
+
+    def readWithVersion(self, key):
+        """
+        Return a tuple of (contents, version) for the file at key, or (None,
+        None) if it does not exist.
+        """
+        raise NotImplementedError
+
+
+    def readFrom(self, key, offset):
+        """
+        Return the contents of the file at key after the first offset bytes
+        (b"" if the file is not longer than offset), or None if it does not
+        exist. This default implementation reads the entire file, so backends
+        that can read part of a file should override it.
+        """
+        data = self.read(key)
+        return data[offset:] if data is not None else None
+
+
+    def write(self, key, data):
+        """
+        Write data to the file at key, replacing any existing contents, and
+        return the new version.
+        """
+        raise NotImplementedError
+
+
+    def writeIfChanged(self, key, data):
+        """
+        Write data to the file at key only if its current contents are
+        different. Return the new version if the file was written, None if it
+        was not.
+        """
+        if self.read(key) == data:
+            return None
+        return self.write(key, data)
+
+
+    def conditionalWrite(self, key, data, expectedVersion):
+        """
+        Write data to the file at key only if its current version is
+        expectedVersion (None meaning the file must not exist yet). Return the
+        new version if the write took place, None otherwise.
+        """
+        raise NotImplementedError
+
+
+    def append(self, key, data):
+        """
+        Append data to the file at key, creating it if it does not exist. This
+        default implementation rewrites the entire file, so backends that can
+        append in place should override it.
+        """
+        self.write(key, (self.read(key) or b"") + data)
+
+
+    def delete(self, key):
+        """
+        Remove the file at key. Removing a file that does not exist is not an
+        error.
+        """
+        raise NotImplementedError
+
+
+    def acquireLock(self, lockName, timeout, debugPrint=False):
+        """
+        Block until the database-wide lock is held on behalf of lockName, which
+        must be unique to the caller. Locks held by others for longer than
+        timeout seconds may be presumed dead and cleared. The lock is only held
+        by the calling thread, even if other threads use the same lockName.
+        """
+        raise NotImplementedError
+
+
+    def releaseLock(self, lockName, debugPrint=False):
+        """
+        Release the lock previously acquired for lockName.
+        """
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    """
+    Storage for a database in a directory on the local (or a network mounted)
+    file system.
+    """
+    def __init__(self, rootDir):
+        self.rootDir = rootDir
+
+
+    def getRootURL(self):
+        return path.abspath(self.rootDir)
+
+
+    def exists(self):
+        return path.isdir(self.rootDir)
+
+
+    def create(self):
+        if not(path.exists(self.rootDir)):
+            os.mkdir(self.rootDir)
+            # Hack: os.mkdir() seems to return before the filesystem catches up,
+            # so pause before returning to help ensure the dir actually exists
+            time.sleep(0.1)
+
+
+    def listVersions(self, prefix=""):
+        versions = {}
+        topDir = self.__getPath(prefix)
+        for (dirPath, _, fileNames) in os.walk(topDir):
+            relDir = path.relpath(dirPath, self.rootDir).replace(os.sep, "/")
+            for fileName in fileNames:
+                key = posixpath.normpath(posixpath.join(relDir, fileName))
+                try:
+                    versions[key] = self.__getVersion(path.join(dirPath, fileName))
+                except FileNotFoundError:
+                    pass
+        return versions
+
+
+    def readWithVersion(self, key):
+        filePath = self.__getPath(key)
+        try:
+            with open(filePath, "rb") as fobj:
+                # FIXME: ideally this could use flock(), but some situations do
+                # not allow grabbing a file lock (NFS?)
+                # fcntl.flock(fobj, fcntl.LOCK_EX)
+                return (fobj.read(), self.__getVersion(fobj.fileno()))
+        except FileNotFoundError:
+            return (None, None)
+
+
+    def readFrom(self, key, offset):
+        try:
+            with open(self.__getPath(key), "rb") as fobj:
+                fobj.seek(offset)
+                return fobj.read()
+        except FileNotFoundError:
+            return None
+
+
+    def write(self, key, data):
+        """
+        The data is written to a temp file in the same dir, which then replaces
+        the file, so readers (and the file after a crash) never see a
+        partially written file.
+        """
+        filePath = self.__getPath(key)
+        tmpFilePath = self.__writeTempFile(filePath, data)
+        try:
+            os.replace(tmpFilePath, filePath)
+        except BaseException:
+            self.__removeFiles([tmpFilePath])
+            raise
+        return self.__getVersion(filePath)
+
+
+    def writeIfChanged(self, key, data):
+        filePath = self.__getPath(key)
+        try:
+            # Files of a different size cannot have the same contents, so
+            # only read the file if the size matches.
+            if os.stat(filePath).st_size == len(data):
+                with open(filePath, "rb") as fobj:
+                    if fobj.read() == data:
+                        return None
+        except FileNotFoundError:
+            pass
+        return self.write(key, data)
+
+
+    def conditionalWrite(self, key, data, expectedVersion):
+        """
+        Creating a file (expectedVersion=None) is atomic. Replacing a file is
+        only atomic with respect to other callers holding the database lock.
+        """
+        filePath = self.__getPath(key)
+        if expectedVersion is None:
+            # Linking the temp file only creates the file if it does not
+            # exist, and readers never see it partially written.
+            tmpFilePath = self.__writeTempFile(filePath, data)
+            try:
+                os.link(tmpFilePath, filePath)
+            except FileExistsError:
+                return None
+            finally:
+                self.__removeFiles([tmpFilePath])
+            return self.__getVersion(filePath)
+
+        try:
+            currentVersion = self.__getVersion(filePath)
+        except FileNotFoundError:
+            return None
+        if currentVersion != expectedVersion:
+            return None
+        return self.write(key, data)
+
+
+    def append(self, key, data):
+        filePath = self.__getPath(key)
+        dirPath = path.dirname(filePath)
+        if not path.isdir(dirPath):
+            os.makedirs(dirPath, exist_ok=True)
+
+        # A single write() to a file opened for appending is not interleaved
+        # with appends from other processes.
+        with open(filePath, "ab") as fobj:
+            fobj.write(data)
+
+
+    def delete(self, key):
+        try:
+            os.remove(self.__getPath(key))
+        except FileNotFoundError:
+            pass
+
+
+    def acquireLock(self, lockName, timeout, debugPrint=False):
+        """
+        Gets a lock on the database dir against other ASVDb instances (in other
+        processes, possibily on other machines) using the following technique:
+
+        * Check for other locks and clear them if they've been seen for longer
+          than timeout (do this to help cleanup after others that may have died
+          prematurely)
+
+        * Once all locks are clear - either by their owner because they
+          finished their read/write, or by removing them because they're
+          presumed dead - create a lock for this instance
+
+        * If a race condition was detected, probably because multiple ASVDbs
+          saw all locks were cleared at the same time and created their locks
+          at the same time, remove this lock, and wait a random amount of time
+          before trying again.  The random time prevents yet another race.
+
+        Threads in this process wait for each other on an in-process lock
+        before checking for lockfiles.
+        """
+        _getProcessLock(self.getRootURL()).acquire()
+        otherLockfileTimes = {}
+        thisLockfile = path.join(self.rootDir, lockName)
+        # FIXME: This shouldn't be needed? But if so, be smarter about
+        # preventing an infintite loop?
+        i = 0
+        while i < 1000:
+            # Keep checking for other locks to clear
+            self.__updateOtherLockfileTimes(lockName, otherLockfileTimes,
+                                            timeout, debugPrint)
+            # FIXME: potential infintite loop due to starvation?
+            otherLocks = list(otherLockfileTimes.keys())
+            while otherLocks:
+                if debugPrint:
+                    print(f"This lock file will be {thisLockfile} but other "
+                          f"locks present: {otherLocks}, waiting to try to "
+                          "lock again...")
+                time.sleep(0.2)
+                self.__updateOtherLockfileTimes(lockName, otherLockfileTimes,
+                                                timeout, debugPrint)
+                otherLocks = list(otherLockfileTimes.keys())
+
+            # All clear, create lock
+            if debugPrint:
+                print(f"All clear, setting lock {thisLockfile}")
+            self.__createLockfile(thisLockfile)
+
+            # Check for a race condition where another lock could have been created
+            # while creating the lock for this instance.
+            self.__updateOtherLockfileTimes(lockName, otherLockfileTimes,
+                                            timeout, debugPrint)
+
+            # If another lock snuck in while this instance was creating its
+            # lock, remove this lock and wait a random amount of time before
+            # trying again (random time to prevent another race condition with
+            # the competing instance, this way someone will clearly get there
+            # first)
+            if otherLockfileTimes:
+                self.__removeFiles([thisLockfile])
+                self.lockCollisions += 1
+                randTime = (int(5 * random.random()) + 1) + random.random()
+                if debugPrint:
+                    print(f"Collision - waiting {randTime} seconds before "
+                          "trying to lock again.")
+                time.sleep(randTime)
+            else:
+                break
+
+            i += 1
+
+
+    def releaseLock(self, lockName, debugPrint=False):
+        thisLockfile = path.join(self.rootDir, lockName)
+        if debugPrint:
+            print(f"Removing lock {thisLockfile}")
+        self.__removeFiles([thisLockfile])
+        _releaseProcessLock(self.getRootURL())
+
+
+    def __updateOtherLockfileTimes(self, lockName, lockfileTimes, timeout,
+                                   debugPrint):
+        """
+        Remove lockfiles that have "timed out", probably because their process
+        was killed. This will never include the lockfile for lockName.  Update
+        the lockfileTimes dict as a side effect with the discovery time of any
+        new lockfiles and remove any lockfiles that are no longer present.
+        """
+        thisLockfile = path.join(self.rootDir, lockName)
+        now = time.time()
+        expired = []
+
+        allLockfiles = glob.glob(path.join(self.rootDir, lockfilePrefix) + "*")
+
+        if debugPrint:
+            print(f"   This lockfile is {thisLockfile}, allLockfiles is "
+                  f"{allLockfiles}, lockfileTimes is {lockfileTimes}")
+        # Remove lockfiles from the lockfileTimes dict that are no longer
+        # present on disk
+        lockfilesToRemove = set(lockfileTimes.keys()) - set(allLockfiles)
+        for removedLockfile in lockfilesToRemove:
+            lockfileTimes.pop(removedLockfile)
+
+        # check for expired lockfiles while also setting the discovery time on
+        # new lockfiles in the lockfileTimes dict.
+        for lockfile in allLockfiles:
+            if lockfile == thisLockfile:
+                continue
+            if (now - lockfileTimes.setdefault(lockfile, now)) > timeout:
+                expired.append(lockfile)
+
+        if debugPrint:
+            print(f"   This lockfile is {thisLockfile}, lockfileTimes is "
+                  f"{lockfileTimes}, now is {now}, expired is {expired}")
+        self.__removeFiles(expired)
+
+
+    def __createLockfile(self, lockfile):
+        """
+        low-level lockfile creation - consider calling acquireLock() instead.
+        """
+        open(lockfile, "w").close()
+        # Make the lockfile read/write to all so others can remove it if this
+        # process dies prematurely
+        os.chmod(lockfile, (stat.S_IRUSR | stat.S_IWUSR
+                            | stat.S_IRGRP | stat.S_IWGRP
+                            | stat.S_IROTH | stat.S_IWOTH))
+
+
+    def __removeFiles(self, fileList):
+        for f in fileList:
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+
+    def __getPath(self, key):
+        return path.join(self.rootDir, *key.split("/")) if key else self.rootDir
+
+
+    def __writeTempFile(self, filePath, data):
+        """
+        Write data to a new temp file in the dir of filePath, creating the dir
+        if needed, and return the path of the temp file.
+        """
+        dirPath = path.dirname(filePath)
+        if not path.isdir(dirPath):
+            os.makedirs(dirPath, exist_ok=True)
+
+        # Temp files are hidden so they are never read as ASV files.
+        tmpFilePath = path.join(dirPath, ".%s.%s.tmp"
+                                % (path.basename(filePath), uuid.uuid4().hex))
+        try:
+            with open(tmpFilePath, "wb") as fobj:
+                fobj.write(data)
+        except BaseException:
+            self.__removeFiles([tmpFilePath])
+            raise
+        return tmpFilePath
+
+
+    def __getVersion(self, fileOrFd):
+        # Files are replaced (not modified) on write, so the inode changes even
+        # if the mtime does not (its resolution can be coarser than the time
+        # between writes) and the size is the same.
+        st = os.stat(fileOrFd)
+        return f"{st.st_ino}-{st.st_mtime_ns}-{st.st_size}"
+
+
+# boto3 clients are thread-safe and expensive to create (session creation,
+# credential resolution, a new connection pool), so a single client is shared by
+# all S3Storage instances in a process. Clients are cached by the environment
+# settings that affect them so changing eg. the endpoint still takes effect.
+_s3ClientEnvVars = ["AWS_ENDPOINT_URL_S3", "AWS_ENDPOINT_URL", "AWS_PROFILE",
+                    "AWS_DEFAULT_REGION", "AWS_ACCESS_KEY_ID"]
+_s3Clients = {}
+_s3ClientsLock = threading.Lock()
+_s3MaxPoolConnections = int(os.environ.get("ASVDB_S3_MAX_POOL_CONNECTIONS", 32))
+
+
+def setS3MaxPoolConnections(maxPoolConnections):
+    """
+    Set the size of the HTTP connection pool used by the shared S3 client,
+    which limits the number of concurrent S3 requests in this process. The
+    default can also be set with the ASVDB_S3_MAX_POOL_CONNECTIONS env var.
+    """
+    global _s3MaxPoolConnections
+    with _s3ClientsLock:
+        _s3MaxPoolConnections = int(maxPoolConnections)
+        _s3Clients.clear()
+
+
+def getS3Client():
+    """
+    Return the S3 client shared by all threads and S3Storage instances in this
+    process, creating it on first use.
+    """
+    cacheKey = (os.getpid(), _s3MaxPoolConnections) \
+        + tuple(os.environ.get(v) for v in _s3ClientEnvVars)
+    client = _s3Clients.get(cacheKey)
+    if client is None:
+        with _s3ClientsLock:
+            client = _s3Clients.get(cacheKey)
+            if client is None:
+                (boto3, _) = _importBoto()
+                from botocore.config import Config
+                # boto3 sessions are not thread-safe, so each client gets its
+                # own session, created while holding the lock.
+                session = boto3.session.Session()
+                client = session.client(
+                    "s3",
+                    config=Config(max_pool_connections=_s3MaxPoolConnections))
+                _s3Clients[cacheKey] = client
+    return client
+
+
+def _importBoto():
+    """
+    Import and return (boto3, botocore.exceptions). These are only imported
+    when a S3 URL is first used since importing them is slow, and they are an
+    optional dependency.
+    """
+    try:
+        import boto3
+        from botocore import exceptions
+    except ImportError as e:
+        raise ImportError("boto3 and botocore are required for S3 support, "
+                          "install them using 'pip install asvdb[s3]'") from e
+    return (boto3, exceptions)
+
+
+class S3Storage(StorageBackend):
+    """
+    Storage for a database under a "s3://<bucket>/<prefix>" URL. The endpoint
+    and credentials are resolved by boto3 as usual, so setting
+    AWS_ENDPOINT_URL_S3 allows a local S3 stand-in server to be used.
+    """
+    def __init__(self, url):
+        parsed = urlparse(url, allow_fragments=False)
+        self.bucketName = parsed.netloc
+        self.bucketKey = parsed.path.strip("/")
+        self.__clientError = _importBoto()[1].ClientError
+        self.s3Client = getS3Client()
+        # Time to wait after setting a lock before checking for collisions.
+        self.lockSettleTime = 1
+        self.__bucketExists = False
+
+
+    def getRootURL(self):
+        return f"s3://{self.bucketName}/{self.bucketKey}"
+
+
+    def exists(self):
+        if not(self.__bucketExists):
+            try:
+                self.s3Client.head_bucket(Bucket=self.bucketName)
+            except self.__clientError as e:
+                if not self.__isNotFound(e):
+                    raise
+                return False
+            self.__bucketExists = True
+        return True
+
+
+    def create(self):
+        # Buckets are never created by asvdb.
+        if not(self.exists()):
+            raise FileNotFoundError(f"S3 bucket {self.bucketName} does not "
+                                    "exist")
+
+
+    def listVersions(self, prefix=""):
+        versions = {}
+        keyPrefix = self.__getKey(prefix)
+        if prefix:
+            keyPrefix += "/"
+        paginator = self.s3Client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucketName,
+                                       Prefix=keyPrefix):
+            for obj in page.get("Contents", []):
+                versions[self.__getRelKey(obj["Key"])] = obj["ETag"]
+        return versions
+
+
+    def readWithVersion(self, key):
+        try:
+            response = self.s3Client.get_object(Bucket=self.bucketName,
+                                                Key=self.__getKey(key))
+        except self.__clientError as e:
+            if not self.__isNotFound(e):
+                raise
+            return (None, None)
+        return (response["Body"].read(), response["ETag"])
+
+
+    def readFrom(self, key, offset):
+        try:
+            response = self.s3Client.get_object(Bucket=self.bucketName,
+                                                Key=self.__getKey(key),
+                                                Range=f"bytes={offset}-")
+        except self.__clientError as e:
+            if self.__isNotFound(e):
+                return None
+            # The range starts at or after the end of the object.
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return b""
+            raise
+        return response["Body"].read()
+
+
+    def write(self, key, data):
+        response = self.s3Client.put_object(Bucket=self.bucketName,
+                                            Key=self.__getKey(key),
+                                            Body=data)
+        return response["ETag"]
+
+
+    def writeIfChanged(self, key, data):
+        """
+        The ETag of an object uploaded in a single part is the MD5 of its
+        contents, so this only needs a HEAD request to detect an unchanged
+        object. Objects with other ETags (eg. multipart uploads) are always
+        written.
+        """
+        try:
+            response = self.s3Client.head_object(Bucket=self.bucketName,
+                                                 Key=self.__getKey(key))
+        except self.__clientError as e:
+            if not self.__isNotFound(e):
+                raise
+        else:
+            if response["ETag"].strip('"') == hashlib.md5(data).hexdigest():
+                return None
+        return self.write(key, data)
+
+
+    def conditionalWrite(self, key, data, expectedVersion):
+        if expectedVersion is None:
+            condition = {"IfNoneMatch": "*"}
+        else:
+            condition = {"IfMatch": expectedVersion}
+        try:
+            response = self.s3Client.put_object(Bucket=self.bucketName,
+                                                Key=self.__getKey(key),
+                                                Body=data, **condition)
+        except self.__clientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("PreconditionFailed", "ConditionalRequestConflict",
+                        "NoSuchKey"):
+                return None
+            raise
+        return response["ETag"]
+
+
+    def delete(self, key):
+        self.s3Client.delete_object(Bucket=self.bucketName,
+                                    Key=self.__getKey(key))
+
+
+    def acquireLock(self, lockName, timeout, debugPrint=False):
+        _getProcessLock(self.getRootURL()).acquire()
+        thisLockfile = self.__getKey(lockName)
+        # FIXME: This shouldn't be needed? But if so, be smarter about
+        # preventing an infintite loop?
+        i = 0
+
+        while i < 1000:
+            otherLockfiles = self.__getOtherS3Lockfiles(lockName)
+
+            while otherLockfiles:
+                if debugPrint:
+                    print(f"This lock file will be {thisLockfile} but other "
+                          f"locks present: {otherLockfiles}, waiting to try to "
+                          "lock again...")
+
+                time.sleep(1)
+                otherLockfiles = self.__getOtherS3Lockfiles(lockName)
+
+            # All clear, create lock
+            if debugPrint:
+                print(f"All clear, setting lock {thisLockfile}")
+            self.s3Client.put_object(Bucket=self.bucketName, Key=thisLockfile,
+                                     Body=b"")
+
+            #Give S3 time to see the new lock
+            time.sleep(self.lockSettleTime)
+
+            # Check for a race condition where another lock could have been created
+            # while creating the lock for this instance.
+            otherLockfiles = self.__getOtherS3Lockfiles(lockName)
+
+            if otherLockfiles:
+                self.s3Client.delete_object(Bucket=self.bucketName,
+                                            Key=thisLockfile)
+                self.lockCollisions += 1
+                randTime = (int(30 * random.random()) + 5) + random.random()
+                if debugPrint:
+                    print(f"Collision - waiting {randTime} seconds before "
+                          "trying to lock again.")
+                time.sleep(randTime)
+            else:
+                break
+
+            i += 1
+
+
+    def releaseLock(self, lockName, debugPrint=False):
+        thisLockfile = self.__getKey(lockName)
+        if debugPrint:
+            print(f"Removing lock {thisLockfile}")
+        self.s3Client.delete_object(Bucket=self.bucketName, Key=thisLockfile)
+        _releaseProcessLock(self.getRootURL())
+
+
+    def __getOtherS3Lockfiles(self, lockName):
+        """
+        Return the keys of all lockfiles in the bucket other than the one for
+        lockName.
+        """
+        thisLockfile = self.__getKey(lockName)
+        response = self.s3Client.list_objects_v2(
+            Bucket=self.bucketName, Prefix=self.__getKey(lockfilePrefix))
+        return [obj["Key"] for obj in response.get("Contents", [])
+                if obj["Key"] != thisLockfile]
+
+
+    def __getKey(self, key):
+        return posixpath.join(self.bucketKey, key) if key else self.bucketKey
+
+
+    def __getRelKey(self, s3Key):
+        if self.bucketKey:
+            return s3Key[len(self.bucketKey) + 1:]
+        return s3Key
+
+
+    def __isNotFound(self, clientError):
+        code = clientError.response.get("Error", {}).get("Code")
+        return code in ("404", "NoSuchKey", "NoSuchBucket", "NotFound")
+
+
+class MemoryStorage(StorageBackend):
+    """
+    Storage for a database held entirely in memory, identified by a
+    "memory://<name>" URL. All MemoryStorage instances for the same name in a
+    process share the same files, which makes this useful for measuring the
+    cost of asvdb itself without any I/O, and for fast concurrency tests.
+    """
+    __stores = {}
+    __storesLock = threading.Lock()
+
+    def __init__(self, url):
+        self.name = urlparse(url, allow_fragments=False).netloc or url
+
+
+    def getRootURL(self):
+        return f"memory://{self.name}"
+
+
+    def exists(self):
+        return self.name in MemoryStorage.__stores
+
+
+    def create(self):
+        self.__getStore(create=True)
+
+
+    def destroy(self):
+        """
+        Remove all files for this in-memory database.
+        """
+        with MemoryStorage.__storesLock:
+            MemoryStorage.__stores.pop(self.name, None)
+
+
+    def listVersions(self, prefix=""):
+        store = self.__getStore()
+        if store is None:
+            return {}
+        keyPrefix = prefix + "/" if prefix else ""
+        with store.filesLock:
+            return {k: v for (k, (_, v)) in store.files.items()
+                    if k.startswith(keyPrefix)}
+
+
+    def readWithVersion(self, key):
+        store = self.__getStore()
+        if store is None:
+            return (None, None)
+        with store.filesLock:
+            return store.files.get(key, (None, None))
+
+
+    def write(self, key, data):
+        store = self.__getStore(create=True)
+        with store.filesLock:
+            return self.__write(store, key, data)
+
+
+    def conditionalWrite(self, key, data, expectedVersion):
+        store = self.__getStore(create=True)
+        with store.filesLock:
+            currentVersion = store.files.get(key, (None, None))[1]
+            if currentVersion != expectedVersion:
+                return None
+            return self.__write(store, key, data)
+
+
+    def append(self, key, data):
+        store = self.__getStore(create=True)
+        with store.filesLock:
+            self.__write(store, key,
+                         store.files.get(key, (b"", None))[0] + data)
+
+
+    def delete(self, key):
+        store = self.__getStore()
+        if store is None:
+            return
+        with store.filesLock:
+            store.files.pop(key, None)
+
+
+    def acquireLock(self, lockName, timeout, debugPrint=False):
+        store = self.__getStore(create=True)
+        if debugPrint:
+            print(f"Waiting for lock on memory://{self.name} for {lockName}")
+        store.dbLock.acquire()
+
+
+    def releaseLock(self, lockName, debugPrint=False):
+        if debugPrint:
+            print(f"Removing lock on memory://{self.name} for {lockName}")
+        self.__getStore().dbLock.release()
+
+
+    def __write(self, store, key, data):
+        store.writeCount += 1
+        version = str(store.writeCount)
+        store.files[key] = (bytes(data), version)
+        return version
+
+
+    def __getStore(self, create=False):
+        with MemoryStorage.__storesLock:
+            store = MemoryStorage.__stores.get(self.name)
+            if store is None and create:
+                store = _MemoryStore()
+                MemoryStorage.__stores[self.name] = store
+            return store
+
+
+class _MemoryStore:
+    def __init__(self):
+        self.files = {}
+        self.filesLock = threading.Lock()
+        self.dbLock = threading.Lock()
+        self.writeCount = 0
+
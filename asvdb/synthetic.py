@@ -0,0 +1,126 @@
+"""
+Generates synthetic ASV "databases" of any size, for benchmarking and load
+testing asvdb itself.
+
+A db has results for every machine x commit x benchmark x param combination,
+where each benchmark has numParams params with paramGridSize values each.
+sparsity is the fraction of those results that are randomly left out, as when
+benchmarks are added, removed or fail over time. All values are generated from
+seed, so the same args always generate the same db.
+
+Run with "python -m asvdb.synthetic --write-to PATH [options]".
+"""
+import argparse
+import hashlib
+import random
+
+from .asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+repo = "https://github.com/rapidsai/asvdb-synthetic"
+branch = "main"
+# Time of the first commit, in ms since the epoch, as ASV expects.
+firstCommitTime = 1577836800000
+commitInterval = 60 * 60 * 1000
+
+
+def getCommitHash(commitNum):
+    return hashlib.sha1(str(commitNum).encode()).hexdigest()
+
+
+def getBenchmarkInfo(machineNum, commitNum):
+    """
+    Return the BenchmarkInfo obj for machine machineNum and commit commitNum.
+    """
+    return BenchmarkInfo(machineName=f"machine{machineNum}",
+                         cudaVer="11.2",
+                         osType="linux",
+                         pythonVer="3.8",
+                         commitHash=getCommitHash(commitNum),
+                         commitTime=firstCommitTime
+                         + (commitNum * commitInterval),
+                         branch=branch,
+                         gpuType="Tesla V100-SXM2-32GB",
+                         cpuType="x86_64",
+                         arch="x86_64",
+                         ram="540863360",
+                         gpuRam="34089730048")
+
+
+def getParamCombinations(numParams, paramGridSize):
+    """
+    Return a list of all argNameValuePairs lists for the param grid.
+    """
+    combos = [[]]
+    for p in range(numParams):
+        combos = [pairs + [(f"param{p}", str(v))]
+                  for pairs in combos for v in range(paramGridSize)]
+    return combos
+
+
+def generateResultTuples(numMachines=1, numCommits=10, numBenchmarks=10,
+                         paramGridSize=3, numParams=2, sparsity=0.0, seed=0):
+    """
+    Return a generator of (BenchmarkInfo obj, [BenchmarkResult obj, ...])
+    tuples, one per machine x commit.
+    """
+    rng = random.Random(seed)
+    paramCombos = getParamCombinations(numParams, paramGridSize)
+    for machineNum in range(numMachines):
+        for commitNum in range(numCommits):
+            results = []
+            for b in range(numBenchmarks):
+                for pairs in paramCombos:
+                    if sparsity and (rng.random() < sparsity):
+                        continue
+                    results.append(BenchmarkResult(
+                        funcName=f"bench_algo_{b}", argNameValuePairs=pairs,
+                        result=rng.uniform(0.001, 10)))
+            yield (getBenchmarkInfo(machineNum, commitNum), results)
+
+
+def generateDb(dbDir, numMachines=1, numCommits=10, numBenchmarks=10,
+               paramGridSize=3, numParams=2, sparsity=0.0, seed=0):
+    """
+    Create (or add to) the db at dbDir with the results from
+    generateResultTuples(), and return its ASVDb obj.
+    """
+    db = ASVDb(dbDir, repo, [branch])
+    db.addResultTuples(generateResultTuples(
+        numMachines=numMachines, numCommits=numCommits,
+        numBenchmarks=numBenchmarks, paramGridSize=paramGridSize,
+        numParams=numParams, sparsity=sparsity, seed=seed))
+    return db
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m asvdb.synthetic",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Generate a synthetic ASV 'database'.",
+        epilog=__doc__
+    )
+    parser.add_argument("--write-to", type=str, metavar="PATH", required=True,
+                        help="Path (or URL) of the db to create.")
+    parser.add_argument("--machines", type=int, default=1)
+    parser.add_argument("--commits", type=int, default=10)
+    parser.add_argument("--benchmarks", type=int, default=10)
+    parser.add_argument("--param-grid-size", type=int, default=3,
+                        help="Number of values for each param.")
+    parser.add_argument("--params", type=int, default=2,
+                        help="Number of params for each benchmark.")
+    parser.add_argument("--sparsity", type=float, default=0.0,
+                        help="Fraction of results left out (0-1).")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    generateDb(args.write_to, numMachines=args.machines,
+               numCommits=args.commits, numBenchmarks=args.benchmarks,
+               paramGridSize=args.param_grid_size, numParams=args.params,
+               sparsity=args.sparsity, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
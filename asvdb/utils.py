@@ -1,5 +1,13 @@
+import os
+import re
 import subprocess
 
+# {(repo dir, full commit hash): (commit time, branch)} for all commits
+# resolved by getCommitInfos() and iterCommitInfos(). branch is None if it has
+# not been resolved yet.
+_commitInfoCache = {}
+_fullHashRegex = re.compile("^[0-9a-f]{40}$")
+
 
 def getRepoInfo():
     out = getCommandOutput("git remote -v")
@@ -8,26 +16,113 @@ def getRepoInfo():
     return (repo, branch)
 
 
-def getCommandOutput(cmd):
+def getCommandOutput(cmd, cwd=None, stdin=None):
+    """
+    Run cmd, a string run by the shell or a list of args, and return its
+    output. stdin is a string sent to the command's stdin.
+    """
     result = subprocess.run(cmd,
+                            input=stdin.encode() if stdin is not None else None,
                             stdout=subprocess.PIPE,
                             stderr=subprocess.PIPE,
-                            shell=True)
+                            shell=isinstance(cmd, str),
+                            cwd=cwd)
     stdout = result.stdout.decode().strip()
     if result.returncode == 0:
         return stdout
 
     stderr = result.stderr.decode().strip()
+    if not(isinstance(cmd, str)):
+        cmd = " ".join(cmd)
     raise RuntimeError("Problem running '%s' (STDOUT: '%s' STDERR: '%s')"
                        % (cmd, stdout, stderr))
 
 
 def getCommitInfo():
-    commitHash = getCommandOutput("git rev-parse HEAD")
-    commitTime = getCommandOutput("git log -n1 --pretty=%%ct %s" % commitHash)
+    out = getCommandOutput("git log -n1 --format='%H %ct' HEAD")
+    (commitHash, commitTime) = out.split()
     return (commitHash, str(int(commitTime)*1000))
 
 
+def getCommitInfos(commitHashes, repoDir=None, resolveBranches=True):
+    """
+    Return a dictionary of {commit hash as given: (full commit hash, commit time
+    in ms as a str, branch)} for each commit hash (or any other rev) in
+    commitHashes. All commits are resolved with a single "git log" (plus a
+    "git rev-parse" for revs that are not already cached commit hashes, and a
+    "git name-rev" for the branches), and are cached so each commit is only
+    resolved once per process. Revs that are not commits (eg. annotated tags)
+    are resolved to the commit they point to.
+
+    The branch of a commit is the local branch it is on, or "" if it is not on
+    any. If resolveBranches is False, branches not already cached are None.
+    """
+    repoKey = os.path.abspath(repoDir or os.getcwd())
+    commitHashes = list(dict.fromkeys(commitHashes))
+
+    # Other revs (eg. "HEAD" or abbreviated hashes) can refer to different
+    # commits over time, so only full commit hashes are cached. Full hashes not
+    # in the cache may be of other objects (eg. annotated tags), so are also
+    # resolved to the hash of the commit they point to.
+    otherRevs = [rev for rev in commitHashes
+                 if not(_fullHashRegex.match(rev))
+                 or ((repoKey, rev) not in _commitInfoCache)]
+    fullHashes = dict((rev, rev) for rev in commitHashes)
+    if otherRevs:
+        out = getCommandOutput(["git", "rev-parse"]
+                               + [f"{rev}^{{commit}}" for rev in otherRevs],
+                               cwd=repoDir)
+        fullHashes.update(zip(otherRevs, out.split()))
+
+    uncached = [h for h in dict.fromkeys(fullHashes.values())
+                if (repoKey, h) not in _commitInfoCache]
+    if uncached:
+        out = getCommandOutput(["git", "log", "--no-walk=unsorted", "--stdin",
+                                "--format=%H %ct"],
+                               cwd=repoDir, stdin="\n".join(uncached) + "\n")
+        for line in out.splitlines():
+            (commitHash, commitTime) = line.split()
+            _commitInfoCache[(repoKey, commitHash)] = \
+                (str(int(commitTime)*1000), None)
+
+    unresolved = [h for h in dict.fromkeys(fullHashes.values())
+                  if _commitInfoCache[(repoKey, h)][1] is None]
+    if resolveBranches and unresolved:
+        out = getCommandOutput(["git", "name-rev", "--name-only",
+                                "--refs=refs/heads/*"] + unresolved,
+                               cwd=repoDir)
+        for (commitHash, name) in zip(unresolved, out.splitlines()):
+            # Names are of the form "<branch>~<n>^<n>..."
+            branch = "" if name == "undefined" else re.split("[~^]", name)[0]
+            _commitInfoCache[(repoKey, commitHash)] = \
+                (_commitInfoCache[(repoKey, commitHash)][0], branch)
+
+    return dict((rev, (fullHashes[rev],)
+                 + _commitInfoCache[(repoKey, fullHashes[rev])])
+                for rev in commitHashes)
+
+
+def iterCommitInfos(revRange, repoDir=None):
+    """
+    Generate (full commit hash, commit time in ms as a str, branch) tuples for
+    all commits in revRange, newest first, using a single "git log". revRange
+    is a rev range or list of revs as passed to "git log" (eg. "v1.0..main",
+    or ["main", "release"]), and branch is the rev in revRange that each commit
+    was reached from. The commit times are cached for getCommitInfos().
+    """
+    repoKey = os.path.abspath(repoDir or os.getcwd())
+    revs = [revRange] if isinstance(revRange, str) else list(revRange)
+    out = getCommandOutput(["git", "log", "--source", "--format=%H %ct %S"]
+                           + revs + ["--"], cwd=repoDir)
+    for line in out.splitlines():
+        (commitHash, commitTime, branch) = line.split(" ", 2)
+        commitTime = str(int(commitTime)*1000)
+        # The rev a commit was reached from is not necessarily its branch as
+        # returned by getCommitInfos(), so only the commit time is cached.
+        _commitInfoCache.setdefault((repoKey, commitHash), (commitTime, None))
+        yield (commitHash, commitTime, branch)
+
+
 def getCudaVer():
     # FIXME
     return "10.0"
@@ -0,0 +1,112 @@
+"""
+Runs the benchmarks in this dir without ASV, printing the time and peak RSS of
+each. Each benchmark is run in its own process so peak RSS is not affected by
+other benchmarks.
+
+Usage (from the repo root): python -m benchmarks [--scale SCALE ...] [REGEX]
+
+To track results over time, run the suite with ASV instead, using the
+asv.conf.json in the repo root (eg. "asv run"). The results ASV writes are
+themselves an asvdb.
+"""
+import argparse
+import importlib
+import inspect
+import multiprocessing
+import os
+import pkgutil
+import re
+import resource
+import tempfile
+import time
+
+import benchmarks
+
+benchmarkPrefixes = ("time_", "peakmem_")
+
+
+def getBenchmarkClasses():
+    """
+    Return a list of (name, class) tuples for all benchmark classes.
+    """
+    classes = []
+    for moduleInfo in pkgutil.iter_modules(benchmarks.__path__):
+        if not(moduleInfo.name.startswith("bench_")):
+            continue
+        module = importlib.import_module(f"benchmarks.{moduleInfo.name}")
+        for (name, cls) in inspect.getmembers(module, inspect.isclass):
+            if (cls.__module__ == module.__name__) and \
+               any(m.startswith(benchmarkPrefixes) for m in dir(cls)):
+                classes.append((f"{moduleInfo.name}.{name}", cls))
+    return classes
+
+
+def runBenchmark(cls, methodName, cacheValue, param, resultQueue):
+    """
+    Run a single benchmark, and put a (seconds, peak RSS in MB) tuple on
+    resultQueue.
+    """
+    obj = cls()
+    if hasattr(obj, "setup"):
+        obj.setup(cacheValue, param)
+    st = time.perf_counter()
+    getattr(obj, methodName)(cacheValue, param)
+    seconds = time.perf_counter() - st
+    if hasattr(obj, "teardown"):
+        obj.teardown(cacheValue, param)
+    # ru_maxrss is in KB on Linux
+    peakRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    resultQueue.put((seconds, peakRSS))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("regex", nargs="?", default="",
+                        help="Only run benchmarks whose name matches.")
+    parser.add_argument("--scale", action="append",
+                        help="Only run benchmarks for this scale (default: "
+                        "all scales).")
+    args = parser.parse_args(argv)
+
+    ctx = multiprocessing.get_context("fork")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as cacheDir:
+        os.chdir(cacheDir)
+        try:
+            cacheValues = {}
+            print(f"{'benchmark':<50}{'scale':<10}{'seconds':>10}"
+                  f"{'peak MB':>10}")
+            for (className, cls) in getBenchmarkClasses():
+                for methodName in sorted(m for m in dir(cls)
+                                         if m.startswith(benchmarkPrefixes)):
+                    name = f"{className}.{methodName}"
+                    if not(re.search(args.regex, name)):
+                        continue
+                    # All classes share the same setup_cache(), so it is only
+                    # called once.
+                    setupCache = getattr(cls, "setup_cache", None)
+                    if setupCache not in cacheValues:
+                        cacheValues[setupCache] = \
+                            setupCache(cls()) if setupCache else None
+                    for param in cls.params:
+                        if args.scale and (param not in args.scale):
+                            continue
+                        resultQueue = ctx.Queue()
+                        proc = ctx.Process(target=runBenchmark,
+                                           args=(cls, methodName,
+                                                 cacheValues[setupCache],
+                                                 param, resultQueue))
+                        proc.start()
+                        proc.join()
+                        if proc.exitcode != 0:
+                            print(f"{name:<50}{param:<10}{'FAILED':>10}")
+                            continue
+                        (seconds, peakRSS) = resultQueue.get()
+                        print(f"{name:<50}{param:<10}{seconds:>10.3f}"
+                              f"{peakRSS:>10.1f}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmarks of the ASVDb read and write APIs.
+"""
+import shutil
+import tempfile
+from os import path
+
+from asvdb import ASVDb, BenchmarkResult
+from asvdb import synthetic
+
+from .common import DbBenchmark, scales
+
+
+class TimeWrite(DbBenchmark):
+    """
+    Adding results to an existing db. Each sample writes to a fresh copy of
+    the db.
+    """
+    number = 1
+    repeat = (1, 10, 20.0)
+
+    def setup(self, dbDirs, scale):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        dbDir = path.join(self.tmpDir.name, "db")
+        shutil.copytree(dbDirs[scale], dbDir)
+        self.db = ASVDb(dbDir, synthetic.repo, [synthetic.branch])
+        generateArgs = scales[scale]
+        # A commit already in the db, whose results file is rewritten, and the
+        # results for a new commit.
+        self.existingInfo = synthetic.getBenchmarkInfo(
+            0, generateArgs["numCommits"] - 1)
+        (self.newInfo, self.newResults) = next(synthetic.generateResultTuples(
+            numMachines=1, numCommits=1,
+            numBenchmarks=generateArgs["numBenchmarks"],
+            paramGridSize=generateArgs["paramGridSize"], seed=1))
+        self.newInfo.commitHash = synthetic.getCommitHash(-1)
+
+
+    def teardown(self, dbDirs, scale):
+        self.tmpDir.cleanup()
+
+
+    def time_addResult(self, dbDirs, scale):
+        self.db.addResult(self.existingInfo,
+                          BenchmarkResult(funcName="bench_new", result=1.0))
+
+
+    def time_addResults(self, dbDirs, scale):
+        self.db.addResults(self.newInfo, self.newResults)
+
+
+class TimeRead(DbBenchmark):
+    def setup(self, dbDirs, scale):
+        self.db = ASVDb(dbDirs[scale])
+        self.filterInfo = synthetic.getBenchmarkInfo(0, 0)
+        self.paramCombos = synthetic.getParamCombinations(
+            2, scales[scale]["paramGridSize"])
+
+
+    def time_getInfo(self, dbDirs, scale):
+        self.db.getInfo()
+
+
+    def time_getResults(self, dbDirs, scale):
+        self.db.getResults()
+
+
+    def time_getResultsFiltered(self, dbDirs, scale):
+        self.db.getResults(filterInfoObjList=[self.filterInfo])
+
+
+    def time_getResult(self, dbDirs, scale):
+        self.db.getResult(self.filterInfo, "bench_algo_0",
+                          self.paramCombos[-1])
+
+
+    def time_getResultsForParams(self, dbDirs, scale):
+        self.db.getResultsForParams(self.filterInfo, "bench_algo_0",
+                                    self.paramCombos)
+
+
+    def time_iterResults(self, dbDirs, scale):
+        for _ in self.db.iterResults():
+            pass
+
+
+    def peakmem_getResults(self, dbDirs, scale):
+        self.db.getResults()
+
+
+    def peakmem_iterResults(self, dbDirs, scale):
+        for _ in self.db.iterResults():
+            pass
@@ -0,0 +1,54 @@
+"""
+Benchmarks of the asvdb CLI actions.
+"""
+import contextlib
+import io
+import tempfile
+from os import path
+
+from asvdb import __main__ as cli
+
+from .common import DbBenchmark
+
+
+class TimeCLI(DbBenchmark):
+    number = 1
+    repeat = (1, 10, 20.0)
+
+    def setup(self, dbDirs, scale):
+        self.dbDir = dbDirs[scale]
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+
+    def teardown(self, dbDirs, scale):
+        self.tmpDir.cleanup()
+
+
+    def runCLI(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli.main(["--read-from", self.dbDir] + list(args))
+
+
+    def time_filterWriteTo(self, dbDirs, scale):
+        self.runCLI("--filter", "funcName == 'bench_algo_0'",
+                    "--write-to", path.join(self.tmpDir.name, "db"))
+
+
+    def time_filterPrint(self, dbDirs, scale):
+        self.runCLI("--filter", "result is not None and result < 1",
+                    "--print", "funcName, result")
+
+
+    def time_exportCSV(self, dbDirs, scale):
+        self.runCLI("--export", "csv",
+                    "--output", path.join(self.tmpDir.name, "out.csv"))
+
+
+    def time_groupBy(self, dbDirs, scale):
+        self.runCLI("--group-by", "machineName,funcName",
+                    "--agg", "median(result)", "--agg", "count()")
+
+
+    def peakmem_exportCSV(self, dbDirs, scale):
+        self.runCLI("--export", "csv",
+                    "--output", path.join(self.tmpDir.name, "out.csv"))
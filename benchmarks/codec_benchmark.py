@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the load and dump throughput of each installed JSON codec
+(see asvdb.codec) on a results file like those written by ASVDb.
+
+Usage: python benchmarks/codec_benchmark.py [--size-mb MB] [--repeat N]
+"""
+import argparse
+import random
+import time
+
+from asvdb.codec import getInstalledCodecs
+
+
+def createResultsDict(sizeMB):
+    """
+    Return a dictionary in the format of an ASV results file, with benchmarks
+    added until its indented JSON is approximately sizeMB MB.
+    """
+    rng = random.Random(0)
+    datasets = [f"dataset{i}.csv" for i in range(10)]
+    scales = [str(2 ** i) for i in range(10)]
+    modes = ["cpu", "gpu", "multi_gpu"]
+    results = {}
+    d = {"params": {"gpu": "Tesla V100-SXM2-32GB", "cuda": "11.2",
+                    "machine": "benchmark-host-01", "os": "Linux 5.4.0",
+                    "python": "3.8"},
+         "requirements": {"cudf": "21.06", "cugraph": "21.06"},
+         "results": results,
+         "commit_hash": "809a1569e8a2ff138cdde4d9c282328be9dcad43",
+         "branch": "branch-21.06",
+         "date": 1590007324000,
+         "python": "3.8",
+         "version": 1,
+         }
+    # Each benchmark has len(datasets) * len(scales) * len(modes) results,
+    # about 30 bytes each once indented.
+    numBenchmarks = max(1, int(sizeMB * 1e6 / (30 * 300)))
+    for i in range(numBenchmarks):
+        results[f"bench_algo_{i}"] = {
+            "params": [datasets, scales, modes],
+            "result": [None if rng.random() < 0.01 else rng.uniform(1e-4, 10)
+                       for _ in range(len(datasets) * len(scales) * len(modes))],
+        }
+    return d
+
+
+def timeIt(func, repeat):
+    """
+    Return the minimum time in seconds of repeat calls to func.
+    """
+    times = []
+    for _ in range(repeat):
+        st = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - st)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=float, default=30,
+                        help="Approximate size of the results file "
+                        "(default: %(default)s).")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of times each operation is timed, the "
+                        "fastest is reported (default: %(default)s).")
+    args = parser.parse_args(argv)
+
+    d = createResultsDict(args.size_mb)
+    print(f"{'codec':<10}{'mode':<10}{'size MB':>10}{'dump MB/s':>12}"
+          f"{'load MB/s':>12}")
+    for codec in getInstalledCodecs():
+        for compact in [False, True]:
+            data = codec.dumps(d, compact)
+            sizeMB = len(data) / 1e6
+            dumpTime = timeIt(lambda: codec.dumps(d, compact), args.repeat)
+            loadTime = timeIt(lambda: codec.loads(data), args.repeat)
+            print(f"{codec.name:<10}{'compact' if compact else 'indent':<10}"
+                  f"{sizeMB:>10.1f}{sizeMB / dumpTime:>12.1f}"
+                  f"{sizeMB / loadTime:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Synthetic dbs shared by the benchmarks.
+"""
+import os
+
+from asvdb import synthetic
+
+# Args to asvdb.synthetic.generateDb() for each scale benchmarked.
+scales = {
+    "small": dict(numMachines=1, numCommits=10, numBenchmarks=10,
+                  paramGridSize=3),
+    "medium": dict(numMachines=2, numCommits=50, numBenchmarks=20,
+                   paramGridSize=5, sparsity=0.1),
+    "large": dict(numMachines=4, numCommits=100, numBenchmarks=25,
+                  paramGridSize=8, sparsity=0.1),
+}
+
+
+def generateDbs():
+    """
+    Generate a db for each scale in the current dir, and return a dictionary
+    of {scale: db dir}. Used as setup_cache(), which ASV calls once (in a
+    temp dir) for all benchmarks in a class.
+    """
+    dbDirs = {}
+    for (scale, generateArgs) in scales.items():
+        dbDir = os.path.abspath(f"db_{scale}")
+        synthetic.generateDb(dbDir, **generateArgs)
+        dbDirs[scale] = dbDir
+    return dbDirs
+
+
+class DbBenchmark:
+    """
+    Base class for benchmarks run on the db for each scale.
+    """
+    params = list(scales)
+    param_names = ["scale"]
+    # Generating the large db takes a while.
+    timeout = 600
+
+    def setup_cache(self):
+        return generateDbs()
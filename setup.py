@@ -3,7 +3,13 @@ from setuptools import setup
 setup(name="asvdb",
       version="0.4.2",
       packages=["asvdb"],
-      install_requires=["botocore", "boto3"],
+      install_requires=[],
+      extras_require={
+          # Only needed for DBs at s3:// URLs
+          "s3": ["botocore", "boto3"],
+          # Faster reading and writing of DB files
+          "fast-json": ["orjson"],
+      },
       description='ASV "database" interface',
       entry_points={
           "console_scripts": [
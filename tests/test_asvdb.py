@@ -1,12 +1,13 @@
 from os import path
 import os
+import sys
+import subprocess
 import tempfile
 import json
 import threading
 import time
 
 import pytest
-import boto3
 
 datasetName = "dolphins.csv"
 algoRunResults = [('loadDataFile', 3.2228727098554373),
@@ -343,6 +344,7 @@ def test_concurrency_stress():
 
 
 def test_s3_concurrency():
+    import boto3
     from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
 
     tmpDir = tempfile.TemporaryDirectory(suffix='asv')
@@ -398,10 +400,11 @@ def test_s3_concurrency():
         assert "somebenchmark3" in jo
 
     tmpDir.cleanup()
-    db3.s3Resource.Bucket(db3.bucketName).objects.filter(Prefix="asvdb/").delete()
+    resource.Bucket(bucketName).objects.filter(Prefix="asvdb/").delete()
 
 
 def test_s3_concurrency_stress():
+    import boto3
     from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
 
     asvDirName = "s3://gpuci-cache-testing/asvdb"
@@ -525,3 +528,731 @@ def test_getFilteredResults():
     assert brList1[0][0] != brList1[1][0]
     assert len(brList1[0][1]) == len(algoRunResults)
     assert len(brList1[1][1]) == len(algoRunResults)
+
+
+def test_iterResults():
+    from asvdb import ASVDb, BenchmarkInfo
+
+    tmpDir = tempfile.TemporaryDirectory()
+    asvDirName = path.join(tmpDir.name, "dir_that_did_not_exist_before")
+
+    db = ASVDb(asvDirName, repo, [branch])
+    bInfo1 = BenchmarkInfo(machineName=machineName, cudaVer="9.2",
+                           osType="linux", pythonVer="3.6",
+                           commitHash=commitHash, commitTime=commitTime)
+    bInfo2 = BenchmarkInfo(machineName=machineName, cudaVer="10.1",
+                           osType="linux", pythonVer="3.7",
+                           commitHash=commitHash, commitTime=commitTime)
+    addResultsForInfo(db, bInfo1)
+    addResultsForInfo(db, bInfo2)
+
+    # iterResults() produces the same tuples as getResults(), one results file
+    # at a time.
+    assert list(db.iterResults()) == db.getResults()
+    brList = list(db.iterResults(filterInfoObjList=[bInfo2]))
+    assert len(brList) == 1
+    assert brList[0][0] == bInfo2
+
+    # Writing all the tuples at once with addResultTuples() results in the same
+    # DB as adding them individually.
+    asvDirName2 = path.join(tmpDir.name, "copy")
+    db2 = ASVDb(asvDirName2, repo, [branch])
+    db2.addResultTuples(db.iterResults())
+    assert db2.getResults() == db.getResults()
+    for fileName in [path.join("results", "benchmarks.json"),
+                     path.join("results", machineName, "machine.json")]:
+        with open(path.join(asvDirName, fileName)) as fobj1, \
+             open(path.join(asvDirName2, fileName)) as fobj2:
+            assert json.load(fobj1) == json.load(fobj2)
+
+
+def test_prune():
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    asvDirName = path.join(tmpDir.name, "dir_that_did_not_exist_before")
+
+    db = ASVDb(asvDirName, repo, [branch])
+    bInfos = [BenchmarkInfo(machineName=machineName, cudaVer="9.2",
+                            osType="linux", pythonVer="3.6",
+                            commitHash=f"{commitHash[:-1]}{i}",
+                            commitTime=commitTime + i)
+              for i in range(3)]
+    for (i, bInfo) in enumerate(bInfos):
+        db.addResults(bInfo, [
+            BenchmarkResult(funcName=funcName, result=i + scale,
+                            argNameValuePairs=[("dataset", datasetName),
+                                               ("scale", scale)])
+            for funcName in ["bfs", "sssp"]
+            for scale in [i, 10]])
+    db.addResult(bInfos[0], BenchmarkResult(funcName="louvain", result=1))
+
+    # Remove all results for the first commit, louvain (only present in the
+    # first commit), and all scale=1 results (only present in the second).
+    numRemoved = db.prune(
+        lambda bInfo, bResult: (bInfo.commitHash == bInfos[0].commitHash)
+        or (dict(bResult.argNameValuePairs)["scale"] == "1"))
+    assert numRemoved == 5 + 2
+
+    resultsDir = path.join(asvDirName, "results", machineName)
+    assert not(path.exists(path.join(
+        resultsDir, f"{bInfos[0].commitHash}.json")))
+
+    results = db.getResults()
+    assert sorted(bInfo.commitHash for (bInfo, _) in results) == \
+        [bInfos[1].commitHash, bInfos[2].commitHash]
+    for (bInfo, bResults) in results:
+        if bInfo == bInfos[1]:
+            assert sorted((r.funcName, r.argNameValuePairs[1][1], r.result)
+                          for r in bResults) == \
+                [("bfs", "10", 11), ("sssp", "10", 11)]
+        else:
+            assert len(bResults) == 4
+
+    # Unused benchmarks and param values are removed from benchmarks.json
+    with open(path.join(asvDirName, "results", "benchmarks.json")) as fobj:
+        bDict = json.load(fobj)
+    assert sorted(k for k in bDict if k != "version") == ["bfs", "sssp"]
+    assert bDict["bfs"]["params"] == [[datasetName], ["10", "2"]]
+
+    # Pruning everything removes the machine dir contents too
+    assert db.prune(lambda bInfo, bResult: True) == 6
+    assert os.listdir(resultsDir) == []
+    assert db.prune(lambda bInfo, bResult: True) == 0
+
+
+def test_merge():
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    bInfos = [BenchmarkInfo(machineName=f"machine{i % 2}", cudaVer="9.2",
+                            osType="linux", pythonVer="3.6",
+                            commitHash=f"{commitHash[:-1]}{i}",
+                            commitTime=commitTime + i, branch=f"branch{i}")
+              for i in range(3)]
+
+    def createDb(name, bInfo, scales, result, branches):
+        db = ASVDb(path.join(tmpDir.name, name), repo, branches)
+        db.addResults(bInfo, [
+            BenchmarkResult(funcName="bfs", result=result + scale,
+                            argNameValuePairs=[("scale", scale)])
+            for scale in scales])
+        return db
+
+    # src1 and src2 have the same results file, with one conflicting result
+    # (scale=2). src3 has a different results file.
+    src1 = createDb("src1", bInfos[0], [1, 2], 0, ["branch0"])
+    src2 = createDb("src2", bInfos[0], [2, 3], 10, ["branch1"])
+    src3 = createDb("src3", bInfos[2], [4], 0, ["branch2"])
+    destDir = path.join(tmpDir.name, "dest")
+
+    def getResults(db):
+        return sorted((bInfo.commitHash, r.argNameValuePairs[0][1], r.result)
+                      for (bInfo, bResults) in db.getResults()
+                      for r in bResults)
+
+    dest = ASVDb(destDir)
+    assert dest.merge([src1.dbDir, src2, src3]) == 2
+    dest.loadConfFile()
+    assert dest.branches == ["branch0", "branch1", "branch2"]
+    assert getResults(dest) == [(bInfos[0].commitHash, "1", 1),
+                                (bInfos[0].commitHash, "2", 12),
+                                (bInfos[0].commitHash, "3", 13),
+                                (bInfos[2].commitHash, "4", 4)]
+    with open(path.join(destDir, "results", "benchmarks.json")) as fobj:
+        assert json.load(fobj)["bfs"]["params"] == [["1", "2", "3", "4"]]
+
+    # Files only in one source are copied verbatim
+    src3File = path.join("results", "machine0",
+                         f"{bInfos[2].commitHash}-python3.6-cuda9.2-linux.json")
+    with open(path.join(src3.dbDir, src3File), "rb") as fobj1, \
+         open(path.join(destDir, src3File), "rb") as fobj2:
+        assert fobj1.read() == fobj2.read()
+
+    # "keep" uses the first value, "error" raises without writing anything.
+    keepDb = ASVDb(path.join(tmpDir.name, "keep"))
+    keepDb.merge([src1, src2], conflict="keep")
+    assert (bInfos[0].commitHash, "2", 2) in getResults(keepDb)
+
+    src4 = createDb("src4", bInfos[1], [5], 0, ["branch1"])
+    with pytest.raises(ValueError):
+        dest.merge([src4, src1], conflict="error")
+    assert len(dest.getResults()) == 2
+    # Identical results never conflict
+    dest.merge([src4, src3], conflict="error")
+    assert len(dest.getResults()) == 3
+
+
+def test_importTime():
+    """
+    Ensures importing asvdb stays fast, which mainly means the S3 dependencies
+    (boto3, botocore) must not be imported until a S3 URL is used.
+    """
+    budgetMicroseconds = 100000
+
+    proc = subprocess.run([sys.executable, "-X", "importtime",
+                           "-c", "import asvdb"],
+                          cwd=path.dirname(path.dirname(path.abspath(__file__))),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          check=True)
+
+    # Lines look like: "import time:  <self us> | <cumulative us> | <module>"
+    cumulativeTimes = {}
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith("import time:"):
+            continue
+        (_, cumulative, moduleName) = line.split("|")
+        if cumulative.strip().isdigit():
+            cumulativeTimes[moduleName.strip()] = int(cumulative)
+
+    assert "asvdb" in cumulativeTimes
+    assert "boto3" not in cumulativeTimes
+    assert "botocore" not in cumulativeTimes
+    assert cumulativeTimes["asvdb"] < budgetMicroseconds
+
+
+def test_addResultAsync():
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+    import asyncio
+
+    tmpDir = tempfile.TemporaryDirectory()
+    db = ASVDb(tmpDir.name, repo, [branch])
+    bInfo = BenchmarkInfo(machineName=machineName, commitHash=commitHash,
+                          commitTime=commitTime, branch=branch)
+    writes = []
+    addResultTuples = db._ASVDb__addResultTuples
+    db._ASVDb__addResultTuples = \
+        lambda resultTuples, lockfileName: (writes.append(len(resultTuples)),
+                                            addResultTuples(resultTuples,
+                                                            lockfileName))
+
+    futures = [db.addResultAsync(bInfo, BenchmarkResult(funcName=algoName,
+                                                        result=exeTime))
+               for (algoName, exeTime) in algoRunResults]
+    # Nothing is written until the delay passes or flush() is called, then
+    # all queued results are written at once.
+    assert writes == []
+    db.flush()
+    assert writes == [len(algoRunResults)]
+    assert all(f.result() is None for f in futures)
+    assert len(db.getResults()[0][1]) == len(algoRunResults)
+
+    asyncio.run(db.aaddResult(bInfo, BenchmarkResult(funcName="new",
+                                                     result=1)))
+    assert "new" in [r.funcName for r in db.getResults()[0][1]]
+    db.close()
+
+    # Errors are reported through the futures
+    db = ASVDb(path.join(tmpDir.name, "norepo"), None, [branch])
+    future = db.addResultAsync(bInfo, BenchmarkResult(funcName="bfs",
+                                                      result=1))
+    db.close()
+    assert isinstance(future.exception(), AttributeError)
+
+
+def test_journal():
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    journalDir = path.join(tmpDir.name, ASVDb.journalDirName)
+    bInfo = BenchmarkInfo(machineName=machineName, commitHash=commitHash,
+                          commitTime=commitTime, branch=branch)
+    writer1 = ASVDb(tmpDir.name, repo, [branch], journaled=True)
+    writer2 = ASVDb(tmpDir.name, repo, ["other_branch"], journaled=True)
+    reader = ASVDb(tmpDir.name)
+
+    def getResults(db):
+        return sorted((bInfo.commitHash, r.funcName, r.result)
+                      for (bInfo, bResults) in db.getResults()
+                      for r in bResults)
+
+    writer1.addResult(bInfo, BenchmarkResult(funcName="bfs", result=1))
+    writer1.addResult(bInfo, BenchmarkResult(funcName="sssp", result=2))
+    # Appends only write the journal, but are seen by readers immediately.
+    assert not(path.exists(path.join(tmpDir.name, "results")))
+    assert len(os.listdir(journalDir)) == 1
+    assert getResults(reader) == [(commitHash, "bfs", 1), (commitHash, "sssp", 2)]
+
+    # Compacting folds the journals of all writers into the ASV files, and
+    # only removes the journal files of the instance compacting.
+    writer2.addResult(bInfo, BenchmarkResult(funcName="bfs", result=3))
+    assert writer1.compactJournal() == 3
+    assert len(os.listdir(journalDir)) == 2  # writer2 journal and offsets
+    reader.loadConfFile()
+    assert reader.branches == [branch, "other_branch"]
+    expected = [(commitHash, "bfs", 3), (commitHash, "sssp", 2)]
+    assert getResults(reader) == expected
+    assert writer2.compactJournal() == 0
+    assert os.listdir(journalDir) == [ASVDb.journalOffsetsFileName]
+    assert getResults(reader) == expected
+
+    # Uncompacted results replace compacted results for the same benchmark,
+    # including when reading with iterResults().
+    writer2.addResult(bInfo, BenchmarkResult(funcName="sssp", result=4))
+    expected = [(commitHash, "bfs", 3), (commitHash, "sssp", 4)]
+    assert getResults(reader) == expected
+    assert sorted((bi.commitHash, r.funcName, r.result)
+                  for (bi, bResults) in reader.iterResults()
+                  for r in bResults) == expected
+
+    # Journal files are only read after the part already compacted.
+    reads = []
+    readFrom = reader.storage.readFrom
+    reader.storage.readFrom = \
+        lambda key, offset: (reads.append((key, offset)), readFrom(key, offset))[1]
+    read = reader.storage.readWithVersion
+    reader.storage.readWithVersion = \
+        lambda key: (reads.append((key, None)), read(key))[1]
+    writer1.compactJournal()
+    writer2.addResult(bInfo, BenchmarkResult(funcName="sssp", result=5))
+    assert getResults(reader) == [(commitHash, "bfs", 3), (commitHash, "sssp", 5)]
+    journalReads = [(key, offset) for (key, offset) in reads
+                    if key.endswith(".jsonl")]
+    assert len(journalReads) == 1
+    with open(path.join(tmpDir.name, journalReads[0][0]), "rb") as fobj:
+        assert journalReads[0][1] == len(fobj.readline())
+
+    # getResultsSince() only returns results in journal files once compacted,
+    # so they are never returned twice.
+    (token, results) = reader.getResultsSince()
+    assert [r.result for (_, bResults) in results for r in bResults
+            if r.funcName == "sssp"] == [4]
+    writer1.compactJournal()
+    (token, results) = reader.getResultsSince(token)
+    assert [(r.funcName, r.result) for (_, bResults) in results
+            for r in bResults] == [("sssp", 5)]
+
+    # The compacted journal files of other writers are removed once they are
+    # older than twice journalSegmentMaxAge, and the writers start new ones.
+    for db in [writer1, writer2]:
+        db.journalSegmentMaxAge = 0.1
+    writer1.compactJournal()
+    assert len(os.listdir(journalDir)) == 2
+    time.sleep(0.25)
+    writer1.compactJournal()
+    assert os.listdir(journalDir) == [ASVDb.journalOffsetsFileName]
+    writer2.addResult(bInfo, BenchmarkResult(funcName="sssp", result=6))
+    assert getResults(reader) == [(commitHash, "bfs", 3), (commitHash, "sssp", 6)]
+
+    tmpDir.cleanup()
+
+
+def test_unchangedFilesNotWritten():
+    """
+    Adding results that are already in the db, as when a CI job is re-run,
+    does not write any files.
+    """
+    tmpDir = tempfile.TemporaryDirectory()
+    db = createAndPopulateASVDb(tmpDir.name)
+    # The first read creates the catalog.
+    results = db.getResults()
+    versions = db.storage.listVersions()
+    writes = []
+    write = db.storage.write
+    db.storage.write = lambda key, data: (writes.append(key), write(key, data))[1]
+
+    createAndPopulateASVDb(tmpDir.name)
+    db.addResultTuples(results)
+    db.getResults()
+    assert writes == []
+    assert db.storage.listVersions() == versions
+
+
+def test_catalog():
+    """
+    Reads use the catalog instead of reading every machine.json and results
+    file, and the catalog is kept up to date with changes by asvdb and others.
+    """
+    from asvdb import ASVDb, BenchmarkInfo
+
+    tmpDir = tempfile.TemporaryDirectory()
+    db = createAndPopulateASVDb(tmpDir.name)
+    bInfo2 = BenchmarkInfo(machineName="machine2", commitHash="hash2",
+                           commitTime=commitTime + 1, branch=branch)
+    addResultsForInfo(db, bInfo2)
+    catalogFile = path.join(tmpDir.name, "results", ASVDb.catalogFileName)
+
+    # Created by the first read, then updated by writes
+    assert not(path.exists(catalogFile))
+    infos = db.getInfo()
+    assert path.exists(catalogFile)
+    bInfo3 = BenchmarkInfo(machineName="machine2", commitHash="hash3",
+                           commitTime=commitTime + 2, branch=branch)
+    addResultsForInfo(db, bInfo3)
+    with open(catalogFile) as fobj:
+        catalog = json.load(fobj)
+    files = catalog["machines"]["machine2"]["files"]
+    assert sorted(e["commit_hash"] for e in files.values()) == ["hash2", "hash3"]
+    assert files["hash3-python-cuda-.json"]["benchmarks"] == \
+        sorted(name for (name, _) in algoRunResults)
+
+    # getInfo() only reads the catalog, and a filtered getResults() only reads
+    # the results file returned.
+    reads = []
+    read = db.storage.readWithVersion
+    db.storage.readWithVersion = lambda key: (reads.append(key), read(key))[1]
+    assert db.getInfo() == [infos[0], bInfo3, infos[1]]
+    assert [key for key in reads if key.startswith("results/")] == \
+        ["results/.asvdb-index.json"]
+    reads.clear()
+    results = db.getResults(filterInfoObjList=[bInfo2])
+    assert [bi for (bi, _) in results] == [bInfo2]
+    assert [key for key in reads if key.endswith("-.json")] == \
+        ["results/machine2/hash2-python-cuda-.json"]
+    db.storage.readWithVersion = read
+
+    # Changes not made by asvdb are found, unless the catalog is trusted.
+    resultsFile = path.join(tmpDir.name, "results", "machine2",
+                            "hash3-python-cuda-.json")
+    with open(resultsFile) as fobj:
+        rDict = json.load(fobj)
+    rDict["branch"] = "other_branch"
+    time.sleep(0.01)
+    with open(resultsFile, "w") as fobj:
+        json.dump(rDict, fobj)
+    db.trustCatalog = True
+    assert db.getInfo()[1].branch == branch
+    db.trustCatalog = False
+    assert db.getInfo()[1].branch == "other_branch"
+
+    # A missing or corrupt catalog is rebuilt.
+    os.remove(catalogFile)
+    assert ASVDb(tmpDir.name).getInfo()[1].branch == "other_branch"
+    with open(catalogFile, "w") as fobj:
+        json.dump({"version": 0}, fobj)
+    db.trustCatalog = True
+    assert len(db.getInfo()) == 3
+    with open(catalogFile) as fobj:
+        assert json.load(fobj)["version"] == ASVDb.catalogVersion
+
+    # A catalog changed by another writer while being updated is not
+    # overwritten, the update is applied to the new catalog instead.
+    catalogKey = "results/" + ASVDb.catalogFileName
+    conditionalWrite = db.storage.conditionalWrite
+    def racingConditionalWrite(key, data, expectedVersion):
+        if key == catalogKey:
+            db.storage.conditionalWrite = conditionalWrite
+            catalog = json.loads(db.storage.read(key))
+            catalog["machines"]["machine3"] = {"files": {}}
+            db.storage.write(key, json.dumps(catalog).encode())
+        return conditionalWrite(key, data, expectedVersion)
+    db.storage.conditionalWrite = racingConditionalWrite
+    bInfo4 = BenchmarkInfo(machineName="machine2", commitHash="hash4",
+                           commitTime=commitTime + 3, branch=branch)
+    addResultsForInfo(db, bInfo4)
+    assert db.storage.conditionalWrite == conditionalWrite
+    with open(catalogFile) as fobj:
+        catalog = json.load(fobj)
+    assert "machine3" in catalog["machines"]
+    assert "hash4-python-cuda-.json" in catalog["machines"]["machine2"]["files"]
+
+    tmpDir.cleanup()
+
+
+def test_publishIncremental():
+    """
+    publishIncremental() only rewrites the graphs of the results files that
+    changed, and the result is the same as publishing the whole db.
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+    from asvdb import publish
+
+    def readFiles(htmlDir):
+        files = {}
+        for (dirPath, _, fileNames) in os.walk(htmlDir):
+            for fileName in fileNames:
+                if fileName in (publish.infoFileName,
+                                ASVDb.publishStateFileName):
+                    continue
+                with open(path.join(dirPath, fileName)) as fobj:
+                    files[path.relpath(path.join(dirPath, fileName),
+                                       htmlDir)] = json.load(fobj)
+        return files
+
+    tmpDir = tempfile.TemporaryDirectory()
+    db = createAndPopulateASVDb(tmpDir.name)
+    htmlDir = path.join(tmpDir.name, "html")
+    graphParams = {"branch": branch, "cuda": "9.2", "gpu": "n/a",
+                   "machine": machineName, "os": "linux", "python": "3.6"}
+    graphFile = path.join(htmlDir, publish.getGraphKey(graphParams, "bfs"))
+
+    assert db.publishIncremental() == len(algoRunResults) - 1
+    with open(graphFile) as fobj:
+        assert json.load(fobj) == [[commitTime, [3.004273353144526482]]]
+    with open(path.join(htmlDir, "index.json")) as fobj:
+        index = json.load(fobj)
+    assert index["graph_param_list"] == [graphParams]
+    assert index["revision_to_hash"] == {str(commitTime): commitHash}
+    assert index["machines"][machineName]["arch"] == "my_arch"
+    assert db.publishIncremental() == 0
+
+    # A new commit only adds a point to the graphs of its benchmarks.
+    bInfo2 = BenchmarkInfo(machineName=machineName, cudaVer="9.2",
+                           osType="linux", pythonVer="3.6",
+                           commitHash="hash2", commitTime=commitTime + 1,
+                           branch=branch, gpuType="n/a")
+    db.addResults(bInfo2, [BenchmarkResult(funcName="bfs", result=1.5,
+                                           argNameValuePairs=[("dataset",
+                                                               datasetName)])])
+    assert db.publishIncremental() == 1
+    with open(graphFile) as fobj:
+        assert json.load(fobj) == [[commitTime, [3.004273353144526482]],
+                                   [commitTime + 1, [1.5]]]
+
+    # A new param value changes the values of all points of the benchmark.
+    db.addResults(bInfo2, [BenchmarkResult(funcName="bfs", result=2.5,
+                                           argNameValuePairs=[("dataset",
+                                                               "other.csv")])])
+    assert db.publishIncremental() == 1
+    with open(graphFile) as fobj:
+        assert json.load(fobj) == [[commitTime, [3.004273353144526482, None]],
+                                   [commitTime + 1, [1.5, 2.5]]]
+
+    # Pruned results are removed, and the files are the same as for a db
+    # published all at once.
+    db.prune(lambda bi, br: br.funcName == "pagerank")
+    assert db.publishIncremental() == 1
+    otherHtmlDir = path.join(tmpDir.name, "other_html")
+    ASVDb(tmpDir.name).publishIncremental(otherHtmlDir)
+    assert readFiles(htmlDir) == readFiles(otherHtmlDir)
+    assert not(any("pagerank" in key for key in readFiles(htmlDir)))
+
+    # Without a state file (eg. after "asv publish"), existing graph files are
+    # rewritten instead of merged with the new points.
+    os.remove(path.join(htmlDir, ASVDb.publishStateFileName))
+    with open(graphFile, "w") as fobj:
+        json.dump([[1, [10.0, 20.0]], [commitTime, [0.0, 0.0]]], fobj)
+    ASVDb(tmpDir.name).publishIncremental()
+    assert readFiles(htmlDir) == readFiles(otherHtmlDir)
+
+    tmpDir.cleanup()
+
+
+def test_threadSafety():
+    """
+    A single ASVDb instance can be used by many threads at once, without
+    losing results or colliding on lockfiles, and reads share parsed results
+    files.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    db = ASVDb(path.join(tmpDir.name, "db"), repo, [branch])
+    numThreads = 8
+    numWrites = 10
+
+    def writeAndRead(i):
+        for j in range(numWrites):
+            bInfo = BenchmarkInfo(machineName=machineName, commitHash=f"hash{j}",
+                                  commitTime=commitTime + j, branch=branch)
+            db.addResults(bInfo, [BenchmarkResult(funcName=f"bench{i}",
+                                                  result=float(j))])
+            db.getResults()
+
+    with ThreadPoolExecutor(max_workers=numThreads) as executor:
+        list(executor.map(writeAndRead, range(numThreads)))
+
+    results = db.getResults()
+    assert len(results) == numWrites
+    for (bInfo, bResults) in results:
+        assert sorted((r.funcName, r.result) for r in bResults) == \
+            [(f"bench{i}", float(bInfo.commitHash[4:]))
+             for i in range(numThreads)]
+    assert db.storage.lockCollisions == 0
+
+    # Unchanged results files are not read (or parsed) again, by this or any
+    # other instance.
+    reads = []
+    otherDb = ASVDb(db.dbDir)
+    read = otherDb.storage.readWithVersion
+    otherDb.storage.readWithVersion = \
+        lambda key: (reads.append(key), read(key))[1]
+    hits = ASVDb.parsedFileCache.hits
+    assert otherDb.getResults() == results
+    assert not(any(key.endswith(".json") and ("hash" in key)
+                   for key in reads))
+    assert ASVDb.parsedFileCache.hits == hits + numWrites
+
+    # Results files are parsed without holding the lock, so readers in the
+    # same process do not wait for each other.
+    lockHeldWhileParsing = []
+    class CheckingCodec:
+        def __init__(self, codec):
+            self.codec = codec
+        def loads(self, data):
+            lockHeld = any(f.startswith(ASVDb.lockfilePrefix)
+                           for f in os.listdir(otherDb.dbDir))
+            contents = self.codec.loads(data)
+            # Only results files, not the catalog or benchmarks.json
+            if "commit_hash" in contents:
+                lockHeldWhileParsing.append(lockHeld)
+            return contents
+        def dumps(self, *args, **kwargs):
+            return self.codec.dumps(*args, **kwargs)
+    ASVDb.parsedFileCache.clear()
+    otherDb.jsonCodec = CheckingCodec(otherDb.jsonCodec)
+    assert otherDb.getResults() == results
+    assert len(lockHeldWhileParsing) >= numWrites
+    assert not(any(lockHeldWhileParsing))
+
+    # Cancelling a delayed write only cancels the write delayed at the time,
+    # not writes by other threads.
+    db.writeDelay = 10
+    bInfo = BenchmarkInfo(machineName=machineName, commitHash="hash0",
+                          commitTime=commitTime, branch=branch)
+    thread = threading.Thread(target=db.addResults, args=(
+        bInfo, [BenchmarkResult(funcName="cancelled", result=1.0)]))
+    thread.start()
+    time.sleep(0.5)
+    db.cancelWrite = True
+    thread.join(timeout=5)
+    assert not(thread.is_alive())
+    db.writeDelay = 0
+    thread = threading.Thread(target=db.addResults, args=(
+        bInfo, [BenchmarkResult(funcName="written", result=1.0)]))
+    thread.start()
+    thread.join()
+    funcNames = set(r.funcName for (bi, bResults) in db.getResults()
+                    for r in bResults)
+    assert "written" in funcNames
+    assert "cancelled" not in funcNames
+
+    tmpDir.cleanup()
+
+
+def test_getResultsSince():
+    """
+    getResultsSince() returns the results added or changed since a token, from
+    any instance, including results added by merge().
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    dbDir = path.join(tmpDir.name, "db")
+    db = ASVDb(dbDir, repo, [branch])
+    db.changeFeedSegmentSize = 2
+    token = 0
+
+    bInfos = [BenchmarkInfo(machineName=machineName, commitHash=f"hash{i}",
+                            commitTime=commitTime + i, branch=branch)
+              for i in range(3)]
+    for bInfo in bInfos:
+        db.addResults(bInfo, [BenchmarkResult(funcName="bfs", result=1.0)])
+    (newToken, results) = db.getResultsSince(token)
+    assert newToken == 3
+    assert [bInfo.commitHash for (bInfo, _) in results] == \
+        ["hash0", "hash1", "hash2"]
+
+    # Polling again only returns new results, which span segments.
+    db.addResults(bInfos[1], [BenchmarkResult(funcName="sssp", result=2.0)])
+    (token, results) = db.getResultsSince(newToken)
+    assert token == 4
+    assert [(bInfo.commitHash, [r.funcName for r in bResults])
+            for (bInfo, bResults) in results] == [("hash1", ["sssp"])]
+    assert ASVDb(dbDir).getResultsSince(token) == (token, [])
+    assert ASVDb(dbDir).getResultsSince(2)[0] == 4
+
+    # Results added by merge() are recorded.
+    otherDir = path.join(tmpDir.name, "other")
+    otherDb = ASVDb(otherDir, repo, [branch])
+    otherInfo = BenchmarkInfo(machineName=machineName, commitHash="hash9",
+                              commitTime=commitTime + 9, branch=branch)
+    otherDb.addResults(otherInfo,
+                       [BenchmarkResult(funcName="bfs", result=3.0)])
+    db.merge([otherDb])
+    (newToken, results) = db.getResultsSince(token)
+    assert newToken == token + 1
+    assert [(bInfo.commitHash, [r.result for r in bResults])
+            for (bInfo, bResults) in results] == [("hash9", [3.0])]
+
+    # Adding or merging results already in the db are not changes.
+    db.addResults(bInfos[0], [BenchmarkResult(funcName="bfs", result=1.0)])
+    db.merge([otherDb])
+    assert db.getResultsSince(newToken) == (newToken, [])
+
+    for badToken in [-1, newToken + 1]:
+        with pytest.raises(ValueError):
+            db.getResultsSince(badToken)
+
+    # Only the last changeFeedMaxSegments segments are kept, and tokens for
+    # changes in removed segments expire.
+    changeFeedDir = path.join(dbDir, ASVDb.changeFeedDirName)
+    db.changeFeedMaxSegments = 2
+    for i in range(3, 7):
+        db.addResults(BenchmarkInfo(machineName=machineName,
+                                    commitHash=f"hash{i}",
+                                    commitTime=commitTime + i, branch=branch),
+                      [BenchmarkResult(funcName="bfs", result=1.0)])
+    assert db.getResultsSince()[0] == 9
+    assert sorted(os.listdir(changeFeedDir)) == \
+        ["00000003.jsonl", "00000004.jsonl", "head.json"]
+    assert [bInfo.commitHash for (bInfo, _) in db.getResultsSince(6)[1]] == \
+        ["hash4", "hash5", "hash6"]
+    with pytest.raises(ValueError, match="expired"):
+        db.getResultsSince(5)
+
+    # prune() also removes segments older than changeFeedMaxAge.
+    db.changeFeedMaxAge = 0
+    db.prune(lambda bInfo, bResult: False)
+    assert sorted(os.listdir(changeFeedDir)) == ["00000004.jsonl", "head.json"]
+    with pytest.raises(ValueError, match="expired"):
+        db.getResultsSince(7)
+    assert db.getResultsSince(8)[0] == 9
+
+    tmpDir.cleanup()
+
+
+def test_getResult():
+    """
+    getResult() and getResultsForParams() return the same results as
+    getResults() for any params, including results not yet compacted from
+    journal files.
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    dbDir = path.join(tmpDir.name, "db")
+    db = ASVDb(dbDir, repo, [branch])
+    bInfo = BenchmarkInfo(machineName=machineName, commitHash="hash0",
+                          commitTime=commitTime, branch=branch)
+    # A sparse grid, with a param value (None) that is stored as "NaN"
+    params = [(dataset, gpus) for dataset in ["karate", "hollywood", None]
+              for gpus in [1, 2, 4] if (dataset, gpus) != ("karate", 4)]
+    db.addResults(bInfo, [
+        BenchmarkResult(funcName="bfs", result=float(i),
+                        argNameValuePairs=[("dataset", dataset),
+                                           ("gpus", gpus)])
+        for (i, (dataset, gpus)) in enumerate(params)])
+    db.addResults(bInfo, [BenchmarkResult(funcName="noparams", result=9.0)])
+
+    results = [r for r in db.getResults()[0][1] if r.funcName == "bfs"]
+    assert len(results) == 9
+    assert db.getResultsForParams(
+        bInfo, "bfs", [r.argNameValuePairs for r in results]) == \
+        [r.result for r in results]
+    assert db.getResult(bInfo, "bfs", {"dataset": "hollywood", "gpus": 4}) \
+        == params.index(("hollywood", 4))
+    assert db.getResult(bInfo, "bfs", [("dataset", None), ("gpus", 2)]) \
+        == params.index((None, 2))
+    assert db.getResult(bInfo, "noparams") == 9.0
+    assert db.getResultsForParams(
+        bInfo, "bfs", [{"dataset": "karate", "gpus": 4},
+                       {"dataset": "cyber", "gpus": 1}]) == [None, None]
+    assert db.getResult(bInfo, "sssp", {"dataset": "karate"}) is None
+    otherInfo = BenchmarkInfo(machineName=machineName, commitHash="hash1",
+                              commitTime=commitTime, branch=branch)
+    assert db.getResult(otherInfo, "bfs", {"dataset": "karate", "gpus": 1}) \
+        is None
+    with pytest.raises(ValueError):
+        db.getResult(bInfo, "bfs", {"dataset": "karate"})
+
+    journaledDb = ASVDb(dbDir, repo, [branch], journaled=True)
+    journaledDb.addResults(bInfo, [
+        BenchmarkResult(funcName="bfs", result=-1.0,
+                        argNameValuePairs=[("dataset", "karate"),
+                                           ("gpus", 4)])])
+    assert db.getResult(bInfo, "bfs", {"dataset": "karate", "gpus": 4}) \
+        == -1.0
+
+    tmpDir.cleanup()
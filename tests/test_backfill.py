@@ -0,0 +1,126 @@
+import os
+import subprocess
+
+import pytest
+
+branch = "main"
+
+
+@pytest.fixture
+def gitRepo(tmp_path):
+    """
+    A git repo with 5 commits on main, and 1 more on the "feature" branch.
+    """
+    repoDir = str(tmp_path / "repo")
+    def git(*args, commitTime=1600000000):
+        env = dict(os.environ, GIT_COMMITTER_DATE=f"@{commitTime} +0000",
+                   GIT_AUTHOR_DATE=f"@{commitTime} +0000")
+        return subprocess.run(["git"] + list(args), cwd=repoDir, check=True,
+                              env=env, stdout=subprocess.PIPE
+                              ).stdout.decode().strip()
+
+    subprocess.run(["git", "init", "-q", "-b", branch, repoDir], check=True)
+    git("config", "user.email", "asvdb@example.com")
+    git("config", "user.name", "asvdb")
+    for i in range(5):
+        git("commit", "-q", "--allow-empty", "-m", f"commit {i}",
+            commitTime=1600000000 + i)
+    git("checkout", "-q", "-b", "feature")
+    git("commit", "-q", "--allow-empty", "-m", "feature commit",
+        commitTime=1600000010)
+    git("checkout", "-q", branch)
+    return (repoDir, git)
+
+
+def test_getCommitInfos(gitRepo, monkeypatch):
+    from asvdb import utils
+
+    (repoDir, git) = gitRepo
+    hashes = git("log", "--format=%H", branch).split()
+    featureHash = git("rev-parse", "feature")
+
+    commands = []
+    getCommandOutput = utils.getCommandOutput
+    def countingGetCommandOutput(cmd, **kwargs):
+        commands.append(cmd[1])
+        return getCommandOutput(cmd, **kwargs)
+    monkeypatch.setattr(utils, "getCommandOutput", countingGetCommandOutput)
+
+    infos = utils.getCommitInfos(hashes[:3] + [featureHash[:10]],
+                                 repoDir=repoDir)
+    assert commands == ["rev-parse", "log", "name-rev"]
+    assert infos[hashes[0]] == (hashes[0], "1600000004000", branch)
+    assert infos[hashes[2]] == (hashes[2], "1600000002000", branch)
+    assert infos[featureHash[:10]] == (featureHash, "1600000010000", "feature")
+
+    # Cached commits are not resolved again.
+    commands.clear()
+    infos = utils.getCommitInfos(hashes, repoDir=repoDir)
+    assert commands == ["rev-parse", "log", "name-rev"]
+    assert [infos[h][1] for h in hashes] == \
+        [str((1600000004 - i) * 1000) for i in range(5)]
+    commands.clear()
+    utils.getCommitInfos(hashes, repoDir=repoDir)
+    assert commands == []
+
+    assert [(h, t) for (h, t, _) in utils.iterCommitInfos(
+        f"{hashes[3]}..{branch}", repoDir=repoDir)] == \
+        [(h, infos[h][1]) for h in hashes[:3]]
+    assert [b for (_, _, b) in utils.iterCommitInfos(
+        [branch, "feature"], repoDir=repoDir)] == ["feature"] + [branch] * 5
+
+    with pytest.raises(RuntimeError):
+        utils.getCommitInfos(["not_a_commit"], repoDir=repoDir)
+
+
+def test_getCommitInfosAnnotatedTag(gitRepo):
+    """
+    Annotated tags, by name or by the hash of the tag object, resolve to the
+    commit they point to.
+    """
+    from asvdb import utils
+
+    (repoDir, git) = gitRepo
+    git("tag", "-a", "v1.0", "-m", "release", f"{branch}~1")
+    tagHash = git("rev-parse", "v1.0")
+    commitHash = git("rev-parse", f"{branch}~1")
+    assert tagHash != commitHash
+
+    infos = utils.getCommitInfos(["v1.0", tagHash, commitHash],
+                                 repoDir=repoDir)
+    assert infos["v1.0"] == (commitHash, "1600000003000", branch)
+    assert infos[tagHash] == infos["v1.0"]
+    assert infos[commitHash] == infos["v1.0"]
+    assert infos == utils.getCommitInfos(["v1.0", tagHash, commitHash],
+                                         repoDir=repoDir)
+
+
+def test_backfill(gitRepo, monkeypatch):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult, utils
+    from asvdb.backfill import backfill
+
+    (repoDir, git) = gitRepo
+    db = ASVDb(f"memory://backfill-{id(gitRepo)}", "myrepo", [branch])
+    writes = []
+    addResultTuples = db.addResultTuples
+    monkeypatch.setattr(db, "addResultTuples",
+                        lambda tuples: (writes.append(len(tuples)),
+                                        addResultTuples(tuples)))
+
+    hashes = git("log", "--format=%H", branch).split()
+    def getResults(commitHash):
+        # The oldest commit has no results
+        if commitHash == hashes[-1]:
+            return None
+        return [BenchmarkResult(funcName="bench", result=hashes.index(commitHash))]
+
+    numAdded = backfill(db, utils.iterCommitInfos(branch, repoDir=repoDir),
+                        getResults, BenchmarkInfo(machineName="machine"),
+                        batchSize=3)
+    assert numAdded == 4
+    assert writes == [3, 1]
+    results = sorted(db.getResults(), key=lambda r: r[0].commitTime)
+    assert [(bInfo.commitHash, bInfo.commitTime, bInfo.branch, bInfo.machineName)
+            for (bInfo, _) in results] == \
+        [(hashes[i], (1600000000 + 4 - i) * 1000, branch, "machine")
+         for i in range(3, -1, -1)]
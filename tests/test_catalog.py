@@ -0,0 +1,75 @@
+import json
+import uuid
+
+
+def getCatalog(storage, version=1):
+    from asvdb.catalog import Catalog
+    from asvdb.codec import getCodec
+
+    return Catalog(storage, getCodec("json"), "results", "machine.json",
+                   ".asvdb-index.json", version)
+
+
+def writeJson(storage, key, contents):
+    return storage.write(key, json.dumps(contents).encode())
+
+
+def test_catalog():
+    """
+    The catalog is built from, and kept up to date with, the files in the
+    results dir, and only the files that changed are read.
+    """
+    from asvdb.storage import MemoryStorage
+
+    storage = MemoryStorage(f"memory://{uuid.uuid4().hex}")
+    storage.create()
+    catalog = getCatalog(storage)
+
+    # No catalog is written for an empty results dir.
+    assert catalog.load(verify=True) == {"version": 1, "machines": {}}
+    assert storage.read(catalog.key) is None
+
+    writeJson(storage, "results/m1/machine.json", {"machine": "m1"})
+    v1 = writeJson(storage, "results/m1/hash1.json",
+                   {"commit_hash": "hash1", "date": 1000, "branch": "main",
+                    "results": {"b": {}, "a": {}}})
+    # Files in dirs without a machine.json are not results files.
+    writeJson(storage, "results/other/hash1.json", {"commit_hash": "hash1"})
+
+    contents = catalog.load(verify=False)
+    assert json.loads(storage.read(catalog.key)) == contents
+    assert catalog.getResultsFiles(contents) == [
+        ("results/m1/hash1.json", {"machine": "m1"},
+         {"commit_hash": "hash1", "date": 1000, "branch": "main",
+          "params": {}, "requirements": {}, "benchmarks": ["a", "b"],
+          "version": v1})]
+
+    # Files are only read again once their version changes.
+    reads = []
+    read = storage.readWithVersion
+    storage.readWithVersion = lambda key: reads.append(key) or read(key)
+    catalog.load(verify=True)
+    assert reads == [catalog.key]
+    writeJson(storage, "results/m1/hash2.json", {"commit_hash": "hash2"})
+    storage.delete("results/m1/hash1.json")
+    reads.clear()
+    contents = catalog.load(verify=True)
+    assert reads == [catalog.key, "results/m1/hash2.json"]
+    assert list(contents["machines"]["m1"]["files"]) == ["hash2.json"]
+    del storage.readWithVersion
+
+    # Without verify, changes not made through update() are not seen.
+    writeJson(storage, "results/m1/hash3.json", {"commit_hash": "hash3"})
+    assert len(catalog.getResultsFiles(catalog.load(verify=False))) == 1
+    v4 = writeJson(storage, "results/m1/hash4.json", {"commit_hash": "hash4"})
+    catalog.update({}, {"results/m1/hash4.json": ({"commit_hash": "hash4"},
+                                                  v4)})
+    assert [f[0] for f in catalog.getResultsFiles(catalog.load(False))] == \
+        ["results/m1/hash2.json", "results/m1/hash4.json"]
+    assert len(catalog.getResultsFiles(catalog.rebuild())) == 3
+
+    # A catalog in another format is rebuilt, not updated.
+    otherCatalog = getCatalog(storage, version=2)
+    otherCatalog.update({}, {"results/m1/hash5.json": ({}, "v")})
+    assert json.loads(storage.read(catalog.key))["version"] == 1
+    assert otherCatalog.load(verify=False)["version"] == 2
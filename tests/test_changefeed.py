@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+
+from asvdb import BenchmarkInfo, BenchmarkResult
+
+
+def getChangeFeed(storage, maxSegments=100, maxAge=None):
+    from asvdb.changefeed import ChangeFeed
+    from asvdb.codec import getCodec
+
+    return ChangeFeed(storage, getCodec("json"), "changes", "head.json", 2,
+                      maxSegments, maxAge)
+
+
+def test_changeFeed():
+    """
+    Records are returned after a token, and old segments are removed, which
+    expires the tokens in them.
+    """
+    from asvdb.storage import MemoryStorage
+
+    storage = MemoryStorage(f"memory://{uuid.uuid4().hex}")
+    storage.create()
+    changeFeed = getChangeFeed(storage)
+    assert changeFeed.loadHead() == {}
+    assert changeFeed.read(0, {}) == []
+
+    resultTuples = [(BenchmarkInfo(machineName="m1", commitHash=f"hash{i}"),
+                     [BenchmarkResult("a", float(i))]) for i in range(5)]
+    # Writes with no results are not recorded.
+    changeFeed.append([(resultTuples[0][0], [])])
+    assert changeFeed.loadHead() == {}
+    for resultTuple in resultTuples:
+        changeFeed.append([resultTuple])
+    head = changeFeed.loadHead()
+    assert head["seq"] == 5
+    assert storage.listFiles("changes") == [
+        "changes/00000000.jsonl", "changes/00000001.jsonl",
+        "changes/00000002.jsonl", "changes/head.json"]
+    assert changeFeed.read(0, head) == resultTuples
+    assert changeFeed.read(3, head) == resultTuples[3:]
+    assert changeFeed.read(5, head) == []
+    with pytest.raises(ValueError, match="Invalid"):
+        changeFeed.read(6, head)
+
+    # Only the oldest segments are removed, never the current one.
+    getChangeFeed(storage, maxSegments=2).trim()
+    head = changeFeed.loadHead()
+    assert head["first"] == 2
+    assert storage.listFiles("changes") == [
+        "changes/00000001.jsonl", "changes/00000002.jsonl",
+        "changes/head.json"]
+    assert changeFeed.read(2, head) == resultTuples[2:]
+    with pytest.raises(ValueError, match="expired"):
+        changeFeed.read(1, head)
+    getChangeFeed(storage, maxAge=0).trim()
+    assert storage.listFiles("changes") == [
+        "changes/00000002.jsonl", "changes/head.json"]
+    assert changeFeed.read(4, changeFeed.loadHead()) == resultTuples[4:]
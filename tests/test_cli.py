@@ -0,0 +1,406 @@
+import uuid
+
+import pytest
+
+repo = "myrepo"
+branch = "my_branch"
+machineName = "my_machine"
+commitHashes = ["809a1569e8a2ff138cdde4d9c282328be9dcad43",
+                "c29c3e359d1d945ef32b6867809a331f460d3e46"]
+funcNames = ["bfs", "sssp", "pagerank"]
+scales = [10, 11, 12]
+
+
+def createDb(dbURL=None):
+    """
+    Return the URL of a new in-memory DB with a result for each combination of
+    commitHashes, funcNames and scales.
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    dbURL = dbURL or f"memory://{uuid.uuid4().hex}"
+    db = ASVDb(dbURL, repo, [branch])
+    for (i, commitHash) in enumerate(commitHashes):
+        bInfo = BenchmarkInfo(machineName=machineName, cudaVer="9.2",
+                              osType="linux", pythonVer="3.6",
+                              commitHash=commitHash, commitTime=1000 + i,
+                              branch=branch)
+        db.addResults(bInfo, [
+            BenchmarkResult(funcName=funcName,
+                            argNameValuePairs=[("scale", scale)],
+                            result=i + scale / 100)
+            for funcName in funcNames
+            for scale in scales])
+    return dbURL
+
+
+def runCLI(capsys, *argv):
+    from asvdb.__main__ import main
+
+    main(list(argv))
+    return capsys.readouterr().out.splitlines()
+
+
+def test_filterPrint(capsys):
+    dbURL = createDb()
+    out = runCLI(capsys, "--read-from", dbURL,
+                 "--filter", "funcName=='bfs' and result > 1",
+                 "--print", "commitHash, funcName, result")
+    assert sorted(out) == [f"{commitHashes[1]} bfs {1 + s / 100}"
+                           for s in scales]
+
+
+def test_exec(capsys):
+    dbURL = createDb()
+    out = runCLI(capsys, "--read-from", dbURL,
+                 "--exec-once", "i=0",
+                 "--exec", "i+=1",
+                 "--exec-once", "print(i)")
+    assert out == [str(len(commitHashes) * len(funcNames) * len(scales))]
+
+
+def test_execWriteTo(capsys):
+    from asvdb import ASVDb
+
+    dbURL = createDb()
+    newDbURL = f"memory://{uuid.uuid4().hex}"
+    runCLI(capsys, "--read-from", dbURL,
+           "--filter", "funcName=='sssp'",
+           "--exec", "unit='milliseconds'",
+           "--write-to", newDbURL)
+
+    results = ASVDb(newDbURL).getResults()
+    assert len(results) == len(commitHashes)
+    for (_, resultObjs) in results:
+        assert len(resultObjs) == len(scales)
+        assert set(r.funcName for r in resultObjs) == set(["sssp"])
+        assert set(r.unit for r in resultObjs) == set(["milliseconds"])
+
+
+@pytest.mark.parametrize("expr", [
+    "funcName=='bfs' and result > 1",
+    "not (funcName=='bfs') or commitTime == 1000",
+    "result * 100 >= threshold",
+    "funcName=='bfs' and argNameValuePairs==[('scale', '10')]",
+    "funcName in ['bfs', 'sssp']",
+    "result",
+])
+def test_filterVectorized(capsys, expr):
+    pytest.importorskip("numpy")
+
+    dbURL = createDb()
+    args = ["--read-from", dbURL, "--exec-once", "threshold=111",
+            "--filter", expr, "--print", "commitHash, funcName, result"]
+    expected = sorted(runCLI(capsys, *args))
+    assert expected
+    assert sorted(runCLI(capsys, "--vectorize", *args)) == expected
+
+
+def test_filterLargeInts():
+    """
+    Filters on ints outside the int64 range, or whose arithmetic would
+    overflow int64, give the same results when vectorized as in Python, and
+    assignments in an expression are not seen by the next row.
+    """
+    numpy = pytest.importorskip("numpy")
+    from asvdb import BenchmarkInfo, BenchmarkResult
+    from asvdb.__main__ import filterResults, filterResultsVectorized
+
+    resultTupleList = [
+        (BenchmarkInfo(commitTime=t),
+         [BenchmarkResult(funcName="bfs", result=r) for r in [2**63, 1]])
+        for t in [2**62, 1]]
+    def getRows(results):
+        return [(bi.commitTime, r.result) for (bi, rs) in results for r in rs]
+
+    for expr in ["result == 2**63 + 1", "result == 2**63",
+                 "commitTime * 4 > 10", "-commitTime * 4 < 0"]:
+        expected = getRows(filterResults(resultTupleList, expr))
+        assert getRows(filterResultsVectorized(resultTupleList, expr)) == \
+            expected
+    assert getRows(filterResultsVectorized(resultTupleList,
+                                           "commitTime * 4 > 10")) == \
+        [(2**62, 2**63), (2**62, 1)]
+
+    expr = "'r' in dir() or (r := result) == 1"
+    assert getRows(filterResults(resultTupleList, expr)) == \
+        [(2**62, 1), (1, 1)]
+
+
+def test_compileVectorizedExpr():
+    from asvdb.__main__ import compileVectorizedExpr
+
+    (_, names, hasArithmetic) = compileVectorizedExpr(
+        "funcName=='bfs' and result > x")
+    assert names == set(["funcName", "result", "x"])
+    assert hasArithmetic is False
+    assert compileVectorizedExpr("-result > x * 2")[2] is True
+    # Calls, containers, chained comparisons and non-boolean and/or operands
+    # cannot be vectorized.
+    assert compileVectorizedExpr("len(funcName) > 2") is None
+    assert compileVectorizedExpr("funcName in ['bfs']") is None
+    assert compileVectorizedExpr("1 < result < 2") is None
+    assert compileVectorizedExpr("result and commitTime") is None
+
+
+def test_streamingBarrier(capsys):
+    """
+    A --filter using a value computed by an --exec on all rows must see the
+    final value even though rows are processed in batches.
+    """
+    dbURL = createDb()
+    out = runCLI(capsys, "--read-from", dbURL, "--batch-size", "1",
+                 "--exec-once", "latest=0",
+                 "--exec", "latest=max(latest, commitTime)",
+                 "--filter", "commitTime==latest",
+                 "--print", "commitHash")
+    assert out == [commitHashes[-1]] * (len(funcNames) * len(scales))
+
+
+def test_streamingExecOnce(capsys):
+    dbURL = createDb()
+    out = runCLI(capsys, "--read-from", dbURL, "--batch-size", "2",
+                 "--exec-once", "n=0",
+                 "--filter", "funcName=='bfs'",
+                 "--exec", "n+=1",
+                 "--exec-once", "print('total', n)",
+                 "--filter", "result > 0")
+    assert out == [f"total {len(commitHashes) * len(scales)}"]
+
+
+def test_streamingWriteTo(capsys):
+    from asvdb import ASVDb
+
+    dbURL = createDb()
+    newDbURL = f"memory://{uuid.uuid4().hex}"
+    runCLI(capsys, "--read-from", dbURL, "--batch-size", "1",
+           "--write-to", newDbURL)
+    assert ASVDb(newDbURL).getResults() == ASVDb(dbURL).getResults()
+
+
+def test_getActionEffects():
+    from asvdb.__main__ import getActionEffects
+
+    assert getActionEffects("filter", "funcName=='bfs'") == (False, False)
+    assert getActionEffects("filter", "(x:=1)") == (True, False)
+    assert getActionEffects("print", "funcName") == (False, True)
+    assert getActionEffects("exec", "unit='ms'") == (False, False)
+    assert getActionEffects("exec", "total+=result") == (True, False)
+    assert getActionEffects("exec", "print(funcName)") == (True, True)
+
+
+def test_exportCSV(capsys):
+    import csv
+    from asvdb import BenchmarkInfoKeys, BenchmarkResultKeys
+
+    dbURL = createDb()
+    out = runCLI(capsys, "--read-from", dbURL,
+                 "--filter", "funcName=='bfs'",
+                 "--export", "csv")
+    rows = list(csv.DictReader(out))
+    assert len(rows) == len(commitHashes) * len(scales)
+    assert sorted(rows[0]) == sorted(
+        set.union(BenchmarkInfoKeys, BenchmarkResultKeys,
+                  set(["param_scale"])))
+    assert set(r["funcName"] for r in rows) == set(["bfs"])
+    assert sorted(r["param_scale"] for r in rows if r["commitTime"] == "1001") \
+        == [str(s) for s in scales]
+    assert sorted(float(r["result"]) for r in rows if r["param_scale"] == "10") \
+        == [0.1, 1.1]
+
+
+def test_exportJSONL(capsys, tmp_path):
+    import json
+    from asvdb import ASVDb
+
+    dbURL = createDb()
+    outputPath = tmp_path / "out.jsonl"
+    runCLI(capsys, "--read-from", dbURL, "--batch-size", "4",
+           "--export", "jsonl", "--output", str(outputPath))
+    rows = [json.loads(l) for l in outputPath.read_text().splitlines()]
+    results = ASVDb(dbURL).getResults()
+    expectedRows = []
+    for (benchmarkInfo, benchmarkResults) in results:
+        for benchmarkResult in benchmarkResults:
+            row = dict(benchmarkInfo.__dict__)
+            row.update(benchmarkResult.__dict__)
+            row["argNameValuePairs"] = \
+                [list(p) for p in benchmarkResult.argNameValuePairs]
+            row["param_scale"] = benchmarkResult.argNameValuePairs[0][1]
+            expectedRows.append(row)
+    assert rows == expectedRows
+
+
+def test_exportParquet(capsys, tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    dbURL = createDb()
+    outputPath = tmp_path / "out.parquet"
+    runCLI(capsys, "--read-from", dbURL, "--batch-size", "4",
+           "--export", "parquet", "--output", str(outputPath))
+    table = parquet.read_table(str(outputPath))
+    assert table.num_rows == len(commitHashes) * len(funcNames) * len(scales)
+    assert sorted(set(table.column("commitTime").to_pylist())) == [1000, 1001]
+    assert sorted(set(table.column("param_scale").to_pylist())) == \
+        [str(s) for s in scales]
+    assert str(table.schema.field("result").type) == "double"
+
+
+def test_exportParquetNonFloatResults(capsys, tmp_path):
+    """
+    Results that are not numbers, even if only found after some batches have
+    been written, are written as a string column of JSON values.
+    """
+    import json
+    parquet = pytest.importorskip("pyarrow.parquet")
+
+    dbURL = createDb()
+    expected = runCLI(capsys, "--read-from", dbURL, "--print",
+                      "commitTime, result")
+    outputPath = tmp_path / "out.parquet"
+    runCLI(capsys, "--read-from", dbURL, "--batch-size", "4",
+           "--exec", "result = [result] if commitTime == 1001 else result",
+           "--export", "parquet", "--output", str(outputPath))
+    table = parquet.read_table(str(outputPath))
+    assert str(table.schema.field("result").type) == "string"
+    commitTimes = table.column("commitTime").to_pylist()
+    results = table.column("result").to_pylist()
+    assert sorted((t, json.loads(r)) for (t, r) in zip(commitTimes, results)) \
+        == sorted((int(t), float(r) if t == "1000" else [float(r)])
+                  for (t, r) in (line.split() for line in expected))
+
+
+
+def test_groupBy(capsys):
+    import csv
+
+    dbURL = createDb()
+    out = runCLI(capsys, "--read-from", dbURL,
+                 "--filter", "funcName!='pagerank'",
+                 "--group-by", "funcName, param_scale",
+                 "--agg", "count()", "--agg", "min(result)",
+                 "--agg", "max(commitTime)", "--agg", "mean(result)",
+                 "--agg", "median(result)", "--agg", "percentile(result, 25)")
+    rows = list(csv.reader(out))
+    assert rows[0] == ["funcName", "param_scale", "count()", "min(result)",
+                       "max(commitTime)", "mean(result)", "median(result)",
+                       "percentile(result,25)"]
+    assert [r[:2] for r in rows[1:]] == [[f, str(s)] for f in ["bfs", "sssp"]
+                                         for s in scales]
+    # Results for each scale are scale/100 and 1+scale/100
+    (_, _, count, minResult, maxTime, mean, median, p25) = rows[1]
+    assert int(count) == 2
+    assert float(minResult) == 0.1
+    assert int(float(maxTime)) == 1001
+    assert float(mean) == pytest.approx(0.6)
+    assert float(median) == pytest.approx(0.6)
+    assert float(p25) == pytest.approx(0.35)
+
+
+def test_groupByOutput(capsys, tmp_path):
+    import json
+
+    dbURL = createDb()
+    outputPath = tmp_path / "agg.jsonl"
+    out = runCLI(capsys, "--read-from", dbURL,
+                 "--group-by", "commitHash", "--agg-output", str(outputPath),
+                 "--print", "funcName")
+    # Rows are passed through --group-by unmodified
+    assert len(out) == len(commitHashes) * len(funcNames) * len(scales)
+    rows = [json.loads(l) for l in outputPath.read_text().splitlines()]
+    assert rows == [{"commitHash": h, "count()": len(funcNames) * len(scales)}
+                    for h in sorted(commitHashes)]
+
+
+def test_aggregate():
+    from asvdb.aggregate import Aggregator, parseAggSpec, _aggregate
+    import array
+
+    assert parseAggSpec("count()") == ("count", None, None)
+    assert parseAggSpec(" median( result ) ") == ("median", "result", None)
+    assert parseAggSpec("percentile(result, 99.5)") == \
+        ("percentile", "result", 99.5)
+    for spec in ["sum(result)", "min()", "percentile(result)",
+                 "median(result, 50)", "percentile(result, 101)", "result"]:
+        with pytest.raises(ValueError):
+            parseAggSpec(spec)
+    for key in ["requirements", "argNameValuePairs", "notAKey"]:
+        with pytest.raises(ValueError):
+            Aggregator(["funcName", key], ["count()"])
+
+    # The pure-Python implementations (used without numpy) match numpy's.
+    numpy = pytest.importorskip("numpy")
+    values = array.array("d", [5, 1, 4, 2, 8, 3])
+    for (funcName, q) in [("min", None), ("max", None), ("mean", None),
+                          ("median", None), ("percentile", 10),
+                          ("percentile", 90), ("percentile", 100)]:
+        assert _aggregate(None, funcName, values, q) == \
+            pytest.approx(_aggregate(numpy, funcName, values, q))
+    assert _aggregate(numpy, "median", array.array("d"), None) is None
+
+
+def test_pruneRetain(capsys):
+    from asvdb import ASVDb
+
+    dbURL = createDb()
+    runCLI(capsys, "--read-from", dbURL, "--retain", "last:1",
+           "--prune", "funcName=='bfs'",
+           "--prune", "argNameValuePairs==[('scale', '10')]")
+    results = ASVDb(dbURL).getResults()
+    assert len(results) == 1
+    assert results[0][0].commitHash == commitHashes[-1]
+    assert sorted((r.funcName, r.argNameValuePairs[0][1])
+                  for r in results[0][1]) == \
+        [(f, str(s)) for f in ["pagerank", "sssp"] for s in scales[1:]]
+
+
+def test_mergeFrom(capsys):
+    from asvdb import ASVDb
+
+    dbURL1 = createDb()
+    dbURL2 = createDb()
+    newDbURL = f"memory://{uuid.uuid4().hex}"
+    out = runCLI(capsys, "--merge-from", dbURL1, "--merge-from", dbURL2,
+                 "--merge-conflict", "error", "--write-to", newDbURL)
+    assert out == []
+    assert ASVDb(newDbURL).getResults() == ASVDb(dbURL1).getResults()
+
+    with pytest.raises(RuntimeError):
+        runCLI(capsys, "--merge-from", dbURL1)
+
+
+def test_since(capsys):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+    from asvdb.__main__ import followResults
+
+    dbURL = createDb()
+    db = ASVDb(dbURL, repo, [branch])
+    (token, _) = db.getResultsSince()
+    bInfo = BenchmarkInfo(machineName=machineName, commitHash="newhash",
+                          commitTime=2000, branch=branch)
+    db.addResults(bInfo, [BenchmarkResult(funcName="bfs", result=5.0,
+                                          argNameValuePairs=[("scale", 13)])])
+
+    out = runCLI(capsys, "--read-from", dbURL, "--since", str(token),
+                 "--print", "commitHash, funcName, result")
+    assert out == ["newhash bfs 5.0"]
+
+    # Only polls which found results are generated.
+    assert list(followResults(db, token + 1, 0, maxPolls=2)) == []
+    db.addResults(bInfo, [BenchmarkResult(funcName="sssp", result=6.0,
+                                          argNameValuePairs=[("scale", 13)])])
+    batches = list(followResults(db, token + 1, 0, maxPolls=2))
+    assert [[(bInfo.commitHash, [r.funcName for r in bResults])
+             for (bInfo, bResults) in batch] for batch in batches] == \
+        [[("newhash", ["sssp"])]]
+
+    with pytest.raises(RuntimeError):
+        runCLI(capsys, "--read-from", dbURL, "--follow", "--group-by",
+               "funcName")
+    # An --exec-once after a row action would only run after all rows, which
+    # never end with --follow.
+    for cmds in [["--filter", "True", "--exec-once", "print(1)"],
+                 ["--filter", "True", "--exec-once", "n=0",
+                  "--print", "funcName"]]:
+        with pytest.raises(RuntimeError, match="--exec-once"):
+            runCLI(capsys, "--read-from", dbURL, "--follow", *cmds)
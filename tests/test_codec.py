@@ -0,0 +1,65 @@
+import json
+import math
+import tempfile
+from os import path
+
+import pytest
+
+
+def test_codecs():
+    from asvdb.codec import getCodec, getInstalledCodecs
+
+    d = {"results": {"bfs": {"params": [["a.csv", "b.csv"]],
+                             "result": [0.5, None]}},
+         "date": 1590007324000}
+    codecs = getInstalledCodecs()
+    assert codecs[-1].name == "json"
+    assert getCodec() is codecs[0]
+    for codec in codecs:
+        data = codec.dumps(d)
+        assert json.loads(data) == d
+        assert codec.loads(data) == d
+        compactData = codec.dumps(d, compact=True)
+        assert b"\n" not in compactData
+        assert len(compactData) < len(data)
+        assert codec.loads(compactData) == d
+        # NaN is not valid JSON, but is written by the stdlib (and ASV).
+        assert codec.loads(b'{"result": [NaN, 1]}')["result"][1] == 1
+        # NaN and Infinity are written as the stdlib does, and read back.
+        for compact in [False, True]:
+            data = codec.dumps({"result": [float("nan"), float("inf"), None]},
+                               compact=compact)
+            assert b"NaN" in data
+            (nan, inf, none) = codec.loads(data)["result"]
+            assert (math.isnan(nan), inf, none) == (True, float("inf"), None)
+            assert data == getCodec("json").dumps(
+                {"result": [float("nan"), float("inf"), None]}, compact=compact)
+
+    with pytest.raises(ValueError):
+        getCodec("not_a_codec")
+
+
+def test_codecEnvVar(monkeypatch):
+    from asvdb.codec import getCodec
+
+    monkeypatch.setenv("ASVDB_JSON_CODEC", "json")
+    assert getCodec().name == "json"
+
+
+def test_compactJson(monkeypatch):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    tmpDir = tempfile.TemporaryDirectory()
+    db = ASVDb(tmpDir.name, "myrepo", ["my_branch"])
+    db.compactJson = True
+    bInfo = BenchmarkInfo(machineName="my_machine", commitHash="abc123",
+                          commitTime=1590007324, branch="my_branch")
+    db.addResult(bInfo, BenchmarkResult(funcName="bfs", result=1.5))
+
+    with open(path.join(tmpDir.name, "results", "benchmarks.json"), "rb") as f:
+        assert b"\n" not in f.read()
+    # Compact files can be read with any codec.
+    monkeypatch.setattr(ASVDb, "jsonCodecName", "json")
+    results = ASVDb(tmpDir.name).getResults()
+    assert [(bi.commitHash, [r.result for r in rs]) for (bi, rs) in results] \
+        == [("abc123", [1.5])]
@@ -0,0 +1,174 @@
+import json
+import uuid
+
+import pytest
+
+commitHash = "809a1569e8a2ff138cdde4d9c282328be9dcad43"
+
+
+def writePytestBenchmarkReport(filePath, node="my_machine", testNum=0):
+    report = {
+        "machine_info": {"node": node, "processor": "x86_64",
+                         "machine": "x86_64", "python_version": "3.8.5",
+                         "release": "5.4.0", "system": "Linux",
+                         "cpu": {"brand_raw": "Intel Xeon"}},
+        "commit_info": {"id": commitHash, "time": "2020-06-01T12:00:00+00:00",
+                        "dirty": False, "project": "myrepo",
+                        "branch": "main"},
+        "benchmarks": [
+            {"name": f"test_bfs[{dataset}-{scale}]",
+             "fullname": f"tests/test_algos.py::test_bfs{testNum}[{dataset}-{scale}]",
+             "params": {"dataset": dataset, "scale": scale},
+             "param": f"{dataset}-{scale}",
+             "stats": {"min": scale / 100, "median": scale / 10,
+                       "mean": scale / 5}}
+            for dataset in ["a.csv", "b.csv"] for scale in [10, 20]],
+        "datetime": "2020-06-01T12:34:56.789012",
+        "version": "3.2.3",
+    }
+    with open(filePath, "w") as fobj:
+        json.dump(report, fobj)
+
+
+def writeGoogleBenchmarkReport(filePath):
+    def benchmark(name, realTime, runName=None, **kwargs):
+        b = {"name": name, "run_type": "iteration", "iterations": 100,
+             "real_time": realTime, "cpu_time": realTime, "time_unit": "us"}
+        if runName is not None:
+            b["run_name"] = runName
+        b.update(kwargs)
+        return b
+
+    report = {
+        "context": {"date": "2020-06-01T12:34:56+00:00", "host_name": "gb_host",
+                    "num_cpus": 8},
+        "benchmarks": [
+            benchmark("BM_Sort/8/size:16/real_time", 10),
+            benchmark("BM_Sort/8/size:32/real_time", 20),
+            # Repetitions with an aggregate, using the newer run_name
+            benchmark("BM_Copy/threads:2", 5, "BM_Copy/threads:2"),
+            benchmark("BM_Copy/threads:2", 7, "BM_Copy/threads:2"),
+            benchmark("BM_Copy/threads:2_median", 6, "BM_Copy/threads:2",
+                      run_type="aggregate", aggregate_name="median"),
+            benchmark("BM_Copy/threads:2_mean", 6.5, "BM_Copy/threads:2",
+                      run_type="aggregate", aggregate_name="mean"),
+            # Repetitions without aggregates
+            benchmark("BM_Fill", 1),
+            benchmark("BM_Fill", 3),
+            benchmark("BM_Fill", 2),
+            benchmark("BM_Error", 0, error_occurred=True),
+        ],
+    }
+    with open(filePath, "w") as fobj:
+        json.dump(report, fobj)
+
+
+def test_pytestBenchmark(tmp_path):
+    from asvdb import BenchmarkInfo, BenchmarkResult
+    from asvdb import importers
+
+    writePytestBenchmarkReport(tmp_path / "report.json")
+    [(bInfo, results)] = importers.importFiles("pytest-benchmark",
+                                               [tmp_path / "report.json"])
+    assert bInfo == BenchmarkInfo(machineName="my_machine", osType="Linux 5.4.0",
+                                  pythonVer="3.8", commitHash=commitHash,
+                                  commitTime=1591012800000, branch="main",
+                                  cpuType="Intel Xeon", arch="x86_64")
+    assert results[0] == BenchmarkResult(
+        funcName="tests.test_algos.test_bfs0",
+        argNameValuePairs=[("dataset", "a.csv"), ("scale", "10")], result=1.0)
+    assert len(results) == 4
+
+    [(_, results)] = importers.importFiles("pytest-benchmark",
+                                           [tmp_path / "report.json"],
+                                           stat="min")
+    assert [r.result for r in results] == [0.1, 0.2, 0.1, 0.2]
+
+
+def test_googleBenchmark(tmp_path):
+    from asvdb import importers
+
+    writeGoogleBenchmarkReport(tmp_path / "report.json")
+    [(bInfo, results)] = importers.importFiles(
+        "google-benchmark", [tmp_path / "report.json"],
+        infoDefaults={"commitHash": commitHash, "branch": "main"})
+    assert (bInfo.machineName, bInfo.commitHash, bInfo.branch) == \
+        ("gb_host", commitHash, "main")
+    assert [(r.funcName, r.argNameValuePairs, r.result) for r in results] == [
+        ("BM_Sort", [("arg0", "8"), ("size", "16")], pytest.approx(10e-6)),
+        ("BM_Sort", [("arg0", "8"), ("size", "32")], pytest.approx(20e-6)),
+        ("BM_Copy", [("threads", "2")], pytest.approx(6e-6)),
+        ("BM_Fill", [], pytest.approx(2e-6)),
+    ]
+
+    [(_, results)] = importers.importFiles(
+        "google-benchmark", [tmp_path / "report.json"], stat="mean")
+    assert [r.result for r in results if r.funcName == "BM_Copy"] == \
+        [pytest.approx(6.5e-6)]
+
+
+def test_importErrors(tmp_path):
+    from asvdb import importers
+
+    with pytest.raises(ValueError, match="Unsupported import format"):
+        importers.parseImportSpec("csv:*.csv")
+    with pytest.raises(ValueError, match="must be of the form"):
+        importers.parseImportSpec("pytest-benchmark")
+
+    with open(tmp_path / "bad.json", "w") as fobj:
+        json.dump({"benchmarks": [{"name": "test_x"}]}, fobj)
+    with pytest.raises(ValueError, match="Could not import .*bad.json"):
+        importers.importFiles("pytest-benchmark", [tmp_path / "bad.json"])
+
+
+def test_importFromCLI(tmp_path, monkeypatch):
+    """
+    All imported results are written with a single write per results file.
+    """
+    from asvdb import ASVDb
+    from asvdb.__main__ import main
+    from asvdb.storage import MemoryStorage
+
+    numReports = 8
+    for i in range(numReports):
+        writePytestBenchmarkReport(tmp_path / f"report{i}.json",
+                                   node=f"machine{i % 2}", testNum=i)
+    dbURL = f"memory://{uuid.uuid4().hex}"
+    writes = []
+    writeIfChanged = MemoryStorage.writeIfChanged
+    def countingWriteIfChanged(self, key, data):
+        writes.append(key)
+        return writeIfChanged(self, key, data)
+    monkeypatch.setattr(MemoryStorage, "writeIfChanged", countingWriteIfChanged)
+
+    main(["--import-from", f"pytest-benchmark:{tmp_path}/report*.json",
+          "--exec", "cudaVer='11.0'",
+          "--repo", "myrepo", "--write-to", dbURL])
+
+    resultsWrites = [key for key in writes if key.count("/") == 2
+                     and not(key.endswith("/machine.json"))]
+    assert sorted(resultsWrites) == \
+        [f"results/machine{i}/{commitHash}-python3.8-cuda11.0-Linux 5.4.0.json"
+         for i in range(2)]
+
+    results = ASVDb(dbURL).getResults()
+    assert sorted((bInfo.machineName, bInfo.cudaVer, len(bResults))
+                  for (bInfo, bResults) in results) == \
+        [("machine0", "11.0", 4 * numReports // 2),
+         ("machine1", "11.0", 4 * numReports // 2)]
+
+    with pytest.raises(RuntimeError, match="No files match"):
+        main(["--import-from", f"pytest-benchmark:{tmp_path}/none*.json"])
+
+
+def test_importFilesParallel(tmp_path):
+    from asvdb import importers
+
+    paths = []
+    for i in range(6):
+        paths.append(tmp_path / f"report{i}.json")
+        writePytestBenchmarkReport(paths[-1], testNum=i)
+    resultTuples = importers.importFiles("pytest-benchmark", paths,
+                                         maxWorkers=2)
+    assert [results[0].funcName for (_, results) in resultTuples] == \
+        [f"tests.test_algos.test_bfs{i}" for i in range(6)]
@@ -0,0 +1,234 @@
+import os
+import stat
+import threading
+
+import pytest
+
+repo = "myrepo"
+branch = "my_branch"
+
+
+@pytest.fixture
+def ingestSocket(tmp_path):
+    from asvdb.ingest import IngestServer
+
+    socketPath = str(tmp_path / "ingest.sock")
+    server = IngestServer(socketPath, [str(tmp_path / "db")], batchWindow=0.2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield socketPath
+    server.shutdown()
+    server.server_close()
+
+
+def test_batchWriter():
+    from asvdb.batchwriter import BatchWriter
+
+    batches = []
+    def writeFunc(items):
+        if "bad" in items:
+            raise ValueError("bad item")
+        batches.append(items)
+
+    writer = BatchWriter(writeFunc, maxDelay=10, maxBatchSize=3)
+    futures = [writer.submit(i) for i in range(4)]
+    # The first 3 items are written as soon as maxBatchSize is reached, and
+    # the last when flushed.
+    futures[2].result(timeout=5)
+    writer.flush()
+    assert batches == [[0, 1, 2], [3]]
+    assert all(f.done() for f in futures)
+
+    badFuture = writer.submit("bad")
+    writer.close()
+    assert isinstance(badFuture.exception(), ValueError)
+    with pytest.raises(RuntimeError):
+        writer.submit(5)
+
+
+def test_batchWriterIdle():
+    """
+    The writer thread of an idle BatchWriter exits and is restarted when
+    needed, and idle or closed writers are not kept alive to be closed at exit.
+    """
+    import gc
+    import time
+    import weakref
+    from asvdb import batchwriter
+
+    batches = []
+    writer = batchwriter.BatchWriter(batches.append, maxDelay=0,
+                                     maxIdleTime=0.1)
+    writer.submit(0).result(timeout=5)
+    assert writer in batchwriter._openWriters
+    deadline = time.monotonic() + 5
+    while (writer in batchwriter._openWriters) and \
+          (time.monotonic() < deadline):
+        time.sleep(0.05)
+    assert writer not in batchwriter._openWriters
+    writer.submit(1).result(timeout=5)
+    assert batches == [[0], [1]]
+
+    writerRef = weakref.ref(writer)
+    writer.close()
+    assert writerRef() not in batchwriter._openWriters
+    del writer
+    gc.collect()
+    assert writerRef() is None
+
+    # A writer that is not closed can be collected once its thread exits.
+    writer = batchwriter.BatchWriter(batches.append, maxDelay=0,
+                                     maxIdleTime=0.1)
+    writer.submit(2).result(timeout=5)
+    writerRef = weakref.ref(writer)
+    del writer
+    deadline = time.monotonic() + 5
+    while (writerRef() is not None) and (time.monotonic() < deadline):
+        time.sleep(0.05)
+        gc.collect()
+    assert writerRef() is None
+
+
+def test_ingest(tmp_path, ingestSocket, monkeypatch):
+    """
+    Results added concurrently by many clients are all written, in fewer
+    batches than there are calls.
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    dbDir = str(tmp_path / "db")
+    writes = []
+    addResultTuples = ASVDb.addResultTuples
+    def countingAddResultTuples(self, resultTupleList):
+        if self.ingestSocket is None:
+            writes.append(len(resultTupleList))
+        return addResultTuples(self, resultTupleList)
+    monkeypatch.setattr(ASVDb, "addResultTuples", countingAddResultTuples)
+
+    numClients = 8
+    numResults = 5
+    def addResults(clientNum):
+        db = ASVDb(dbDir, repo, [branch], ingestSocket=ingestSocket)
+        bInfo = BenchmarkInfo(machineName="machine", commitHash=f"hash{clientNum}",
+                              commitTime=clientNum, branch=branch)
+        for i in range(numResults):
+            db.addResult(bInfo, BenchmarkResult(funcName=f"bench{i}", result=i))
+
+    threads = [threading.Thread(target=addResults, args=(n,))
+               for n in range(numClients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(writes) == numClients * numResults
+    assert len(writes) < numClients * numResults
+
+    results = ASVDb(dbDir).getResults()
+    assert sorted((bInfo.commitHash, len(bResults))
+                  for (bInfo, bResults) in results) == \
+        [(f"hash{n}", numResults) for n in range(numClients)]
+
+
+def test_ingestError(tmp_path, ingestSocket):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    # repo must be set to create the db, so the daemon fails to write.
+    db = ASVDb(str(tmp_path / "db"), ingestSocket=ingestSocket)
+    with pytest.raises(RuntimeError, match="repo must be set"):
+        db.addResult(BenchmarkInfo(machineName="machine", commitHash="hash0",
+                                   branch=branch),
+                     BenchmarkResult(funcName="bench", result=1))
+
+
+def test_ingestAllowedDbs(tmp_path, ingestSocket):
+    """
+    The socket is only accessible by its owner, and results for dbs not given
+    to the daemon are rejected.
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    assert stat.S_IMODE(os.stat(ingestSocket).st_mode) == 0o600
+
+    otherDbDir = str(tmp_path / "other_db")
+    db = ASVDb(otherDbDir, repo, [branch], ingestSocket=ingestSocket)
+    with pytest.raises(RuntimeError, match="not one of the dbs"):
+        db.addResult(BenchmarkInfo(machineName="machine", commitHash="hash0",
+                                   branch=branch),
+                     BenchmarkResult(funcName="bench", result=1))
+    assert not(os.path.exists(otherDbDir))
+
+    # The same db, through a symlink, is allowed.
+    os.symlink(str(tmp_path), str(tmp_path / "link"))
+    db = ASVDb(str(tmp_path / "link" / "db"), repo, [branch],
+               ingestSocket=ingestSocket)
+    db.addResult(BenchmarkInfo(machineName="machine", commitHash="hash0",
+                               branch=branch),
+                 BenchmarkResult(funcName="bench", result=1))
+    assert len(ASVDb(str(tmp_path / "db")).getResults()) == 1
+
+
+def test_ingestBadRequest(tmp_path, ingestSocket, monkeypatch):
+    """
+    A client sending invalid results, or results that fail to be written, only
+    gets an error itself, and the results of other clients written in the same
+    batch are still added.
+    """
+    import json
+    import socket
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+    from asvdb.asvdb import encodeResultTuples
+
+    dbDir = str(tmp_path / "db")
+    writes = []
+    addResultTuples = ASVDb.addResultTuples
+    def failingAddResultTuples(self, resultTupleList):
+        if self.ingestSocket is None:
+            writes.append(len(resultTupleList))
+            if any(r.funcName == "explode" for (_, rs) in resultTupleList
+                   for r in rs):
+                raise RuntimeError("cannot write explode")
+        return addResultTuples(self, resultTupleList)
+    monkeypatch.setattr(ASVDb, "addResultTuples", failingAddResultTuples)
+
+    # The bad results are sent as-is, since BenchmarkResult would reject some.
+    def sendBad(encodedResults, responses):
+        request = {"dbDir": dbDir, "conf": {"repo": repo},
+                   "results": encodedResults}
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(ingestSocket)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            responses.append(json.loads(sock.makefile("rb").readline()))
+
+    def sendGood(commitHash):
+        db = ASVDb(dbDir, repo, [branch], ingestSocket=ingestSocket)
+        db.addResult(BenchmarkInfo(machineName="machine",
+                                   commitHash=commitHash, branch=branch),
+                     BenchmarkResult(funcName="bench", result=2))
+
+    bInfo = BenchmarkInfo(machineName="machine", commitHash="bad",
+                          branch=branch)
+    (encodedInfo, _) = encodeResultTuples([(bInfo, [])])[0]
+    for (encodedResults, errorMatch) in [
+            ([[encodedInfo, [["bench", 1, [["dataset"]], "seconds"]]]],
+             "ValueError: not enough values"),
+            ([[encodedInfo, [["bench", {"a": 1}, [], "seconds"]]]],
+             "ValueError: The result of bench"),
+            (encodeResultTuples(
+                [(bInfo, [BenchmarkResult(funcName="explode", result=1)])]),
+             "cannot write explode")]:
+        writes.clear()
+        responses = []
+        threads = [threading.Thread(target=sendBad,
+                                    args=(encodedResults, responses)),
+                   threading.Thread(target=sendGood, args=("good",))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert errorMatch in responses[0]["error"]
+        results = ASVDb(dbDir).getResults()
+        assert [bInfo.commitHash for (bInfo, _) in results] == ["good"]
+    # The results that could not be written were written in one batch with
+    # the good ones, then each on its own.
+    assert writes == [2, 1, 1]
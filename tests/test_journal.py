@@ -0,0 +1,65 @@
+import uuid
+
+from asvdb import BenchmarkInfo, BenchmarkResult
+
+
+def getJournal(storage, writer, segmentMaxAge=300):
+    from asvdb.codec import getCodec
+    from asvdb.journal import Journal
+
+    return Journal(storage, getCodec("json"), writer, "journal",
+                   "compacted.json", segmentMaxAge)
+
+
+def getResultsFileKey(benchmarkInfo):
+    return f"results/{benchmarkInfo.machineName}/{benchmarkInfo.commitHash}.json"
+
+
+def test_journal():
+    """
+    Records appended by each writer are returned until compacted, and only the
+    journal files no longer appended to are removed once compacted.
+    """
+    from asvdb.journal import JournalWriter
+    from asvdb.storage import MemoryStorage
+
+    storage = MemoryStorage(f"memory://{uuid.uuid4().hex}")
+    storage.create()
+    (writer1, writer2) = (JournalWriter(), JournalWriter())
+    journal1 = getJournal(storage, writer1)
+    journal2 = getJournal(storage, writer2)
+
+    bInfo = BenchmarkInfo(machineName="m1", commitHash="hash1")
+    journal1.append([(bInfo, [BenchmarkResult("a", 1.0, [("n", 1)])])],
+                    {"repo": "myrepo"})
+    journal2.append([(bInfo, [BenchmarkResult("a", 2.0, [("n", 1)]),
+                              BenchmarkResult("b", 3.0)])], {})
+    # A record being appended is ignored until complete.
+    storage.append(f"journal/{writer2.writerId}-0.jsonl", b'{"time": 0')
+
+    # Later results replace earlier ones for the same benchmark and params.
+    journalResults = journal1.getResults(getResultsFileKey)
+    assert list(journalResults) == ["results/m1/hash1.json"]
+    (bi, results) = journalResults["results/m1/hash1.json"]
+    assert bi == bInfo
+    assert [r.result for r in results.values()] == [2.0, 3.0]
+
+    compacted = []
+    journal1.startSegment()
+    records = journal1.compact(compacted.extend)
+    assert records == compacted
+    assert [confArgs for (confArgs, _) in records] == [{"repo": "myrepo"}, {}]
+    assert journal1.getResults(getResultsFileKey) == {}
+    # Only the previous segment of writer1 is removed.
+    assert storage.listFiles("journal") == sorted([
+        "journal/compacted.json",
+        f"journal/{writer2.writerId}-0.jsonl",
+        f"journal/{writer2.writerId}-{writer2.segment}.jsonl"])
+    assert journal1.compact(compacted.extend) == []
+
+    # Complete journal files of other writers are removed once older than
+    # twice the segment max age.
+    journal1 = getJournal(storage, writer1, segmentMaxAge=0)
+    journal1.compact(compacted.extend)
+    assert storage.listFiles("journal") == sorted([
+        "journal/compacted.json", f"journal/{writer2.writerId}-0.jsonl"])
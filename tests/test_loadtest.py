@@ -0,0 +1,36 @@
+
+def test_loadtest(tmp_path):
+    from asvdb import loadtest
+
+    report = loadtest.runLoadTest(str(tmp_path / "asv"), numProcesses=2,
+                                  duration=1, resultsPerWrite=3, numCommits=2)
+    assert report["errors"] == []
+    assert report["write"]["count"] > 0
+    assert report["lockWait"]["count"] >= \
+        report["write"]["count"] + report["read"]["count"]
+    assert report["write"]["p50"] <= report["write"]["p99"] \
+        <= report["write"]["max"]
+    assert report["integrity"]["ok"] is True
+    assert 0 < report["integrity"]["expected"] <= 2 * 2 * 3
+    assert "integrity:   OK" in loadtest.formatReport(report)
+
+
+def test_checkIntegrity(tmp_path):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+    from asvdb import loadtest
+
+    db = ASVDb(str(tmp_path / "asv"), loadtest.repo, [loadtest.branch])
+    db.addResults(BenchmarkInfo(machineName=loadtest.machineName,
+                                commitHash="hash0", branch=loadtest.branch),
+                  [BenchmarkResult(funcName="bench_0", result=1.5,
+                                   argNameValuePairs=[("worker", "0")]),
+                   BenchmarkResult(funcName="bench_1", result=2.5,
+                                   argNameValuePairs=[("worker", "0")])])
+
+    integrity = loadtest.checkIntegrity(db, {0: {("hash0", "bench_0"): 1.5,
+                                                 ("hash0", "bench_1"): 3.5,
+                                                 ("hash1", "bench_0"): 1.5}})
+    assert integrity["expected"] == 3
+    assert integrity["missing"] == [(0, "hash1", "bench_0")]
+    assert integrity["mismatched"] == [(0, "hash0", "bench_1")]
+    assert integrity["ok"] is False
@@ -0,0 +1,105 @@
+import threading
+import uuid
+
+import pytest
+
+repo = "myrepo"
+branch = "my_branch"
+
+
+def createDb(machineName, numCommits):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    db = ASVDb(f"memory://{uuid.uuid4().hex}", repo, [branch])
+    for i in range(numCommits):
+        bInfo = BenchmarkInfo(machineName=machineName, commitHash=f"hash{i}",
+                              commitTime=i, branch=branch)
+        db.addResults(bInfo, [BenchmarkResult(funcName=f, result=i)
+                              for f in ["bfs", "sssp"]])
+    return db
+
+
+def test_getResults():
+    from asvdb import MultiASVDb, BenchmarkInfo
+
+    dbs = [createDb(f"machine{i}", i + 1) for i in range(4)]
+    multiDb = MultiASVDb([dbs[0].dbDir] + dbs[1:], maxWorkers=2)
+
+    results = multiDb.getResults()
+    assert sorted((source, bInfo.commitHash, len(bResults))
+                  for (source, bInfo, bResults) in results) == \
+        sorted((db.dbDir, f"hash{j}", 2)
+               for (i, db) in enumerate(dbs) for j in range(i + 1))
+    machineNames = dict((db.dbDir, f"machine{i}") for (i, db) in enumerate(dbs))
+    for (source, bInfo, _) in results:
+        assert bInfo.machineName == machineNames[source]
+
+    # Filters are applied to each source
+    results = multiDb.getResults(
+        filterInfoObjList=[BenchmarkInfo(machineName="machine3",
+                                         commitHash="hash1", commitTime=1,
+                                         branch=branch)],
+        filterFunc=lambda bInfo, bResult: bResult.funcName == "sssp")
+    assert [(s, i.commitHash, [r.funcName for r in rs])
+            for (s, i, rs) in results] == [(dbs[3].dbDir, "hash1", ["sssp"])]
+
+    assert sorted(bInfo.machineName for (_, bInfo) in multiDb.getInfo()) == \
+        sorted(f"machine{i}" for i in range(4) for _ in range(i + 1))
+
+
+def test_iterResultsStreaming():
+    """
+    Results from sources that have been read are generated without waiting for
+    slower sources.
+    """
+    from asvdb import MultiASVDb
+
+    fastDb = createDb("fast", 1)
+    slowDb = createDb("slow", 1)
+    readSlow = threading.Event()
+    getResults = slowDb.getResults
+    def slowGetResults(*args, **kwargs):
+        assert readSlow.wait(timeout=10)
+        return getResults(*args, **kwargs)
+    slowDb.getResults = slowGetResults
+
+    results = MultiASVDb([slowDb, fastDb]).iterResults()
+    (source, bInfo, _) = next(results)
+    assert source == fastDb.dbDir
+    readSlow.set()
+    assert [s for (s, _, _) in results] == [slowDb.dbDir]
+
+
+def test_iterResultsStopEarly():
+    """
+    Closing the generator before all sources are read returns without waiting
+    for the sources still being read.
+    """
+    import time
+    from asvdb import MultiASVDb
+
+    fastDb = createDb("fast", 1)
+    slowDbs = [createDb(f"slow{i}", 1) for i in range(3)]
+    readSlow = threading.Event()
+    for slowDb in slowDbs:
+        def slowGetResults(*args, getResults=slowDb.getResults, **kwargs):
+            readSlow.wait(timeout=10)
+            return getResults(*args, **kwargs)
+        slowDb.getResults = slowGetResults
+
+    results = MultiASVDb([fastDb] + slowDbs, maxWorkers=2).iterResults()
+    startTime = time.monotonic()
+    for (source, _, _) in results:
+        assert source == fastDb.dbDir
+        break
+    results.close()
+    assert time.monotonic() - startTime < 5
+    readSlow.set()
+
+
+def test_iterResultsError():
+    from asvdb import MultiASVDb
+
+    multiDb = MultiASVDb([createDb("m", 1), f"memory://{uuid.uuid4().hex}"])
+    with pytest.raises(FileNotFoundError):
+        multiDb.getResults()
@@ -0,0 +1,57 @@
+import pytest
+
+day = 24 * 60 * 60
+
+
+def createInfos(commitTimes, branch="main"):
+    from asvdb import BenchmarkInfo
+
+    return [BenchmarkInfo(machineName="my_machine", commitHash=f"c{i}",
+                          commitTime=t, branch=branch)
+            for (i, t) in enumerate(commitTimes)]
+
+
+def test_parseRetentionPolicy():
+    from asvdb.retention import (parseRetentionPolicy, KeepLastCommits,
+                                 DownsampleWeekly)
+
+    policy = parseRetentionPolicy("last:20")
+    assert isinstance(policy, KeepLastCommits)
+    assert policy.numCommits == 20
+    policy = parseRetentionPolicy("weekly-after:90")
+    assert isinstance(policy, DownsampleWeekly)
+    assert policy.afterDays == 90
+    for spec in ["last", "last:x", "last:-1", "monthly-after:2"]:
+        with pytest.raises(ValueError):
+            parseRetentionPolicy(spec)
+
+
+def test_keepLastCommits():
+    from asvdb.retention import KeepLastCommits
+
+    # Multiple infos for the same commit (eg. different machines) count once.
+    infos = createInfos([5, 1, 3, 2, 4]) + createInfos([5], branch="other") \
+        + createInfos([5, 4])
+    assert KeepLastCommits(2).getCommitsToRemove(infos) == \
+        set([("main", "c1"), ("main", "c2"), ("main", "c3")])
+    assert KeepLastCommits(10).getCommitsToRemove(infos) == set()
+
+
+def test_downsampleWeekly():
+    from asvdb.retention import DownsampleWeekly, getPrunePredicate
+
+    now = 1000 * 7 * day
+    # Two commits per week for the last 4 weeks, in milliseconds.
+    commitTimes = [(now - (w * 7 + d) * day) * 1000
+                   for w in range(4) for d in [1, 3]]
+    infos = createInfos(commitTimes)
+    policy = DownsampleWeekly(14, now=now)
+    # Commits in the last 14 days are all kept, older ones are kept once per
+    # week.
+    assert policy.getCommitsToRemove(infos) == set([("main", "c5"),
+                                                    ("main", "c7")])
+
+    predicate = getPrunePredicate([policy], infos)
+    assert predicate(infos[5], None) is True
+    assert predicate(infos[4], None) is False
+    assert predicate(createInfos([0], branch="new")[0], None) is False
@@ -0,0 +1,198 @@
+import http.client
+import json
+import os
+import socket
+import stat
+import threading
+import urllib.parse
+import urllib.request
+
+import pytest
+
+repo = "myrepo"
+branch = "my_branch"
+
+
+def addCommit(db, i, machineName="machine0"):
+    from asvdb import BenchmarkInfo, BenchmarkResult
+
+    bInfo = BenchmarkInfo(machineName=machineName, commitHash=f"hash{i}",
+                          commitTime=i, branch=branch)
+    db.addResults(bInfo, [BenchmarkResult(funcName=f, result=(i + 1) * n,
+                                          argNameValuePairs=[("dataset", d)])
+                          for (n, f) in enumerate(["bfs", "sssp"], start=1)
+                          for d in ["a.csv", "b.csv"]])
+
+
+@pytest.fixture
+def resultsIndex(tmp_path):
+    from asvdb import ASVDb
+    from asvdb.server import ResultsIndex
+
+    db = ASVDb(str(tmp_path / "db"), repo, [branch])
+    for i in range(3):
+        addCommit(db, i)
+    index = ResultsIndex(db)
+    index.refresh()
+    return index
+
+
+@pytest.fixture
+def serverURL(resultsIndex):
+    from asvdb.server import createServer
+
+    server = createServer(resultsIndex, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def query(serverURL, path, method="GET"):
+    request = urllib.request.Request(serverURL + path, method=method)
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def test_updateResultsCache(tmp_path):
+    from asvdb import ASVDb
+
+    db = ASVDb(str(tmp_path / "db"), repo, [branch])
+    addCommit(db, 0)
+    addCommit(db, 1, machineName="machine1")
+
+    cache = {}
+    (changed, removed) = db.updateResultsCache(cache)
+    assert len(changed) == 2
+    assert removed == set()
+    assert sorted(bInfo.commitHash for (bInfo, _) in cache["results"].values()) \
+        == ["hash0", "hash1"]
+
+    # Nothing is re-read if nothing changed.
+    assert db.updateResultsCache(cache) == (set(), set())
+
+    addCommit(db, 2)
+    (changed, removed) = db.updateResultsCache(cache)
+    assert [cache["results"][k][0].commitHash for k in changed] == ["hash2"]
+
+    db.prune(lambda bInfo, bResult: bInfo.machineName == "machine1")
+    (changed, removed) = db.updateResultsCache(cache)
+    assert (changed, len(removed)) == (set(), 1)
+    assert sorted(bInfo.commitHash for (bInfo, _) in cache["results"].values()) \
+        == ["hash0", "hash2"]
+
+
+def test_filter(serverURL):
+    rows = json.loads(query(serverURL, "/filter?funcName=sssp&param_dataset=b.csv"))
+    assert [(r["commitHash"], r["result"]) for r in rows] == \
+        [("hash0", 2), ("hash1", 4), ("hash2", 6)]
+
+    rows = json.loads(query(serverURL,
+                            "/filter?expr=result+%3E%3D+3+and+funcName%3D%3D'bfs'"
+                            "&limit=1"))
+    assert [(r["commitHash"], r["funcName"]) for r in rows] == [("hash2", "bfs")]
+
+    status = json.loads(query(serverURL, "/status"))
+    assert (status["numResults"], status["numResultsFiles"]) == (12, 3)
+
+
+def test_historyCompare(serverURL):
+    rows = json.loads(query(serverURL, "/history?funcName=bfs&commitHash=hash1"))
+    assert [r["argNameValuePairs"] for r in rows] == \
+        [[["dataset", "a.csv"]], [["dataset", "b.csv"]]]
+
+    rows = json.loads(query(serverURL, "/compare?base=hash0&head=hash2"
+                            "&param_dataset=a.csv"))
+    assert sorted((r["funcName"], r["baseResult"], r["result"], r["ratio"])
+                  for r in rows) == [("bfs", 1, 3, 3.0), ("sssp", 2, 6, 3.0)]
+
+
+def test_export(serverURL):
+    lines = query(serverURL, "/export?format=csv&funcName=bfs").decode().splitlines()
+    assert len(lines) == 7
+    assert "param_dataset" in lines[0].split(",")
+
+    lines = query(serverURL, "/export?format=jsonl&commitHash=hash0").splitlines()
+    assert len(lines) == 4
+
+
+def test_errors(serverURL):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        query(serverURL, "/filter?expr=result+%3E")
+    assert e.value.code == 400
+    assert "SyntaxError" in json.loads(e.value.read())["error"]
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        query(serverURL, "/filter?notAKey=1")
+    assert e.value.code == 400
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        query(serverURL, "/unknown")
+    assert e.value.code == 404
+
+
+def test_exprNotExecuted(serverURL, tmp_path):
+    """
+    Query expressions can only compare the keys of results to constants, and
+    cannot call functions or access attributes or builtins.
+    """
+    markerFile = tmp_path / "marker"
+    for expr in [f"__import__('os').system('touch {markerFile}')",
+                 "open('/etc/passwd')",
+                 "funcName.__class__",
+                 "__builtins__",
+                 "[x for x in (1, 2)]",
+                 "result in 5"]:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            query(serverURL, "/filter?" + urllib.parse.urlencode({"expr": expr}))
+        assert e.value.code == 400
+    assert not(markerFile.exists())
+
+    rows = json.loads(query(serverURL, "/filter?" + urllib.parse.urlencode(
+        {"expr": "funcName in ('bfs',) and not(result < -1)"})))
+    assert len(rows) == 6
+
+
+def test_refresh(resultsIndex, serverURL):
+    """
+    Results added to the db after the server started are only read when the
+    index is refreshed, and only the new results file is read.
+    """
+    addCommit(resultsIndex.db, 3)
+    assert json.loads(query(serverURL, "/status"))["numResults"] == 12
+
+    with pytest.raises(urllib.error.HTTPError) as e:
+        query(serverURL, "/refresh")
+    assert e.value.code == 405
+    assert json.loads(query(serverURL, "/status"))["numResults"] == 12
+
+    refreshed = json.loads(query(serverURL, "/refresh", method="POST"))
+    assert len(refreshed["changed"]) == 1
+    assert refreshed["removed"] == []
+    rows = json.loads(query(serverURL, "/history?funcName=bfs&param_dataset=a.csv"))
+    assert [r["commitHash"] for r in rows] == ["hash0", "hash1", "hash2", "hash3"]
+
+
+def test_unixSocket(resultsIndex, tmp_path):
+    from asvdb.server import createServer
+
+    socketPath = str(tmp_path / "asvdb.sock")
+    server = createServer(resultsIndex, unixSocket=socketPath)
+    # Only the owner can connect.
+    assert stat.S_IMODE(os.stat(socketPath).st_mode) == 0o600
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socketPath)
+        conn = http.client.HTTPConnection("localhost")
+        conn.sock = sock
+        conn.request("GET", "/status")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert json.loads(response.read())["numResults"] == 12
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,272 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+import pytest
+
+repo = "myrepo"
+branch = "my_branch"
+machineName = "my_machine"
+
+
+def getMemoryURL():
+    return f"memory://{uuid.uuid4().hex}"
+
+
+def checkBackend(storage):
+    """
+    Exercises the StorageBackend interface on an existing, empty DB root.
+    """
+    assert storage.listFiles("results") == []
+    assert storage.read("results/a.json") is None
+
+    v1 = storage.write("results/a.json", b"one")
+    storage.write("results/m/b.json", b"two")
+    storage.write("asv.conf.json", b"conf")
+    assert storage.read("results/a.json") == b"one"
+    assert storage.readWithVersion("results/a.json") == (b"one", v1)
+    assert storage.listFiles("results") == ["results/a.json", "results/m/b.json"]
+    assert sorted(storage.listVersions("results")) == storage.listFiles("results")
+
+    # Conditional writes only succeed if the expected version matches
+    assert storage.conditionalWrite("results/a.json", b"x", None) is None
+    assert storage.conditionalWrite("results/a.json", b"x", "bad") is None
+    v2 = storage.conditionalWrite("results/a.json", b"three", v1)
+    assert v2 is not None
+    assert storage.read("results/a.json") == b"three"
+    assert storage.conditionalWrite("results/c.json", b"new", None) is not None
+    assert storage.read("results/c.json") == b"new"
+
+    storage.delete("results/a.json")
+    storage.delete("results/a.json")
+    assert storage.read("results/a.json") is None
+    assert storage.listFiles("results") == ["results/c.json", "results/m/b.json"]
+
+    # Writes of unchanged contents are skipped
+    v3 = storage.writeIfChanged("d.json", b"four")
+    assert v3 is not None
+    assert storage.writeIfChanged("d.json", b"four") is None
+    assert storage.readWithVersion("d.json") == (b"four", v3)
+    assert storage.writeIfChanged("d.json", b"five") is not None
+    assert storage.read("d.json") == b"five"
+
+    # Reads of the end of a file
+    assert storage.readFrom("d.json", 0) == b"five"
+    assert storage.readFrom("d.json", 2) == b"ve"
+    assert storage.readFrom("d.json", 4) == b""
+    assert storage.readFrom("d.json", 10) == b""
+    assert storage.readFrom("e.json", 0) is None
+
+
+def test_localStorage():
+    from asvdb.storage import LocalStorage
+
+    tmpDir = tempfile.TemporaryDirectory()
+    storage = LocalStorage(os.path.join(tmpDir.name, "db"))
+    assert storage.exists() is False
+    storage.create()
+    assert storage.exists() is True
+    checkBackend(storage)
+    # Files are written to temp files which replace them, none are left over.
+    for (_, _, fileNames) in os.walk(storage.rootDir):
+        assert not([f for f in fileNames if f.endswith(".tmp")])
+
+    # A file rewritten with the same size and mtime has a new version.
+    v1 = storage.write("same.json", b"one")
+    st = os.stat(os.path.join(storage.rootDir, "same.json"))
+    storage.write("same.json", b"two")
+    os.utime(os.path.join(storage.rootDir, "same.json"),
+             ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert storage.readWithVersion("same.json")[1] != v1
+
+    tmpDir.cleanup()
+
+
+def test_memoryStorage():
+    from asvdb.storage import getStorageForURL, MemoryStorage
+
+    url = getMemoryURL()
+    storage = getStorageForURL(url)
+    assert isinstance(storage, MemoryStorage)
+    assert storage.exists() is False
+    storage.create()
+    checkBackend(storage)
+
+    # Other instances for the same URL share the same files
+    assert getStorageForURL(url).read("results/c.json") == b"new"
+    storage.destroy()
+    assert getStorageForURL(url).exists() is False
+
+
+def test_memoryDb():
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    dbURL = getMemoryURL()
+    db = ASVDb(dbURL, repo, [branch])
+    bInfo = BenchmarkInfo(machineName=machineName, cudaVer="9.2",
+                          osType="linux", pythonVer="3.6",
+                          commitHash="abc123", commitTime=1590007324)
+    resultList = [BenchmarkResult(funcName="bfs", result=i,
+                                  argNameValuePairs=[("scale", i)])
+                  for i in range(10)]
+    db.addResults(bInfo, resultList)
+
+    dbCheck = ASVDb(dbURL)
+    dbCheck.loadConfFile()
+    assert dbCheck.repo == f"{repo}.git"
+    retList = dbCheck.getResults()
+    assert len(retList) == 1
+    assert retList[0][0] == bInfo
+    assert retList[0][1] == resultList
+
+    db.storage.destroy()
+
+
+def test_memoryDbDNE():
+    from asvdb import ASVDb
+
+    with pytest.raises(FileNotFoundError):
+        ASVDb(getMemoryURL()).getResults()
+
+
+def test_memoryConcurrency():
+    """
+    Same as test_concurrency, but much faster due to the in-memory storage.
+    """
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    dbURL = getMemoryURL()
+    db1 = ASVDb(dbURL, repo, [branch])
+    db2 = ASVDb(dbURL, repo, [branch])
+    db3 = ASVDb(dbURL, repo, [branch])
+    db1.writeDelay = 10
+    db2.writeDelay = 10
+
+    bInfo = BenchmarkInfo(machineName=machineName)
+    t1 = threading.Thread(target=db1.addResult,
+                          args=(bInfo, BenchmarkResult("somebenchmark1", 43)))
+    t2 = threading.Thread(target=db2.addResult,
+                          args=(bInfo, BenchmarkResult("somebenchmark2", 43)))
+    t3 = threading.Thread(target=db3.addResult,
+                          args=(bInfo, BenchmarkResult("somebenchmark3", 43)))
+    t1.start()
+    t2.start()
+    time.sleep(0.1)  # ensure t3 tries to write last
+    t3.start()
+
+    t3.join(timeout=0.1)
+    assert t3.is_alive() is True
+
+    db1.cancelWrite = True
+    db2.cancelWrite = True
+    t3.join(timeout=11)
+    assert t3.is_alive() is False
+    t1.join()
+    t2.join()
+
+    results = db3.getResults()
+    assert [r.funcName for r in results[0][1]] == ["somebenchmark3"]
+
+    db3.storage.destroy()
+
+
+def test_memoryConcurrencyStress():
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    dbURL = getMemoryURL()
+    num = 64
+    bInfo = BenchmarkInfo(machineName=machineName)
+    threads = []
+    allFuncNames = []
+    for i in range(num):
+        db = ASVDb(dbURL, repo, [branch])
+        funcName = f"somebenchmark{i}"
+        allFuncNames.append(funcName)
+        threads.append(threading.Thread(
+            target=db.addResult,
+            args=(bInfo, BenchmarkResult(funcName=funcName, result=43))))
+
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results = db.getResults()
+    assert sorted(r.funcName for r in results[0][1]) == sorted(allFuncNames)
+
+    db.storage.destroy()
+
+
+@pytest.fixture
+def s3Server(monkeypatch):
+    """
+    Starts a local S3 stand-in server and points boto3 at it.
+    """
+    moto_server = pytest.importorskip("moto.server")
+    boto3 = pytest.importorskip("boto3")
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+
+    monkeypatch.setenv("AWS_ENDPOINT_URL_S3", f"http://127.0.0.1:{port}")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    boto3.client("s3").create_bucket(Bucket="asvdb-test")
+    yield f"s3://asvdb-test/{uuid.uuid4().hex}"
+    server.stop()
+
+
+def test_s3Storage(s3Server):
+    from asvdb.storage import getStorageForURL, S3Storage
+
+    storage = getStorageForURL(s3Server)
+    assert isinstance(storage, S3Storage)
+    assert storage.exists() is True
+    checkBackend(storage)
+
+    assert getStorageForURL("s3://bucket-that-does-not-exist").exists() is False
+
+
+def test_s3SharedClient(s3Server):
+    from asvdb import ASVDb
+    from asvdb.storage import setS3MaxPoolConnections
+
+    db1 = ASVDb(s3Server, repo, [branch])
+    db2 = ASVDb(s3Server, repo, [branch])
+    assert db1.storage.s3Client is db2.storage.s3Client
+
+    setS3MaxPoolConnections(4)
+    db3 = ASVDb(s3Server, repo, [branch])
+    assert db3.storage.s3Client is not db1.storage.s3Client
+    assert db3.storage.s3Client.meta.config.max_pool_connections == 4
+    setS3MaxPoolConnections(32)
+
+
+def test_s3Db(s3Server):
+    from asvdb import ASVDb, BenchmarkInfo, BenchmarkResult
+
+    db = ASVDb(s3Server, repo, [branch])
+    db.storage.lockSettleTime = 0
+    bInfo = BenchmarkInfo(machineName=machineName, cudaVer="9.2",
+                          osType="linux", pythonVer="3.6",
+                          commitHash="abc123", commitTime=1590007324)
+    resultList = [BenchmarkResult(funcName="bfs", result=i,
+                                  argNameValuePairs=[("scale", i)])
+                  for i in range(4)]
+    db.addResults(bInfo, resultList)
+
+    dbCheck = ASVDb(s3Server)
+    dbCheck.storage.lockSettleTime = 0
+    retList = dbCheck.getResults()
+    assert len(retList) == 1
+    assert retList[0][0] == bInfo
+    assert retList[0][1] == resultList
+    # No lock objects are left behind
+    assert not [k for k in dbCheck.storage.listFiles() if ".asvdbLOCK" in k]
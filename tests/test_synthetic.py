@@ -0,0 +1,32 @@
+import uuid
+
+
+def test_generateDb():
+    from asvdb import synthetic
+
+    db = synthetic.generateDb(f"memory://{uuid.uuid4().hex}", numMachines=2,
+                              numCommits=3, numBenchmarks=4, paramGridSize=3,
+                              numParams=2)
+    results = db.getResults()
+    assert len(results) == 2 * 3
+    assert sorted(set(bInfo.machineName for (bInfo, _) in results)) == \
+        ["machine0", "machine1"]
+    for (bInfo, bResults) in results:
+        assert len(bResults) == 4 * 3 * 3
+    assert db.getParamNames() == ["param0", "param1"]
+
+
+def test_sparsity():
+    from asvdb import synthetic
+
+    def getResults(**kwargs):
+        return [(bInfo.commitHash, [(r.funcName, r.argNameValuePairs, r.result)
+                                    for r in bResults])
+                for (bInfo, bResults) in synthetic.generateResultTuples(
+                    numCommits=5, numBenchmarks=10, paramGridSize=4, **kwargs)]
+
+    numResults = sum(len(r) for (_, r) in getResults(sparsity=0.5))
+    assert 0.3 < numResults / (5 * 10 * 16) < 0.7
+    # The same seed always generates the same results
+    assert getResults(sparsity=0.5) == getResults(sparsity=0.5)
+    assert getResults(seed=1) != getResults(seed=2)